@@ -42,6 +42,10 @@ IDX-SUB subtitles, and the converted video), and merges them together, setting
 flags on 'forced' tracks correctly, and maintaining default/forced flags on the
 rest of the tracks.
 
+These steps don't all wait on each other. The Handbrake encode of a movie only
+needs the original rip, so it starts right away and runs at the same time as
+the subtitle extraction and conversion. Only the final merge waits for both.
+
 If at any point in the process the computer crashes (normally during the
 Handbrake encoding), Ripmaster starts from the last completed task.
 
@@ -94,6 +98,17 @@ addition to the BFrames set by the speed preset, but will override the tune.
 
 Default: None
 
+Movies whose video is already H.264 don't always need encoding again. Set
+auto_Remux to yes, and any movie whose video is H.264, and no wider or taller
+than its target resolution, is remuxed instead, just as if its folder had the
+remux instruction. Movies given the tv or an fps instruction are still encoded.
+Without a resolution instruction, the target is the source's own resolution,
+so a Bluray rip would be remuxed too. To keep those encoding, set
+remux_Max_Kbps, and only movies at or under that bitrate, counting the whole
+file, are remuxed. 0 doesn't limit the bitrate.
+
+Default: no, 0
+
 If you want to adjust the movie order, you can change the sorting setting.
 
 Options for sorting are:
@@ -101,10 +116,179 @@ Options for sorting are:
     alphabetical (default)
     resolution (lowest res to highest)
     quality (lowest quality to highest)
+    shortest (quickest estimated encode to slowest)
+    longest (slowest estimated encode to quickest)
+    estimated_size (smallest estimated encode to largest)
 
 You can also set the sorting to be reverse sorting with the sorting_Reverse
 setting.
 
+The shortest, longest and estimated_size sortings estimate each movie's encode
+before sorting. Short ranges spread through the movie (samples of them, each
+sample_Seconds long) are encoded with the same settings as the real encode, and
+the time they took and the size they came to are scaled up to the whole movie.
+Sorting by shortest finishes the most movies in a night. Estimates are kept in
+the cache_File of the Estimate Settings section, so each movie is only sampled
+once for the same settings. Leave cache_File blank to sample every time.
+
+Default: 3 samples, 30 seconds each
+
+While a movie encodes, Ripmaster reads HandBrake's progress as it goes, and
+prints each running encode's percentage, frame rate and ETA every minute,
+along with an ETA for the whole queue. If an encode's percentage hasn't moved
+for stall_Seconds, Ripmaster warns that it looks stalled. The encode is left
+running.
+
+Default: 600
+
+If the same disc is ripped more than once, in different folders, Ripmaster can
+reuse the first encode instead of encoding it again. Set max_GB in the Encode
+Cache section, and every finished encode is kept in cache_Folder, keyed by a
+fingerprint of its source (its size, and a hash of its start, middle and end),
+its HandBrake settings and the HandBrake version. A later movie with the same
+source and settings gets the kept encode in seconds, as long as HandBrake
+hasn't changed. Encodes are kept by hard link, so an encode
+and its kept copy share the same space on disk until the encode is deleted, as
+long as cache_Folder is on the same disk as toConvert. On other disks they're
+reflinked if the filesystem can, and copied if not. Once the kept encodes add
+up to more than max_GB, the least recently used are removed. 0 keeps nothing.
+
+Default: encodes, 0
+
+Every stage Ripmaster finishes is recorded in the history_File of the History
+Settings section, along with how long it took. Encodes also record their
+resolution, x264 speed, tune, deinterlacing, forced frame rate and the bitrate
+of the source. When Ripmaster starts, it predicts from that history when each
+movie in the queue will be done, and when the whole queue will be. Encodes are
+predicted from past encodes with the same settings, and get more accurate the
+more movies Ripmaster has encoded. While an encode runs, if it's going at less
+than slow_Percent of the speed past encodes with the same settings went,
+Ripmaster warns that the machine may be throttling, or busy with something
+else. Set slow_Percent to 0 to turn the warning off, and leave history_File
+blank to record nothing.
+
+Default: history.db, 50
+
+BDSup2Sub conversions run on a pool of workers shared by every movie, so
+subtitle tracks from different movies (or different languages of one movie)
+convert at the same time. Set the size of that pool with the sup2Sub_Workers
+setting in the Subtitle Settings section. Each worker runs its own copy of
+Java, so don't set this higher than the number of cores you can spare.
+
+Default: 2
+
+Every BDSup2Sub conversion normally starts up Java from scratch, which can take
+longer than converting a small subtitle track. Setting sup2Sub_Persistent to
+yes keeps one Java process running per BDSup2Sub worker and sends it track
+after track instead. This needs the Java compiler (javac, which comes with the
+JDK), to build the small launcher in tools/java into a temporary folder the
+first time it's needed each run. If that can't be done, Ripmaster goes back to
+starting Java for every track.
+
+Default: no
+
+Setting the Subtitle Settings converter to native converts subtitles with
+Ripmaster's own converter instead of BDSup2Sub, without starting Java at all.
+It needs NumPy installed. It writes the full and forced subtitle tracks in a
+single pass, and is much faster than BDSup2Sub on a full length movie. If NumPy
+isn't installed, or a subtitle track can't be read, Ripmaster uses BDSup2Sub
+for that track instead.
+
+Default: bdsup2sub
+
+Setting the Subtitle Settings extractor to native extracts PGS subtitles
+straight from the mkv, instead of running mkvextract. Only the parts of the
+file the Cues say hold subtitles are read, rather than the whole movie, and
+every subtitle track comes out of the one pass. If a movie's subtitles can't be
+extracted that way, they're extracted with mkvextract as before.
+
+Default: mkvextract
+
+Ripmaster keeps the tracks mkvmerge lists for each movie in a small database,
+set by the Probe Cache cache_File option, relative to Ripmaster.ini. When
+Ripmaster starts again, a movie file that hasn't changed size, modification
+time or inode is listed from the cache instead of running mkvmerge again. Only
+the max_Entries most recently used files are kept. Setting enabled to no probes
+every file every time.
+
+Default: probes.db, yes, 10000
+
+Setting the Probe Cache reader to native reads each movie's tracks, length and
+chapters straight from the mkv, instead of running mkvmerge and mkvextract.
+Only the headers at the start and end of the file are read, so scanning and
+sorting a large library starts no processes at all. A file that can't be read
+that way, such as one that isn't Matroska, is probed with mkvmerge as before.
+
+Default: mkvmerge
+
+Watch Settings are only used when Ripmaster is run with --watch (see How To).
+A new movie isn't queued until its size and modification time have stayed the
+same for settle_Seconds, so a rip that MakeMKV is still writing is left alone.
+Where inotify isn't available (anywhere but Linux), toConvert is checked for
+new movies every poll_Seconds.
+
+Default: 10, 60
+
+Setting encode_Chunks above 1 splits each movie's encode into that many pieces,
+at the chapters nearest an even split, and encodes the pieces with separate
+HandBrakes at the same time. The pieces are joined back together with mkvmerge,
+without re-encoding. x264 doesn't make full use of a machine with many cores on
+a single 1080p encode, so this can finish a movie much sooner. A piece is never
+made shorter than five minutes, and movies without chapters, or with VobSub
+subtitles, are encoded in one piece. If Ripmaster stops part way through, only
+the pieces that weren't finished are encoded again.
+
+encode_Threads sets how many threads each piece's x264 uses. At 0, the cores
+are split evenly between the pieces.
+
+Default: 1, 0
+
+The CPU Settings divide the machine's cores into encode_Slots slots, and run
+each HandBrake on a slot of its own, pinned to that slot's cores with as many
+x264 threads as the slot has cores. Each slot gets slot_Cores cores, or an even
+share of them at 0. Slots are kept within a single NUMA node where they fit,
+and take both hyperthreads of a core together, so encodes don't fight over the
+same caches and memory. An encode waits for a free slot before it starts. The
+slots are shared with other Ripmasters on the same machine (such as several
+--worker processes) through lock files, so they never encode on the same cores.
+With encode_Chunks above 1, set encode_Slots to at least encode_Chunks, so
+every piece gets a slot. Pinning only works on Linux. Setting pin_Cores to no,
+or running elsewhere, still limits how many encodes run at once, and their
+threads, without pinning them. At 0 slots, encodes aren't limited or pinned.
+
+Default: 0, yes, 0
+
+mkvextract and mkvmerge spend their time reading and writing whole movies, so
+the disks are what hold them up, while HandBrake and BDSup2Sub are held up by
+the CPU. Extracting and merging movies runs on io_Workers workers of their own,
+apart from conversions and encodes, so they never keep an encode waiting. Each
+mkvextract or mkvmerge run waits until every disk its files are on has fewer
+than jobs_Per_Disk runs on it, so two remuxes never make the same spinning disk
+seek back and forth between them, but movies on different disks are extracted
+and merged at the same time. A solid state disk can take a jobs_Per_Disk of 2
+or more. Setting it to 0 doesn't limit runs at all.
+
+Default: 2, 1
+
+Worker Settings are only used when Ripmaster is run with --worker (see How To).
+A worker renews its claim on the movie it's working on every quarter of
+lease_Seconds. If a worker stops renewing, because it crashed or its machine
+went down, any other worker takes the movie over once lease_Seconds have
+passed, carrying on from the last stage it finished.
+
+Default: 120
+
+The Metrics settings export how long each stage and each external tool takes,
+how many bytes of files each reads and writes, and how often each fails, in
+the format Prometheus reads. Setting http_Port serves them on this machine at
+http://127.0.0.1:<port>/metrics while Ripmaster runs. Setting metrics_File
+writes them to that file every write_Seconds instead, relative to
+Ripmaster.ini, for node_exporter's textfile collector to pick up (the file's
+name needs to end in .prom). Either shows which tool a batch spends most of
+its time in, and whether a slow network share is holding it up.
+
+Default: 0, blank, 15
+
 Sample Ripmaster.ini file:
 
 ================================================================================
@@ -119,11 +303,62 @@ mkvMerge: C://Program Files (x86)/MKVToolNix/mkvmerge.exe
 [Handbrake Settings]
 animation_BFrames: 8
 audio_Fallback: ffac3
+auto_Remux: no
+encode_Chunks: 1
+encode_Threads: 0
 language: English
+remux_Max_Kbps: 0
 sorting: alphabetical
 sorting_Reverse: no
+stall_Seconds: 600
 x264_Speed: slow
 
+[CPU Settings]
+encode_Slots: 0
+pin_Cores: yes
+slot_Cores: 0
+
+[Disk Settings]
+io_Workers: 2
+jobs_Per_Disk: 1
+
+[Encode Cache]
+cache_Folder: encodes
+max_GB: 0
+
+[Estimate Settings]
+cache_File: estimates.db
+sample_Seconds: 30
+samples: 3
+
+[History Settings]
+history_File: history.db
+slow_Percent: 50
+
+[Probe Cache]
+cache_File: probes.db
+enabled: yes
+max_Entries: 10000
+reader: mkvmerge
+
+[Subtitle Settings]
+converter: bdsup2sub
+extractor: mkvextract
+sup2Sub_Persistent: no
+sup2Sub_Workers: 2
+
+[Watch Settings]
+poll_Seconds: 10
+settle_Seconds: 60
+
+[Worker Settings]
+lease_Seconds: 120
+
+[Metrics]
+http_Port: 0
+metrics_File:
+write_Seconds: 15
+
 [Base Encode Quality]
 1080p: 20
 720p: 20
@@ -208,6 +443,15 @@ If your file needs to be de-interlaced, give the instruction set:
 
 And it will do a high quality de-interlacing pass.
 
+REMUX:
+
+If the video is already H.264 at the size you want, give the instruction set:
+
+    remux
+
+And Handbrake is skipped entirely. The video is merged straight from the
+original rip, with the same audio, subtitles and flags as an encoded movie.
+
 How To:
 -------
 
@@ -217,6 +461,31 @@ which is where Ripmaster will search for movies to encode.
 
 Double click on Ripmaster.py to begin the process.
 
+To keep Ripmaster running as a service instead, start it with:
+
+    python Ripmaster.py --watch
+
+Ripmaster then watches toConvert, and queues each new movie folder as it
+appears, while the movies already queued carry on encoding. New movies,
+including any already in toConvert when it starts, are only queued once their
+files have stopped changing for settle_Seconds. It runs until it
+receives SIGTERM or Ctrl+C, at which point it lets the running stages finish,
+saves its progress, and exits. Anything left is picked up when it next starts.
+
+To share the work between several machines, put toConvert on a network share
+that each of them mounts, and start Ripmaster on each with:
+
+    python Ripmaster.py --worker
+
+Each worker claims one movie at a time, so no movie is worked on twice, and
+moves on to the next unclaimed movie as soon as it's done. Their progress is
+kept in toConvert/.leases instead of jobs.db. If a worker dies, another worker
+takes its movie over after lease_Seconds, carrying on from the last stage it
+finished. Workers exit once every movie is done, or keep waiting for new movies
+if also given --watch. Mount toConvert at the same path on every machine, or
+movies taken over from another machine start over from the beginning. Several
+workers can also be run on the same machine.
+
 If you want Ripmaster to automatically start up after a crash, place a shortcut
 to Ripmaster.py in your startup folder, but be warned that EVERY time you start
 your computer, Ripmaster will start with it. Just close the window if you don't
@@ -229,12 +498,20 @@ Starting Fresh:
 If you mess something up, or you want to start an entire encode batch over again
 (say you changed the ini settings), simply delete the following from the folder:
 
-    movies.p
-    movies.p.bak
+    jobs.db
+    jobs.db-shm
+    jobs.db-wal
 
 Once those are deleted, every movie ripmaster finds will be treated as a new
 movie to be converted.
 
+Workers keep their progress in the .leases folder inside toConvert instead.
+Delete that folder, with every worker stopped, to start their batch over.
+
+Older versions of Ripmaster kept their progress in movies.p instead. The first
+time a newer Ripmaster starts, it imports movies.p into jobs.db, and renames it
+to movies.p.migrated.
+
 """
 
 #===============================================================================
@@ -242,12 +519,53 @@ movie to be converted.
 #===============================================================================
 
 # Standard Imports
+import argparse
+from functools import partial
 import os
-import cPickle as pickle
-from shutil import copyfile
+import signal
+import socket
+import threading
+import time
 
 # Ripmaster Imports
-from tools import Config, Movie
+from tools import (
+    Config, cpuSlots, ESTIMATED_SORTINGS, metrics, Movie, stageRecord,
+    throughputModel
+)
+from tools.history import forecast
+from tools.jobstore import JobStore
+from tools.lease import LeaseManager
+from tools.progress import formatSeconds, queueEta
+from tools.scheduler import PENDING, RUNNING, TaskGraph
+from tools.watcher import FolderWatcher
+
+#===============================================================================
+# GLOBALS
+#===============================================================================
+
+# Stages run concurrently once their dependencies are met. A single x264
+# encode will already use every core, so encodes are limited to one at a time.
+# Extracts and merges run on a pool of IO workers of their own, so they never
+# keep a conversion or encode waiting for a worker. mkvextract and mkvmerge
+# runs are limited per disk as they start, instead of one at a time, so movies
+# on different disks extract and merge at once.
+GRAPH_WORKERS = 4
+GRAPH_LIMITS = {'encode': 1}
+GRAPH_IO_KINDS = ['extract', 'merge']
+
+JOBS_FILE = './jobs.db'
+# Older versions of Ripmaster pickled every movie to these.
+PICKLE_FILES = ['./movies.p', './movies.p.bak']
+
+# Workers sharing toConvert keep their leases in this folder inside it. It has
+# no instruction set, so it's never mistaken for a movie folder.
+LEASE_DIR = '.leases'
+
+# How often the progress of running encodes is printed, in seconds.
+PROGRESS_INTERVAL = 60
+
+# How often the watch loop checks if it's been asked to stop, in seconds.
+WATCH_WAKE = 1
 
 #===============================================================================
 # FUNCTIONS
@@ -255,9 +573,23 @@ from tools import Config, Movie
 
 # Utility
 
-def _get_movies(dir):
-    """Gets the movies from the specified directory"""
-    movieList = []
+def _find_movies(dir):
+    """Lists the movie files in the specified directory, without probing them
+
+    Args:
+        dir : (str)
+            The directory to search for movie folders.
+
+    Raises:
+        N/A
+
+    Returns:
+        [(str, str, str)]
+            The root, movie folder and file name of every mkv found, the
+            arguments a Movie is built from.
+
+    """
+    found = []
 
     directories = os.listdir(dir)
     for d in directories:
@@ -267,16 +599,288 @@ def _get_movies(dir):
         files = os.listdir("{root}/{subdir}".format(root=dir, subdir=d))
         for f in files:
             # Don't add .mkv's that are handbrake encodes.
-            if '--converted' not in f and '.mkv' in f:
-                movie = Movie(dir, d, f)
-                movieList.append(movie)
+            if '--converted' in f or '.mkv' not in f:
+                continue
+            found.append((dir, d, f))
+
+    return found
+
+#===============================================================================
+
+def _get_movies(dir, known=None):
+    """Gets the movies from the specified directory that aren't known yet
+
+    Args:
+        dir : (str)
+            The directory to search for movie folders.
+
+        known=None : set(str)|None
+            Paths of movies that are already in progress. These are skipped
+            without building a Movie, so they're never probed again.
+
+    Raises:
+        N/A
+
+    Returns:
+        [<Movie>]
+            A Movie for every new mkv found.
+
+    The folders and file names are listed first, and only the paths not in
+    known are built into Movies. Since building a Movie runs mkvmerge, the
+    cost of a scan is the number of new movies, not the size of the library.
+
+    """
+    if known is None:
+        known = set()
+
+    movieList = []
+
+    for root, d, f in _find_movies(dir):
+        # Same path the Movie would have.
+        path = os.path.join(root, d, f).replace('\\', '/')
+        if path not in known:
+            movieList.append(Movie(root, d, f))
 
     return movieList
 
 #===============================================================================
 
+def _add_tasks(graph, movies, save):
+    """Adds a task to the graph for every stage left for the given movies
+
+    Args:
+        graph : <TaskGraph>
+            The graph to add to. It can already be running.
+
+        movies : [<Movie>]
+            Sorted list of movies to build stage tasks for. Tasks are added in
+            this order, which is the order ready tasks will be started in.
+
+        save : (callable)
+            Called with the movie after every stage completes, to checkpoint
+            its progress.
+
+    Raises:
+        N/A
+
+    Returns:
+        None
+
+    Each movie gets up to four tasks:
+
+        extract -> convert -> merge
+                   encode  -> merge
+
+    The Handbrake encode only needs the source, so it can start right away and
+    run alongside the subtitle extraction and conversion of every movie.
+    Stages that have already been completed don't get a task at all.
+
+    """
+    def stage(movie, method):
+        """Wraps a movie stage so we checkpoint after it completes"""
+        def run():
+            method()
+            save(movie)
+        return run
+
+    for movie in movies:
+        extract = convert = encode = None
+
+        if not movie.extracted:
+            extract = graph.addTask(
+                'extract ' + movie.path, stage(movie, movie.extractTracks),
+                kind='extract'
+            )
+        if not movie.converted:
+            convert = graph.addTask(
+                'convert ' + movie.path, stage(movie, movie.convertTracks),
+                deps=[extract], kind='convert'
+            )
+        if not movie.encoded:
+            # A chunked encode also checkpoints after every chunk.
+            encode = graph.addTask(
+                'encode ' + movie.path,
+                stage(
+                    movie,
+                    partial(movie.encodeMovie, checkpoint=partial(save, movie))
+                ),
+                kind='encode'
+            )
+        if not movie.merged:
+            graph.addTask(
+                'merge ' + movie.path, stage(movie, movie.mergeMovie),
+                deps=[convert, encode], kind='merge'
+            )
+
+#===============================================================================
+
+def _build_graph(movies, save, persistent=False):
+    """Builds the dependency graph of every stage left for the given movies
+
+    Args:
+        movies : [<Movie>]
+            Sorted list of movies to build stage tasks for.
+
+        save : (callable)
+            Called with the movie after every stage completes.
+
+        persistent=False : (bool)
+            If True, the graph keeps running once its tasks are done, so new
+            movies can be added to it.
+
+    Raises:
+        N/A
+
+    Returns:
+        <TaskGraph>
+            The graph, ready to run.
+
+    """
+    limits = dict(GRAPH_LIMITS)
+    workers = GRAPH_WORKERS
+    # Each encode slot can run a movie's encode, with a worker to wait on it.
+    if Config.encodeSlots > 1:
+        limits['encode'] = Config.encodeSlots
+        workers += Config.encodeSlots - 1
+
+    graph = TaskGraph(
+        workers=workers, limits=limits, persistent=persistent,
+        pools={'io': (Config.ioWorkers, GRAPH_IO_KINDS)}
+    )
+    _add_tasks(graph, movies, save)
+
+    return graph
+
+#===============================================================================
+
+def _graph_metrics(graphs):
+    """Returns the queue depth and running stages of each graph, as gauges"""
+    gauges = []
+    for graph in list(graphs):
+        for kind, states in graph.counts().items():
+            labels = {'stage': kind}
+            gauges.append(
+                ('ripmaster_queue_depth', labels, states.get(PENDING, 0))
+            )
+            gauges.append(
+                ('ripmaster_stages_running', labels, states.get(RUNNING, 0))
+            )
+    return gauges
+
+#===============================================================================
+
+def _start_metrics(graphs, config):
+    """Exports metrics over HTTP and to a textfile, as configured
+
+    Args:
+        graphs : [<TaskGraph>]
+            The graphs to report the queue depth of. Graphs added to it later
+            are reported too.
+
+        config : <Config>
+            Supplies the HTTP port, the textfile and how often to write it.
+
+    Raises:
+        N/A
+
+    Returns:
+        (callable)
+            Call it to stop exporting. The textfile is written one last time.
+
+    """
+    metrics.collect(partial(_graph_metrics, graphs))
+
+    server = None
+    if config.metricsPort:
+        try:
+            server = metrics.serve(config.metricsPort)
+        except socket.error, err:
+            print "Could not serve metrics on port {port}: {err}".format(
+                port=config.metricsPort, err=err
+            )
+        else:
+            print "Serving metrics on http://{host}:{port}/metrics".format(
+                host=metrics.HOST_DEFAULT, port=config.metricsPort
+            )
+
+    stop = threading.Event()
+
+    def write():
+        """Writes the textfile every interval, and once more when stopped"""
+        while True:
+            stopped = stop.wait(config.metricsInterval)
+            try:
+                metrics.writeTextfile(config.metricsFile)
+            except (IOError, OSError), err:
+                print "Could not write metrics to {file}: {err}".format(
+                    file=config.metricsFile, err=err
+                )
+            if stopped:
+                return
+
+    writer = None
+    if config.metricsFile:
+        writer = threading.Thread(target=write)
+        writer.daemon = True
+        writer.start()
+
+    def finish():
+        """Stops exporting"""
+        stop.set()
+        if writer:
+            writer.join()
+        if server:
+            server.shutdown()
+
+    return finish
+
+#===============================================================================
+
+def _migrate_pickle(store):
+    """Imports the movies.p an older Ripmaster wrote into an empty job store
+
+    Args:
+        store : (<JobStore>)
+            The job store to import into. Nothing is imported if it already
+            has movies.
+
+    Raises:
+        N/A
+
+    Returns:
+        None
+
+    movies.p is tried first, then its backup. Once imported, the pickle files
+    are renamed with a .migrated extension, so they aren't imported again.
+
+    """
+    if len(store):
+        return
+
+    for pickleFile in PICKLE_FILES:
+        if not os.path.exists(pickleFile):
+            continue
+        try:
+            count = store.importPickle(pickleFile)
+        except Exception:
+            print "{file} is damaged, skipping it.".format(file=pickleFile)
+            continue
+
+        print "Imported {count} movies from {file}".format(
+            count=count, file=pickleFile
+        )
+        break
+    else:
+        return
+
+    for pickleFile in PICKLE_FILES:
+        if os.path.exists(pickleFile):
+            os.rename(pickleFile, pickleFile + '.migrated')
+
+#===============================================================================
+
 def _sort_movies(movies, sorting, reverse):
-    """Sorts of the movies by quality, resolution or alphabetical
+    """Sorts of the movies by quality, resolution, estimate or alphabetical
 
     Args:
         movies : [<Movie>]
@@ -286,9 +890,9 @@ def _sort_movies(movies, sorting, reverse):
             Quality dictionary to get rf value of conversion out of.
 
         sorting : (str)
-            Type of sorting to use. Either 'quality', 'resolution' or
-            'alphabetical'. Any value other than quality of resolution will
-            also resolve to alphabetical.
+            Type of sorting to use. Either 'quality', 'resolution',
+            'shortest', 'longest', 'estimated_size' or 'alphabetical'. Any
+            other value will also resolve to alphabetical.
 
     Raises:
         N/A
@@ -309,17 +913,528 @@ def _sort_movies(movies, sorting, reverse):
         movies.sort(key=lambda mv: mv.quality, reverse=not reverse)
     elif sorting == 'resolution':
         movies.sort(key=lambda mv: mv.resolution, reverse=reverse)
+    elif sorting in ESTIMATED_SORTINGS:
+        print "Estimating encodes from samples:"
+        # Estimates are cached, so only new movies, or movies whose settings
+        # changed, are sampled.
+        for movie in movies:
+            movie.estimateEncode()
+            _print_estimate(movie)
+        print
+
+        if sorting == 'estimated_size':
+            key = lambda mv: mv.estimate.size
+        else:
+            key = lambda mv: mv.estimate.seconds
+        if sorting == 'longest':
+            reverse = not reverse
+
+        # Movies that couldn't be estimated go last, whichever way we sort.
+        known = [mv for mv in movies if getattr(mv, 'estimate', None)]
+        unknown = [mv for mv in movies if not getattr(mv, 'estimate', None)]
+        known.sort(key=key, reverse=reverse)
+        movies = known + unknown
     else:  # Alphabetical by directory name, which is the title.
         movies.sort(key=lambda mv: mv.subdir, reverse=reverse)
 
     return movies
 
+#===============================================================================
+
+def _watch(root, movies, graph, config, store):
+    """Runs the graph, adding new movies to it as they appear in root
+
+    Args:
+        root : (str)
+            The toConvert folder to watch.
+
+        movies : [<Movie>]
+            The movies in the graph. New movies are added to it.
+
+        graph : <TaskGraph>
+            A persistent graph holding the tasks of the movies so far.
+
+        config : <Config>
+            Supplies the watch settle and poll intervals.
+
+        store : <JobStore>
+            Every movie Ripmaster knows about. New movies are saved to it.
+
+    Raises:
+        N/A
+
+    Returns:
+        [<Task>]
+            The tasks that failed or were skipped because of a failure.
+
+    Runs until Ripmaster receives SIGTERM, or Ctrl+C is pressed. Stages that
+    are running then are allowed to finish and are saved, no new stages are
+    started, and the stages left are picked up the next time Ripmaster starts.
+
+    """
+    stop = threading.Event()
+
+    def terminate(signum, frame):
+        """Stops watching and stops the graph from starting new stages"""
+        print ""
+        print "Stopping. Waiting for running stages to finish..."
+        stop.set()
+        graph.stop()
+
+    signal.signal(signal.SIGTERM, terminate)
+    signal.signal(signal.SIGINT, terminate)
+
+    failed = []
+    runner = threading.Thread(target=lambda: failed.extend(graph.run()))
+    runner.daemon = True
+    runner.start()
+
+    watcher = FolderWatcher(
+        root,
+        known=store.paths(),
+        settle=config.watchSettle,
+        poll=config.watchPoll
+    )
+
+    print ""
+    print "Watching {root} for new movies...".format(root=root)
+
+    try:
+        while not stop.isSet():
+            for args in watcher.check(WATCH_WAKE):
+                try:
+                    movie = Movie(*args)
+                except Exception, err:
+                    print "Could not read {file}: {err}".format(
+                        file='/'.join(args[1:]), err=err
+                    )
+                    continue
+
+                movies.append(movie)
+                store.save(movie)
+
+                print "Queued new movie:", movie.path
+                _add_tasks(graph, [movie], store.save)
+    finally:
+        watcher.close()
+
+    # Joining with a timeout keeps us responsive to a second signal.
+    while runner.isAlive():
+        runner.join(1)
+
+    return failed
+
+#===============================================================================
+
+def _print_results(movies, failed):
+    """Prints the movies that were completed, and the tasks that failed"""
+    print ""
+    print "The following movies have been completed:"
+    for movie in movies:
+        if movie.merged:
+            print movie.path
+    print ""
+
+    if failed:
+        print "The following tasks failed or were skipped:"
+        for task in failed:
+            print task.name
+        print ""
+
+    slots = cpuSlots()
+    if slots and slots.averageFps():
+        print "Encode slots averaged {fps:.2f} fps together".format(
+            fps=slots.averageFps()
+        )
+        print ""
+
+#===============================================================================
+
+def _print_estimate(movie):
+    """Prints a movie's estimated encode time and size"""
+    estimate = getattr(movie, 'estimate', None)
+    if not estimate:
+        print "{path}: couldn't be estimated".format(path=movie.path)
+        return
+    if getattr(movie, 'remux', False):
+        print "{path}: remuxed, no encode".format(path=movie.path)
+        return
+
+    print "{path}: {time} to encode, {size:.1f} GB ({speed:.2f}x)".format(
+        path=movie.path,
+        time=formatSeconds(estimate.seconds),
+        size=estimate.size / 1000000000.0,
+        speed=estimate.speed
+    )
+
+#===============================================================================
+
+def _print_forecast(movies):
+    """Prints when each queued movie should finish, from the stage history
+
+    Args:
+        movies : [<Movie>]
+            Every movie in the queue, in the order they'll be run.
+
+    Raises:
+        N/A
+
+    Returns:
+        None
+
+    """
+    model = throughputModel()
+    if model is None:
+        return
+
+    jobs = []
+    for movie in movies:
+        stages = [
+            stage for stage, done in [
+                ('extract', movie.extracted), ('convert', movie.converted),
+                ('encode', movie.encoded), ('merge', movie.merged),
+            ] if not done
+        ]
+        jobs.append([stageRecord(movie, stage) for stage in stages])
+
+    finishes = forecast(jobs, model, max(1, Config.encodeSlots))
+
+    print "Forecast from the stage history:"
+    for movie, finish in zip(movies, finishes):
+        print "{path} done in {eta}".format(
+            path=movie.path, eta=formatSeconds(finish)
+        )
+    known = [finish for finish in finishes if finish is not None]
+    print "Every movie will be done in {eta}{unknown}".format(
+        eta=formatSeconds(max(known) if known else None),
+        unknown=(
+            ", not counting movies with no history to go on"
+            if len(known) < len(finishes) and known else ''
+        )
+    )
+    print
+
+#===============================================================================
+
+def _print_progress(movies, since, stallSeconds):
+    """Prints the progress of every running encode, and the queue's ETA
+
+    Args:
+        movies : [<Movie>]
+            Every movie in the queue.
+
+        since : (float)
+            When this Ripmaster started. Progress from before then was left
+            by an encode that's no longer running.
+
+        stallSeconds : (int)
+            An encode that hasn't moved in this many seconds is reported as
+            stalled.
+
+    Raises:
+        N/A
+
+    Returns:
+        None
+
+    """
+    movies = list(movies)
+    encoding = [
+        movie for movie in movies
+        if getattr(movie, 'progress', None) and not movie.encoded and
+        not movie.progress.finished and movie.progress.started >= since
+    ]
+    if not encoding:
+        return
+
+    print ""
+    for movie in encoding:
+        current = movie.progress
+        rates = [
+            '{0:.2f}'.format(fps) if fps else '--'
+            for fps in [current.fps, current.avgFps]
+        ]
+        print "Encoding {path}: {percent:.2f} % ({fps} fps, avg {avgFps} " \
+              "fps, ETA {eta})".format(
+            path=movie.path, percent=current.percent, fps=rates[0],
+            avgFps=rates[1], eta=formatSeconds(current.remaining())
+        )
+        if current.stalled(stallSeconds):
+            print "WARNING: HandBrake has made no progress on {path} in " \
+                  "{minutes} minutes. It may be stalled.".format(
+                path=movie.path,
+                minutes=int(time.time() - current.updated) // 60
+            )
+        _warn_slow(movie)
+
+    slots = cpuSlots()
+    if slots:
+        rates = [
+            '{0:.2f}'.format(fps) if fps else '--'
+            for fps in [slots.fps(), slots.averageFps()]
+        ]
+        print "Encode slots: {busy} of {total} busy ({fps} fps, avg {avgFps} " \
+              "fps)".format(
+            busy=slots.busy(), total=len(slots.slots), fps=rates[0],
+            avgFps=rates[1]
+        )
+
+    print "Every movie will be encoded in {eta}".format(
+        eta=formatSeconds(queueEta(movies))
+    )
+    print ""
+
+#===============================================================================
+
+def _warn_slow(movie):
+    """Warns if a running encode is much slower than encodes like it were"""
+    model = throughputModel()
+    if model is None or not Config.slowPercent:
+        return
+
+    fraction = model.slow(
+        stageRecord(movie, 'encode'), movie.progress.rate(),
+        Config.slowPercent / 100.0
+    )
+    if fraction:
+        print "WARNING: {path} is encoding at {percent}% of the speed of " \
+              "past encodes with the same settings. The machine may be " \
+              "throttling, or something else may be using it.".format(
+            path=movie.path, percent=int(fraction * 100)
+        )
+
+#===============================================================================
+
+def _start_monitor(movies, config):
+    """Prints encode progress every PROGRESS_INTERVAL, until told to stop
+
+    Args:
+        movies : [<Movie>]
+            Every movie in the queue. Movies added to it later are reported
+            too.
+
+        config : <Config>
+            Supplies the stall interval.
+
+    Raises:
+        N/A
+
+    Returns:
+        (<threading.Event>)
+            Set it to stop the monitor.
+
+    """
+    stop = threading.Event()
+    since = time.time()
+
+    def monitor():
+        """Prints progress until stopped"""
+        while not stop.wait(PROGRESS_INTERVAL):
+            _print_progress(movies, since, config.stallSeconds)
+
+    thread = threading.Thread(target=monitor)
+    thread.daemon = True
+    thread.start()
+
+    return stop
+
+#===============================================================================
+
+def _run_leased(leases, key, args, running, movies):
+    """Runs every stage left of a movie this worker holds the lease on
+
+    Args:
+        leases : <LeaseManager>
+            Holds the lease on the movie.
+
+        key : (str)
+            The movie's lease key.
+
+        args : (str, str, str)
+            The root, movie folder and file name to build the Movie from.
+
+        running : [<TaskGraph>]
+            The movie's graph is kept in this list while it runs, so it can be
+            stopped from a signal handler.
+
+        movies : [<Movie>]
+            The movie is added to this once it's built, so its progress can
+            be reported.
+
+    Raises:
+        N/A
+
+    Returns:
+        (<Movie>|None, [<Task>])
+            The movie, or None if it couldn't be read or the lease was lost
+            before it started, and the tasks that failed or were skipped
+            because of a failure.
+
+    The movie is picked up from the state the last worker to hold it
+    published, so stages it finished aren't run again. Each stage publishes
+    the movie as it finishes, and fails if the lease has been lost, so a
+    worker that was taken over never overwrites the new holder's progress.
+
+    """
+    path = os.path.join(*args).replace('\\', '/')
+    movie = leases.load(key)
+    # toConvert mounted somewhere else on the last worker's machine. Its
+    # progress would point at the wrong files, so we start over.
+    if movie is not None and movie.path != path:
+        movie = None
+
+    try:
+        if movie is None:
+            movie = Movie(*args)
+        else:
+            print "Resuming {path}".format(path=path)
+
+        # The lease can be lost while the movie's read. No stage may start
+        # unless it's still ours, or two workers would write the same files.
+        if not leases.publish(key, movie):
+            print "Lost the lease on {path}, skipping it".format(path=path)
+            return None, []
+        movies.append(movie)
+
+        def save(movie):
+            """Publishes the movie, if we still hold its lease"""
+            if not leases.publish(key, movie):
+                raise RuntimeError(
+                    "Lost the lease on {path}".format(path=movie.path)
+                )
+
+        graph = _build_graph([movie], save)
+        running.append(graph)
+        failed = graph.run()
+
+        if movie.merged:
+            leases.publish(key, movie, done=True)
+    except Exception, err:
+        print "Could not process {file}: {err}".format(file=key, err=err)
+        return None, []
+    finally:
+        del running[:]
+        leases.release(key)
+
+    return movie, failed
+
+#===============================================================================
+
+def _work(root, config, watch=False):
+    """Works through toConvert alongside any other workers sharing it
+
+    Args:
+        root : (str)
+            The toConvert folder, usually on a share every worker mounts.
+
+        config : <Config>
+            Supplies the lease and poll intervals.
+
+        watch=False : (bool)
+            If True, keeps waiting for new movies once every movie is done.
+
+    Raises:
+        N/A
+
+    Returns:
+        ([<Movie>], [<Task>])
+            The movies this worker worked on, and the tasks that failed or were
+            skipped because of a failure.
+
+    Movies are claimed one at a time by taking a lease on them in the .leases
+    folder of toConvert, so each is worked on by one worker, and each worker
+    moves on to the next unclaimed movie as soon as it's finished with one.
+    Once nothing is left to claim, the worker waits for the movies other
+    workers hold, taking over any whose lease runs out. Without watch, it
+    exits once there's nothing left but movies that failed.
+
+    Runs until Ripmaster receives SIGTERM or Ctrl+C, at which point the movie
+    being worked on is published as it stands, and its lease is released.
+
+    """
+    stop = threading.Event()
+    running = []
+
+    def terminate(signum, frame):
+        """Stops claiming movies and stops the current movie's graph"""
+        print ""
+        print "Stopping. Waiting for running stages to finish..."
+        stop.set()
+        for graph in running:
+            graph.stop()
+
+    signal.signal(signal.SIGTERM, terminate)
+    signal.signal(signal.SIGINT, terminate)
+
+    leases = LeaseManager(
+        os.path.join(root, LEASE_DIR), ttl=config.leaseSeconds
+    )
+
+    movies = []
+    failed = []
+    # Movies that failed here are left for other workers to try.
+    given = set()
+
+    print ""
+    print "Working on {root} as {owner}...".format(
+        root=root, owner=leases.owner
+    )
+
+    monitor = _start_monitor(movies, config)
+    stopMetrics = _start_metrics(running, config)
+
+    try:
+        while not stop.isSet():
+            waiting = False
+            claimed = None
+            for args in _find_movies(root):
+                key = '/'.join(args[1:])
+                if key in given or leases.isDone(key):
+                    continue
+                if leases.acquire(key):
+                    claimed = (key, args)
+                    break
+                waiting = True
+
+            if claimed:
+                key, args = claimed
+                print "Claimed {key}".format(key=key)
+                movie, movieFailed = _run_leased(
+                    leases, key, args, running, movies
+                )
+                if (movie is None or not movie.merged) and not stop.isSet():
+                    given.add(key)
+                failed.extend(movieFailed)
+                continue
+
+            if not waiting and not watch:
+                break
+
+            # Sleeping in short steps keeps us responsive to a signal.
+            for i in xrange(config.watchPoll):
+                if stop.wait(WATCH_WAKE):
+                    break
+    finally:
+        monitor.set()
+        stopMetrics()
+        leases.close()
+
+    return movies, failed
+
 #===============================================================================
 # MAIN
 #===============================================================================
 
-def main():
-    """Main app process. This controls every step of the process"""
+def main(watch=False, worker=False):
+    """Main app process. This controls every step of the process
+
+    If watch is True, Ripmaster keeps running and queues new movies as they
+    appear in toConvert, until it receives SIGTERM.
+
+    If worker is True, Ripmaster shares toConvert with other workers, claiming
+    one movie at a time.
+
+    """
     # TODO: Allow users to supply alt configs?
     try:
         config = Config('./Ripmaster.ini')
@@ -334,26 +1449,18 @@ def main():
 
     root = os.getcwd() + '/toConvert/'
 
-    # See if we can load from the main file.
-    try:
-        with open("./movies.p", "rb") as f:
-            movies = pickle.load(f)
-    except (IOError, EOFError):
-        # See if we have a backup copy.
-        print "No main movie file found. Loading from backup..."
-        try:
-            copyfile("./movies.p.bak", "./movies.p")
-        except IOError:
-            # If no backup exists, we're fresh as can be.
-            print "No backup found. Starting from scratch"
-            movies = []
-        else:
-            try:
-                with open("./movies.p", "rb") as f:
-                    movies = pickle.load(f)
-            except (IOError, EOFError):
-                print "Backup file is bad. Have to start from scratch."
-                movies = []
+    if worker:
+        # Progress is published to toConvert for every worker to see, so the
+        # local job store isn't used.
+        movies, failed = _work(root, config, watch=watch)
+        _print_results(movies, failed)
+        return
+
+    store = JobStore(JOBS_FILE)
+    _migrate_pickle(store)
+
+    # Finished movies stay in the store, but there's no need to load them.
+    movies = store.pending()
 
     print
     print "Found the following movies in progress:"
@@ -361,23 +1468,19 @@ def main():
         print entry.path
     print
 
-    newMovies = _get_movies(root)
-    duplicates = []
-
-    for movie in movies:
-        for raw in newMovies:
-            # If a movie that get_movies() found already matches a movie in our
-            # pickled list, we should remove it, otherwise we'll add it twice.
-            if movie.path == raw.path:
-                duplicates.append(raw)
-
-    for dup in duplicates:
-        newMovies.remove(dup)
+    if watch:
+        # MakeMKV may still be writing anything found now, so new movies are
+        # left for the watcher, which only queues them once they've settled.
+        newMovies = []
+    else:
+        # Movies already in the store are skipped by the scan, otherwise
+        # we'd probe them again and add them twice.
+        newMovies = _get_movies(root, store.paths())
+        store.add(newMovies)
 
     print
 
-    # Now that we've removed duplicates, we'll extend the main list of movie
-    # objects by the new movies found.
+    # Now we'll extend the main list of movie objects by the new movies found.
     movies.extend(newMovies)
 
     # Sort movies
@@ -386,48 +1489,48 @@ def main():
     print "Total movie list after adding new movies and sorting:"
     for entry in movies:
         print entry.path
+    print
 
-    with open("./movies.p.bak", "wb") as f:
-        pickle.dump(movies, f)
-    # Copy the temp file to the master
-    copyfile("./movies.p.bak", "./movies.p")
+    _print_forecast(movies)
 
-    for movie in movies:
-        if not movie.extracted:
-            movie.extractTracks()
-            with open("./movies.p.bak", "wb") as f:
-                pickle.dump(movies, f)
-        copyfile("./movies.p.bak", "./movies.p")
-    for movie in movies:
-        if not movie.converted:
-            movie.convertTracks()
-            with open("./movies.p.bak", "wb") as f:
-                pickle.dump(movies, f)
-        copyfile("./movies.p.bak", "./movies.p")
-    for movie in movies:
-        if not movie.encoded:
-            movie.encodeMovie()
-            with open("./movies.p.bak", "wb") as f:
-                pickle.dump(movies, f)
-        copyfile("./movies.p.bak", "./movies.p")
-        if not movie.merged:
-            movie.mergeMovie()
-            with open("./movies.p.bak", "wb") as f:
-                pickle.dump(movies, f)
-        copyfile("./movies.p.bak", "./movies.p")
+    graph = _build_graph(movies, store.save, persistent=watch)
+    monitor = _start_monitor(movies, config)
+    stopMetrics = _start_metrics([graph], config)
+    if watch:
+        failed = _watch(root, movies, graph, config, store)
+    else:
+        failed = graph.run()
+    monitor.set()
+    stopMetrics()
 
-    print ""
-    print "The following movies have been completed:"
-    for movie in movies:
-        print movie.path
-    print ""
+    _print_results(movies, failed)
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description='Converts and encodes the movies placed in toConvert.'
+    )
+    parser.add_argument(
+        '--watch', action='store_true',
+        help="keep running, queueing new movies as they're placed in "
+             "toConvert, until stopped with SIGTERM or Ctrl+C"
+    )
+    parser.add_argument(
+        '--worker', action='store_true',
+        help="share toConvert with other Ripmaster workers, each claiming "
+             "one movie at a time"
+    )
+    args = parser.parse_args()
+
+    # Services have no one to press enter.
+    interactive = not (args.watch or args.worker)
+
     try:
-        main()
+        main(watch=args.watch, worker=args.worker)
     except Exception, err:
         print err
-        raw_input('Press enter key to exit')
+        if interactive:
+            raw_input('Press enter key to exit')
 
-# Keep the shell up to show results
-raw_input('\n\nTask complete. Press enter to close')
\ No newline at end of file
+    if interactive:
+        # Keep the shell up to show results
+        raw_input('\n\nTask complete. Press enter to close')
\ No newline at end of file
@@ -0,0 +1,145 @@
+#/usr/bin/python
+# Ripmaster Job Store Benchmark
+# Times a stage checkpoint with the job store against pickling every movie
+"""
+Builds libraries of movies and times a single stage checkpoint, the way
+Ripmaster used to do it (pickle every movie to movies.p.bak, then copy that
+over movies.p) and with the job store (write the one movie that changed).
+
+Usage:
+
+    python benchmarks/bench_jobstore.py
+    python benchmarks/bench_jobstore.py --sizes 100 1000 10000
+"""
+
+#===============================================================================
+# IMPORTS
+#===============================================================================
+
+# Standard Imports
+import argparse
+import cPickle
+import os
+import shutil
+import sys
+import tempfile
+import time
+from shutil import copyfile
+
+sys.path.append('/'.join(os.path.realpath(__file__).split('/')[:-2]))
+
+# Ripmaster Imports
+import tools
+from tools.jobstore import JobStore
+
+#===============================================================================
+# GLOBALS
+#===============================================================================
+
+SIZES_DEFAULT = [100, 1000, 5000]
+CHECKPOINTS = 20
+
+#===============================================================================
+# FUNCTIONS
+#===============================================================================
+
+def fakeMkvInfo(movie):
+    """Stands in for mkvInfo with the tracks of a typical Blu-ray rip"""
+    def info(codec, language, default):
+        return {
+            'codec_id': codec, 'language': language,
+            'default_track': '1' if default else '0', 'forced_track': '0',
+        }
+
+    video = [[0, {'pixel_dimensions': '1920x1080'}]]
+    audio = [
+        tools.AudioTrack(movie, 1, 'dts', info('A_DTS', 'eng', True)),
+        tools.AudioTrack(movie, 2, 'ac3', info('A_AC3', 'eng', False)),
+    ]
+    subtitles = [
+        tools.SubtitleTrack(
+            movie, trackID, 'pgs', info('S_HDMV/PGS', language, not i)
+        )
+        for i, (trackID, language) in enumerate(
+            [(3, 'eng'), (4, 'fre'), (5, 'spa'), (6, 'eng')]
+        )
+    ]
+    return video, audio, subtitles
+
+#===============================================================================
+
+def buildLibrary(count):
+    """Builds count movies, without running mkvmerge"""
+    tools.mkvInfo = fakeMkvInfo
+    return [
+        tools.Movie('/toConvert', 'Movie {0}__1080'.format(i), 'Movie.mkv')
+        for i in xrange(count)
+    ]
+
+#===============================================================================
+
+def timePickle(root, movies):
+    """Times checkpoints that pickle every movie, then copy the file"""
+    pickleFile = os.path.join(root, 'movies.p')
+    start = time.time()
+    for i in xrange(CHECKPOINTS):
+        movies[i].extracted = True
+        with open(pickleFile + '.bak', 'wb') as f:
+            cPickle.dump(movies, f)
+        copyfile(pickleFile + '.bak', pickleFile)
+    return (time.time() - start) / CHECKPOINTS
+
+#===============================================================================
+
+def timeStore(root, movies):
+    """Times checkpoints that write the one movie that changed"""
+    store = JobStore(os.path.join(root, 'jobs.db'))
+    store.add(movies)
+    start = time.time()
+    for i in xrange(CHECKPOINTS):
+        movies[i].encoded = True
+        store.save(movies[i])
+    elapsed = (time.time() - start) / CHECKPOINTS
+
+    start = time.time()
+    pending = store.pending()
+    listed = time.time() - start
+
+    store.close()
+    return elapsed, listed, len(pending)
+
+#===============================================================================
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument(
+        '--sizes', type=int, nargs='+', default=SIZES_DEFAULT,
+        help='library sizes to time'
+    )
+    args = parser.parse_args()
+
+    header = '{0:>8} {1:>12} {2:>12} {3:>14}'
+    print header.format('movies', 'pickle', 'job store', 'list pending')
+
+    for size in args.sizes:
+        movies = buildLibrary(size)
+        # Most of a library is finished.
+        for movie in movies[CHECKPOINTS * 2:]:
+            movie.merged = True
+
+        root = tempfile.mkdtemp()
+        try:
+            pickled = timePickle(root, movies)
+            stored, listed, pending = timeStore(root, movies)
+        finally:
+            shutil.rmtree(root)
+
+        print header.format(
+            size,
+            '{0:.1f}ms'.format(pickled * 1000),
+            '{0:.1f}ms'.format(stored * 1000),
+            '{0:.1f}ms ({1})'.format(listed * 1000, pending)
+        )
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,275 @@
+#/usr/bin/python
+# Ripmaster Matroska Benchmark
+# Times reading Matroska headers directly against mkvmerge and mkvextract
+"""
+Builds a library of synthetic movies with the headers a Blu-ray rip has: a
+video track, a handful of audio and subtitle tracks with statistics tags,
+chapters, and the Cues. The Clusters between the headers and the Cues are a
+sparse hole, so each movie is as large as a real rip on disk without taking
+any space.
+
+Each movie's tracks and chapters are then read with the native reader, and,
+if mkvmerge and mkvextract are given, by running them the way mkvInfo() and
+mkvChapters() do.
+
+Usage:
+
+    python benchmarks/bench_matroska.py
+    python benchmarks/bench_matroska.py --files 500 \\
+        --mkvmerge /usr/bin/mkvmerge --mkvextract /usr/bin/mkvextract
+"""
+
+#===============================================================================
+# IMPORTS
+#===============================================================================
+
+# Standard Imports
+import argparse
+import os
+import random
+import shutil
+import struct
+import sys
+import tempfile
+import time
+
+sys.path.append('/'.join(os.path.realpath(__file__).split('/')[:-2]))
+# The test helpers that write Matroska elements.
+sys.path.append(
+    '/'.join(os.path.realpath(__file__).split('/')[:-2] + ['tools', 'tests'])
+)
+
+# Ripmaster Imports
+import tools
+from tools import matroska
+from tests_matroska import element
+
+#===============================================================================
+# GLOBALS
+#===============================================================================
+
+FILES_DEFAULT = 200
+# Bytes of Clusters in each movie, about a full length 1080p rip
+MOVIE_BYTES = 30 * 1024 ** 3
+# A cue every second of a two hour movie, for the video track
+CUE_POINTS = 7200
+CHAPTERS = 32
+
+TRACKS = [
+    (1, 'V_MPEG4/ISO/AVC', 'eng'),
+    (2, 'A_TRUEHD', 'eng'),
+    (2, 'A_AC3', 'eng'),
+    (2, 'A_DTS', 'fre'),
+    (2, 'A_AC3', 'spa'),
+    (0x11, 'S_HDMV/PGS', 'eng'),
+    (0x11, 'S_HDMV/PGS', 'eng'),
+    (0x11, 'S_HDMV/PGS', 'fre'),
+    (0x11, 'S_HDMV/PGS', 'spa'),
+    (0x11, 'S_HDMV/PGS', 'ger'),
+    (0x11, 'S_HDMV/PGS', 'jpn'),
+]
+
+#===============================================================================
+# FUNCTIONS
+#===============================================================================
+
+def _masterHeader(elementId, size):
+    """Returns the header of an element, without writing its data"""
+    return struct.pack('>I', elementId) + '\x01' + struct.pack('>Q', size)[1:]
+
+#===============================================================================
+
+def buildMovie(path, rand):
+    """Writes a movie's headers around a sparse hole of Clusters
+
+    Args:
+        path : (str)
+            The file to write.
+
+        rand : (<random.Random>)
+            Picks the sizes the statistics tags give.
+
+    Returns:
+        None
+
+    """
+    entries = []
+    tags = []
+    for number, (trackType, codec, language) in enumerate(TRACKS, 1):
+        extra = []
+        if trackType == 1:
+            extra.append(element(matroska.VIDEO, [
+                element(matroska.PIXEL_WIDTH, 1920),
+                element(matroska.PIXEL_HEIGHT, 1080),
+            ]))
+            extra.append(element(matroska.CODEC_PRIVATE, '\x01' * 44))
+        elif trackType == 2:
+            extra.append(element(matroska.AUDIO, [
+                element(matroska.SAMPLING_FREQUENCY, 48000.0),
+                element(matroska.CHANNELS, 6),
+            ]))
+        entries.append(element(matroska.TRACK_ENTRY, [
+            element(matroska.TRACK_NUMBER, number),
+            element(matroska.TRACK_UID, number),
+            element(matroska.TRACK_TYPE, trackType),
+            element(matroska.CODEC_ID, codec),
+            element(matroska.LANGUAGE, language),
+        ] + extra))
+        tags.append(element(matroska.TAG, [
+            element(matroska.TARGETS, [element(matroska.TAG_TRACK_UID, number)])
+        ] + [
+            element(matroska.SIMPLE_TAG, [
+                element(matroska.TAG_NAME, name),
+                element(matroska.TAG_STRING, str(rand.randrange(1, 2 ** 34))),
+            ]) for name in matroska.STATISTICS_TAGS
+        ]))
+
+    info = element(matroska.INFO, [
+        element(matroska.TIMECODE_SCALE, 1000000),
+        element(matroska.DURATION, CUE_POINTS * 1000.0),
+    ])
+    tracks = element(matroska.TRACKS, entries)
+    chapters = element(matroska.CHAPTERS, [
+        element(matroska.EDITION_ENTRY, [
+            element(matroska.CHAPTER_ATOM, [
+                element(
+                    matroska.CHAPTER_TIME_START,
+                    chapter * CUE_POINTS * 1000000000 // CHAPTERS
+                )
+            ]) for chapter in xrange(CHAPTERS)
+        ])
+    ])
+    tags = element(matroska.TAGS, tags)
+
+    # The SeekHead is written at a fixed size, so the positions it gives can
+    # be worked out before it's filled in.
+    def seekHead(positions):
+        return element(matroska.SEEK_HEAD, [
+            element(matroska.SEEK, [
+                element(matroska.SEEK_ID, struct.pack('>I', elementId)),
+                element(matroska.SEEK_POSITION, struct.pack('>Q', position)),
+            ]) for elementId, position in positions
+        ])
+
+    ids = [matroska.INFO, matroska.TRACKS, matroska.CUES, matroska.CHAPTERS,
+           matroska.TAGS]
+    offset = len(seekHead([(elementId, 0) for elementId in ids]))
+    positions = {matroska.INFO: offset}
+    offset += len(info)
+    positions[matroska.TRACKS] = offset
+    offset += len(tracks)
+    cluster = offset
+    # The Clusters, as one element of the size they'd all add up to
+    offset += 12 + MOVIE_BYTES
+    cues = element(matroska.CUES, [
+        element(matroska.CUE_POINT, [
+            element(matroska.CUE_TIME, second * 1000),
+            element(matroska.CUE_TRACK_POSITIONS, [
+                element(matroska.CUE_TRACK, 1),
+                element(
+                    matroska.CUE_CLUSTER_POSITION,
+                    cluster + second * MOVIE_BYTES // CUE_POINTS
+                ),
+            ]),
+        ]) for second in xrange(CUE_POINTS)
+    ])
+    positions[matroska.CUES] = offset
+    offset += len(cues)
+    positions[matroska.CHAPTERS] = offset
+    offset += len(chapters)
+    positions[matroska.TAGS] = offset
+    offset += len(tags)
+
+    header = element(matroska.EBML, [element(matroska.DOC_TYPE, 'matroska')])
+    with open(path, 'wb') as f:
+        f.write(header + _masterHeader(matroska.SEGMENT, offset))
+        f.write(seekHead([(eid, positions[eid]) for eid in ids]))
+        f.write(info + tracks)
+        f.write(_masterHeader(matroska.CLUSTER, MOVIE_BYTES))
+        f.seek(MOVIE_BYTES, os.SEEK_CUR)
+        f.write(cues + chapters + tags)
+
+#===============================================================================
+
+def timeNative(paths):
+    """Times reading every movie's tracks and chapters directly"""
+    start = time.time()
+    for path in paths:
+        with matroska.MatroskaFile(path) as mkv:
+            mkv.duration()
+            mkv.tracks()
+            mkv.chapters()
+    return time.time() - start
+
+#===============================================================================
+
+def timeCues(paths):
+    """Times reading every movie's Cues directly"""
+    start = time.time()
+    for path in paths:
+        with matroska.MatroskaFile(path) as mkv:
+            mkv.cues()
+    return time.time() - start
+
+#===============================================================================
+
+def timeTools(paths):
+    """Times listing every movie's tracks and chapters with MKVToolNix"""
+    start = time.time()
+    for path in paths:
+        tools._mkvProbe(path)
+        tools.mkvChapters(path)
+    return time.time() - start
+
+#===============================================================================
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument(
+        '--files', type=int, default=FILES_DEFAULT,
+        help='number of movies in the library'
+    )
+    parser.add_argument(
+        '--runs', type=int, default=3, help='runs of each, best is kept'
+    )
+    parser.add_argument('--mkvmerge', help='mkvmerge, to time it against')
+    parser.add_argument('--mkvextract', help='mkvextract, to time it against')
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp()
+    try:
+        rand = random.Random(1)
+        paths = []
+        for i in xrange(args.files):
+            path = os.path.join(root, 'Movie{0}.mkv'.format(i))
+            buildMovie(path, rand)
+            paths.append(path)
+
+        tracks = len(matroska.probe(paths[0])[1])
+        print "{count} movies of {size}GB, {tracks} tracks each".format(
+            count=args.files, size=MOVIE_BYTES // 1024 ** 3, tracks=tracks
+        )
+
+        native = min([timeNative(paths) for i in xrange(args.runs)])
+        print "native:         {0:.3f}s ({1:.2f}ms per movie)".format(
+            native, native / args.files * 1000
+        )
+
+        cues = min([timeCues(paths) for i in xrange(args.runs)])
+        print "native cues:    {0:.3f}s ({1:.2f}ms per movie, {2} cues)".format(
+            cues, cues / args.files * 1000, CUE_POINTS
+        )
+
+        if args.mkvmerge and args.mkvextract:
+            tools.Config.mkvMerge = args.mkvmerge
+            tools.Config.mkvExtract = args.mkvextract
+            mkvtoolnix = min([timeTools(paths) for i in xrange(args.runs)])
+            print "mkvtoolnix:     {0:.3f}s ({1:.2f}ms per movie)".format(
+                mkvtoolnix, mkvtoolnix / args.files * 1000
+            )
+            print "speedup:        {0:.1f}x".format(mkvtoolnix / native)
+    finally:
+        shutil.rmtree(root)
+
+if __name__ == '__main__':
+    main()
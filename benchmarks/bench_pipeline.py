@@ -0,0 +1,450 @@
+#/usr/bin/python
+# Ripmaster Pipeline Benchmark
+# Times Ripmaster from scan to merge, with stand in media tools
+"""
+Builds a toConvert folder of thousands of movie folders, writes a Ripmaster.ini
+that points at the stand in tools in stub_tools.py, and runs every movie
+through Ripmaster the way main() does: scan toConvert, add the new movies to
+the job store, then extract, convert, encode and merge them all. Nothing but
+the stand in tools is faked, so the times are Ripmaster's own overhead and
+scheduling, plus whatever the cost model says the tools take.
+
+Reported:
+
+    scan        Finding and probing every new movie.
+    persistence Adding the new movies to the job store, and every checkpoint
+                after a stage.
+    stages      The latency of each stage, per movie.
+    pipeline    The time from the first stage to the last merge, and the
+                movies merged per minute.
+
+The results can be saved as JSON with --save. Given a --baseline saved the
+same way, any time that's grown, or throughput that's dropped, by more than
+--threshold is reported, and the benchmark exits with 1. Times that differ by
+less than a few milliseconds are left out, since they're within the noise of
+starting a process.
+
+The cost model is stub_tools.COSTS_DEFAULT and MEDIA_DEFAULT, and can be
+changed with a JSON file given to --costs, like:
+
+    {"costs": {"encode": {"start": 0.5}}, "media": {"subtitles": 4}}
+
+The stand in tools are shell scripts, so this only runs on Linux and OS X.
+
+Usage:
+
+    python benchmarks/bench_pipeline.py
+    python benchmarks/bench_pipeline.py --folders 5000 --save base.json
+    python benchmarks/bench_pipeline.py --baseline base.json --threshold 0.1
+"""
+
+#===============================================================================
+# IMPORTS
+#===============================================================================
+
+# Standard Imports
+import argparse
+from contextlib import contextmanager
+import json
+import os
+import re
+import shutil
+import stat
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.append('/'.join(os.path.realpath(__file__).split('/')[:-2]))
+
+# Ripmaster Imports
+import Ripmaster
+import tools
+from tools.jobstore import JobStore
+
+#===============================================================================
+# GLOBALS
+#===============================================================================
+
+FOLDERS_DEFAULT = 250
+SIZE_DEFAULT = 4 * 1024  # MB, sparse
+CHUNKS_DEFAULT = 1
+THRESHOLD_DEFAULT = 0.2
+# Differences smaller than this many seconds are never regressions.
+NOISE = 0.005
+
+STUBS = os.path.join(
+    os.path.dirname(os.path.realpath(__file__)), 'stub_tools.py'
+)
+# Ripmaster.ini option: the tool stub_tools.py plays
+PROGRAMS = {
+    'HandbrakeCLI': 'HandBrakeCLI',
+    'Java': 'java',
+    'mkvExtract': 'mkvextract',
+    'mkvMerge': 'mkvmerge',
+}
+
+STAGES = ['extract', 'convert', 'encode', 'merge']
+
+#===============================================================================
+# CLASSES
+#===============================================================================
+
+class Latencies(object):
+    """Collects how long each call of each stage takes, from any thread"""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.seconds = {}
+
+    def add(self, name, seconds):
+        with self.lock:
+            self.seconds.setdefault(name, []).append(seconds)
+
+    def timed(self, name, func):
+        """Wraps func so every call is added under name"""
+        def run(*args, **kwargs):
+            start = time.time()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.add(name, time.time() - start)
+        return run
+
+LATENCIES = Latencies()
+
+#===============================================================================
+
+class TimedMovie(tools.Movie):
+    """A real Movie, with every stage timed"""
+    extractTracks = LATENCIES.timed('extract', tools.Movie.extractTracks)
+    convertTracks = LATENCIES.timed('convert', tools.Movie.convertTracks)
+    encodeMovie = LATENCIES.timed('encode', tools.Movie.encodeMovie)
+    mergeMovie = LATENCIES.timed('merge', tools.Movie.mergeMovie)
+
+#===============================================================================
+# FUNCTIONS
+#===============================================================================
+
+def buildLibrary(root, count, size):
+    """Writes count movie folders, each with a sparse movie of size MB"""
+    for i in xrange(count):
+        subdir = os.path.join(root, 'Movie {0:05d}__1080_hq'.format(i))
+        os.mkdir(subdir)
+        with open(os.path.join(subdir, 'Movie.mkv'), 'wb') as f:
+            f.truncate(size * 1024 * 1024)
+
+#===============================================================================
+
+def buildTools(root, model):
+    """Writes the cost model, and a script running each stand in tool
+
+    Returns:
+        {str: str}
+            The path of each tool's script, by its Ripmaster.ini option.
+
+    """
+    costs = os.path.join(root, 'costs.json')
+    with open(costs, 'w') as f:
+        json.dump(model, f)
+
+    bin = os.path.join(root, 'bin')
+    os.mkdir(bin)
+
+    programs = {'BDSupToSub': os.path.join(bin, 'BDSup2Sub.jar')}
+    for option, tool in PROGRAMS.items():
+        path = os.path.join(bin, tool)
+        with open(path, 'w') as f:
+            f.write('#!/bin/sh\nexec "{python}" -S "{stubs}" "{costs}" {tool} '
+                    '"$@"\n'.format(python=sys.executable, stubs=STUBS,
+                                    costs=costs, tool=tool))
+        os.chmod(path, os.stat(path).st_mode | stat.S_IXUSR)
+        programs[option] = path
+
+    return programs
+
+#===============================================================================
+
+def buildConfig(path, programs, chunks):
+    """Writes a Ripmaster.ini running the given programs"""
+    config = tools.SAMPLE_CONFIG
+    settings = dict(programs)
+    settings['encode_Chunks'] = chunks
+    for option, value in settings.items():
+        config = re.sub(
+            r'(?m)^{0}:.*$'.format(option),
+            '{0}: {1}'.format(option, value).replace('\\', '\\\\'),
+            config
+        )
+
+    with open(path, 'w') as f:
+        f.write(config)
+
+#===============================================================================
+
+def compare(results, baseline, threshold):
+    """Returns a line for each result that regressed past the baseline
+
+    Times regress by growing, and movies per minute by dropping.
+
+    """
+    regressions = []
+    for name, value in sorted(flatten(results).items()):
+        old = flatten(baseline).get(name)
+        if old is None or value is None:
+            continue
+        leaf = name.split('.')[-1]
+        if leaf == 'moviesPerMinute':
+            worse = old - value
+        elif leaf in ['seconds', 'mean', 'p50', 'p95']:
+            worse = value - old
+            if worse < NOISE:
+                continue
+        else:
+            continue
+        if worse > threshold * old:
+            regressions.append(
+                '{name}: {old:.4f} -> {new:.4f} ({change:+.1%})'.format(
+                    name=name, old=old, new=value,
+                    change=(value - old) / old if old else 0
+                )
+            )
+
+    return regressions
+
+#===============================================================================
+
+def flatten(results, prefix=''):
+    """Flattens the results into {'stages.encode.p95': value}, leaving out
+    the settings"""
+    flat = {}
+    for key, value in results.items():
+        if not prefix and key == 'settings':
+            continue
+        if isinstance(value, dict):
+            flat.update(flatten(value, prefix + key + '.'))
+        else:
+            flat[prefix + key] = value
+    return flat
+
+#===============================================================================
+
+@contextmanager
+def quiet():
+    """Sends our stdout, and the stand in tools', to devnull"""
+    sys.stdout.flush()
+    held = os.dup(1)
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    os.dup2(devnull, 1)
+    os.close(devnull)
+    try:
+        yield
+    finally:
+        sys.stdout.flush()
+        os.dup2(held, 1)
+        os.close(held)
+
+#===============================================================================
+
+def summarize(seconds):
+    """Returns the runs, mean, median, 95th percentile and total of seconds"""
+    if not seconds:
+        return {'runs': 0, 'mean': None, 'p50': None, 'p95': None, 'total': 0}
+    seconds = sorted(seconds)
+    return {
+        'runs': len(seconds),
+        'mean': sum(seconds) / len(seconds),
+        'p50': seconds[len(seconds) // 2],
+        'p95': seconds[min(len(seconds) - 1, int(len(seconds) * 0.95))],
+        'total': sum(seconds),
+    }
+
+#===============================================================================
+
+def runPipeline(root):
+    """Runs every movie in root/toConvert through Ripmaster, timing each phase
+
+    Follows main(), without the console output. Each phase is timed on its
+    own, so a change to one shows up on its own.
+
+    """
+    toConvert = os.path.join(root, 'toConvert') + '/'
+    start = time.time()
+
+    config = tools.Config(os.path.join(root, 'Ripmaster.ini'))
+    store = JobStore(Ripmaster.JOBS_FILE)
+
+    scanStart = time.time()
+    movies = Ripmaster._get_movies(toConvert, store.paths())
+    scan = time.time() - scanStart
+
+    addStart = time.time()
+    store.add(movies)
+    add = time.time() - addStart
+
+    movies = Ripmaster._sort_movies(
+        movies, config.sorting, config.sortingReverse
+    )
+    graph = Ripmaster._build_graph(movies, LATENCIES.timed('save', store.save))
+
+    pipelineStart = time.time()
+    failed = graph.run()
+    pipeline = time.time() - pipelineStart
+
+    store.close()
+    merged = len([movie for movie in movies if movie.merged])
+
+    stages = {}
+    for stage in STAGES:
+        stages[stage] = summarize(LATENCIES.seconds.get(stage, []))
+
+    return {
+        'scan': {
+            'seconds': scan,
+            'movies': len(movies),
+            'perMovie': scan / len(movies) if movies else None,
+        },
+        'persistence': {
+            'add': {'seconds': add},
+            'save': summarize(LATENCIES.seconds.get('save', [])),
+        },
+        'stages': stages,
+        'pipeline': {
+            'seconds': pipeline,
+            'merged': merged,
+            'failed': len(failed),
+            'moviesPerMinute': merged / pipeline * 60 if pipeline else None,
+        },
+        'total': {'seconds': time.time() - start},
+    }
+
+#===============================================================================
+
+def report(results):
+    """Prints the results as tables"""
+    scan = results['scan']
+    print '{movies} movies scanned in {seconds:.2f}s ({each:.1f}ms ' \
+          'each)'.format(
+        movies=scan['movies'], seconds=scan['seconds'],
+        each=(scan['perMovie'] or 0) * 1000
+    )
+    print 'Added to the job store in {0:.3f}s'.format(
+        results['persistence']['add']['seconds']
+    )
+    print ''
+
+    header = '{0:<10} {1:>7} {2:>10} {3:>10} {4:>10} {5:>10}'
+    print header.format('stage', 'runs', 'mean', 'p50', 'p95', 'total')
+    rows = [(stage, results['stages'][stage]) for stage in STAGES]
+    rows.append(('checkpoint', results['persistence']['save']))
+    for name, summary in rows:
+        print header.format(
+            name, summary['runs'],
+            *['{0:.1f}ms'.format(summary[key] * 1000)
+              if summary[key] is not None else '-'
+              for key in ['mean', 'p50', 'p95', 'total']]
+        )
+    print ''
+
+    pipeline = results['pipeline']
+    print '{merged} movies merged in {seconds:.2f}s ({rate:.1f}/min), ' \
+          '{failed} stages failed'.format(
+              merged=pipeline['merged'], seconds=pipeline['seconds'],
+              rate=pipeline['moviesPerMinute'] or 0, failed=pipeline['failed']
+          )
+    print 'Total: {0:.2f}s'.format(results['total']['seconds'])
+
+#===============================================================================
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument(
+        '--folders', type=int, default=FOLDERS_DEFAULT,
+        help='movie folders in toConvert'
+    )
+    parser.add_argument(
+        '--size', type=int, default=SIZE_DEFAULT,
+        help='size of each movie in MB. Movies are sparse files.'
+    )
+    parser.add_argument(
+        '--chunks', type=int, default=CHUNKS_DEFAULT,
+        help='encode_Chunks to run with'
+    )
+    parser.add_argument(
+        '--costs',
+        help='JSON file of costs and media, over the stub_tools defaults'
+    )
+    parser.add_argument(
+        '--write', action='store_true',
+        help='have the stand in tools write every byte of their output'
+    )
+    parser.add_argument(
+        '--save', help='write the results to this JSON file'
+    )
+    parser.add_argument(
+        '--baseline', help='JSON results to check for regressions against'
+    )
+    parser.add_argument(
+        '--threshold', type=float, default=THRESHOLD_DEFAULT,
+        help='fraction a result can regress by before failing'
+    )
+    args = parser.parse_args()
+
+    model = {'costs': {}, 'media': {}}
+    if args.costs:
+        with open(args.costs) as f:
+            model.update(json.load(f))
+    model['writeData'] = args.write
+
+    settings = {
+        'folders': args.folders, 'size': args.size, 'chunks': args.chunks,
+        'model': model,
+    }
+
+    root = tempfile.mkdtemp()
+    cwd = os.getcwd()
+    try:
+        os.mkdir(os.path.join(root, 'toConvert'))
+        buildLibrary(os.path.join(root, 'toConvert'), args.folders, args.size)
+        programs = buildTools(root, model)
+        buildConfig(os.path.join(root, 'Ripmaster.ini'), programs, args.chunks)
+
+        Ripmaster.Movie = TimedMovie
+        # Ripmaster keeps its job store, and writes merged movies, in the
+        # working folder.
+        os.chdir(root)
+        with quiet():
+            results = runPipeline(root)
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(root)
+
+    results['settings'] = settings
+    report(results)
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=4, sort_keys=True)
+
+    failed = bool(results['pipeline']['failed'])
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        print ''
+        if baseline.get('settings') != settings:
+            print 'The baseline was run with different settings:'
+            print json.dumps(baseline.get('settings'), sort_keys=True)
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print 'Regressed by more than {0:.0%}:'.format(args.threshold)
+            for line in regressions:
+                print '    ' + line
+            failed = True
+        else:
+            print 'No regressions past {0:.0%}'.format(args.threshold)
+
+    if failed:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
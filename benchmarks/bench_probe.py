@@ -0,0 +1,236 @@
+#/usr/bin/python
+# Ripmaster Probe Benchmark
+# Times parsing mkvmerge -I track lines against mkvmerge's JSON identification
+"""
+Builds thousands of synthetic tracks, written both as mkvmerge -I track lines
+and as mkvmerge's JSON identification, then times turning them into track
+dictionaries with _trackInfo and with _jsonTrackInfo.
+
+It then fills a probe cache for a library of stand in movie files, and times
+looking every one of them up again, the way a restart of Ripmaster would.
+
+Usage:
+
+    python benchmarks/bench_probe.py
+    python benchmarks/bench_probe.py --tracks 20000 --files 10000
+"""
+
+#===============================================================================
+# IMPORTS
+#===============================================================================
+
+# Standard Imports
+import argparse
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.append('/'.join(os.path.realpath(__file__).split('/')[:-2]))
+
+# Ripmaster Imports
+import tools
+from tools import probecache
+
+#===============================================================================
+# GLOBALS
+#===============================================================================
+
+FILES_DEFAULT = 2000
+TRACKS_DEFAULT = 5000
+# Tracks in each cached probe, about what a Blu-ray rip has.
+TRACKS_PER_FILE = 12
+
+CODECS = [
+    ('video', 'V_MPEG4/ISO/AVC'),
+    ('audio', 'A_DTS'),
+    ('audio', 'A_TRUEHD'),
+    ('audio', 'A_AC3'),
+    ('subtitles', 'S_HDMV/PGS'),
+]
+LANGUAGES = ['eng', 'fre', 'spa', 'ger', 'jpn']
+
+#===============================================================================
+# FUNCTIONS
+#===============================================================================
+
+def buildTracks(count):
+    """Builds count tracks, as -I lines and as a JSON identification
+
+    Args:
+        count : (int)
+            Number of tracks to build.
+
+    Returns:
+        [str], (str)
+            The mkvmerge -I track lines, and the JSON document.
+
+    """
+    rand = random.Random(1)
+
+    lines = []
+    tracks = []
+    for trackID in xrange(count):
+        trackType, codec = rand.choice(CODECS)
+        properties = {
+            'number': trackID + 1,
+            'uid': rand.randrange(1, 2 ** 32),
+            'codec_id': codec,
+            'codec_private_length': rand.choice([0, 44, 348]),
+            'language': rand.choice(LANGUAGES),
+            'default_track': rand.random() < 0.2,
+            'forced_track': rand.random() < 0.1,
+            'enabled_track': True,
+            'tag_number_of_bytes': str(rand.randrange(1, 2 ** 34)),
+        }
+        if trackType == 'video':
+            properties['pixel_dimensions'] = '1920x1080'
+            properties['display_dimensions'] = '1920x1080'
+        elif trackType == 'audio':
+            properties['audio_sampling_frequency'] = 48000
+            properties['audio_channels'] = 6
+
+        tracks.append(
+            {'id': trackID, 'type': trackType, 'codec': codec,
+             'properties': properties}
+        )
+
+        entries = []
+        for key, value in sorted(properties.items()):
+            if isinstance(value, bool):
+                value = int(value)
+            entries.append('{key}:{value}'.format(key=key, value=value))
+        lines.append(
+            'Track ID {id}: {type} ({codec}) [{entries}]\r\n'.format(
+                id=trackID,
+                type=trackType,
+                codec=codec,
+                entries=' '.join(entries)
+            )
+        )
+
+    document = json.dumps(
+        {'container': {'properties': {'duration': 5767563000000}},
+         'tracks': tracks}
+    )
+
+    return lines, document
+
+#===============================================================================
+
+def timeCache(root, count, document):
+    """Times filling a probe cache for count files, then reading it all back
+
+    Args:
+        root : (str)
+            Directory to write the stand in files and cache to.
+
+        count : (int)
+            Number of files.
+
+        document : (str)
+            JSON identification to take each file's tracks from.
+
+    Returns:
+        (float), (float)
+            Seconds to store every probe, and to look every file up again
+            from a freshly opened cache.
+
+    """
+    tracks = [
+        tools._jsonTrackInfo(track) for track in json.loads(document)['tracks']
+    ][:TRACKS_PER_FILE]
+
+    files = []
+    for i in xrange(count):
+        path = os.path.join(root, 'Movie{0}.mkv'.format(i))
+        with open(path, 'wb') as f:
+            f.write(str(i))
+        files.append(path)
+
+    db = os.path.join(root, 'probes.db')
+    cache = probecache.ProbeCache(db, count)
+    start = time.time()
+    for path in files:
+        cache.put(path, ('5767563000000', tracks))
+    stored = time.time() - start
+    cache.close()
+
+    cache = probecache.ProbeCache(db, count)
+    start = time.time()
+    for path in files:
+        assert cache.get(path)
+    found = time.time() - start
+    cache.close()
+
+    return stored, found
+
+#===============================================================================
+
+def timeJson(document):
+    """Times parsing the JSON document and every track in it"""
+    start = time.time()
+    for track in json.loads(document)['tracks']:
+        tools._jsonTrackInfo(track)
+    return time.time() - start
+
+#===============================================================================
+
+def timeLines(lines):
+    """Times parsing every -I track line"""
+    start = time.time()
+    for line in lines:
+        tools._trackInfo(line)
+    return time.time() - start
+
+#===============================================================================
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument(
+        '--tracks', type=int, default=TRACKS_DEFAULT,
+        help='number of synthetic tracks'
+    )
+    parser.add_argument(
+        '--files', type=int, default=FILES_DEFAULT,
+        help='number of files in the probe cache'
+    )
+    parser.add_argument(
+        '--runs', type=int, default=5, help='runs of each, best is kept'
+    )
+    args = parser.parse_args()
+
+    lines, document = buildTracks(args.tracks)
+
+    legacy = min([timeLines(lines) for i in xrange(args.runs)])
+    native = min([timeJson(document) for i in xrange(args.runs)])
+
+    print "{count} tracks".format(count=args.tracks)
+    print "mkvmerge -I:    {0:.3f}s ({1:.1f}us per track)".format(
+        legacy, legacy / args.tracks * 1000000
+    )
+    print "mkvmerge JSON:  {0:.3f}s ({1:.1f}us per track)".format(
+        native, native / args.tracks * 1000000
+    )
+    print "speedup:        {0:.1f}x".format(legacy / native)
+    print ""
+
+    root = tempfile.mkdtemp()
+    try:
+        stored, found = timeCache(root, args.files, document)
+    finally:
+        shutil.rmtree(root)
+
+    print "{count} cached files".format(count=args.files)
+    print "cache fill:     {0:.3f}s ({1:.1f}us per file)".format(
+        stored, stored / args.files * 1000000
+    )
+    print "cache lookup:   {0:.3f}s ({1:.1f}us per file)".format(
+        found, found / args.files * 1000000
+    )
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,148 @@
+#/usr/bin/python
+# Ripmaster Scan Benchmark
+# Times finding new movies in a large toConvert folder with saved state
+"""
+Builds a toConvert folder with thousands of movie folders, most of which are
+already in progress, then times finding the new ones the way Ripmaster used to
+(build a Movie for every file, then drop the ones already known with a nested
+loop) and the way it does now (skip known paths before building a Movie).
+
+Building a Movie runs mkvmerge, which isn't timed here. A stand in Movie
+records how many would have been built instead, and --probe adds a fixed cost
+to each to show what a real mkvmerge launch does to the totals.
+
+Usage:
+
+    python benchmarks/bench_scan.py
+    python benchmarks/bench_scan.py --folders 10000 --new 50 --probe 0.05
+"""
+
+#===============================================================================
+# IMPORTS
+#===============================================================================
+
+# Standard Imports
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.append('/'.join(os.path.realpath(__file__).split('/')[:-2]))
+
+# Ripmaster Imports
+import Ripmaster
+
+#===============================================================================
+# GLOBALS
+#===============================================================================
+
+FOLDERS_DEFAULT = 10000
+NEW_DEFAULT = 50
+
+#===============================================================================
+# CLASSES
+#===============================================================================
+
+class StubMovie(object):
+    """Stands in for Movie, counting how many would have been probed"""
+    probes = 0
+
+    def __init__(self, root, subdir, fname):
+        StubMovie.probes += 1
+        self.path = os.path.join(root, subdir, fname).replace('\\', '/')
+
+#===============================================================================
+# FUNCTIONS
+#===============================================================================
+
+def buildLibrary(root, count):
+    """Writes count movie folders, each with a movie and its encode"""
+    for i in xrange(count):
+        subdir = os.path.join(root, 'Movie {0}__1080'.format(i))
+        os.mkdir(subdir)
+        for name in ['Movie.mkv', 'Movie--converted.mkv']:
+            open(os.path.join(subdir, name), 'w').close()
+
+#===============================================================================
+
+def scanNested(root, movies):
+    """The old scan: a Movie for every file, then an O(n*m) dedupe"""
+    newMovies = Ripmaster._get_movies(root)
+    duplicates = []
+
+    for movie in movies:
+        for raw in newMovies:
+            if movie.path == raw.path:
+                duplicates.append(raw)
+
+    for dup in duplicates:
+        newMovies.remove(dup)
+
+    return newMovies
+
+#===============================================================================
+
+def scanIndexed(root, movies):
+    """The new scan: known paths are skipped before a Movie is built"""
+    return Ripmaster._get_movies(root, set([movie.path for movie in movies]))
+
+#===============================================================================
+
+def timeScan(scan, root, movies):
+    """Times a scan, returning (seconds, new movies found, movies built)"""
+    StubMovie.probes = 0
+    start = time.time()
+    found = scan(root, movies)
+    return time.time() - start, len(found), StubMovie.probes
+
+#===============================================================================
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument(
+        '--folders', type=int, default=FOLDERS_DEFAULT,
+        help='number of movie folders in toConvert'
+    )
+    parser.add_argument(
+        '--new', type=int, default=NEW_DEFAULT,
+        help='how many of those folders are not in progress yet'
+    )
+    parser.add_argument(
+        '--probe', type=float, default=0.0,
+        help='seconds to add for each Movie built, as mkvmerge would take'
+    )
+    args = parser.parse_args()
+
+    Ripmaster.Movie = StubMovie
+
+    root = tempfile.mkdtemp()
+    try:
+        buildLibrary(root, args.folders)
+        # Everything but the newest folders is already in progress.
+        movies = sorted(
+            Ripmaster._get_movies(root), key=lambda mv: mv.path
+        )[:args.folders - args.new]
+
+        print "{folders} folders, {known} in progress".format(
+            folders=args.folders, known=len(movies)
+        )
+        print ""
+
+        header = '{0:<10} {1:>10} {2:>8} {3:>8} {4:>12}'
+        print header.format('scan', 'time', 'new', 'probes', 'with probes')
+        for name, scan in [('nested', scanNested), ('indexed', scanIndexed)]:
+            seconds, found, probes = timeScan(scan, root, movies)
+            print header.format(
+                name,
+                '{0:.2f}s'.format(seconds),
+                found,
+                probes,
+                '{0:.2f}s'.format(seconds + probes * args.probe)
+            )
+    finally:
+        shutil.rmtree(root)
+
+if __name__ == '__main__':
+    main()
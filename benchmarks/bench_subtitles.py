@@ -0,0 +1,273 @@
+#/usr/bin/python
+# Ripmaster Subtitle Benchmark
+# Times the native PGS to VobSub converter against BDSup2Sub
+"""
+Builds a synthetic, feature length PGS subtitle track and times converting it
+to VobSub at each of Ripmaster's resolutions, the way SubtitleTrack would:
+a full track plus a forced track.
+
+The native converter writes both in one pass. BDSup2Sub, if a java executable
+and BDSup2Sub jar are given, needs a pass for each, and a JVM start for each
+pass.
+
+Usage:
+
+    python benchmarks/bench_subtitles.py
+    python benchmarks/bench_subtitles.py --java /usr/bin/java \\
+        --jar /opt/BDSup2Sub.jar
+
+REQUIREMENTS:
+
+numpy
+"""
+
+#===============================================================================
+# IMPORTS
+#===============================================================================
+
+# Standard Imports
+import argparse
+import os
+import random
+import shutil
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy
+
+sys.path.append('/'.join(os.path.realpath(__file__).split('/')[:-2]))
+# The test helpers that write run length encoded bitmaps.
+sys.path.append(
+    '/'.join(os.path.realpath(__file__).split('/')[:-2] + ['tools', 'tests'])
+)
+
+# Ripmaster Imports
+from tools import pgs
+from tools import vobsub
+from tests_pgs import encodeRle
+
+#===============================================================================
+# GLOBALS
+#===============================================================================
+
+# A feature film has somewhere around 1,500 captions.
+CAPTIONS_DEFAULT = 1500
+# Roughly 1 caption in 10 is forced on a track that has forced captions.
+FORCED_EVERY = 10
+# Captions are built from a handful of distinct bitmaps, since encoding them
+# in Python is far slower than anything being measured.
+DISTINCT_CAPTIONS = 24
+
+LINE_HEIGHT = 54
+RESOLUTIONS = ['1080p', '720p', 'ntsc']
+
+#===============================================================================
+# FUNCTIONS
+#===============================================================================
+
+def buildCaption(rand):
+    """Draws one or two lines of glyph like shapes, outlined in black
+
+    Args:
+        rand : (<random.Random>)
+            Source of the caption's layout.
+
+    Returns:
+        (int), (int), (str)
+            Width, height and run length encoded data of the caption.
+
+    """
+    lines = rand.choice([1, 2, 2])
+    width = rand.randrange(500, 1400)
+    height = lines * LINE_HEIGHT
+
+    text = numpy.zeros((height, width), dtype=bool)
+    for line in xrange(lines):
+        top = line * LINE_HEIGHT + 8
+        x = 6
+        while x < width - 30:
+            glyph = rand.randrange(10, 22)
+            if rand.random() < 0.18:
+                # A space between words.
+                x += glyph
+                continue
+            # A couple of vertical strokes and a bar, like most letters.
+            for stroke in xrange(rand.choice([1, 2, 2, 3])):
+                left = x + rand.randrange(0, glyph - 3)
+                text[top:top + 38, left:left + 4] = True
+            bar = top + rand.randrange(0, 34)
+            text[bar:bar + 4, x:x + glyph] = True
+            x += glyph + 3
+
+    # Black outline around the text, and a grey, half transparent edge
+    # around that for anti-aliasing.
+    outline = _grow(_grow(text)) & ~text
+    edge = _grow(text | outline) & ~(text | outline)
+
+    pixels = numpy.zeros((height, width), dtype=numpy.uint8)
+    pixels[edge] = 3
+    pixels[outline] = 2
+    pixels[text] = 1
+
+    return width, height, encodeRle(pixels.tostring(), width, height)
+
+#===============================================================================
+
+def buildSup(path, count):
+    """Writes a synthetic PGS track of count captions, a second apart"""
+    rand = random.Random(1)
+    bitmaps = [buildCaption(rand) for i in xrange(DISTINCT_CAPTIONS)]
+
+    palette = '\x00\x00' + ''.join([
+        '\x01\xeb\x80\x80\xff',  # White
+        '\x02\x10\x80\x80\xff',  # Black
+        '\x03\x7e\x80\x80\x80',  # Half transparent grey
+    ])
+
+    with open(path, 'wb') as f:
+        for i in xrange(count):
+            width, height, data = bitmaps[i % DISTINCT_CAPTIONS]
+            pts = 90000 * 60 + i * 270000
+            forced = not i % FORCED_EVERY
+
+            pcs = struct.pack(
+                '>HHBHBBBB', 1920, 1080, 0x10, i * 2, pgs.EPOCH_START, 0, 0, 1
+            ) + struct.pack(
+                '>HBBHH', 0, 0, pgs.OBJECT_FORCED if forced else 0,
+                (1920 - width) // 2, 1000 - height
+            )
+            wds = '\x01' + struct.pack(
+                '>BHHHH', 0, (1920 - width) // 2, 1000 - height, width, height
+            )
+
+            # Object data is split into fragments, like real streams.
+            fragments = [
+                data[pos:pos + 0xffe0] for pos in xrange(0, len(data), 0xffe0)
+            ]
+            objects = []
+            for n, fragment in enumerate(fragments):
+                sequence = 0
+                if not n:
+                    sequence |= pgs.FIRST_IN_SEQUENCE
+                if n == len(fragments) - 1:
+                    sequence |= pgs.LAST_IN_SEQUENCE
+                payload = struct.pack('>HBB', 0, 0, sequence)
+                if not n:
+                    payload += struct.pack('>I', len(data) + 4)[1:]
+                    payload += struct.pack('>HH', width, height)
+                objects.append(_segment(pgs.ODS, payload + fragment, pts))
+
+            f.write(''.join(
+                [_segment(pgs.PCS, pcs, pts), _segment(pgs.WDS, wds, pts),
+                 _segment(pgs.PDS, palette, pts)] + objects +
+                [_segment(pgs.END, '', pts)]
+            ))
+
+            # Cleared 2 seconds later
+            clear = struct.pack(
+                '>HHBHBBBB', 1920, 1080, 0x10, i * 2 + 1, pgs.NORMAL, 0, 0, 0
+            )
+            f.write(_segment(pgs.PCS, clear, pts + 180000))
+            f.write(_segment(pgs.END, '', pts + 180000))
+
+#===============================================================================
+
+def timeBdSup2Sub(java, jar, sup, dest, resolution):
+    """Times BDSup2Sub's full pass and forced pass, one JVM each"""
+    start = time.time()
+    for options, idx in [([], 'full.idx'), (['-D'], 'full_forced.idx')]:
+        subprocess.check_call(
+            [java, '-jar', jar, '-r', resolution] + options +
+            ['-o', os.path.join(dest, idx), sup],
+            stdout=open(os.devnull, 'w'),
+            stderr=subprocess.STDOUT
+        )
+    return time.time() - start
+
+#===============================================================================
+
+def timeNative(sup, dest, resolution):
+    """Times the native converter writing both tracks in one pass"""
+    start = time.time()
+    vobsub.convert(
+        sup,
+        idx=os.path.join(dest, 'full.idx'),
+        forcedIdx=os.path.join(dest, 'full_forced.idx'),
+        resolution=resolution
+    )
+    return time.time() - start
+
+#===============================================================================
+
+def _grow(mask):
+    """Grows a boolean mask by a pixel in every direction"""
+    grown = mask.copy()
+    grown[1:] |= mask[:-1]
+    grown[:-1] |= mask[1:]
+    grown[:, 1:] |= mask[:, :-1]
+    grown[:, :-1] |= mask[:, 1:]
+    return grown
+
+#===============================================================================
+
+def _segment(segType, payload, pts):
+    """Wraps a payload in a PGS segment header"""
+    return struct.pack(
+        '>2sIIBH', pgs.MAGIC, pts, pts, segType, len(payload)
+    ) + payload
+
+#===============================================================================
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument(
+        '--captions', type=int, default=CAPTIONS_DEFAULT,
+        help='number of captions in the synthetic track'
+    )
+    parser.add_argument('--java', help='java executable, to time BDSup2Sub')
+    parser.add_argument('--jar', help='BDSup2Sub jar, to time BDSup2Sub')
+    parser.add_argument(
+        '--runs', type=int, default=3, help='runs of each, best is kept'
+    )
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp()
+    try:
+        sup = os.path.join(root, 'bench.sup')
+        buildSup(sup, args.captions)
+        info = pgs.supInfo(sup)
+        print "{count} captions, {forced} forced, {size:.1f}MB".format(
+            count=info.totalCount,
+            forced=info.forcedCount,
+            size=os.path.getsize(sup) / 1048576.0
+        )
+        print ""
+
+        header = '{0:<8} {1:>10} {2:>10} {3:>8}'
+        print header.format('res', 'native', 'bdsup2sub', 'speedup')
+
+        for resolution in RESOLUTIONS:
+            native = min(
+                [timeNative(sup, root, resolution) for i in xrange(args.runs)]
+            )
+            java = None
+            if args.java and args.jar:
+                java = min([
+                    timeBdSup2Sub(args.java, args.jar, sup, root, resolution)
+                    for i in xrange(args.runs)
+                ])
+
+            print header.format(
+                resolution,
+                '{0:.2f}s'.format(native),
+                '{0:.2f}s'.format(java) if java else '-',
+                '{0:.1f}x'.format(java / native) if java else '-'
+            )
+    finally:
+        shutil.rmtree(root)
+
+if __name__ == '__main__':
+    main()
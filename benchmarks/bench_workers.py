@@ -0,0 +1,189 @@
+#/usr/bin/python
+# Ripmaster Worker Benchmark
+# Times several Ripmaster workers sharing one toConvert folder
+"""
+Builds a toConvert folder of movies, then works through it with one worker
+process, then two, then four, the same way `Ripmaster.py --worker` does on
+each machine sharing toConvert. Movies are claimed through the lease files in
+toConvert/.leases, so workers on one machine compete exactly as workers on
+several machines would.
+
+No encodes are run. A stand in Movie sleeps for --encode seconds in its encode
+stage, and a tenth of that in every other stage, and logs each encode to its
+folder, so the benchmark also checks that no movie was encoded twice.
+
+Times are taken to the last merge. Idle workers wait up to a poll interval
+longer before exiting, in case a busy worker dies and leaves its movie behind.
+
+Usage:
+
+    python benchmarks/bench_workers.py
+    python benchmarks/bench_workers.py --movies 48 --encode 0.5 --workers 1 8
+"""
+
+#===============================================================================
+# IMPORTS
+#===============================================================================
+
+# Standard Imports
+import argparse
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.append('/'.join(os.path.realpath(__file__).split('/')[:-2]))
+
+# Ripmaster Imports
+import Ripmaster
+
+#===============================================================================
+# GLOBALS
+#===============================================================================
+
+MOVIES_DEFAULT = 24
+ENCODE_DEFAULT = 0.5
+WORKERS_DEFAULT = [1, 2, 4]
+
+#===============================================================================
+# CLASSES
+#===============================================================================
+
+class StubConfig(object):
+    """Stands in for Config, with the settings a worker reads"""
+    leaseSeconds = 30
+    metricsFile = ''
+    metricsInterval = 15
+    metricsPort = 0
+    stallSeconds = 600
+    watchPoll = 1
+
+#===============================================================================
+
+class StubMovie(object):
+    """Stands in for Movie, sleeping instead of running each stage"""
+    encode = ENCODE_DEFAULT
+
+    def __init__(self, root, subdir, fname):
+        self.subdir = subdir
+        self.path = os.path.join(root, subdir, fname).replace('\\', '/')
+        self.extracted = False
+        self.converted = False
+        self.encoded = False
+        self.merged = False
+
+    def extractTracks(self):
+        time.sleep(self.encode / 10)
+        self.extracted = True
+
+    def convertTracks(self):
+        time.sleep(self.encode / 10)
+        self.converted = True
+
+    def encodeMovie(self, checkpoint=None):
+        with open(os.path.join(os.path.dirname(self.path), 'encodes'), 'a') as f:
+            f.write('{pid}\n'.format(pid=os.getpid()))
+        time.sleep(self.encode)
+        self.encoded = True
+
+    def mergeMovie(self):
+        time.sleep(self.encode / 10)
+        with open(os.path.join(os.path.dirname(self.path), 'merged'), 'w') as f:
+            f.write(repr(time.time()))
+        self.merged = True
+
+#===============================================================================
+# FUNCTIONS
+#===============================================================================
+
+def buildLibrary(root, count):
+    """Writes count movie folders, each with a movie"""
+    for i in xrange(count):
+        subdir = os.path.join(root, 'Movie {0}__1080'.format(i))
+        os.mkdir(subdir)
+        open(os.path.join(subdir, 'Movie.mkv'), 'w').close()
+
+#===============================================================================
+
+def runWorker(root, encode):
+    """Runs one worker process through toConvert, quietly"""
+    sys.stdout = open(os.devnull, 'w')
+    StubMovie.encode = encode
+    Ripmaster.Movie = StubMovie
+    Ripmaster._work(root, StubConfig)
+
+#===============================================================================
+
+def timeWorkers(count, movies, encode):
+    """Times count worker processes working through a fresh library"""
+    root = tempfile.mkdtemp()
+    try:
+        buildLibrary(root, movies)
+
+        processes = [
+            multiprocessing.Process(target=runWorker, args=(root, encode))
+            for i in xrange(count)
+        ]
+        start = time.time()
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+
+        encodes = []
+        merged = [start]
+        for subdir in os.listdir(root):
+            log = os.path.join(root, subdir, 'encodes')
+            if os.path.exists(log):
+                with open(log) as f:
+                    encodes.append(len(f.read().split()))
+            log = os.path.join(root, subdir, 'merged')
+            if os.path.exists(log):
+                with open(log) as f:
+                    merged.append(float(f.read()))
+    finally:
+        shutil.rmtree(root)
+
+    return max(merged) - start, len(encodes), max(encodes) if encodes else 0
+
+#===============================================================================
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument(
+        '--movies', type=int, default=MOVIES_DEFAULT,
+        help='movies in toConvert'
+    )
+    parser.add_argument(
+        '--encode', type=float, default=ENCODE_DEFAULT,
+        help='seconds each stand in encode takes'
+    )
+    parser.add_argument(
+        '--workers', type=int, nargs='+', default=WORKERS_DEFAULT,
+        help='worker counts to time'
+    )
+    args = parser.parse_args()
+
+    header = '{0:>8} {1:>10} {2:>12} {3:>9} {4:>9} {5:>14}'
+    print header.format(
+        'workers', 'time', 'movies/min', 'speedup', 'encoded', 'most encodes'
+    )
+
+    baseline = None
+    for count in args.workers:
+        elapsed, encoded, most = timeWorkers(count, args.movies, args.encode)
+        if baseline is None:
+            baseline = elapsed
+        print header.format(
+            count,
+            '{0:.2f}s'.format(elapsed),
+            '{0:.1f}'.format(args.movies / elapsed * 60),
+            '{0:.2f}x'.format(baseline / elapsed),
+            encoded,
+            most
+        )
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,351 @@
+#/usr/bin/python
+# Ripmaster Stub Tools
+# Stands in for mkvmerge, mkvextract, HandBrakeCLI and java in benchmarks
+"""
+Plays the part of each external tool Ripmaster runs, so a benchmark can run
+Ripmaster from scan to merge without any media, or any of the real tools
+installed. Each stub reads the same arguments the real tool would be given,
+writes the same console output Ripmaster reads, and writes its output files.
+
+How long each stub takes comes from a cost model: a fixed start up cost, plus
+the bytes of its input files divided by a read rate. Output files are sized
+from the input, by a ratio. They're sparse unless writeData is set, so a
+library of large movies costs no disk space.
+
+The cost model, and the media each source movie stands for, are read from a
+JSON file, merged over COSTS_DEFAULT and MEDIA_DEFAULT.
+
+Usage:
+
+    python stub_tools.py <costs.json> mkvmerge|mkvextract|HandBrakeCLI|java \\
+        <the real tool's arguments>
+
+bench_pipeline.py writes a small script for each tool that runs this one, and
+points Ripmaster.ini at those scripts.
+"""
+
+#===============================================================================
+# IMPORTS
+#===============================================================================
+
+# Standard Imports
+import json
+import os
+import struct
+import sys
+import time
+
+sys.path.append(
+    os.path.join(
+        '/'.join(os.path.realpath(__file__).split('/')[:-2]), 'tools'
+    )
+)
+
+# Ripmaster Imports
+import pgs
+
+#===============================================================================
+# GLOBALS
+#===============================================================================
+
+# Each tool's seconds to start, bytes of input read per second (0 for no read
+# cost), and bytes of output per byte of input. They're a small fraction of
+# what the real tools take, so thousands of movies go through in minutes, but
+# keep roughly to the real tools' costs against each other.
+COSTS_DEFAULT = {
+    'identify': {'start': 0.005, 'rate': 0, 'ratio': 0},
+    'chapters': {'start': 0.005, 'rate': 0, 'ratio': 0},
+    'extract': {'start': 0.005, 'rate': 2e12, 'ratio': 0},
+    # A JVM start for every pass
+    'bdsup2sub': {'start': 0.02, 'rate': 0, 'ratio': 0},
+    'encode': {'start': 0.01, 'rate': 4e11, 'ratio': 0.25},
+    'merge': {'start': 0.005, 'rate': 2e12, 'ratio': 1.0},
+}
+
+# What every source movie stands for.
+MEDIA_DEFAULT = {
+    'duration': 7200,
+    'chapters': 24,
+    'subtitles': 2,
+    'captions': 1500,
+    # Every nth caption is forced.
+    'forcedEvery': 10,
+}
+
+PROGRESS_STEPS = 10
+# Bytes written at a time, if writeData is set
+BLOCK_SIZE = 1024 * 1024
+
+#===============================================================================
+# FUNCTIONS
+#===============================================================================
+
+def buildSup(captions, forcedEvery):
+    """Returns a PGS stream of captions a second apart, every nth forced"""
+    def segment(segType, payload, pts):
+        return struct.pack(
+            '>2sIIBH', pgs.MAGIC, pts, 0, segType, len(payload)
+        ) + payload
+
+    window = '\x01' + struct.pack('>BHHHH', 0, 0, 0, 1, 1)
+    palette = '\x00\x00' + pgs.PDS_ENTRY.pack(1, 235, 128, 128, 255)
+    bitmap = pgs.ODS_HEADER.pack(
+        0, 0, pgs.FIRST_IN_SEQUENCE | pgs.LAST_IN_SEQUENCE
+    ) + '\x00\x00\x05' + struct.pack('>HH', 1, 1) + '\x01'
+
+    stream = []
+    for i in xrange(captions):
+        pts = 90000 * 60 + i * 90000
+        forced = forcedEvery and not i % forcedEvery
+        pcs = pgs.PCS_HEADER.pack(
+            1920, 1080, 0x10, i * 2, pgs.EPOCH_START, 0, 0, 1
+        ) + pgs.PCS_OBJECT.pack(
+            0, 0, pgs.OBJECT_FORCED if forced else 0, 100, 900
+        )
+        # Cleared half a second later
+        clear = pgs.PCS_HEADER.pack(
+            1920, 1080, 0x10, i * 2 + 1, pgs.NORMAL, 0, 0, 0
+        )
+        stream.extend([
+            segment(pgs.PCS, pcs, pts),
+            segment(pgs.WDS, window, pts),
+            segment(pgs.PDS, palette, pts),
+            segment(pgs.ODS, bitmap, pts),
+            segment(pgs.END, '', pts),
+            segment(pgs.PCS, clear, pts + 45000),
+            segment(pgs.END, '', pts + 45000),
+        ])
+
+    return ''.join(stream)
+
+#===============================================================================
+
+def forcedCount(media):
+    """Returns how many of the media's captions are forced"""
+    if not media['forcedEvery']:
+        return 0
+    every = media['forcedEvery']
+    return (media['captions'] + every - 1) // every
+
+#===============================================================================
+
+def loadModel(path):
+    """Reads the cost model, filling anything it leaves out from the defaults"""
+    with open(path) as f:
+        model = json.load(f)
+
+    costs = {}
+    for tool, cost in COSTS_DEFAULT.items():
+        costs[tool] = dict(cost)
+        costs[tool].update(model.get('costs', {}).get(tool, {}))
+
+    media = dict(MEDIA_DEFAULT)
+    media.update(model.get('media', {}))
+
+    return costs, media, model.get('writeData', False)
+
+#===============================================================================
+
+def readCost(cost, size):
+    """Returns the seconds a tool with the given cost takes to read size"""
+    seconds = cost['start']
+    if cost['rate']:
+        seconds += size / float(cost['rate'])
+    return seconds
+
+#===============================================================================
+
+def sizeOf(paths):
+    """Returns the total size of the files that exist"""
+    return sum(
+        [os.path.getsize(path) for path in paths if os.path.isfile(path)]
+    )
+
+#===============================================================================
+
+def writeFile(path, size, writeData=False, data=None):
+    """Writes data, or size bytes, to path, creating its folder if needed"""
+    folder = os.path.dirname(path)
+    if folder and not os.path.isdir(folder):
+        os.makedirs(folder)
+
+    with open(path, 'wb') as f:
+        if data is not None:
+            f.write(data)
+        elif writeData:
+            block = '\x00' * BLOCK_SIZE
+            for i in xrange(int(size) // BLOCK_SIZE):
+                f.write(block)
+            f.write('\x00' * (int(size) % BLOCK_SIZE))
+        else:
+            f.truncate(int(size))
+
+#===============================================================================
+# TOOLS
+#===============================================================================
+
+def handBrake(args, costs, media, writeData):
+    """HandBrakeCLI -i <source> -o <dest> [--start-at duration:S]
+    [--stop-at duration:L] <options>"""
+    source = args[args.index('-i') + 1]
+    dest = args[args.index('-o') + 1]
+
+    start = 0.0
+    length = None
+    for option, value in zip(args, args[1:]):
+        if option == '--start-at':
+            start = float(value.split(':')[-1])
+        elif option == '--stop-at':
+            length = float(value.split(':')[-1])
+    if length is None:
+        length = media['duration'] - start
+    share = max(0.0, min(1.0, length / media['duration']))
+
+    cost = costs['encode']
+    size = sizeOf([source]) * share
+    seconds = readCost(cost, size)
+    fps = length * 23.976 / seconds if seconds else 0.0
+
+    for step in xrange(PROGRESS_STEPS):
+        time.sleep(seconds / PROGRESS_STEPS)
+        left = seconds * (PROGRESS_STEPS - step - 1) / PROGRESS_STEPS
+        sys.stdout.write(
+            '\rEncoding: task 1 of 1, {percent:.2f} % ({fps:.2f} fps, avg '
+            '{fps:.2f} fps, ETA {h:02d}h{m:02d}m{s:02d}s)'.format(
+                percent=100.0 * (step + 1) / PROGRESS_STEPS, fps=fps,
+                h=int(left) // 3600, m=int(left) % 3600 // 60, s=int(left) % 60
+            )
+        )
+        sys.stdout.flush()
+
+    writeFile(dest, size * cost['ratio'], writeData)
+    sys.stdout.write('\nEncode done!\n')
+    return 0
+
+#===============================================================================
+
+def java(args, costs, media, writeData):
+    """java -jar BDSup2Sub.jar -r <res> [-D] -o <dest.idx> <source.sup>"""
+    dest = args[args.index('-o') + 1]
+    forcedOnly = '-D' in args
+
+    time.sleep(readCost(costs['bdsup2sub'], 0))
+
+    total = media['captions']
+    forced = forcedCount(media)
+    written = forced if forcedOnly else total
+
+    print 'BDSup2Sub 5.1.2 - Copyright 2009 Volker Oth, 2011-2013 Miklos Juhasz'
+    print 'Loading ' + args[-1]
+    for i in xrange(1, total + 1):
+        print '#> {0} (00:{1:02d}:{2:02d}.000)'.format(i, i // 60 % 60, i % 60)
+    print 'Detected {0} forced captions.'.format(forced)
+    print 'Writing ' + dest
+
+    writeFile(dest, 0, data='# VobSub index file, v7\n' * written)
+    writeFile(dest.replace('.idx', '.sub'), written * 2048, writeData)
+    return 0
+
+#===============================================================================
+
+def mkvExtract(args, costs, media, writeData):
+    """mkvextract tracks <source> <id>:<dest> ... | chapters <source> -s"""
+    if args[0] == 'chapters':
+        time.sleep(readCost(costs['chapters'], 0))
+        spacing = media['duration'] / max(1, media['chapters'])
+        for i in xrange(media['chapters']):
+            seconds = i * spacing
+            print 'CHAPTER{0:02d}={1:02d}:{2:02d}:{3:06.3f}'.format(
+                i + 1, int(seconds) // 3600, int(seconds) % 3600 // 60,
+                seconds % 60
+            )
+            print 'CHAPTER{0:02d}NAME=Chapter {0:02d}'.format(i + 1)
+        return 0
+
+    source = args[1]
+    time.sleep(readCost(costs['extract'], sizeOf([source])))
+
+    sup = buildSup(media['captions'], media['forcedEvery'])
+    for extraction in args[2:]:
+        trackID, dest = extraction.split(':', 1)
+        print 'Extracting track {0} with the CodecID \'S_HDMV/PGS\' to the ' \
+              'file \'{1}\'. Container format: SUP'.format(trackID, dest)
+        writeFile(dest, len(sup), data=sup)
+    print 'Progress: 100%'
+    return 0
+
+#===============================================================================
+
+def mkvMerge(args, costs, media, writeData):
+    """mkvmerge --identify <file> | -o <dest> <options and sources>"""
+    if '--identify' in args:
+        source = args[args.index('--identify') + 1]
+        time.sleep(readCost(costs['identify'], 0))
+
+        tracks = [{
+            'id': 0, 'type': 'video', 'codec': 'MPEG-4p10/AVC/h.264',
+            'properties': {
+                'codec_id': 'V_MPEG4/ISO/AVC', 'pixel_dimensions': '1920x1080',
+                'language': 'eng', 'default_track': True,
+            },
+        }]
+        # The encode only has its video, until it's merged.
+        if not source.endswith('--converted.mkv'):
+            for codec in ['A_DTS', 'A_AC3']:
+                tracks.append({
+                    'id': len(tracks), 'type': 'audio', 'codec': codec,
+                    'properties': {
+                        'codec_id': codec, 'language': 'eng',
+                        'default_track': len(tracks) == 1,
+                    },
+                })
+            for i in xrange(media['subtitles']):
+                tracks.append({
+                    'id': len(tracks), 'type': 'subtitles', 'codec': 'HDMV PGS',
+                    'properties': {
+                        'codec_id': 'S_HDMV/PGS', 'language': 'eng',
+                        'default_track': False, 'forced_track': False,
+                    },
+                })
+
+        print json.dumps({
+            'container': {
+                'type': 'Matroska',
+                'properties': {
+                    'duration': int(media['duration'] * 1000000000)
+                },
+            },
+            'tracks': tracks,
+        })
+        return 0
+
+    dest = args[args.index('-o') + 1]
+    sources = [
+        arg for arg in args if arg != dest and os.path.isfile(arg)
+    ]
+    cost = costs['merge']
+    size = sizeOf(sources)
+    time.sleep(readCost(cost, size))
+
+    writeFile(dest, size * cost['ratio'], writeData)
+    print 'Progress: 100%'
+    print 'Multiplexing took 1 second.'
+    return 0
+
+#===============================================================================
+
+TOOLS = {
+    'HandBrakeCLI': handBrake,
+    'java': java,
+    'mkvextract': mkvExtract,
+    'mkvmerge': mkvMerge,
+}
+
+#===============================================================================
+
+def main():
+    costs, media, writeData = loadModel(sys.argv[1])
+    sys.exit(TOOLS[sys.argv[2]](sys.argv[3:], costs, media, writeData))
+
+if __name__ == '__main__':
+    main()
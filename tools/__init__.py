@@ -34,6 +34,10 @@ SubtitleTrack
     two subtitle tracks- one forced and the other containing every subtitle
     (both forced and not forced).
 
+Sup2SubServer
+    A long running JVM that BDSup2Sub conversions are sent to, so that Java
+    only has to start up once rather than once per subtitle track.
+
 Functions
 ---------
 
@@ -41,14 +45,36 @@ bdSup2Sub()
     CLI command builder for converting subtitle tracks with BDSup2Sub. For all
     intents and purposes, this is the BDSup2Sub application.
 
+cpuSlots()
+    Returns the encode slots shared by every HandBrake run, if configured.
+
+deviceLimits()
+    Returns the limits on disk bound tool runs shared by every movie.
+
 handbrake()
     CLI command builder for converting video and audio with Handbrake. For all
     intents and purposes, this is the Handbrake application.
 
+historyStore()
+    Returns the history of finished stages shared by every movie, if
+    configured.
+
+extractTracks()
+    Extracts a list of tracks from a single mkv with one mkvextract run, then
+    updates the extraction state of each track.
+
 mkvExtract()
     CLI command builder for extracting tracks with mkvextract. For all intents
     and purposes, this is the mkvextract application.
 
+mkvExtractTracks()
+    CLI command builder for extracting several tracks from one mkv with a
+    single mkvextract run.
+
+mkvIdentify()
+    Runs mkvmerge's JSON identification of a file, returning the parsed
+    result.
+
 mkvInfo()
     Uses mkvmerge to fetch names, filetypes and trackIDs for all audio, video
     and subtitle tracks from a given mkv.
@@ -56,6 +82,68 @@ mkvInfo()
 mkvMerge()
     Merges a converted movie, converted subtitles and any extracted audio tracks
 
+stageRecord()
+    Describes a stage of a movie the way the stage history records it.
+
+throughputModel()
+    Returns the model of how long stages take, fit from the stage history.
+
+Modules
+-------
+
+affinity
+    Splits the machine's cores into slots, and pins each encode to its own
+    slot.
+
+devices
+    Limits how many disk bound tool runs read or write each disk at once.
+
+encodecache
+    Reuses finished encodes of the same source with the same options.
+
+estimate
+    Estimates how long an encode will take, and how big it will be, from
+    short sample encodes.
+
+history
+    Records every finished stage, and predicts how long stages will take from
+    that history.
+
+lease
+    Lease files that let several Ripmaster workers share one toConvert folder.
+
+matroska
+    Reads the tracks, chapters and cues of Matroska files directly, without
+    running mkvmerge.
+
+metrics
+    Measures Ripmaster's stages and tools, for Prometheus to collect.
+
+pgs
+    Reads Bluray PGS subtitle streams directly, to find forced captions
+    without running BDSup2Sub.
+
+probecache
+    Keeps mkvmerge's track listing of each file on disk, so unchanged files
+    aren't probed again.
+
+progress
+    Follows HandBrake's progress through an encode, and the queue's through its
+    encodes.
+
+runner
+    Runs external tools from a single event loop, streaming their output.
+
+scheduler
+    Runs a graph of dependent tasks, running ready tasks concurrently.
+
+vobsub
+    Converts PGS subtitles to VobSub with NumPy, without BDSup2Sub or Java.
+
+watcher
+    Watches toConvert for new movies once Ripmaster is running, queueing each
+    once it has finished being written.
+
 """
 
 #===============================================================================
@@ -64,9 +152,38 @@ mkvMerge()
 
 # Standard Imports
 from ast import literal_eval
+from contextlib import contextmanager
+from functools import wraps
+import atexit
 import ConfigParser
+import json
+from multiprocessing import cpu_count
+from multiprocessing.pool import ThreadPool
 import os
-from subprocess import Popen, PIPE
+import Queue
+import re
+import shlex
+import shutil
+from subprocess import list2cmdline
+import tempfile
+import threading
+import time
+
+# Ripmaster Imports
+from tools import lease
+from tools import metrics
+from tools import affinity
+from tools import devices
+from tools import encodecache
+from tools import estimate
+from tools import history
+from tools import matroska
+from tools import pgs
+from tools import probecache
+from tools import progress
+from tools import runner
+from tools import vobsub
+from tools import watcher
 
 #===============================================================================
 # GLOBALS
@@ -88,6 +205,7 @@ BFRAMES = {
 
 # Possible Config Choices
 AUDIO_FALLBACK_DEFAULT = 'ffac3'
+AUTO_REMUX_DEFAULT = False
 AUDIO_FALLBACKS = [
     'faac',
     'ffaac',
@@ -96,15 +214,55 @@ AUDIO_FALLBACKS = [
     'vorbis',
     'ffflac',
     ]
+CONVERTER_DEFAULT = 'bdsup2sub'
+ENCODE_CACHE_FOLDER_DEFAULT = 'encodes'
+ENCODE_CACHE_GB_DEFAULT = 0
+ENCODE_CHUNKS_DEFAULT = 1
+ENCODE_SLOTS_DEFAULT = 0
+ENCODE_THREADS_DEFAULT = 0
+ESTIMATE_CACHE_FILE_DEFAULT = 'estimates.db'
+ESTIMATE_SAMPLES_DEFAULT = estimate.SAMPLES_DEFAULT
+ESTIMATE_SECONDS_DEFAULT = estimate.SAMPLE_SECONDS_DEFAULT
+EXTRACTOR_DEFAULT = 'mkvextract'
+EXTRACTORS = ['mkvextract', 'native']
+HISTORY_FILE_DEFAULT = 'history.db'
+IO_WORKERS_DEFAULT = 2
+CONVERTERS = ['bdsup2sub', 'native']
 LANGUAGE_DEFAULT = 'English'
 LANGUAGES = ['English']
+LEASE_SECONDS_DEFAULT = lease.LEASE_SECONDS_DEFAULT
+METRICS_FILE_DEFAULT = ''
+METRICS_INTERVAL_DEFAULT = 15
+METRICS_PORT_DEFAULT = 0
+JOBS_PER_DISK_DEFAULT = devices.PER_DEVICE_DEFAULT
+PIN_CORES_DEFAULT = True
+PROBE_CACHE_DEFAULT = True
+PROBE_CACHE_ENTRIES_DEFAULT = probecache.MAX_ENTRIES_DEFAULT
+PROBE_CACHE_FILE_DEFAULT = 'probes.db'
+PROBE_READER_DEFAULT = 'mkvmerge'
+PROBE_READERS = ['mkvmerge', 'native']
+SLOT_CORES_DEFAULT = 0
+SLOW_PERCENT_DEFAULT = int(history.SLOW_RATIO_DEFAULT * 100)
 SORTING_DEFAULT = 'alphabetical'
-SORTINGS = ['alphabetical', 'quality', 'resolution']
+SORTINGS = [
+    'alphabetical', 'estimated_size', 'longest', 'quality', 'resolution',
+    'shortest'
+]
+# Sortings that need every movie's encode estimated first
+ESTIMATED_SORTINGS = ['estimated_size', 'longest', 'shortest']
 SORTING_REVERSE_DEFAULT = True
+STALL_SECONDS_DEFAULT = progress.STALL_SECONDS_DEFAULT
+SUP2SUB_PERSISTENT_DEFAULT = False
+SUP2SUB_WORKERS_DEFAULT = 2
+WATCH_POLL_DEFAULT = watcher.POLL_DEFAULT
+WATCH_SETTLE_DEFAULT = watcher.SETTLE_DEFAULT
 RESOLUTION_DEFAULT = 1080
 RESOLUTIONS = [1080, 720, 480]
 RESOLUTION_WIDTH = {1080: 1920, 720: 1280, 480: 720}
 QUALITY_DEFAULT = 20
+REMUX_MAX_KBPS_DEFAULT = 0
+# Video HandBrake would only encode to H.264 again
+REMUX_CODECS = ['V_MPEG4/ISO/AVC']
 QUALITIES = ['uq', 'hq', 'bq']
 X264_SPEED_DEFAULT = 'slow'
 X264_SPEEDS = BFRAMES.keys()
@@ -122,6 +280,75 @@ H264_PRESETS = [
 FPS_PRESETS = ['30p', '25p', '24p']
 EXTRACTABLE_AUDIO = ['pcm', 'truehd']
 EXTRACTABLE_SUBTITLE = ['pgs']
+# Tracks are extracted to their name with this on the end, and only moved into
+# place once the extraction has finished.
+PARTIAL_EXT = '.part'
+# A chunked encode won't make a chunk shorter than this, in seconds. Every
+# HandBrake run has its own startup and lookahead to fill.
+CHUNK_MIN_LENGTH = 300
+
+# mkvmerge Codec IDs
+AUDIO_TYPES = {
+    'A_AAC': 'aac',
+    'A_DTS': 'dts',
+    'A_AC3': 'ac3',
+    'A_EAC3': 'aec3',
+    'A_TRUEHD': 'truehd',
+    'A_MP3': 'mp3',
+    'A_MS/ACM': 'acm',
+    'A_PCM/INT/LIT': 'pcm'
+}
+SUBTITLE_TYPES = {
+    'S_VOBSUB': 'vobsub',
+    'S_HDMV/PGS': 'pgs'
+}
+# The container duration, in nanoseconds, from a mkvmerge -I File line
+DURATION_RE = re.compile(r'\bduration:(\d+)')
+# A chapter start from mkvextract's simple chapter format
+CHAPTER_RE = re.compile(r'^CHAPTER\d+=(\d+):(\d+):(\d+(?:\.\d+)?)\s*$')
+# Seconds mkvmerge and mkvextract are given to list a file's tracks or
+# chapters. They only read the file's headers, so one that takes this long is
+# stuck, most likely on a network share that's gone away.
+PROBE_TIMEOUT = 600
+
+# Worker Pools
+# BDSup2Sub conversions from every movie share a single pool, created the
+# first time it's needed so it can be sized from the Config.
+_SUP2SUB_POOL = None
+_SUP2SUB_POOL_LOCK = threading.Lock()
+# Idle persistent BDSup2Sub JVMs, waiting for their next job.
+_SUP2SUB_SERVERS = Queue.Queue()
+
+# CPU Slots
+# Made the first time HandBrake runs, so they can be sized from the Config.
+_CPU_SLOTS = None
+_CPU_SLOTS_LOCK = threading.Lock()
+
+# Device Limits
+# Made the first time a tool runs, so they can be sized from the Config.
+_DEVICE_LIMITS = None
+_DEVICE_LIMITS_LOCK = threading.Lock()
+
+# Finished encodes, keyed by source and options, shared by every movie
+_ENCODE_CACHE = None
+_ENCODE_CACHE_LOCK = threading.Lock()
+# The version each HandBrake executable reports, asked for once per run
+_HANDBRAKE_VERSIONS = {}
+_HANDBRAKE_VERSIONS_LOCK = threading.Lock()
+
+# History of finished stages, and the model fit from it
+_HISTORY = None
+_HISTORY_LOCK = threading.Lock()
+_THROUGHPUT = None
+
+# Estimates of encodes, keyed by source file, shared by every movie
+_ESTIMATE_CACHE = None
+_ESTIMATE_CACHE_LOCK = threading.Lock()
+
+# Probe Cache
+# Opened the first time a movie is probed, so it can be placed from the Config.
+_PROBE_CACHE = None
+_PROBE_CACHE_LOCK = threading.Lock()
 
 # Generic
 SAMPLE_CONFIG = """[Programs]
@@ -134,11 +361,62 @@ mkvMerge: C://Program Files (x86)/MKVToolNix/mkvmerge.exe
 [Handbrake Settings]
 animation_BFrames: 8
 audio_Fallback: ffac3
+auto_Remux: no
+encode_Chunks: 1
+encode_Threads: 0
 language: English
+remux_Max_Kbps: 0
 sorting: alphabetical
 sorting_Reverse: no
+stall_Seconds: 600
 x264_Speed: slow
 
+[CPU Settings]
+encode_Slots: 0
+pin_Cores: yes
+slot_Cores: 0
+
+[Disk Settings]
+io_Workers: 2
+jobs_Per_Disk: 1
+
+[Encode Cache]
+cache_Folder: encodes
+max_GB: 0
+
+[Estimate Settings]
+cache_File: estimates.db
+sample_Seconds: 30
+samples: 3
+
+[History Settings]
+history_File: history.db
+slow_Percent: 50
+
+[Probe Cache]
+cache_File: probes.db
+enabled: yes
+max_Entries: 10000
+reader: mkvmerge
+
+[Subtitle Settings]
+converter: bdsup2sub
+extractor: mkvextract
+sup2Sub_Persistent: no
+sup2Sub_Workers: 2
+
+[Watch Settings]
+poll_Seconds: 10
+settle_Seconds: 60
+
+[Worker Settings]
+lease_Seconds: 120
+
+[Metrics]
+http_Port: 0
+metrics_File:
+write_Seconds: 15
+
 [Base Encode Quality]
 1080p: 20
 720p: 20
@@ -158,6 +436,523 @@ x264_Speed: slow
 # PRIVATE FUNCTIONS
 #===============================================================================
 
+def _chunkRanges(chapters, duration, count):
+    """Splits a movie into ranges that start on chapters
+
+    Args:
+        chapters : [float]
+            Chapter start times, in seconds.
+
+        duration : (float)
+            Length of the movie, in seconds.
+
+        count : (int)
+            The number of ranges wanted.
+
+    Raises:
+        N/A
+
+    Returns:
+        [(float, float|None)]
+            The (start, length) of each range, in seconds. The last range has
+            no length, and runs to the end. Empty if the movie can't be split,
+            for want of chapters or length.
+
+    Each split is made at the chapter closest to an even split, as long as
+    that leaves no range shorter than CHUNK_MIN_LENGTH. Chapters begin on
+    keyframes, so each range encodes cleanly on its own.
+
+    """
+    if count < 2 or not duration:
+        return []
+
+    starts = [0.0]
+    for i in xrange(1, count):
+        target = duration * i / count
+        candidates = [
+            chapter for chapter in chapters
+            if chapter - starts[-1] >= CHUNK_MIN_LENGTH and
+            duration - chapter >= CHUNK_MIN_LENGTH
+        ]
+        if not candidates:
+            break
+        starts.append(min(candidates, key=lambda c: abs(c - target)))
+
+    if len(starts) < 2:
+        return []
+
+    ranges = [
+        (start, end - start) for start, end in zip(starts, starts[1:])
+    ]
+    ranges.append((starts[-1], None))
+
+    return ranges
+
+#===============================================================================
+
+def _encoptsThreads(command, threads):
+    """Returns a HandBrake command running x264 with the given threads
+
+    Args:
+        command : [str]
+            The HandBrake command.
+
+        threads : (int)
+            Threads for x264 to run, unless the command already sets them.
+
+    Raises:
+        N/A
+
+    Returns:
+        [str]
+            A copy of the command, with threads added to its --encopts.
+
+    """
+    command = list(command)
+    if '--encopts' in command[:-1]:
+        i = command.index('--encopts') + 1
+        if 'threads=' not in command[i]:
+            command[i] += ':threads={threads}'.format(threads=threads)
+    else:
+        command.extend(
+            ['--encopts', 'threads={threads}'.format(threads=threads)]
+        )
+
+    return command
+
+def _execute(command, **kwargs):
+    """Runs a tool to the end on the shared runner, counting its CPU time
+
+    Args:
+        command : [str]
+            The tool and its arguments.
+
+        Keyword arguments are passed on to runner.run().
+
+    Raises:
+        OSError
+            Raised if the tool can't be started.
+
+    Returns:
+        (<runner.Run>)
+            The finished run, with its status and any output captured.
+
+    """
+    run = runner.run(command, **kwargs)
+    metrics.cpu(run.cpuSeconds)
+    if run.timedOut:
+        print "{tool} was stopped after {seconds} seconds".format(
+            tool=os.path.basename(command[0]), seconds=kwargs.get('timeout')
+        )
+
+    return run
+
+def _extractNative(file, extractions):
+    """Extracts PGS subtitle tracks with tools.matroska instead of mkvextract
+
+    Args:
+        file : (str)
+            The source file the tracks are to be extracted from.
+
+        extractions : [(int, str)]
+            A list of (trackID, destination) pairs to be extracted.
+
+    Raises:
+        N/A
+
+    Returns:
+        (bool)
+            True if every track was extracted. If not, none were, and the
+            caller should run mkvextract instead.
+
+    """
+    writes = [dest for trackID, dest in extractions]
+    with _runTool('matroska-extract', reads=[file], writes=writes) as measured:
+        try:
+            matroska.extractSubtitles(file, extractions)
+        except (EnvironmentError, ValueError), err:
+            measured.fail()
+            print "Could not extract from {file} directly, using mkvextract: " \
+                "{err}".format(file=file, err=err)
+            return False
+
+    return True
+
+def _handBrakeVersion():
+    """Returns the version Config.handBrake reports, or '' if it can't tell"""
+    with _HANDBRAKE_VERSIONS_LOCK:
+        if Config.handBrake not in _HANDBRAKE_VERSIONS:
+            version = ''
+            try:
+                run = _execute(
+                    [Config.handBrake, '--version'], capture=True,
+                    stderr=lambda line: None, timeout=PROBE_TIMEOUT
+                )
+            except OSError:
+                run = None
+            if run and not run.status:
+                for line in run.output.splitlines():
+                    if line.startswith('HandBrake'):
+                        version = line.strip()
+                        break
+            _HANDBRAKE_VERSIONS[Config.handBrake] = version
+
+        return _HANDBRAKE_VERSIONS[Config.handBrake]
+
+#===============================================================================
+
+def _infoInt(infoDict, key):
+    """Returns an integer entry of a track dictionary, or None if missing"""
+    try:
+        return int(infoDict[key])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+#===============================================================================
+
+def _jsonTrackInfo(track):
+    """Takes a track from mkvmerge's JSON identification and returns its info
+
+    Args:
+        track : (dict)
+            A single entry of the 'tracks' list of mkvmerge -J's result.
+
+    Raises:
+        ValueError
+            Will be raised if the track is not a known track type.
+
+    Returns:
+        (int), (str), (dict)
+            The track ID, the track type, and a dictionary with additional
+            information, in the same form _trackInfo returns.
+
+    """
+    trackType = track.get('type')
+    if trackType not in ['video', 'audio', 'subtitles']:
+        raise ValueError(
+            '{type} is not a known track type.'.format(type=trackType)
+        )
+
+    # mkvmerge -I gave every property as a string, with flags as '1' or '0'.
+    # Everything downstream expects that, so we keep to it.
+    trackDict = {}
+    for key, value in track.get('properties', {}).items():
+        if isinstance(value, bool):
+            value = '1' if value else '0'
+        elif isinstance(value, unicode):
+            value = value.encode('utf-8')
+        elif isinstance(value, (dict, list)):
+            continue
+        trackDict[str(key)] = str(value)
+
+    trackDict.setdefault('default_track', '0')
+    trackDict.setdefault('forced_track', '0')
+    trackDict.setdefault('language', 'eng')
+
+    return int(track['id']), trackType, trackDict
+
+#===============================================================================
+
+def _mkvProbe(file):
+    """Runs mkvmerge on a file and parses the tracks it lists
+
+    Args:
+        file : (str)
+            The file to probe.
+
+    Raises:
+        N/A
+
+    Returns:
+        (str|int|None), [((int), (str), (dict))]
+            The container duration in nanoseconds, if reported, and the
+            (trackID, trackType, trackDict) of every track.
+
+    mkvmerge's JSON identification is used if it's available, otherwise we
+    fall back to parsing mkvmerge -I.
+
+    """
+
+    try:
+        identity = mkvIdentify(file)
+    except ValueError:
+        identity = None
+
+    if identity:
+        duration = identity.get('container', {}).get(
+            'properties', {}
+        ).get('duration')
+        tracks = [
+            _jsonTrackInfo(track) for track in identity['tracks']
+            if track.get('type') in ['video', 'audio', 'subtitles']
+        ]
+    else:
+        # mkvMerge will return a listing of each track
+        info = _execute(
+            [Config.mkvMerge, '-I', file], capture=True, timeout=PROBE_TIMEOUT
+        ).output.splitlines(True)
+
+        # info is now a list of lines
+        #
+        # Example:
+        #
+        # File 'I:\Ripmaster\toConvert\JR__1080\JR_t01.mkv': container: Matroska []
+        # Track ID 0: video (V_MPEG4/ISO/AVC) [...]
+        # Track ID 1: audio (A_AC3) [...]
+        # Track ID 2: audio (A_TRUEHD) [...]
+        # Track ID 3: subtitles (S_HDMV/PGS) [...]
+
+        duration = None
+        tracks = []
+        for line in info:
+            if line.startswith('File '):
+                match = DURATION_RE.search(line)
+                if match:
+                    duration = match.group(1)
+            elif line.startswith('Track ID'):
+                tracks.append(_trackInfo(line))
+
+    return duration, tracks
+
+#===============================================================================
+
+def _encodeCache():
+    """Returns the shared encode cache, or None if it's disabled"""
+    global _ENCODE_CACHE
+
+    if not Config.encodeCacheGb or not Config.encodeCacheFolder:
+        return None
+
+    with _ENCODE_CACHE_LOCK:
+        if _ENCODE_CACHE is None:
+            try:
+                _ENCODE_CACHE = encodecache.EncodeCache(
+                    Config.encodeCacheFolder,
+                    Config.encodeCacheGb * 1000000000
+                )
+            except (OSError, encodecache.sqlite3.Error), err:
+                print "Could not open the encode cache {folder}: {err}".format(
+                    folder=Config.encodeCacheFolder,
+                    err=err
+                )
+                Config.encodeCacheGb = 0
+                return None
+
+    return _ENCODE_CACHE
+
+#===============================================================================
+
+def _estimateCache():
+    """Returns the shared estimate cache, or None if it's disabled"""
+    global _ESTIMATE_CACHE
+
+    if not Config.estimateCacheFile:
+        return None
+
+    with _ESTIMATE_CACHE_LOCK:
+        if _ESTIMATE_CACHE is None:
+            try:
+                # Estimates are kept by file identity just like probes, so a
+                # ProbeCache in its own file serves.
+                _ESTIMATE_CACHE = probecache.ProbeCache(
+                    Config.estimateCacheFile
+                )
+            except probecache.sqlite3.Error, err:
+                print "Could not open the estimate cache {file}: {err}".format(
+                    file=Config.estimateCacheFile,
+                    err=err
+                )
+                Config.estimateCacheFile = ''
+                return None
+
+    return _ESTIMATE_CACHE
+
+#===============================================================================
+
+def _placeExtraction(dest, succeeded):
+    """Moves a finished extraction into place, or removes a failed one
+
+    Args:
+        dest : (str)
+            The file the track is extracted to. The extraction was written to
+            dest with PARTIAL_EXT on the end.
+
+        succeeded : (bool)
+            True if the tool extracting the track finished without an error.
+
+    Raises:
+        N/A
+
+    Returns:
+        (bool)
+            True if dest holds the extracted track. A run that was cut short,
+            or wrote nothing, leaves no dest behind to be mistaken for one.
+
+    """
+    partial = dest + PARTIAL_EXT
+    if os.path.isfile(partial):
+        if succeeded and os.path.getsize(partial):
+            # Windows won't rename over a file.
+            if os.path.exists(dest):
+                os.remove(dest)
+            os.rename(partial, dest)
+        else:
+            os.remove(partial)
+
+    if not succeeded:
+        return False
+    return os.path.isfile(dest) and os.path.getsize(dest) > 0
+
+def _probeCache():
+    """Returns the shared probe cache, or None if it's disabled"""
+    global _PROBE_CACHE
+
+    if not Config.probeCache or not Config.probeCacheFile:
+        return None
+
+    with _PROBE_CACHE_LOCK:
+        if _PROBE_CACHE is None:
+            try:
+                _PROBE_CACHE = probecache.ProbeCache(
+                    Config.probeCacheFile, Config.probeCacheEntries
+                )
+            except probecache.sqlite3.Error, err:
+                print "Could not open the probe cache {file}: {err}".format(
+                    file=Config.probeCacheFile,
+                    err=err
+                )
+                Config.probeCache = False
+                return None
+
+    return _PROBE_CACHE
+
+#===============================================================================
+
+def _readMatroska(file, read):
+    """Reads a file with the native Matroska reader, or None if it can't
+
+    Args:
+        file : (str)
+            The mkv to read.
+
+        read : (callable)
+            The <matroska> function to read it with, called with the file.
+
+    Raises:
+        N/A
+
+    Returns:
+        (any)|None
+            What read returned, or None if the file couldn't be read, so the
+            caller can run mkvmerge or mkvextract instead.
+
+    """
+    try:
+        return read(file)
+    except (EnvironmentError, ValueError), err:
+        print "Could not read {file} directly, using MKVToolNix: {err}".format(
+            file=file,
+            err=err
+        )
+        return None
+
+#===============================================================================
+
+def _recorded(stage):
+    """Decorates a Movie stage method, recording every run that finishes
+
+    Args:
+        stage : (str)
+            The stage's name in the history.
+
+    Raises:
+        N/A
+
+    Returns:
+        (callable)
+            The decorator.
+
+    A run that raises isn't recorded. Neither is anything, if the history is
+    disabled.
+
+    """
+    def decorator(func):
+        @wraps(func)
+        def recorded(movie, *args, **kwargs):
+            started = time.time()
+            result = func(movie, *args, **kwargs)
+
+            store = historyStore()
+            if store is None:
+                return result
+
+            record = stageRecord(movie, stage)
+            record['started'] = started
+            record['seconds'] = time.time() - started
+
+            if stage == 'encode':
+                try:
+                    record['outputSize'] = os.path.getsize(movie.destination)
+                except OSError:
+                    pass
+                current = getattr(movie, 'progress', None)
+                if current:
+                    record['avgFps'] = current.avgFps
+                    # Chunks encoded before a restart weren't encoded in the
+                    # time we took.
+                    if record['duration'] and current.skipped:
+                        record['duration'] *= 1 - current.skipped
+
+            try:
+                store.record(record)
+            except history.sqlite3.Error, err:
+                print "Could not record the {stage} of {path}: {err}".format(
+                    stage=stage,
+                    path=movie.path,
+                    err=err
+                )
+            throughputModel().add(record)
+
+            return result
+        return recorded
+    return decorator
+
+#===============================================================================
+
+@contextmanager
+def _runTool(name, reads=None, writes=None):
+    """Measures a run of an external tool, after waiting on its disks
+
+    Args:
+        name : (str)
+            The tool's label, as given to metrics.tool().
+
+        reads=None : [str]
+            The files the tool reads.
+
+        writes=None : [str]
+            The files the tool writes.
+
+    Raises:
+        N/A
+
+    Returns:
+        (<metrics._Measurement>)
+            Given to the with statement. Call its fail() if the tool fails
+            without raising.
+
+    If the tool is IO bound, it first waits until the disks its files are on
+    have room for it. Time spent waiting isn't counted as the tool's.
+
+    """
+    resource = devices.TOOL_RESOURCES.get(name, devices.CPU)
+    paths = (reads or []) + (writes or [])
+    with deviceLimits().hold(resource, paths):
+        with metrics.tool(name, reads=reads, writes=writes) as measured:
+            yield measured
+
+#===============================================================================
+
 def _stripAndRemove(string, remove=None):
     """Strips whitespace and optional chars from both sides of the target string.
 
@@ -183,6 +978,132 @@ def _stripAndRemove(string, remove=None):
 
     return stringFinal
 
+def _sup2SubCounts(lines):
+    """Reads the caption counts out of BDSup2Sub's console output
+
+    Args:
+        lines : [str]
+            The console output of a single BDSup2Sub run, one entry per line.
+
+    Raises:
+        N/A
+
+    Returns:
+        (int), (int)
+            The total number of captions, and the number of forced captions.
+
+    """
+    totalCount = 0
+    forcedCaptions = 0
+
+    for line in lines:
+        if line.startswith('#'):
+            lineList = line.split(' ')
+            # The last count entry from BD will set the total
+            try:
+                totalCount = int(lineList[1])
+            except (ValueError, IndexError):
+                pass
+
+        # There should only be 1 entry with 'forced' in it, that entry
+        # looks like:
+        #
+        # 'Detected 39 forced captions.'
+        if line.startswith('Detected') and 'forced' in line:
+            forcedCaptions = int(line.split()[1])
+
+    return totalCount, forcedCaptions
+
+def _stopSup2SubServers():
+    """Shuts down every idle persistent BDSup2Sub JVM, and their launcher"""
+    while True:
+        try:
+            server = _SUP2SUB_SERVERS.get_nowait()
+        except Queue.Empty:
+            break
+        server.stop()
+
+    Sup2SubServer.removeLauncher()
+
+atexit.register(_stopSup2SubServers)
+
+def _sup2SubPool():
+    """Returns the shared BDSup2Sub worker pool, creating it if needed"""
+    global _SUP2SUB_POOL
+
+    with _SUP2SUB_POOL_LOCK:
+        if not _SUP2SUB_POOL:
+            _SUP2SUB_POOL = ThreadPool(Config.sup2SubWorkers)
+
+    return _SUP2SUB_POOL
+
+def _sup2SubServerRun(args):
+    """Runs a BDSup2Sub conversion on an idle persistent JVM
+
+    Args:
+        args : [str]
+            The BDSup2Sub command line arguments.
+
+    Raises:
+        N/A
+
+    Returns:
+        (int|None, [str])|None
+            BDSup2Sub's exit status and the console output of the conversion,
+            or None if no persistent JVM could be started, in which case the
+            caller should run BDSup2Sub the normal way.
+
+    Conversions are bounded by the BDSup2Sub pool, so we'll never start more
+    JVMs than there are pool workers.
+
+    """
+    try:
+        server = _SUP2SUB_SERVERS.get_nowait()
+    except Queue.Empty:
+        server = Sup2SubServer(Config.java, Config.sup2Sub)
+
+    print ''
+    print "Sending to persistent bdSup2Sub"
+    print ' '.join(args)
+    print ''
+
+    try:
+        result = server.run(args)
+    except (OSError, IOError), err:
+        print "Persistent bdSup2Sub unavailable, starting Java per track:", err
+        Sup2SubServer.unavailable = True
+        server.stop()
+        return None
+
+    _SUP2SUB_SERVERS.put(server)
+
+    return result
+
+def _supInfo(sup):
+    """Reads the caption counts of a sup, returning None if it can't be read
+
+    Args:
+        sup : (str)
+            Path to an extracted PGS subtitle file.
+
+    Raises:
+        N/A
+
+    Returns:
+        <pgs.SupInfo>|None
+            The forced, forcedOnly and totalCount of the sup, or None if it
+            isn't a readable PGS stream.
+
+    """
+    try:
+        return pgs.supInfo(sup)
+    except (EnvironmentError, ValueError), err:
+        print "Couldn't read forced flags from {sup}: {err}".format(
+            sup=sup,
+            err=err
+        )
+        return None
+
 def _trackInfo(line):
     """Takes a track line from mkvmerge -I and returns track information
 
@@ -266,25 +1187,33 @@ class AudioTrack(object):
         self.extracted = False
         self.extractedAudio = None
 
-        self.default = True if self.info['default_track'] == '1' else False
+        # Sizes in bytes, None if mkvmerge didn't report them.
+        self.codecPrivateLength = _infoInt(infoDict, 'codec_private_length')
+        self.size = _infoInt(infoDict, 'tag_number_of_bytes')
 
-    def extractTrack(self):
-        """Extracts the audiotrack this object represents from the parent mkv"""
-        command = "{trackID}:".format(trackID=self.trackID)
+        self.default = True if self.info['default_track'] == '1' else False
 
-        # Derive the location to save the track to
+    def extractPath(self):
+        """Derives the location the extracted audio track should be saved to"""
         fileName = self.movie.fileName.replace('.mkv', '')
         fileName += "_Track{TrackID}_audio.{ext}".format(
             TrackID=self.trackID,
             ext=self.fileType
         )
 
-        self.extractedAudio = os.path.join(
+        return os.path.join(
             self.movie.root,
             self.movie.subdir,
             fileName
         ).replace('\\', '/')
 
+    def extractTrack(self):
+        """Extracts the audiotrack this object represents from the parent mkv"""
+        command = "{trackID}:".format(trackID=self.trackID)
+
+        # Derive the location to save the track to
+        self.extractedAudio = self.extractPath()
+
         print ""
         print "Extracting trackID {ID} of type {type} from {file}".format(
             ID=self.trackID,
@@ -293,9 +1222,36 @@ class AudioTrack(object):
         )
         print ""
 
-        mkvExtract(self.movie.path, command, self.extractedAudio)
+        status = mkvExtract(
+            self.movie.path, command, self.extractedAudio + PARTIAL_EXT
+        )
+
+        self.setExtracted(self.extractedAudio, not status)
+
+    def setExtracted(self, dest, succeeded=True):
+        """Records the result of an extraction of this track
+
+        Args:
+            dest : (str)
+                The file this track is extracted to. The extraction itself
+                was written to dest with PARTIAL_EXT on the end.
+
+            succeeded=True : (bool)
+                False if the extraction failed, in which case anything it
+                wrote is removed.
+
+        Raises:
+            N/A
+
+        Returns:
+            (bool)
+                True if the track was extracted, and isn't empty.
 
-        self.extracted = True
+        """
+        self.extractedAudio = dest
+        self.extracted = _placeExtraction(dest, succeeded)
+
+        return self.extracted
 
 class Config(object):
     """ Class containing the basic encoding environment as described by the .ini
@@ -316,11 +1272,62 @@ class Config(object):
     [Handbrake Settings]
     animation_BFrames: 8
     audio_Fallback: ffac3
+    auto_Remux: no
+    encode_Chunks: 1
+    encode_Threads: 0
     language: English
+    remux_Max_Kbps: 0
     sorting: alphabetical
     sorting_Reverse: no
+    stall_Seconds: 600
     x264_Speed: slow
 
+    [CPU Settings]
+    encode_Slots: 0
+    pin_Cores: yes
+    slot_Cores: 0
+
+    [Disk Settings]
+    io_Workers: 2
+    jobs_Per_Disk: 1
+
+    [Encode Cache]
+    cache_Folder: encodes
+    max_GB: 0
+
+    [Estimate Settings]
+    cache_File: estimates.db
+    sample_Seconds: 30
+    samples: 3
+
+    [History Settings]
+    history_File: history.db
+    slow_Percent: 50
+
+    [Probe Cache]
+    cache_File: probes.db
+    enabled: yes
+    max_Entries: 10000
+    reader: mkvmerge
+
+    [Subtitle Settings]
+    converter: bdsup2sub
+    extractor: mkvextract
+    sup2Sub_Persistent: no
+    sup2Sub_Workers: 2
+
+    [Watch Settings]
+    poll_Seconds: 10
+    settle_Seconds: 60
+
+    [Worker Settings]
+    lease_Seconds: 120
+
+    [Metrics]
+    http_Port: 0
+    metrics_File:
+    write_Seconds: 15
+
     [Base Encode Quality]
     1080p: 20
     720p: 20
@@ -353,11 +1360,67 @@ class Config(object):
     # Handbrake Settings
     bFrames = None
     audioFallback = AUDIO_FALLBACK_DEFAULT
+    autoRemux = AUTO_REMUX_DEFAULT
+    encodeChunks = ENCODE_CHUNKS_DEFAULT
+    encodeThreads = ENCODE_THREADS_DEFAULT
     language = LANGUAGE_DEFAULT
+    remuxMaxKbps = REMUX_MAX_KBPS_DEFAULT
     sorting = SORTING_DEFAULT
     sortingReverse = SORTING_REVERSE_DEFAULT
+    stallSeconds = STALL_SECONDS_DEFAULT
     x264Speed = X264_SPEED_DEFAULT
 
+    # CPU Settings
+    encodeSlots = ENCODE_SLOTS_DEFAULT
+    pinCores = PIN_CORES_DEFAULT
+    slotCores = SLOT_CORES_DEFAULT
+
+    # Disk Settings
+    ioWorkers = IO_WORKERS_DEFAULT
+    jobsPerDisk = JOBS_PER_DISK_DEFAULT
+
+    # Encode Cache
+    # Like the probe cache, nothing is cached until the ini is read.
+    encodeCacheFolder = ''
+    encodeCacheGb = ENCODE_CACHE_GB_DEFAULT
+
+    # Estimate Settings
+    # Like the probe cache, nothing is cached until the ini is read.
+    estimateCacheFile = ''
+    estimateSamples = ESTIMATE_SAMPLES_DEFAULT
+    estimateSeconds = ESTIMATE_SECONDS_DEFAULT
+
+    # History Settings
+    # Nothing is recorded until the ini is read.
+    historyFile = ''
+    slowPercent = SLOW_PERCENT_DEFAULT
+
+    # Probe Cache
+    # The cache file stays blank until the ini is read, so nothing is cached
+    # unless Ripmaster is configured.
+    probeCache = PROBE_CACHE_DEFAULT
+    probeCacheEntries = PROBE_CACHE_ENTRIES_DEFAULT
+    probeCacheFile = ''
+    probeReader = PROBE_READER_DEFAULT
+
+    # Subtitle Settings
+    converter = CONVERTER_DEFAULT
+    extractor = EXTRACTOR_DEFAULT
+    sup2SubPersistent = SUP2SUB_PERSISTENT_DEFAULT
+    sup2SubWorkers = SUP2SUB_WORKERS_DEFAULT
+
+    # Watch Settings
+    watchPoll = WATCH_POLL_DEFAULT
+    watchSettle = WATCH_SETTLE_DEFAULT
+
+    # Worker Settings
+    leaseSeconds = LEASE_SECONDS_DEFAULT
+
+    # Metrics
+    metricsFile = METRICS_FILE_DEFAULT
+    metricsInterval = METRICS_INTERVAL_DEFAULT
+    metricsPort = METRICS_PORT_DEFAULT
+
     # Encode Qualities
     quality = {'uq': {}, 'hq': {}, 'bq': {}}
 
@@ -510,19 +1573,197 @@ class Config(object):
                 cat, 'audio_Fallback', AUDIO_FALLBACK_DEFAULT,
                 allowed=AUDIO_FALLBACKS
             )
+            cls.autoRemux = optionalGet(
+                cat, 'auto_Remux', AUTO_REMUX_DEFAULT, type=bool
+            )
+            cls.encodeChunks = optionalGet(
+                cat, 'encode_Chunks', ENCODE_CHUNKS_DEFAULT, type=int
+            )
+            if cls.encodeChunks < 1:
+                cls.encodeChunks = ENCODE_CHUNKS_DEFAULT
+            cls.encodeThreads = optionalGet(
+                cat, 'encode_Threads', ENCODE_THREADS_DEFAULT, type=int
+            )
+            if cls.encodeThreads < 0:
+                cls.encodeThreads = ENCODE_THREADS_DEFAULT
             cls.language = optionalGet(
                 cat, 'language', LANGUAGE_DEFAULT, allowed=LANGUAGES
             )
+            cls.remuxMaxKbps = optionalGet(
+                cat, 'remux_Max_Kbps', REMUX_MAX_KBPS_DEFAULT, type=int
+            )
+            if cls.remuxMaxKbps < 0:
+                cls.remuxMaxKbps = REMUX_MAX_KBPS_DEFAULT
             cls.sorting = optionalGet(
                 cat, 'sorting', SORTING_DEFAULT, allowed=SORTINGS
             )
             cls.sortingReverse = optionalGet(
                 cat, 'sorting_Reverse', SORTING_REVERSE_DEFAULT, type=bool
             )
+            cls.stallSeconds = optionalGet(
+                cat, 'stall_Seconds', STALL_SECONDS_DEFAULT, type=int
+            )
+            if cls.stallSeconds < 1:
+                cls.stallSeconds = STALL_SECONDS_DEFAULT
             cls.x264Speed = optionalGet(
                 cat, 'x264_Speed', X264_SPEED_DEFAULT, allowed=X264_SPEEDS
             )
 
+            cat = 'CPU Settings'
+            cls.encodeSlots = optionalGet(
+                cat, 'encode_Slots', ENCODE_SLOTS_DEFAULT, type=int
+            )
+            if cls.encodeSlots < 0:
+                cls.encodeSlots = ENCODE_SLOTS_DEFAULT
+            cls.pinCores = optionalGet(
+                cat, 'pin_Cores', PIN_CORES_DEFAULT, type=bool
+            )
+            cls.slotCores = optionalGet(
+                cat, 'slot_Cores', SLOT_CORES_DEFAULT, type=int
+            )
+            if cls.slotCores < 0:
+                cls.slotCores = SLOT_CORES_DEFAULT
+
+            cat = 'Disk Settings'
+            cls.ioWorkers = optionalGet(
+                cat, 'io_Workers', IO_WORKERS_DEFAULT, type=int
+            )
+            if cls.ioWorkers < 1:
+                cls.ioWorkers = IO_WORKERS_DEFAULT
+            cls.jobsPerDisk = optionalGet(
+                cat, 'jobs_Per_Disk', JOBS_PER_DISK_DEFAULT, type=int
+            )
+            if cls.jobsPerDisk < 0:
+                cls.jobsPerDisk = JOBS_PER_DISK_DEFAULT
+
+            cat = 'Encode Cache'
+            cls.encodeCacheFolder = optionalGet(
+                cat, 'cache_Folder', ENCODE_CACHE_FOLDER_DEFAULT
+            ) or ENCODE_CACHE_FOLDER_DEFAULT
+            cls.encodeCacheFolder = os.path.join(
+                os.path.dirname(os.path.abspath(iniFile)),
+                cls.encodeCacheFolder
+            )
+            cls.encodeCacheGb = optionalGet(
+                cat, 'max_GB', ENCODE_CACHE_GB_DEFAULT, type=int
+            )
+            if cls.encodeCacheGb < 0:
+                cls.encodeCacheGb = ENCODE_CACHE_GB_DEFAULT
+
+            cat = 'Estimate Settings'
+            cls.estimateCacheFile = optionalGet(
+                cat, 'cache_File', ESTIMATE_CACHE_FILE_DEFAULT
+            )
+            # Left blank, estimates aren't cached.
+            if cls.estimateCacheFile:
+                cls.estimateCacheFile = os.path.join(
+                    os.path.dirname(os.path.abspath(iniFile)),
+                    cls.estimateCacheFile
+                )
+            cls.estimateSamples = optionalGet(
+                cat, 'samples', ESTIMATE_SAMPLES_DEFAULT, type=int
+            )
+            if cls.estimateSamples < 1:
+                cls.estimateSamples = ESTIMATE_SAMPLES_DEFAULT
+            cls.estimateSeconds = optionalGet(
+                cat, 'sample_Seconds', ESTIMATE_SECONDS_DEFAULT, type=int
+            )
+            if cls.estimateSeconds < 1:
+                cls.estimateSeconds = ESTIMATE_SECONDS_DEFAULT
+
+            cat = 'History Settings'
+            cls.historyFile = optionalGet(
+                cat, 'history_File', HISTORY_FILE_DEFAULT
+            )
+            # Left blank, nothing is recorded.
+            if cls.historyFile:
+                cls.historyFile = os.path.join(
+                    os.path.dirname(os.path.abspath(iniFile)),
+                    cls.historyFile
+                )
+            cls.slowPercent = optionalGet(
+                cat, 'slow_Percent', SLOW_PERCENT_DEFAULT, type=int
+            )
+            if cls.slowPercent < 0:
+                cls.slowPercent = SLOW_PERCENT_DEFAULT
+
+            cat = 'Probe Cache'
+            cls.probeCache = optionalGet(
+                cat, 'enabled', PROBE_CACHE_DEFAULT, type=bool
+            )
+            cls.probeCacheEntries = optionalGet(
+                cat, 'max_Entries', PROBE_CACHE_ENTRIES_DEFAULT, type=int
+            )
+            if cls.probeCacheEntries < 1:
+                cls.probeCacheEntries = PROBE_CACHE_ENTRIES_DEFAULT
+            cls.probeCacheFile = optionalGet(
+                cat, 'cache_File', PROBE_CACHE_FILE_DEFAULT
+            )
+            if not os.path.isabs(cls.probeCacheFile):
+                cls.probeCacheFile = os.path.join(
+                    os.path.dirname(os.path.abspath(iniFile)),
+                    cls.probeCacheFile
+                )
+            cls.probeReader = optionalGet(
+                cat, 'reader', PROBE_READER_DEFAULT, allowed=PROBE_READERS
+            )
+
+            cat = 'Subtitle Settings'
+            cls.converter = optionalGet(
+                cat, 'converter', CONVERTER_DEFAULT, allowed=CONVERTERS
+            )
+            cls.extractor = optionalGet(
+                cat, 'extractor', EXTRACTOR_DEFAULT, allowed=EXTRACTORS
+            )
+            cls.sup2SubPersistent = optionalGet(
+                cat, 'sup2Sub_Persistent', SUP2SUB_PERSISTENT_DEFAULT,
+                type=bool
+            )
+            cls.sup2SubWorkers = optionalGet(
+                cat, 'sup2Sub_Workers', SUP2SUB_WORKERS_DEFAULT, type=int
+            )
+            if cls.sup2SubWorkers < 1:
+                cls.sup2SubWorkers = SUP2SUB_WORKERS_DEFAULT
+
+            cat = 'Watch Settings'
+            cls.watchPoll = optionalGet(
+                cat, 'poll_Seconds', WATCH_POLL_DEFAULT, type=int
+            )
+            if cls.watchPoll < 1:
+                cls.watchPoll = WATCH_POLL_DEFAULT
+            cls.watchSettle = optionalGet(
+                cat, 'settle_Seconds', WATCH_SETTLE_DEFAULT, type=int
+            )
+            if cls.watchSettle < 0:
+                cls.watchSettle = WATCH_SETTLE_DEFAULT
+
+            cat = 'Worker Settings'
+            cls.leaseSeconds = optionalGet(
+                cat, 'lease_Seconds', LEASE_SECONDS_DEFAULT, type=int
+            )
+            if cls.leaseSeconds < 1:
+                cls.leaseSeconds = LEASE_SECONDS_DEFAULT
+
+            cat = 'Metrics'
+            cls.metricsPort = optionalGet(
+                cat, 'http_Port', METRICS_PORT_DEFAULT, type=int
+            )
+            if not 0 <= cls.metricsPort < 65536:
+                cls.metricsPort = METRICS_PORT_DEFAULT
+            cls.metricsFile = optionalGet(
+                cat, 'metrics_File', METRICS_FILE_DEFAULT
+            )
+            if cls.metricsFile and not os.path.isabs(cls.metricsFile):
+                cls.metricsFile = os.path.join(
+                    os.path.dirname(os.path.abspath(iniFile)),
+                    cls.metricsFile
+                )
+            cls.metricsInterval = optionalGet(
+                cat, 'write_Seconds', METRICS_INTERVAL_DEFAULT, type=int
+            )
+            if cls.metricsInterval < 1:
+                cls.metricsInterval = METRICS_INTERVAL_DEFAULT
+
             # Quality catagories are also optional, defaulting to 20.
             qualityCats =  [
                 'Base Encode Quality',
@@ -573,6 +1814,8 @@ class Movie(object):
         self.preset = None
         self.tv = False
         self.fps = None
+        # If True, the source's video is merged as it is, without encoding.
+        self.remux = False
 
         self._getInstructions()
 
@@ -584,6 +1827,9 @@ class Movie(object):
 
         self.vobsub = False
 
+        # Duration in seconds, if mkvmerge reports one
+        self.duration = None
+
         self._getTracks()
 
         # If we don't have a resolution from instructions, we need to grab it
@@ -604,13 +1850,43 @@ class Movie(object):
         if self.quality in QUALITIES:
             self.quality = Config.quality[self.quality][str(self.resolution)]
 
+        if not self.remux and Config.autoRemux:
+            self.remux = self._canRemux()
+
         # Progress
 
         self.extracted = False
         self.converted = False
-        self.encoded = False
+        # A remuxed movie's video is ready for the merge as it is.
+        self.encoded = self.remux
         self.merged = False
 
+        # Ranges of a chunked encode, each a dictionary of its start and
+        # length in seconds, the file it's encoded to, and if it's encoded.
+        self.chunks = []
+
+        # The <progress.EncodeProgress> of the running or last encode
+        self.progress = None
+
+        # The <estimate.Estimate> of the encode, once estimateEncode has run
+        self.estimate = None
+
+    def __setstate__(self, state):
+        """Restores a pickled movie, filling in attributes it predates
+
+        Movies pickled by older versions of Ripmaster, like those imported
+        from movies.p, have none of the attributes added since, so they get
+        the same defaults a new movie starts with.
+
+        """
+        self.remux = False
+        self.duration = None
+        self.chunks = []
+        self.progress = None
+        self.estimate = None
+
+        self.__dict__.update(state)
+
     def _getInstructions(self):
         """Parses the directory name to grab all the given instructions"""
         try:
@@ -642,6 +1918,55 @@ class Movie(object):
                 self.fps = int(fps.replace('p', ''))
         if 'tv' in instructionSet:
             self.tv = True
+        if 'remux' in instructionSet:
+            self.remux = True
+
+    def _canRemux(self):
+        """Checks if the source's video can be merged without encoding
+
+        Args:
+            N/A
+
+        Raises:
+            N/A
+
+        Returns:
+            (bool)
+                True if the first video track is already H.264, no wider or
+                taller than the target resolution, and no more than
+                remux_Max_Kbps, if that's set. Movies that need deinterlacing
+                or a forced frame rate are always encoded.
+
+        """
+        if not self.videoTracks or self.tv or self.fps:
+            return False
+
+        info = self.videoTracks[0][1]
+        if info.get('codec_id') not in REMUX_CODECS:
+            return False
+
+        try:
+            width, height = [
+                int(size) for size in info['pixel_dimensions'].split('x')
+            ]
+        except (KeyError, ValueError):
+            return False
+        if width > RESOLUTION_WIDTH[self.resolution] or \
+                height > self.resolution:
+            return False
+
+        if Config.remuxMaxKbps:
+            # The whole file's bitrate, audio and all, is all mkvmerge tells
+            # us without reading the video.
+            try:
+                size = os.path.getsize(self.path)
+            except OSError:
+                return False
+            if not self.duration or \
+                    size * 8 / self.duration / 1000 > Config.remuxMaxKbps:
+                return False
+
+        return True
 
     def _getTracks(self):
         """Runs mkvInfo on the file to grab all the tracks, creating them"""
@@ -651,40 +1976,110 @@ class Movie(object):
         self.audioTracks = audioTracks
         self.subtitleTracks = subtitleTracks
 
-    def extractTracks(self):
-        """Extracts relevant tracks"""
+    def _encodeChunks(self, options, checkpoint=None):
+        """Encodes each chunk with its own HandBrake, then joins them
 
-        for track in self.videoTracks:
-            # TODO: Multiple video track support
-            pass
+        Args:
+            options : (str)
+                The HandBrake options for the whole movie.
 
-        for track in self.audioTracks:
-            # We're pulling every audio track present in the source mkv
-            # straight into the final merge mkv, so no need to extract
-            pass
+            checkpoint=None : (callable)
+                Called after each chunk is encoded.
 
-        for track in self.subtitleTracks:
-            if track.fileType in EXTRACTABLE_SUBTITLE:
-                if not track.extracted:
-                    track.extractTrack()
+        Raises:
+            RuntimeError
+                Raised if a chunk couldn't be encoded, or the chunks couldn't
+                be joined. Chunks that were encoded are kept, and aren't
+                encoded again next time.
 
-        self.extracted = True
+        Returns:
+            None
 
-    def convertTracks(self):
-        """Converts subtitles to correct res and fileType"""
+        """
+        lock = threading.Lock()
+
+        # Each chunk's progress counts towards the movie's by its length.
+        parts = {}
+        for chunk in self.chunks:
+            if self.duration:
+                length = chunk['length'] or self.duration - chunk['start']
+                weight = length / self.duration
+            else:
+                weight = 1.0 / len(self.chunks)
+            if chunk['encoded']:
+                self.progress.skip(weight)
+            else:
+                parts[chunk['path']] = self.progress.part(weight)
+
+        def encode(chunk):
+            """Encodes a single chunk"""
+            rangeOptions = ''
+            if chunk['start']:
+                rangeOptions += ' --start-at duration:{start}'.format(
+                    start=chunk['start']
+                )
+            if chunk['length']:
+                rangeOptions += ' --stop-at duration:{length}'.format(
+                    length=chunk['length']
+                )
 
-        # TODO: Is there an audio codec that handbrake AND mkvMerge can't
-        # read?
+            status = handBrake(
+                self.path, options + rangeOptions, chunk['path'],
+                encodeProgress=parts[chunk['path']]
+            )
+            if status or not os.path.isfile(chunk['path']):
+                return
 
-        for track in self.subtitleTracks:
-            if not track.converted:
-                track.convertTrack()
+            with lock:
+                chunk['encoded'] = True
+                if checkpoint:
+                    checkpoint()
 
-        self.converted = True
+        chunks = [chunk for chunk in self.chunks if not chunk['encoded']]
+        if chunks:
+            pool = ThreadPool(len(chunks))
+            try:
+                pool.map(metrics.carry(encode), chunks)
+            finally:
+                pool.close()
+                pool.join()
+
+        failed = len([chunk for chunk in self.chunks if not chunk['encoded']])
+        if failed:
+            raise RuntimeError(
+                'HandBrake failed to encode {failed} of {count} chunks of '
+                '{path}'.format(
+                    failed=failed, count=len(self.chunks), path=self.path
+                )
+            )
+
+        paths = [chunk['path'] for chunk in self.chunks]
+        if mkvAppend(paths, self.destination):
+            raise RuntimeError(
+                'mkvmerge could not join the chunks of {path}'.format(
+                    path=self.path
+                )
+            )
+
+        for path in paths:
+            os.remove(path)
+
+    def _encodeOptions(self, chunks=None):
+        """Builds the HandBrake options for encoding the movie
+
+        Args:
+            chunks=None : [{str: float|None|str|bool}]
+                The chunks of a chunked encode, which split the cores between
+                them.
+
+        Raises:
+            N/A
 
-    def encodeMovie(self):
-        """Encodes the video, supported audio and subtitle tracks"""
+        Returns:
+            (str)
+                The options, without the source, destination or any range.
 
+        """
         #
         # VIDEO OPTIONS
         #
@@ -693,15 +2088,28 @@ class Movie(object):
         options = '-f mkv -m -e x264 --x264-preset ' + Config.x264Speed
 
         # Encoder Tuning
+        encopts = []
         if self.preset:
             options += ' --x264-tune {preset}'.format(preset=self.preset)
             if self.preset == 'animation' and Config.bFrames:
                 # If we've set additional animation bframes in the Config, we'll
                 # add those to the preset's built in bFrames now.
                 bFrames = str(BFRAMES[Config.x264Speed] + int(Config.bFrames))
-                options += ' --encopts bframes={bFrames}'.format(
-                    bFrames=bFrames
-                )
+                encopts.append('bframes={bFrames}'.format(bFrames=bFrames))
+
+        # Chunks split the cores between them, rather than each one starting
+        # a thread per core. With encode slots, each HandBrake gets a thread
+        # per core of the slot it runs in instead.
+        if chunks:
+            threads = Config.encodeThreads
+            if not threads and not cpuSlots():
+                running = [chunk for chunk in chunks if not chunk['encoded']]
+                threads = max(1, cpu_count() // max(1, len(running)))
+            if threads:
+                encopts.append('threads={threads}'.format(threads=threads))
+
+        if encopts:
+            options += ' --encopts {encopts}'.format(encopts=':'.join(encopts))
 
         # Encoder Quality
         options += ' -q {quality}'.format(quality=str(self.quality))
@@ -749,17 +2157,236 @@ class Movie(object):
         # SUBTITLES
         #
 
+        if self.vobsub:
+            options += ' -N {lang} -s scan'.format(lang=Config.language)
+
+        return options
+
+    def _planChunks(self):
+        """Splits the movie into chunks, if chunked encoding is configured
+
+        Args:
+            N/A
+
+        Raises:
+            N/A
+
+        Returns:
+            [{str: float|None|str|bool}]
+                The chunks. Empty if the movie is encoded in one piece.
+
+        A chunk plan is kept once made, so an encode that's picked up after a
+        crash carries on with the same chunks.
+
+        """
+        if self.chunks:
+            return self.chunks
+
+        self.chunks = []
+
+        # HandBrake's subtitle scan needs to see the whole movie.
+        if Config.encodeChunks < 2 or self.vobsub:
+            return self.chunks
+
+        ranges = _chunkRanges(
+            mkvChapters(self.path), self.duration, Config.encodeChunks
+        )
+        for i, (start, length) in enumerate(ranges):
+            # Named like the encode, so it's never mistaken for a new movie.
+            path = self.destination.replace(
+                '.mkv', '.chunk{i:02d}.mkv'.format(i=i)
+            )
+            self.chunks.append(
+                {'start': start, 'length': length, 'path': path,
+                 'encoded': False}
+            )
+
+        return self.chunks
+
+    @metrics.stage('extract')
+    @_recorded('extract')
+    def extractTracks(self):
+        """Extracts relevant tracks"""
+
+        for track in self.videoTracks:
+            # TODO: Multiple video track support
+            pass
+
+        for track in self.audioTracks:
+            # We're pulling every audio track present in the source mkv
+            # straight into the final merge mkv, so no need to extract
+            pass
+
+        tracks = []
+        for track in self.subtitleTracks:
+            if track.fileType in EXTRACTABLE_SUBTITLE:
+                if not track.extracted:
+                    tracks.append(track)
+
+        # Every track we need comes out of a single mkvextract run, so the
+        # source is only read from disk once no matter how many tracks it has.
+        if tracks:
+            extractTracks(self.path, tracks)
+
+        # If mkvextract failed to write any of the tracks, we'll leave the
+        # movie unextracted so those tracks get retried next time.
+        self.extracted = all([track.extracted for track in tracks])
+
+    @metrics.stage('convert')
+    @_recorded('convert')
+    def convertTracks(self):
+        """Converts subtitles to correct res and fileType"""
+
+        # TODO: Is there an audio codec that handbrake AND mkvMerge can't
+        # read?
+
+        tracks = []
+        for track in self.subtitleTracks:
+            # Only tracks we pulled out of the mkv have anything to convert.
+            if track.extracted and not track.converted:
+                tracks.append(track)
+
+        # Each track converts independently of the others, so we hand them to
+        # the shared BDSup2Sub pool, which other movies are also feeding.
+        _sup2SubPool().map(metrics.carry(SubtitleTrack.convertTrack), tracks)
+
+        self.converted = True
+
+    @metrics.stage('encode')
+    @_recorded('encode')
+    def encodeMovie(self, checkpoint=None):
+        """Encodes the video, supported audio and subtitle tracks
+
+        Args:
+            checkpoint=None : (callable)
+                Called after each chunk of a chunked encode is finished, so
+                that progress can be saved.
+
+        Raises:
+            RuntimeError
+                Raised if HandBrake fails to encode the movie, or any chunk
+                of it.
+
+        Returns:
+            None
+
+        If the Config asks for more than one encode chunk, the movie is split
+        at chapters into that many ranges, and each range is encoded by its
+        own HandBrake at the same time, with the cores split between them.
+        x264 doesn't make good use of many threads on a single 1080p encode,
+        so this gets more out of a large machine. The chunks are then joined,
+        without re-encoding, with mkvmerge.
+
+        """
+
         for track in self.subtitleTracks:
             if track.fileType == 'vobsub':
                 self.vobsub = True
 
-        if self.vobsub:
-            options += ' -N {lang} -s scan'.format(lang=Config.language)
+        chunks = self._planChunks()
+        options = self._encodeOptions(chunks)
 
-        handBrake(self.path, options, self.destination)
+        self.progress = progress.EncodeProgress(self.duration)
 
+        if chunks:
+            self._encodeChunks(options, checkpoint)
+        else:
+            status = handBrake(
+                self.path, options, self.destination,
+                encodeProgress=self.progress
+            )
+            # A HandBrake that failed, or was stopped, can leave part of an
+            # encode behind, which must never be merged.
+            if status or not os.path.isfile(self.destination):
+                raise RuntimeError(
+                    'HandBrake failed to encode {path}, exiting with status '
+                    '{status}'.format(path=self.path, status=status)
+                )
+
+        self.progress.finish()
         self.encoded = True
 
+    def estimateEncode(self):
+        """Estimates the encode's time and size from sample encodes
+
+        Args:
+            N/A
+
+        Raises:
+            N/A
+
+        Returns:
+            <estimate.Estimate>|None
+                The estimate, also kept as the movie's estimate. None if the
+                movie's duration isn't known, or no sample could be encoded.
+
+        A few short ranges of the movie are encoded with the options the real
+        encode will use, and timed. Estimates are cached by source file,
+        options and sampling, so a movie is only sampled again if it or the
+        settings change.
+
+        A movie that's remuxed isn't encoded at all, so its estimate is no
+        time at all, and the size of the source.
+
+        """
+        if self.remux:
+            try:
+                size = os.path.getsize(self.path)
+            except OSError:
+                size = None
+            self.estimate = estimate.Estimate(0.0, size, None, None)
+            return self.estimate
+
+        options = self._encodeOptions()
+        key = '{handBrake} {options} x{samples} {seconds}s'.format(
+            handBrake=Config.handBrake,
+            options=options,
+            samples=Config.estimateSamples,
+            seconds=Config.estimateSeconds
+        )
+
+        cache = _estimateCache()
+        cached = cache.get(self.path) if cache is not None else None
+        if cached and key in cached:
+            self.estimate = cached[key]
+            return self.estimate
+
+        windows = estimate.sampleWindows(
+            self.duration, Config.estimateSamples, Config.estimateSeconds
+        )
+
+        samples = []
+        for i, (start, length) in enumerate(windows):
+            # Named like the encode, so it's never mistaken for a new movie.
+            dest = self.destination.replace(
+                '.mkv', '.sample{i:02d}.mkv'.format(i=i)
+            )
+            rangeOptions = (
+                ' --start-at duration:{start} --stop-at duration:{length}'
+            ).format(start=start, length=length)
+
+            started = time.time()
+            status = handBrake(
+                self.path, options + rangeOptions, dest, cache=False
+            )
+            taken = time.time() - started
+
+            if os.path.isfile(dest):
+                if not status:
+                    samples.append((length, taken, os.path.getsize(dest)))
+                os.remove(dest)
+
+        self.estimate = estimate.extrapolate(self.duration, samples)
+
+        if cache is not None and self.estimate:
+            cached = cached or {}
+            cached[key] = self.estimate
+            cache.put(self.path, cached)
+
+        return self.estimate
+
+    @metrics.stage('merge')
+    @_recorded('merge')
     def mergeMovie(self):
         """Uses mkvmerge to merge the movie and extracted/converted tracks"""
 
@@ -821,28 +2448,34 @@ class Movie(object):
                     # Add non-forced track
                     subCommand.append(track.convertedIdx)
 
-        # We're going to create a sub-movie that represents the converted
-        # mkv file, to get information on it's subtitle tracks.
+        if self.remux:
+            # The video comes straight from the source, without its audio
+            # and subtitles, which are added the same way as for an encode.
+            vidCommand.extend(['-A', '-S', '-B', '-M', self.path])
+        else:
+            # We're going to create a sub-movie that represents the converted
+            # mkv file, to get information on it's subtitle tracks.
 
-        convertedFName = self.fileName.replace('.mkv', '--converted.mkv')
+            convertedFName = self.fileName.replace('.mkv', '--converted.mkv')
 
-        converted = Movie(self.root, self.subdir, convertedFName)
+            converted = Movie(self.root, self.subdir, convertedFName)
 
-        if subDefault:
-            for track in converted.subtitleTracks:
-                vidCommand.extend(['--default-track', '{trackID}:0'.format(
-                    trackID=track.trackID
-                )])
+            if subDefault:
+                for track in converted.subtitleTracks:
+                    vidCommand.extend(['--default-track', '{trackID}:0'.format(
+                        trackID=track.trackID
+                    )])
 
-        # We'll use -A to exclude any audio tracks that snuck in. There should
-        # not be any.
-        vidCommand.extend(['-A', self.destination])
+            # We'll use -A to exclude any audio tracks that snuck in. There
+            # should not be any.
+            vidCommand.extend(['-A', self.destination])
 
         command = vidCommand + audCommand + subCommand
 
-        mkvmerge(command, dFile)
-
-        self.merged = True
+        # 1 means mkvmerge had warnings, but still wrote the file.
+        if mkvmerge(command, dFile) in [0, 1]:
+            self.merged = True
+            metrics.inc('ripmaster_movies_completed_total')
 
 class SubtitleTrack(object):
     """A single subtitle track.
@@ -866,6 +2499,10 @@ class SubtitleTrack(object):
         self.extracted = False
         self.extractedSup = None
 
+        # Sizes in bytes, None if mkvmerge didn't report them.
+        self.codecPrivateLength = _infoInt(infoDict, 'codec_private_length')
+        self.size = _infoInt(infoDict, 'tag_number_of_bytes')
+
         # When converted, there will be an Idx file and a Sub file
         self.converted = False
         self.convertedIdx = None
@@ -884,39 +2521,137 @@ class SubtitleTrack(object):
         # Default track means this is the main subtitle track
         self.default = True if self.info['default_track'] == '1' else False
 
+    def extractPath(self):
+        """Derives the location the extracted subtitle should be saved to"""
+        fileName = self.movie.fileName.replace('.mkv', '')
+        # TODO: Should this be locked into .sup?
+        fileName += "_Track{trackID}_sub.sup".format(trackID=self.trackID)
+
+        return os.path.join(
+            self.movie.root,
+            self.movie.subdir,
+            fileName
+        ).replace('\\', '/')
+
     def extractTrack(self):
         """Extracts the subtitle this object represents from the parent mkv"""
         command = "{trackID}:".format(trackID=str(self.trackID))
 
         # Derive the location the track should be saved to
-        fileName = self.movie.fileName.replace('.mkv', '')
-        # TODO: Should this be locked into .sup?
-        fileName += "_Track{trackID}_sub.sup".format(trackID=self.trackID)
+        self.extractedSup = self.extractPath()
+
+        print ""
+        print "Extracting trackID {ID} of type {type} from {file}".format(
+            ID=self.trackID,
+            type=self.fileType,
+            file=self.movie.path
+        )
+        print ""
+
+        partial = self.extractedSup + PARTIAL_EXT
+        if Config.extractor == 'native' and _extractNative(
+                self.movie.path, [(self.trackID, partial)]):
+            status = 0
+        else:
+            status = mkvExtract(self.movie.path, command, partial)
+
+        self.setExtracted(self.extractedSup, not status)
+
+    def setExtracted(self, dest, succeeded=True):
+        """Records the result of an extraction of this track
+
+        Args:
+            dest : (str)
+                The file this track is extracted to. The extraction itself
+                was written to dest with PARTIAL_EXT on the end.
+
+            succeeded=True : (bool)
+                False if the extraction failed, in which case anything it
+                wrote is removed.
+
+        Raises:
+            N/A
+
+        Returns:
+            (bool)
+                True if the track was extracted, and isn't empty.
+
+        """
+        self.extractedSup = dest
+        self.extracted = _placeExtraction(dest, succeeded)
+
+        return self.extracted
+
+    def _convertNative(self, res):
+        """Converts the subtitle track with tools.vobsub instead of BDSup2Sub
+
+        Args:
+            res : (str)
+                The resolution to convert to, as BDSup2Sub would be given it.
+
+        Raises:
+            N/A
+
+        Returns:
+            (bool)
+                True if the track was converted. False if NumPy isn't
+                available or the sup couldn't be converted, in which case
+                BDSup2Sub should be used instead.
+
+        """
+        if self.forced:
+            self.convertedIdxForced = self.convertedIdx.replace(
+                '.idx',
+                '_forced.idx'
+            )
+            self.convertedSubForced = self.convertedSub.replace(
+                '.sub',
+                '_forced.sub'
+            )
 
-        self.extractedSup = os.path.join(
-            self.movie.root,
-            self.movie.subdir,
-            fileName
-        ).replace('\\', '/')
+        # The full track and the forced track come out of the same pass. A
+        # track that's entirely forced only needs the forced track.
+        try:
+            vobsub.convert(
+                self.extractedSup,
+                idx=None if self.forcedOnly else self.convertedIdx,
+                forcedIdx=self.convertedIdxForced,
+                resolution=res,
+                language=self.info.get('language', 'eng')
+            )
+        except (ImportError, EnvironmentError, ValueError), err:
+            print "Native conversion of track {ID} of {file} failed: " \
+                "{err}".format(ID=self.trackID, file=self.movie.path, err=err)
+            print "Falling back to BDSup2Sub"
+            return False
 
-        print ""
-        print "Extracting trackID {ID} of type {type} from {file}".format(
+        print "Saved track {ID} of {file} to {dest}".format(
             ID=self.trackID,
-            type=self.fileType,
-            file=self.movie.path
+            file=self.movie.path,
+            dest=self.convertedIdxForced if self.forcedOnly else \
+                self.convertedIdx
+        )
+        print "Track {ID} of {file} has forced titles? {forced}".format(
+            ID=self.trackID,
+            file=self.movie.path,
+            forced=self.forced
+        )
+        print "Track {ID} of {file} is ONLY forced titles? {only}".format(
+            ID=self.trackID,
+            file=self.movie.path,
+            only=self.forcedOnly
         )
         print ""
 
-        mkvExtract(self.movie.path, command, self.extractedSup)
-
-        self.extracted = True
+        return True
 
     def convertTrack(self):
         """Converts and resizes the subtitle track"""
 
         print ""
-        print "Converting track {ID} at res: {res}p".format(
+        print "Converting track {ID} of {file} at res: {res}p".format(
             ID=self.trackID,
+            file=self.movie.path,
             res=str(self.movie.resolution)
         )
 
@@ -935,49 +2670,59 @@ class SubtitleTrack(object):
         self.convertedIdx = self.extractedSup.replace('.sup', '.idx')
         self.convertedSub = self.extractedSup.replace('.sup', '.sub')
 
-        print "Saving IDX file to {dest}".format(dest=self.convertedIdx)
-
-        # Using deprecated os.popen (easier) to put shell output in list
-        shellOut = bdSup2Sub(self.extractedSup, options, self.convertedIdx, popen=True)
+        # Reading the forced flags straight out of the sup is much quicker than
+        # a BDSup2Sub run, and tells us up front which passes we'll need. If
+        # the sup can't be read, we'll get the flags from BDSup2Sub instead.
+        info = _supInfo(self.extractedSup)
 
-        # We need to check the results for FORCED subtitles
-        #
-        # If the amount of Forced subtitles is less than the total subs
-        # We'll just create a new .idx file in addition to the default one.
-        #
-        # If the amount of Forced subtitles is the same as the total subs,
-        # the entire subtitle track is forced, so we remove the resultFiles
-        # and create a new FORCED .idx
+        if info:
+            self.forced = info.forced
+            self.forcedOnly = info.forcedOnly
 
-        totalCount = 0
+        if info and Config.converter == 'native' and self._convertNative(res):
+            self.converted = True
+            return
 
-        for line in shellOut:
+        # A track that's entirely forced only needs the forced pass below.
+        if not info or not self.forcedOnly:
+            print "Saving IDX file to {dest}".format(dest=self.convertedIdx)
 
-            print line
+            # Captured so we can read the forced caption counts from it
+            shellOut = bdSup2Sub(
+                self.extractedSup, options, self.convertedIdx, popen=True
+            )
 
-            if line.startswith('#'):
-                lineList = line.split(' ')
-                # The last count entry from BD will set the total
-                try:
-                    totalCount = int(lineList[1])
-                except ValueError:
-                    pass
+            # Other tracks may be converting at the same time, so we print
+            # this track's output in one go rather than line by line.
+            print '\n'.join(shellOut)
 
-            # There should only be 1 entry with 'forced' in it, that entry
-            # looks like:
+        if not info:
+            # We need to check the results for FORCED subtitles
             #
-            # 'Detected 39 forced captions.'
-            if 'forced' in line:
-                forcedCaptions = int(line.split()[1])
+            # If the amount of Forced subtitles is less than the total subs
+            # We'll just create a new .idx file in addition to the default one.
+            #
+            # If the amount of Forced subtitles is the same as the total subs,
+            # the entire subtitle track is forced, so we remove the resultFiles
+            # and create a new FORCED .idx
+            totalCount, forcedCaptions = _sup2SubCounts(shellOut)
 
-                if forcedCaptions > 0:
-                    self.forced = True
+            if forcedCaptions > 0:
+                self.forced = True
                 if forcedCaptions == totalCount:
                     self.forcedOnly = True
 
         print ""
-        print "Subtitle track has forced titles?", self.forced
-        print "Subtitle track is ONLY forced titles?", self.forcedOnly
+        print "Track {ID} of {file} has forced titles? {forced}".format(
+            ID=self.trackID,
+            file=self.movie.path,
+            forced=self.forced
+        )
+        print "Track {ID} of {file} is ONLY forced titles? {only}".format(
+            ID=self.trackID,
+            file=self.movie.path,
+            only=self.forcedOnly
+        )
         print ""
 
         if self.forced:
@@ -990,10 +2735,11 @@ class SubtitleTrack(object):
                 '_forced.sub'
             )
 
-        if self.forced and not self.forcedOnly:
+        if self.forced and (info or not self.forcedOnly):
             # If some forced subtitles exist (but not the entire subtitle
             # track is forced), we'll create a new _FORCED.idx in addition
-            # to the one already exported.
+            # to the one already exported. If we knew the track was entirely
+            # forced before converting, this is the only pass we run.
             options += ' -D'
 
             bdSup2Sub(self.extractedSup, options, self.convertedIdxForced)
@@ -1017,6 +2763,185 @@ class SubtitleTrack(object):
 
         self.converted = True
 
+class Sup2SubServer(object):
+    """A long running JVM that runs BDSup2Sub conversions sent to it
+
+    Args:
+        java : (str)
+            Path to the java executable.
+
+        jar : (str)
+            Path to the BDSup2Sub jar.
+
+    Starting Java for every subtitle track costs more than converting a small
+    track does. A Sup2SubServer starts the Sup2SubServer launcher from
+    tools/java once, on the shared runner like any other tool, then feeds it
+    conversion jobs over stdin, reading back BDSup2Sub's console output for
+    each.
+
+    The launcher is compiled with the javac found next to the configured java
+    (or on the PATH) the first time it's needed, into a temporary folder that's
+    removed at exit. If it can't be compiled or started, the server is marked
+    unavailable and bdSup2Sub() falls back to starting a new JVM per
+    conversion.
+
+    """
+
+    # The launcher prints this, followed by BDSup2Sub's exit status, once a
+    # job's output is complete.
+    DONE = '@@RIPMASTER_DONE@@'
+
+    SOURCE = os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), 'java', 'Sup2SubServer.java'
+    )
+
+    # Set once we fail to build or start a server, so we stop trying.
+    unavailable = False
+
+    # Where the launcher was compiled to, once it has been.
+    _classDir = None
+    _compileLock = threading.Lock()
+
+    def __init__(self, java, jar):
+        self.java = java
+        self.jar = jar
+        self.tool = None
+        self._lines = None
+
+    #===========================================================================
+    # PRIVATE METHODS
+    #===========================================================================
+
+    def _compile(self):
+        """Compiles the launcher if it hasn't been already"""
+        with self._compileLock:
+            if Sup2SubServer._classDir:
+                return Sup2SubServer._classDir
+
+            javaDir, javaName = os.path.split(self.java)
+            javac = javaName.replace('java', 'javac')
+            if javaDir and os.path.isfile(os.path.join(javaDir, javac)):
+                javac = os.path.join(javaDir, javac)
+            else:
+                javac = 'javac'
+
+            # Compiled fresh for each run of Ripmaster, so the launcher always
+            # matches its source, and nothing is written to the install.
+            classDir = tempfile.mkdtemp(prefix='ripmaster-java-')
+
+            print "Compiling persistent BDSup2Sub launcher with", javac
+            with _runTool('javac', reads=[self.SOURCE]) as measured:
+                try:
+                    if _execute([javac, '-d', classDir, self.SOURCE]).status:
+                        measured.fail()
+                except OSError:
+                    measured.fail()
+
+            classFile = os.path.join(classDir, 'Sup2SubServer.class')
+            if not os.path.isfile(classFile):
+                shutil.rmtree(classDir, ignore_errors=True)
+                raise OSError("Couldn't compile " + self.SOURCE)
+
+            Sup2SubServer._classDir = classDir
+
+        return classDir
+
+    def _start(self):
+        """Starts the JVM if it isn't running"""
+        if self.tool and not self.tool.done:
+            return
+
+        classPath = os.pathsep.join([self.jar, self._compile()])
+
+        # Lines from stdout and stderr alike, and None once the JVM exits.
+        lines = Queue.Queue()
+        self._lines = lines
+        self.tool = runner.start(
+            [self.java, '-cp', classPath, 'Sup2SubServer', self.jar],
+            stdin=True, stdout=lines.put, stderr=lines.put
+        )
+
+        tool = self.tool
+        def exited():
+            tool.wait()
+            # The JVM outlives the jobs measured on it, so its CPU time is
+            # counted once it exits.
+            if tool.cpuSeconds:
+                metrics.inc(
+                    'ripmaster_tool_cpu_seconds_total', tool.cpuSeconds,
+                    tool='bdsup2sub'
+                )
+            lines.put(None)
+        waiter = threading.Thread(target=exited)
+        waiter.daemon = True
+        waiter.start()
+
+    #===========================================================================
+    # PUBLIC METHODS
+    #===========================================================================
+
+    @classmethod
+    def removeLauncher(cls):
+        """Removes the compiled launcher, once no more JVMs will be started"""
+        with cls._compileLock:
+            if cls._classDir:
+                shutil.rmtree(cls._classDir, ignore_errors=True)
+                cls._classDir = None
+
+    def run(self, args):
+        """Runs a single BDSup2Sub conversion on this server
+
+        Args:
+            args : [str]
+                The BDSup2Sub command line arguments, as they would be given
+                after 'java -jar BDSup2Sub.jar'
+
+        Raises:
+            OSError
+                Raised if the launcher couldn't be compiled or started.
+
+            IOError
+                Raised if the JVM exited before the job could be sent.
+
+        Returns:
+            (int|None), [str]
+                BDSup2Sub's exit status, and the console output of the
+                conversion, one entry per line.
+
+        """
+        self._start()
+
+        self.tool.process.stdin.write('\t'.join(args) + '\n')
+        self.tool.process.stdin.flush()
+
+        lines = []
+        while True:
+            line = self._lines.get()
+            if line is None:
+                # The JVM exited rather than reporting back. That happens when
+                # it can't trap BDSup2Sub's System.exit, and still means the
+                # job ran, with the JVM's exit status as its own.
+                return self.tool.status, lines
+            if line.startswith(self.DONE):
+                try:
+                    return int(line[len(self.DONE):]), lines
+                except ValueError:
+                    return None, lines
+            lines.append(line)
+
+    def stop(self):
+        """Closes stdin, which lets the launcher exit after its current job
+
+        A JVM that hasn't exited runner.KILL_SECONDS later is stopped the way
+        any other tool is.
+
+        """
+        if self.tool and not self.tool.done:
+            self.tool.process.stdin.close()
+            if self.tool.wait(runner.KILL_SECONDS) is None:
+                self.tool.stop()
+                self.tool.wait()
+
 #===============================================================================
 # FUNCTIONS
 #===============================================================================
@@ -1036,8 +2961,8 @@ def bdSup2Sub(file, options, dest, popen=False):
             will automatically write the paired file based off this string.
 
         popen=False : (bool)
-            If True, os.popen will be used rather than os.system, and the read()
-            method will be returned, rather than just executed.
+            If True, BDSup2Sub's console output is captured and returned,
+            rather than printed.
 
     Raises:
         N/A
@@ -1047,22 +2972,143 @@ def bdSup2Sub(file, options, dest, popen=False):
             If popen=True, the console output of BDSup2Sub will be returned as a
             list.
 
+    If sup2Sub_Persistent is set in the Config, the conversion is sent to an
+    idle <Sup2SubServer> instead of starting a new JVM. The console output is
+    the same either way.
+
     """
-    c = '""' + Config.java + '" -jar "' + Config.sup2Sub + '" ' + options +\
-        ' -o "' + dest + '" "' + file + '""'
+    writes = [dest, dest.replace('.idx', '.sub')]
+    with _runTool('bdsup2sub', reads=[file], writes=writes) as measured:
+        if Config.sup2SubPersistent and not Sup2SubServer.unavailable:
+            result = _sup2SubServerRun(options.split() + ['-o', dest, file])
+            if result is not None:
+                status, shellOut = result
+                if status:
+                    measured.fail()
+                if popen:
+                    return shellOut
+                print '\n'.join(shellOut)
+                return
+
+        command = [Config.java, '-jar', Config.sup2Sub] + \
+            shlex.split(options) + ['-o', dest, file]
+
+        print ''
+        print "Sending to bdSup2Sub"
+        print list2cmdline(command)
+        print ''
+
+        run = _execute(command, capture=popen)
+        if run.status:
+            measured.fail()
+        if popen:
+            # As read with universal newlines
+            return run.output.replace('\r\n', '\n').split('\n')
+
+def cpuSlots():
+    """Returns the encode slots shared by every HandBrake run
 
-    print ''
-    print "Sending to bdSup2Sub"
-    print c
-    print ''
+    Args:
+        N/A
+
+    Raises:
+        N/A
+
+    Returns:
+        <affinity.CpuSlots>|None
+            The slots, made from the CPU Settings the first time they're
+            asked for. None if encode_Slots isn't set.
+
+    """
+    global _CPU_SLOTS
+
+    if not Config.encodeSlots:
+        return None
+
+    with _CPU_SLOTS_LOCK:
+        if _CPU_SLOTS is None:
+            _CPU_SLOTS = affinity.CpuSlots(
+                Config.encodeSlots, Config.slotCores, pin=Config.pinCores
+            )
+            print "Encode slots: {slots}".format(
+                slots=', '.join([
+                    affinity.formatCpuList(slot.cpus)
+                    for slot in _CPU_SLOTS.slots
+                ])
+            )
+
+    return _CPU_SLOTS
+
+def deviceLimits():
+    """Returns the limits on disk bound tool runs shared by every movie
+
+    Args:
+        N/A
+
+    Raises:
+        N/A
+
+    Returns:
+        <devices.DeviceLimits>
+            The limits, made from the Disk Settings the first time they're
+            asked for.
+
+    """
+    global _DEVICE_LIMITS
+
+    with _DEVICE_LIMITS_LOCK:
+        if _DEVICE_LIMITS is None:
+            _DEVICE_LIMITS = devices.DeviceLimits(Config.jobsPerDisk)
+
+    return _DEVICE_LIMITS
+
+def extractTracks(file, tracks):
+    """Extracts several tracks from a mkv in one pass and updates their state
+
+    Args:
+        file : (str)
+            The source file the tracks are to be extracted from.
+
+        tracks : [<AudioTrack>|<SubtitleTrack>]
+            The tracks to extract. Each track's extraction state is set from
+            the result of the one mkvextract run.
+
+    Raises:
+        N/A
 
-    if popen:
-        return os.popen(c).read().split('\n')
+    Returns:
+        [<AudioTrack>|<SubtitleTrack>]
+            The tracks that were successfully extracted.
+
+    """
+    extractions = [(track.trackID, track.extractPath()) for track in tracks]
+    # Each track is moved into place once the one run writing it has finished,
+    # so a run that's cut short can't leave a track looking extracted.
+    partials = [
+        (trackID, dest + PARTIAL_EXT) for trackID, dest in extractions
+    ]
+
+    print ""
+    print "Extracting trackIDs {IDs} from {file}".format(
+        IDs=', '.join([str(track.trackID) for track in tracks]),
+        file=file
+    )
+    print ""
+
+    if Config.extractor == 'native' and _extractNative(file, partials):
+        status = 0
     else:
-        os.system(c)
+        status = mkvExtractTracks(file, partials)
+
+    extracted = []
+    for track, extraction in zip(tracks, extractions):
+        if track.setExtracted(extraction[1], not status):
+            extracted.append(track)
+
+    return extracted
 
-def handBrake(file, options, dest):
-    """CLI command builder for converting video and audio with Handbrake
+def handBrake(file, options, dest, encodeProgress=None, cache=True):
+    """Converts video and audio with Handbrake, following its progress
 
     Args:
         file : (str)
@@ -1074,22 +3120,215 @@ def handBrake(file, options, dest):
         dest : (str)
             The destination file to write to.
 
+        encodeProgress=None : (<progress.EncodeProgress>)
+            Updated with every progress line HandBrake writes, and finished
+            if HandBrake succeeds.
+
+        cache=True : (bool)
+            If False, the encode cache isn't checked or added to. Sample
+            encodes are timed, so they always run.
+
+    Raises:
+        N/A
+
+    Returns:
+        (int)
+            HandBrake's exit status, or 0 if a cached encode was reused.
+
+    HandBrake's progress is read from its stdout as it's written. Its log
+    still goes to stderr, and the console.
+
+    If encode slots are configured, HandBrake waits for a free slot, then runs
+    pinned to the slot's cores, with a thread per core.
+
+    If the encode cache is configured, an earlier encode of the same source
+    with the same options, threads and HandBrake version is put at dest
+    instead of running HandBrake, and every encode that succeeds is added to
+    the cache.
+
+    """
+    command = [Config.handBrake, '-i', file, '-o', dest] + shlex.split(options)
+
+    slots = cpuSlots()
+    if slots:
+        # Every slot has as many cores, so the threads are known before a
+        # slot is free, and are part of what the encode is cached by.
+        command = _encoptsThreads(command, slots.slots[0].threads)
+
+    encodes = _encodeCache() if cache else None
+    key = None
+    if encodes is not None:
+        try:
+            key = encodecache.cacheKey(
+                encodecache.fingerprint(file), list2cmdline(command[5:]),
+                Config.handBrake + '\n' + _handBrakeVersion()
+            )
+        except (EnvironmentError, ValueError), err:
+            print "Could not fingerprint {file}: {err}".format(
+                file=file, err=err
+            )
+        if key and encodes.get(key, dest):
+            print "Reused an earlier encode of {file} with the same " \
+                  "settings".format(file=file)
+            metrics.inc('ripmaster_encode_cache_hits_total')
+            if encodeProgress:
+                encodeProgress.reuse()
+            return 0
+
+    slot = slots.acquire(encodeProgress) if slots else None
+    try:
+        print ''
+        print "HandBrake Settings:"
+        if slot:
+            print "Running on cpus {cpus}".format(
+                cpus=affinity.formatCpuList(slot.cpus)
+            )
+        print list2cmdline(command)
+        print ''
+
+        with _runTool('handbrake', reads=[file], writes=[dest]) as measured:
+            # Progress lines nobody's following are left out of the console,
+            # as there are thousands of them.
+            follow = encodeProgress.update if encodeProgress else None
+            status = _execute(
+                command, stdout=follow or (lambda line: None),
+                onStart=slot.pin if slot else None
+            ).status
+            if status:
+                measured.fail()
+    finally:
+        if slot:
+            slots.release(slot)
+
+    if encodeProgress and not status:
+        encodeProgress.finish()
+
+    if key and not status and os.path.isfile(dest):
+        encodes.put(key, dest)
+
+    return status
+
+#===============================================================================
+
+def historyStore():
+    """Returns the history of finished stages shared by every movie
+
+    Args:
+        N/A
+
+    Raises:
+        N/A
+
+    Returns:
+        <history.HistoryStore>|None
+            The history, opened the first time it's asked for. None if
+            history_File is blank, or the history couldn't be opened.
+
+    """
+    global _HISTORY
+
+    if not Config.historyFile:
+        return None
+
+    with _HISTORY_LOCK:
+        if _HISTORY is None:
+            try:
+                _HISTORY = history.HistoryStore(Config.historyFile)
+            except history.sqlite3.Error, err:
+                print "Could not open the stage history {file}: {err}".format(
+                    file=Config.historyFile,
+                    err=err
+                )
+                Config.historyFile = ''
+                return None
+
+    return _HISTORY
+
+def mkvAppend(files, dest):
+    """Joins mkv files end to end with mkvmerge, without re-encoding
+
+    Args:
+        files : [str]
+            The files to join, in order.
+
+        dest : (str)
+            The destination file to be written to.
+
     Raises:
         N/A
 
     Returns:
-        None
+        (int)
+            mkvmerge's exit status. 1 means mkvmerge had warnings, but still
+            wrote the file, so it's reported as 0.
 
     """
-    c = '""' + Config.handBrake + '"' + ' -i ' + file + ' -o ' + dest + ' ' + \
-        options + '"'
+    command = [Config.mkvMerge, '-o', dest, files[0]]
+    for file in files[1:]:
+        command.extend(['+', file])
 
     print ''
-    print "HandBrake Settings:"
-    print c
+    print "Joining {count} chunks into {dest}".format(
+        count=len(files), dest=dest
+    )
     print ''
 
-    os.system(c)
+    with _runTool('mkvmerge', reads=files, writes=[dest]) as measured:
+        status = _execute(command).status
+        if status not in [0, 1]:
+            measured.fail()
+
+    return 0 if status == 1 else status
+
+def mkvChapters(file):
+    """Reads the chapter start times of an mkv with mkvextract
+
+    Args:
+        file : (str)
+            The mkv to read chapters from.
+
+    Raises:
+        N/A
+
+    Returns:
+        [float]
+            The start of each chapter in seconds, in order. Empty if the file
+            has no chapters, or they couldn't be read.
+
+    mkvextract's simple chapter format lists each chapter like:
+
+    CHAPTER01=00:00:00.000
+    CHAPTER01NAME=Chapter 01
+
+    If the Probe Cache reader is native, the chapters are read directly
+    instead, unless they can't be.
+
+    """
+    if Config.probeReader == 'native':
+        chapters = _readMatroska(file, matroska.chapters)
+        if chapters is not None:
+            return chapters
+
+    with _runTool('mkvextract') as measured:
+        try:
+            info = _execute(
+                [Config.mkvExtract, 'chapters', file, '-s'],
+                capture=True, timeout=PROBE_TIMEOUT
+            )
+        except OSError:
+            measured.fail()
+            return []
+
+        chapters = set()
+        for line in info.output.splitlines():
+            match = CHAPTER_RE.match(line)
+            if match:
+                hours, minutes, seconds = match.groups()
+                chapters.add(
+                    int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+                )
+
+    return sorted(chapters)
 
 def mkvExtract(file, command, dest):
     """CLI command builder for extracting tracks with mkvextract
@@ -1108,20 +3347,89 @@ def mkvExtract(file, command, dest):
         N/A
 
     Returns:
-        None
+        (int)
+            mkvextract's exit status.
+
+    The command this builds should look like:
+
+    mkvextract tracks I:/src/fold/file.mkv 3:I:/dest/fold/subtitle.sup
+
+    """
+    c = [Config.mkvExtract, 'tracks', file, command + dest]
+    with _runTool('mkvextract', reads=[file], writes=[dest]) as measured:
+        status = _execute(c).status
+        if status:
+            measured.fail()
+
+    return status
+
+def mkvExtractTracks(file, extractions):
+    """CLI command builder for extracting several tracks in one mkvextract run
+
+    Args:
+        file : (str)
+            The source file the tracks are to be extracted from.
+
+        extractions : [(int, str)]
+            A list of (trackID, destination) pairs to be extracted.
+
+    Raises:
+        N/A
+
+    Returns:
+        (int)
+            mkvextract's exit status.
+
+    The command this builds should look like:
+
+    mkvextract tracks I:/src/fold/file.mkv 3:I:/dest/fold/sub3.sup
+    4:I:/dest/fold/sub4.sup
+
+    """
+    c = [Config.mkvExtract, 'tracks', file] + [
+        '{trackID}:{dest}'.format(
+            trackID=trackID,
+            dest=dest
+        ) for trackID, dest in extractions
+    ]
+    writes = [dest for trackID, dest in extractions]
+    with _runTool('mkvextract', reads=[file], writes=writes) as measured:
+        status = _execute(c).status
+        if status:
+            measured.fail()
+
+    return status
+
+def mkvIdentify(file):
+    """Runs mkvmerge's JSON identification on a file
+
+    Args:
+        file : (str)
+            The file to identify.
 
-    The full filepath this builds should look like:
+    Raises:
+        ValueError
+            Raised if mkvmerge's output isn't JSON, as happens with versions
+            of mkvmerge too old to support it.
 
-    '"mkvextract tracks I:/src/fold/file.mkv 3:I:/dest/fold/subtitle.sup "'
+    Returns:
+        (dict)
+            The parsed identification, with 'container' and 'tracks' entries.
 
     """
-    # os.system('"mkvextract tracks ' + file + ' ' + command + dest + ' "')
-    os.system('""{mkvExtract}" tracks "{file}" {command}{dest} "'.format(
-        mkvExtract=Config.mkvExtract,
-        file=file,
-        command=command,
-        dest=dest
-    ))
+    output = _execute(
+        [
+            Config.mkvMerge, '--identification-format', 'json',
+            '--identify', file
+        ],
+        capture=True, timeout=PROBE_TIMEOUT
+    ).output
+
+    info = json.loads(output)
+    if not isinstance(info, dict) or 'tracks' not in info:
+        raise ValueError('mkvmerge returned no track identification')
+
+    return info
 
 def mkvInfo(movie):
     """Uses CLI to fetch names all audio, video and subtitle tracks from a mkv
@@ -1138,63 +3446,67 @@ def mkvInfo(movie):
             A list contraining a list of video tracks, audio tracks and subtitle
             tracks.
 
+    mkvmerge's JSON identification is used if it's available, otherwise we
+    fall back to parsing mkvmerge -I. Either way, the movie's duration is set
+    if mkvmerge reports it.
+
+    If the probe cache is enabled, files that haven't changed since they were
+    last probed are listed from the cache, without running mkvmerge.
+
+    If the Probe Cache reader is native, the file's headers are read directly
+    instead of running mkvmerge, unless they can't be.
+
     """
 
     file = movie.path
 
-    # mkvMerge will return a listing of each track
-    info = Popen(
-        [Config.mkvMerge, '-I', file],
-        shell=True,
-        stdout=PIPE
-    ).stdout
-
-    # info is now a file object, each entry a line
-    #
-    # Example:
-    #
-    # File 'I:\Ripmaster\toConvert\JR__1080\JR_t01.mkv': container: Matroska []
-    # Track ID 0: video (V_MPEG4/ISO/AVC) [...]
-    # Track ID 1: audio (A_AC3) [...]
-    # Track ID 2: audio (A_TRUEHD) [...]
-    # Track ID 3: subtitles (S_HDMV/PGS) [...]
-
-    AUDIO_TYPES = {
-        'A_AAC': 'aac',
-        'A_DTS': 'dts',
-        'A_AC3': 'ac3',
-        'A_EAC3': 'aec3',
-        'A_TRUEHD': 'truehd',
-        'A_MP3': 'mp3',
-        'A_MS/ACM': 'acm',
-        'A_PCM/INT/LIT': 'pcm'
-        }
-
-    SUBTITLE_TYPES = {
-        'S_VOBSUB': 'vobsub',
-        'S_HDMV/PGS': 'pgs'
-        }
+    # Unchanged files are listed from the cache instead of running mkvmerge.
+    # The cache only saves time, so if it fails the file is probed anyway.
+    cache = _probeCache()
+    probe = None
+    if cache is not None:
+        try:
+            probe = cache.get(file)
+        except probecache.sqlite3.Error, err:
+            print "Could not read {file} from the probe cache: {err}".format(
+                file=file, err=err
+            )
+    if probe is None and Config.probeReader == 'native':
+        probe = _readMatroska(file, matroska.probe)
+    if probe is None:
+        with _runTool('mkvmerge-identify'):
+            probe = _mkvProbe(file)
+        if cache is not None:
+            try:
+                cache.put(file, probe)
+            except probecache.sqlite3.Error, err:
+                print "Could not add {file} to the probe cache: {err}".format(
+                    file=file, err=err
+                )
+
+    duration, tracks = probe
+
+    if duration:
+        # mkvmerge reports nanoseconds
+        movie.duration = int(duration) / 1000000000.0
 
     subtitleTracks = []
     audioTracks = []
     videoTracks = []  # No plans to use video tracks for now
 
-    for line in info.readlines():
-        if line.startswith('Track ID'):
-            trackID, trackType, trackDict = _trackInfo(line)
-
-            if trackType == 'video':
-                # Since video tracks aren't really used right now, we'll just
-                # throw this stuff into a list.
-                videoTracks.append([trackID, trackDict])
-            elif trackType == 'audio':
-                fileType = AUDIO_TYPES[trackDict['codec_id']]
-                track = AudioTrack(movie, trackID, fileType, trackDict)
-                audioTracks.append(track)
-            elif trackType == 'subtitles':
-                fileType = SUBTITLE_TYPES[trackDict['codec_id']]
-                track = SubtitleTrack(movie, trackID, fileType, trackDict)
-                subtitleTracks.append(track)
+    for trackID, trackType, trackDict in tracks:
+        if trackType == 'video':
+            # Since video tracks aren't really used right now, we'll just
+            # throw this stuff into a list.
+            videoTracks.append([trackID, trackDict])
+        elif trackType == 'audio':
+            fileType = AUDIO_TYPES[trackDict['codec_id']]
+            track = AudioTrack(movie, trackID, fileType, trackDict)
+            audioTracks.append(track)
+        elif trackType == 'subtitles':
+            fileType = SUBTITLE_TYPES[trackDict['codec_id']]
+            track = SubtitleTrack(movie, trackID, fileType, trackDict)
+            subtitleTracks.append(track)
 
     return videoTracks, audioTracks, subtitleTracks
 
@@ -1210,10 +3522,13 @@ def mkvmerge(command, dest):
             The destination file to be written to.
 
     Raises:
-        N/A
+        RuntimeError
+            If mkvmerge fails to write dest.
 
     Returns:
-        None
+        (int)
+            mkvmerge's exit status. 1 means mkvmerge had warnings, but still
+            wrote the file.
 
     """
 
@@ -1231,8 +3546,90 @@ def mkvmerge(command, dest):
     print commands
     print
 
-    from subprocess import check_call
+    reads = [path for path in command if os.path.isfile(path)]
+    with _runTool('mkvmerge', reads=reads, writes=[dest]) as measured:
+        status = _execute(commands).status
+        if status not in [0, 1]:
+            measured.fail()
+            raise RuntimeError(
+                'mkvmerge exited with status {status}: {command}'.format(
+                    status=status, command=list2cmdline(commands)
+                )
+            )
+
+    return status
+
+def stageRecord(movie, stage):
+    """Describes a stage of a movie the way the stage history records it
+
+    Args:
+        movie : (<Movie>)
+            The movie the stage is run on.
+
+        stage : (str)
+            'extract', 'convert', 'encode' or 'merge'.
+
+    Raises:
+        N/A
+
+    Returns:
+        {str: any}
+            The stage, keyed as <history.HistoryStore> records are, without
+            when it ran or how long it took. Encodes carry the settings their
+            speed depends on, and the bitrate of the source.
+
+    """
     try:
-        check_call(commands)
-    except:
-        raw_input("oops")
+        sourceSize = os.path.getsize(movie.path)
+    except OSError:
+        sourceSize = None
+    duration = getattr(movie, 'duration', None)
+
+    record = {
+        'stage': stage,
+        'path': movie.path,
+        'duration': duration,
+        'sourceSize': sourceSize,
+    }
+
+    if stage == 'encode':
+        record.update(
+            resolution=movie.resolution,
+            x264Speed=Config.x264Speed,
+            preset=movie.preset,
+            tv=movie.tv,
+            fps=movie.fps,
+            bitrate=(
+                sourceSize * 8.0 / duration if sourceSize and duration
+                else None
+            )
+        )
+
+    return record
+
+def throughputModel():
+    """Returns the model of how long stages take, fit from the stage history
+
+    Args:
+        N/A
+
+    Raises:
+        N/A
+
+    Returns:
+        <history.ThroughputModel>|None
+            The model, fit to the history the first time it's asked for, and
+            updated as stages finish. None if there's no history.
+
+    """
+    global _THROUGHPUT
+
+    store = historyStore()
+    if store is None:
+        return None
+
+    with _HISTORY_LOCK:
+        if _THROUGHPUT is None:
+            _THROUGHPUT = history.ThroughputModel(store.records())
+
+    return _THROUGHPUT
@@ -0,0 +1,612 @@
+#/usr/bin/python
+# Ripmaster.tools.affinity
+# Splits the machine's cores into slots, and pins each encode to its own slot
+
+"""
+
+Description
+-----------
+
+Two x264 encodes left to the OS scheduler on the same machine both start a
+thread per core, then fight over every core and the caches they share, and
+the two together encode fewer frames a second than they would taking turns.
+
+CpuSlots splits the cores this process is allowed to run on into disjoint
+sets, one per encode slot. Each HandBrake run waits for a free slot, is
+pinned to the slot's cores with sched_setaffinity, and runs x264 with a
+thread per core of the slot. A slot is kept to one NUMA node where the node
+has enough cores, so an encode's memory stays local, and the hyperthreads of
+a core always go to the same slot.
+
+Slots are also locked with a file per slot in a shared folder, so several
+Ripmaster processes on one machine (like several --worker processes) use the
+same slots without any two encodes landing on the same cores. Processes need
+the same slot settings for that to work.
+
+The topology is read from /sys and /proc. Where those aren't available, the
+cores are taken to be 0 to cpu_count() - 1 on a single node. Where
+sched_setaffinity isn't available (anywhere but Linux), encodes aren't
+pinned, but are still limited to a slot's worth of threads.
+
+Classes
+-------
+
+CpuSlots
+    Hands out the slots encodes run in, recording the frames a second the
+    encodes make together.
+
+Slot
+    A set of cores one encode runs on.
+
+Functions
+---------
+
+allowedCpus()
+    Returns the cores this process is allowed to run on.
+
+formatCpuList()
+    Formats cores as a Linux cpulist, like '0-3,8'.
+
+numaNodes()
+    Returns the given cores, grouped by NUMA node.
+
+parseCpuList()
+    Parses a Linux cpulist, like '0-3,8'.
+
+partition()
+    Splits cores into disjoint sets, keeping each to a NUMA node if it can.
+
+pinner()
+    Returns a function that pins a running process to the given cores.
+
+"""
+
+#===============================================================================
+# IMPORTS
+#===============================================================================
+
+# Standard Imports
+from contextlib import contextmanager
+import ctypes
+import ctypes.util
+import errno
+from multiprocessing import cpu_count
+import os
+import tempfile
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:
+    # Windows has no flock, so slots are only shared within a process.
+    fcntl = None
+
+# Ripmaster Imports
+from tools import metrics
+
+#===============================================================================
+# GLOBALS
+#===============================================================================
+
+LOCK_DIR_DEFAULT = os.path.join(tempfile.gettempdir(), 'ripmaster-cpus')
+PROC_STATUS = '/proc/self/status'
+PROC_TASKS = '/proc/{pid}/task'
+SYS_CPUS = '/sys/devices/system/cpu'
+SYS_NODES = '/sys/devices/system/node'
+
+# Seconds between checks for a slot another process holds.
+WAIT_SECONDS = 1
+
+_CPU_BITS = 8 * ctypes.sizeof(ctypes.c_ulong)
+
+#===============================================================================
+# PRIVATE FUNCTIONS
+#===============================================================================
+
+def _read(path):
+    """Returns the stripped contents of a file, or None if it can't be read"""
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except (IOError, OSError):
+        return None
+
+#===============================================================================
+
+def _siblingOrder(cpus, sysCpus=SYS_CPUS):
+    """Orders cores so the hyperthreads of a core are next to each other"""
+    cpus = set(cpus)
+    keys = {}
+    for cpu in cpus:
+        path = os.path.join(sysCpus, 'cpu{0}'.format(cpu), 'topology')
+        siblings = _read(os.path.join(path, 'thread_siblings_list'))
+        siblings = set(parseCpuList(siblings)) & cpus if siblings else set()
+        keys[cpu] = min(siblings | set([cpu]))
+
+    return sorted(cpus, key=lambda cpu: (keys[cpu], cpu))
+
+#===============================================================================
+# CLASSES
+#===============================================================================
+
+class Slot(object):
+    """A set of cores one encode runs on
+
+    Args:
+        index : (int)
+            The slot's position in its <CpuSlots>.
+
+        cpus : [int]
+            The cores of the slot.
+
+    Raises:
+        N/A
+
+    """
+    def __init__(self, index, cpus):
+        self.index = index
+        self.cpus = cpus
+        # x264 runs a thread per core of the slot.
+        self.threads = len(cpus)
+
+        # Pins a process, by pid, to the slot's cores, if it can be done.
+        self.pin = None
+
+        # Set while an encode holds the slot
+        self.acquired = None
+        self.progress = None
+        self._lockFile = None
+
+    def __repr__(self):
+        return '<Slot {index}: cpus {cpus}>'.format(
+            index=self.index, cpus=formatCpuList(self.cpus)
+        )
+
+#===============================================================================
+
+class CpuSlots(object):
+    """Hands out the slots encodes run in
+
+    Args:
+        slots : (int)
+            How many encodes run at once.
+
+        cores=0 : (int)
+            Cores in each slot. At 0, the cores are split evenly between the
+            slots.
+
+        pin=True : (bool)
+            Pin each encode to its slot's cores, where the OS allows it.
+
+        lockDir=LOCK_DIR_DEFAULT : (str)
+            Folder the slot lock files are kept in, shared by every Ripmaster
+            process on the machine. If None, or it can't be written to, slots
+            are only shared within this process.
+
+        cpus=None : [int]
+            The cores to split. Defaults to the cores this process is allowed
+            to run on.
+
+        nodes=None : [[int]]
+            The cores, grouped by NUMA node. Defaults to the topology in /sys.
+
+    Raises:
+        N/A
+
+    If the cores can't be split into as many slots of the size asked for, as
+    many slots as fit are made.
+
+    """
+    def __init__(self, slots, cores=0, pin=True, lockDir=LOCK_DIR_DEFAULT,
+                 cpus=None, nodes=None):
+        cpus = allowedCpus() if cpus is None else cpus
+        nodes = numaNodes(cpus) if nodes is None else nodes
+
+        self.slots = [
+            Slot(index, slotCpus) for index, slotCpus in
+            enumerate(partition(slots, cores, cpus, nodes))
+        ]
+        self._free = list(self.slots)
+        self._condition = threading.Condition()
+
+        if pin:
+            for slot in self.slots:
+                slot.pin = pinner(slot.cpus)
+
+        self.lockDir = lockDir if fcntl else None
+        if self.lockDir:
+            try:
+                if not os.path.isdir(self.lockDir):
+                    os.makedirs(self.lockDir)
+            except OSError, err:
+                print "Could not create {dir}, encode slots won't be shared " \
+                      "with other Ripmaster processes: {err}".format(
+                    dir=self.lockDir, err=err
+                )
+                self.lockDir = None
+
+        # Frames encoded, and seconds with any encode running, to measure the
+        # frames a second of every slot together.
+        self.frames = 0.0
+        self.activeSeconds = 0.0
+        self._activeSince = None
+
+        metrics.collect(self.gauges)
+
+    #===========================================================================
+    # PRIVATE METHODS
+    #===========================================================================
+
+    def _frames(self, slot, now):
+        """Returns the frames encoded in a slot since it was taken"""
+        progress = slot.progress
+        if not progress or not progress.avgFps:
+            return 0.0
+        # HandBrake's average is over its whole run, which started with ours.
+        end = progress.finished or now
+        return progress.avgFps * max(0.0, end - slot.acquired)
+
+    def _lock(self, slot):
+        """Locks a slot against other processes, returning False if held"""
+        if not self.lockDir:
+            return True
+
+        path = os.path.join(
+            self.lockDir,
+            'cpus-{cpus}.lock'.format(cpus=formatCpuList(slot.cpus))
+        )
+        try:
+            lockFile = open(path, 'a')
+        except IOError:
+            # Another user's lock file we can't open. Their Ripmaster holds
+            # these cores as much as ours would.
+            return False
+
+        try:
+            fcntl.flock(lockFile, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except IOError, err:
+            lockFile.close()
+            if err.errno in [errno.EAGAIN, errno.EACCES, errno.EWOULDBLOCK]:
+                return False
+            raise
+
+        slot._lockFile = lockFile
+        return True
+
+    def _unlock(self, slot):
+        """Releases a slot's lock file"""
+        if slot._lockFile:
+            fcntl.flock(slot._lockFile, fcntl.LOCK_UN)
+            slot._lockFile.close()
+            slot._lockFile = None
+
+    #===========================================================================
+    # PUBLIC METHODS
+    #===========================================================================
+
+    def acquire(self, encodeProgress=None):
+        """Waits for a free slot, and takes it
+
+        Args:
+            encodeProgress=None : (<progress.EncodeProgress>)
+                The progress of the encode that will run in the slot, for
+                measuring the frames a second of every slot together.
+
+        Raises:
+            N/A
+
+        Returns:
+            (<Slot>)
+                The slot. Its pin is a function that pins a process, by pid,
+                to the slot's cores, or None if they can't be pinned.
+
+        """
+        with self._condition:
+            while True:
+                for slot in list(self._free):
+                    if self._lock(slot):
+                        self._free.remove(slot)
+                        break
+                else:
+                    # Slots held by other processes free up without telling
+                    # us, so we check again every WAIT_SECONDS.
+                    self._condition.wait(WAIT_SECONDS if self._free else None)
+                    continue
+                break
+
+            now = time.time()
+            if self._activeSince is None:
+                self._activeSince = now
+            slot.acquired = now
+            slot.progress = encodeProgress
+
+        return slot
+
+    def averageFps(self):
+        """Returns the frames a second of every slot together, so far"""
+        with self._condition:
+            frames = self.frames
+            seconds = self.activeSeconds
+            now = time.time()
+            for slot in self.slots:
+                if slot.acquired:
+                    frames += self._frames(slot, now)
+            if self._activeSince is not None:
+                seconds += now - self._activeSince
+        return frames / seconds if seconds else None
+
+    def busy(self):
+        """Returns how many slots are running an encode"""
+        with self._condition:
+            return len(self.slots) - len(self._free)
+
+    def fps(self):
+        """Returns the frames a second every running encode is making now"""
+        with self._condition:
+            rates = [
+                slot.progress.fps for slot in self.slots
+                if slot.acquired and slot.progress and slot.progress.fps
+            ]
+        return sum(rates) if rates else None
+
+    def gauges(self):
+        """Returns the busy slots and current frames a second, for metrics"""
+        return [
+            ('ripmaster_encode_slots_busy', {}, self.busy()),
+            ('ripmaster_encode_fps', {}, self.fps() or 0),
+        ]
+
+    def release(self, slot):
+        """Frees a slot taken with acquire()"""
+        with self._condition:
+            now = time.time()
+            frames = self._frames(slot, now)
+            self.frames += frames
+            metrics.inc('ripmaster_encode_frames_total', frames)
+
+            slot.acquired = None
+            slot.progress = None
+            self._unlock(slot)
+            self._free.append(slot)
+            self._free.sort(key=lambda free: free.index)
+
+            if len(self._free) == len(self.slots):
+                self.activeSeconds += now - self._activeSince
+                self._activeSince = None
+
+            self._condition.notifyAll()
+
+    @contextmanager
+    def slot(self, encodeProgress=None):
+        """Holds a slot for the length of a with statement"""
+        slot = self.acquire(encodeProgress)
+        try:
+            yield slot
+        finally:
+            self.release(slot)
+
+#===============================================================================
+# FUNCTIONS
+#===============================================================================
+
+def allowedCpus(status=PROC_STATUS):
+    """Returns the cores this process is allowed to run on
+
+    Args:
+        status=PROC_STATUS : (str)
+            The process status file, listing the cores it's allowed on.
+
+    Raises:
+        N/A
+
+    Returns:
+        [int]
+            The cores, in order. Every core cpu_count() reports, if the
+            status file can't be read.
+
+    """
+    text = _read(status)
+    if text:
+        for line in text.splitlines():
+            if line.startswith('Cpus_allowed_list:'):
+                cpus = parseCpuList(line.split(':', 1)[1])
+                if cpus:
+                    return cpus
+
+    return range(cpu_count())
+
+#===============================================================================
+
+def formatCpuList(cpus):
+    """Formats cores as a Linux cpulist, like '0-3,8'"""
+    ranges = []
+    for cpu in sorted(set(cpus)):
+        if ranges and ranges[-1][1] == cpu - 1:
+            ranges[-1][1] = cpu
+        else:
+            ranges.append([cpu, cpu])
+
+    return ','.join([
+        str(first) if first == last else '{0}-{1}'.format(first, last)
+        for first, last in ranges
+    ])
+
+#===============================================================================
+
+def numaNodes(cpus, sysNodes=SYS_NODES, sysCpus=SYS_CPUS):
+    """Returns the given cores, grouped by NUMA node
+
+    Args:
+        cpus : [int]
+            The cores to group.
+
+        sysNodes=SYS_NODES : (str)
+            The folder the kernel lists NUMA nodes in.
+
+        sysCpus=SYS_CPUS : (str)
+            The folder the kernel lists cores in.
+
+    Raises:
+        N/A
+
+    Returns:
+        [[int]]
+            The cores of each node, with the hyperthreads of a core next to
+            each other. A single node of every core if the topology can't be
+            read.
+
+    """
+    cpus = set(cpus)
+    nodes = []
+    try:
+        names = os.listdir(sysNodes)
+    except OSError:
+        names = []
+
+    for name in sorted(names, key=lambda name: (len(name), name)):
+        if not name.startswith('node') or not name[4:].isdigit():
+            continue
+        cpulist = _read(os.path.join(sysNodes, name, 'cpulist'))
+        nodeCpus = set(parseCpuList(cpulist)) & cpus if cpulist else set()
+        if nodeCpus:
+            nodes.append(nodeCpus)
+
+    # Anything the nodes don't list is taken to be on a node of its own.
+    listed = set().union(*nodes) if nodes else set()
+    if cpus - listed:
+        nodes.append(cpus - listed)
+
+    return [_siblingOrder(node, sysCpus) for node in nodes]
+
+#===============================================================================
+
+def parseCpuList(text):
+    """Parses a Linux cpulist, like '0-3,8', into a sorted list of cores"""
+    cpus = set()
+    for part in text.strip().split(','):
+        part = part.strip()
+        if not part:
+            continue
+        if '-' in part:
+            first, last = part.split('-', 1)
+            cpus.update(range(int(first), int(last) + 1))
+        else:
+            cpus.add(int(part))
+
+    return sorted(cpus)
+
+#===============================================================================
+
+def partition(slots, cores, cpus, nodes=None):
+    """Splits cores into disjoint sets, keeping each to a NUMA node if it can
+
+    Args:
+        slots : (int)
+            How many sets to make.
+
+        cores : (int)
+            Cores in each set. At 0, the cores are split evenly.
+
+        cpus : [int]
+            The cores to split.
+
+        nodes=None : [[int]]
+            The cores, grouped by node and in the order sets should be taken
+            from them. One node of every core in order, if not given.
+
+    Raises:
+        N/A
+
+    Returns:
+        [[int]]
+            Up to slots sets. Fewer if the cores run out.
+
+    Whole sets are taken from within each node first. Sets that don't fit in
+    any one node are made from what's left of every node.
+
+    """
+    if not cpus or slots < 1:
+        return []
+
+    if nodes is None:
+        nodes = [sorted(cpus)]
+
+    size = cores if cores > 0 else len(cpus) // slots
+    size = max(1, min(size, len(cpus)))
+
+    sets = []
+    leftover = []
+    for node in nodes:
+        node = list(node)
+        while len(node) >= size and len(sets) < slots:
+            sets.append(sorted(node[:size]))
+            node = node[size:]
+        leftover.extend(node)
+
+    while len(leftover) >= size and len(sets) < slots:
+        sets.append(sorted(leftover[:size]))
+        leftover = leftover[size:]
+
+    return sets
+
+#===============================================================================
+
+def pinner(cpus):
+    """Returns a function that pins a running process to the given cores
+
+    Args:
+        cpus : [int]
+            The cores to pin to.
+
+    Raises:
+        N/A
+
+    Returns:
+        (callable)|None
+            Call it with a pid to pin every thread of that process. None if
+            sched_setaffinity isn't available.
+
+    Processes are pinned from the outside once they've started, rather than
+    between fork and exec, where a child of a threaded process can only
+    safely make system calls. Threads a process starts take the cores of the
+    thread that starts them, so any started while the existing ones are being
+    pinned are picked up by going over the list again until nothing's new.
+
+    """
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        setaffinity = libc.sched_setaffinity
+    except (AttributeError, OSError, TypeError):
+        return None
+
+    mask = (ctypes.c_ulong * (max(cpus) // _CPU_BITS + 1))()
+    for cpu in cpus:
+        mask[cpu // _CPU_BITS] |= 1 << (cpu % _CPU_BITS)
+    size = ctypes.sizeof(mask)
+
+    def pinThread(tid):
+        if setaffinity(tid, size, mask):
+            err = ctypes.get_errno()
+            # A thread that's exited since it was listed needs no pinning.
+            if err != errno.ESRCH:
+                raise OSError(err, os.strerror(err))
+
+    def pin(pid):
+        pinThread(pid)
+        pinned = set([pid])
+        while True:
+            try:
+                tids = set(
+                    [int(tid) for tid in os.listdir(PROC_TASKS.format(pid=pid))]
+                )
+            except OSError:
+                # No /proc, or the process has exited.
+                return
+            if not tids - pinned:
+                return
+            for tid in tids - pinned:
+                pinThread(tid)
+            pinned |= tids
+
+    return pin
@@ -0,0 +1,210 @@
+#/usr/bin/python
+# Ripmaster.tools.devices
+# Limits how many disk bound tool runs read or write each disk at once
+
+"""
+
+Description
+-----------
+
+mkvextract and mkvmerge spend their time reading and writing whole movies, so
+they run as fast as the disks under them. Two of them on the same spinning
+disk make it seek back and forth between the two, and both finish later than
+if they'd taken turns. x264 and BDSup2Sub spend their time on the CPU instead,
+and don't mind what the disks are doing.
+
+Each tool Ripmaster runs is classed as IO or CPU bound in TOOL_RESOURCES.
+DeviceLimits keeps a count of the IO bound runs on each block device, found
+from the st_dev of every file a run reads or writes, and makes a run wait
+until every device it touches has room. Runs on different disks, and CPU
+bound runs, carry on at the same time.
+
+Classes
+-------
+
+DeviceLimits
+    Limits how many IO bound tool runs use each device at once.
+
+Functions
+---------
+
+deviceOf()
+    Returns the device a file is on, or would be written to.
+
+"""
+
+#===============================================================================
+# IMPORTS
+#===============================================================================
+
+# Standard Imports
+from contextlib import contextmanager
+import os
+import threading
+
+#===============================================================================
+# GLOBALS
+#===============================================================================
+
+# Resource Types
+CPU = 'cpu'
+IO = 'io'
+
+# mkvmerge's identify only reads the headers, so it isn't held up behind a
+# remux of the same disk.
+TOOL_RESOURCES = {
+    'bdsup2sub': CPU,
+    'handbrake': CPU,
+    'matroska-extract': IO,
+    'mkvextract': IO,
+    'mkvmerge': IO,
+    'mkvmerge-identify': CPU,
+}
+
+PER_DEVICE_DEFAULT = 1
+
+#===============================================================================
+# CLASSES
+#===============================================================================
+
+class DeviceLimits(object):
+    """Limits how many IO bound tool runs use each device at once
+
+    Args:
+        perDevice=PER_DEVICE_DEFAULT : (int)
+            IO bound runs allowed on a device at once. At 0, runs aren't
+            limited.
+
+    Raises:
+        N/A
+
+    """
+    def __init__(self, perDevice=PER_DEVICE_DEFAULT):
+        self.perDevice = perDevice
+
+        self._condition = threading.Condition()
+        # Runs using each device
+        self._running = {}
+
+    #===========================================================================
+    # PRIVATE METHODS
+    #===========================================================================
+
+    def _available(self, devices):
+        """Checks if every one of the devices has room for another run"""
+        return all([
+            self._running.get(device, 0) < self.perDevice
+            for device in devices
+        ])
+
+    @contextmanager
+    def _held(self, paths):
+        """Holds the paths' devices for the length of a with statement"""
+        devices = self.acquire(paths)
+        try:
+            yield devices
+        finally:
+            self.release(devices)
+
+    #===========================================================================
+    # PUBLIC METHODS
+    #===========================================================================
+
+    def acquire(self, paths):
+        """Waits until every device the paths are on has room, and takes them
+
+        Args:
+            paths : [str]
+                The files a run reads and writes.
+
+        Raises:
+            N/A
+
+        Returns:
+            [int]
+                The devices taken, to hand to release().
+
+        Every device is taken at once, so two runs waiting on each other's
+        disks can't hold one each and wait forever.
+
+        """
+        devices = set([deviceOf(path) for path in paths])
+        devices.discard(None)
+        devices = sorted(devices)
+        if not self.perDevice or not devices:
+            return []
+
+        with self._condition:
+            while not self._available(devices):
+                self._condition.wait()
+            for device in devices:
+                self._running[device] = self._running.get(device, 0) + 1
+
+        return devices
+
+    def hold(self, resource, paths):
+        """Holds the paths' devices for a with statement, if resource is IO
+
+        Args:
+            resource : (str)
+                IO or CPU. CPU bound runs don't wait.
+
+            paths : [str]
+                The files a run reads and writes.
+
+        Raises:
+            N/A
+
+        Returns:
+            (context manager)
+                Waits for the devices on entry, and frees them on exit.
+
+        """
+        return self._held(paths if resource == IO else [])
+
+    def release(self, devices):
+        """Frees the devices taken with acquire()"""
+        if not devices:
+            return
+
+        with self._condition:
+            for device in devices:
+                self._running[device] -= 1
+                if not self._running[device]:
+                    del self._running[device]
+            self._condition.notifyAll()
+
+    def running(self):
+        """Returns how many runs are using each device"""
+        with self._condition:
+            return dict(self._running)
+
+#===============================================================================
+# FUNCTIONS
+#===============================================================================
+
+def deviceOf(path):
+    """Returns the device a file is on, or would be written to
+
+    Args:
+        path : (str)
+            The file. If it doesn't exist yet, the nearest folder above it
+            that does is used, since that's where it will be written.
+
+    Raises:
+        N/A
+
+    Returns:
+        (int)|None
+            The st_dev of the file. None if nothing on the path exists.
+
+    """
+    path = os.path.abspath(path)
+    while True:
+        try:
+            return os.stat(path).st_dev
+        except OSError:
+            parent = os.path.dirname(path)
+            if parent == path:
+                return None
+            path = parent
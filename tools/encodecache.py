@@ -0,0 +1,411 @@
+#/usr/bin/python
+# Ripmaster.tools.encodecache
+# Reuses finished encodes of the same source with the same options
+
+"""
+
+Description
+-----------
+
+The same disc often turns up more than once: a re-release, a box set, or a
+re-rip after a bad read, each in its own folder. Encoding each copy again
+gives the same result for hours of work.
+
+Each source is given a fingerprint: its size, and a hash of three samples of
+it, from its start, middle and end, read through mmap so only those pages are
+touched. A rip of the same disc with the same tool comes out byte for byte the
+same, and a different disc won't match on all three samples and the size.
+
+The EncodeCache keeps a copy of every finished encode, keyed by the source's
+fingerprint, the HandBrake options it was encoded with, and the HandBrake
+executable and version that encoded it. Before HandBrake runs, the cache is
+checked, and a match is put in place of the encode without running HandBrake
+at all. Copies are made by hard link where they can be,
+then by reflink, so that an encode and its copy in the cache share the same
+blocks on disk. Only across filesystems that can't do either is the encode
+copied.
+
+The cache has a size limit. Once its copies add up to more than that, the
+least recently used are removed.
+
+Classes
+-------
+
+EncodeCache
+    A folder of finished encodes, keyed by source fingerprint and options.
+
+Functions
+---------
+
+cacheKey()
+    Returns the key an encode is cached by.
+
+fingerprint()
+    Returns a fingerprint of a source, from its size and three samples.
+
+linkFile()
+    Puts a file at a new path, sharing its blocks if the filesystem can.
+
+"""
+
+#===============================================================================
+# IMPORTS
+#===============================================================================
+
+# Standard Imports
+import errno
+import hashlib
+import mmap
+import os
+import shutil
+import sqlite3
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+#===============================================================================
+# GLOBALS
+#===============================================================================
+
+# Bytes hashed from each of the start, middle and end of a source
+SAMPLE_BYTES = 1048576
+
+# The Linux ioctl that makes one file share another's blocks
+FICLONE = 0x40049409
+
+# Errors os.link gives when the filesystem can't link the file
+LINK_ERRORS = [
+    getattr(errno, name)
+    for name in ['EXDEV', 'EPERM', 'EMLINK', 'ENOTSUP', 'EOPNOTSUPP']
+    if hasattr(errno, name)
+]
+
+INDEX_FILE = 'index.db'
+
+SCHEMA = """CREATE TABLE IF NOT EXISTS encodes (
+    key TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    last_used REAL NOT NULL
+)"""
+
+#===============================================================================
+# CLASSES
+#===============================================================================
+
+class EncodeCache(object):
+    """A folder of finished encodes, keyed by source fingerprint and options
+
+    Args:
+        folder : (str)
+            The folder to keep encodes in. Created if it doesn't exist. It
+            should be on the same filesystem as toConvert, so encodes can be
+            hard linked rather than copied.
+
+        maxBytes : (int)
+            The most bytes of encodes kept. The least recently used encodes
+            past this are removed whenever a new one is stored.
+
+    Raises:
+        OSError
+            Raised if the folder can't be made.
+
+        sqlite3.Error
+            Raised if the index can't be opened.
+
+    The cache is shared by every thread, so access goes through a lock.
+
+    """
+    def __init__(self, folder, maxBytes):
+        self.folder = folder
+        self.maxBytes = maxBytes
+
+        if not os.path.isdir(folder):
+            os.makedirs(folder)
+
+        self._lock = threading.Lock()
+        self._lastUsed = 0
+        self._db = sqlite3.connect(
+            os.path.join(folder, INDEX_FILE), check_same_thread=False
+        )
+        try:
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.execute('PRAGMA synchronous=NORMAL')
+        except sqlite3.Error:
+            pass
+        self._db.execute(SCHEMA)
+        self._db.execute(
+            'CREATE INDEX IF NOT EXISTS encodes_last_used ON encodes '
+            '(last_used)'
+        )
+        self._db.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute(
+                'SELECT COUNT(*) FROM encodes'
+            ).fetchone()[0]
+
+    #===========================================================================
+    # PRIVATE METHODS
+    #===========================================================================
+
+    def _evict(self):
+        """Removes the least recently used encodes past maxBytes
+
+        The lock must already be held.
+
+        """
+        rows = self._db.execute(
+            'SELECT key, size FROM encodes ORDER BY last_used DESC'
+        ).fetchall()
+
+        total = 0
+        for key, size in rows:
+            total += size
+            if total > self.maxBytes:
+                self._remove(key)
+        self._db.commit()
+
+    def _now(self):
+        """Returns the current time, always later than the last returned"""
+        self._lastUsed = max(time.time(), self._lastUsed + 0.000001)
+        return self._lastUsed
+
+    def _path(self, key):
+        """Returns where the encode with the given key is kept"""
+        return os.path.join(self.folder, key + '.mkv')
+
+    def _remove(self, key):
+        """Removes an encode and its entry. The lock must already be held"""
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+        self._db.execute('DELETE FROM encodes WHERE key = ?', (key,))
+
+    #===========================================================================
+    # PUBLIC METHODS
+    #===========================================================================
+
+    def close(self):
+        """Closes the index"""
+        with self._lock:
+            self._db.close()
+
+    def get(self, key, dest):
+        """Puts the cached encode for a key at dest, if there is one
+
+        Args:
+            key : (str)
+                The encode's key, from cacheKey().
+
+            dest : (str)
+                Where the encode should be. Anything already there, such as
+                an encode that was cut short, is replaced.
+
+        Raises:
+            N/A
+
+        Returns:
+            (bool)
+                True if the encode was cached, and is now at dest.
+
+        """
+        path = self._path(key)
+
+        with self._lock:
+            row = self._db.execute(
+                'SELECT size FROM encodes WHERE key = ?', (key,)
+            ).fetchone()
+            if not row:
+                return False
+
+            if not os.path.isfile(path) or os.path.getsize(path) != row[0]:
+                self._remove(key)
+                self._db.commit()
+                return False
+
+            try:
+                if os.path.lexists(dest):
+                    os.remove(dest)
+                linkFile(path, dest)
+            except (IOError, OSError):
+                return False
+
+            self._db.execute(
+                'UPDATE encodes SET last_used = ? WHERE key = ?',
+                (self._now(), key)
+            )
+            self._db.commit()
+
+        return True
+
+    def put(self, key, source):
+        """Stores a finished encode, evicting old encodes if needed
+
+        Args:
+            key : (str)
+                The encode's key, from cacheKey().
+
+            source : (str)
+                The finished encode. It's left where it is.
+
+        Raises:
+            N/A
+
+        Returns:
+            (bool)
+                True if the encode was stored.
+
+        """
+        path = self._path(key)
+        partial = path + '.part'
+
+        with self._lock:
+            try:
+                size = os.path.getsize(source)
+                if size > self.maxBytes:
+                    return False
+                for stale in [partial, path]:
+                    if os.path.lexists(stale):
+                        os.remove(stale)
+                # Linked under another name first, so a crash never leaves a
+                # partial copy under the key.
+                linkFile(source, partial)
+                os.rename(partial, path)
+            except (IOError, OSError):
+                return False
+
+            self._db.execute(
+                'INSERT OR REPLACE INTO encodes (key, size, last_used) '
+                'VALUES (?, ?, ?)',
+                (key, size, self._now())
+            )
+            self._evict()
+
+        return True
+
+    def size(self):
+        """Returns the bytes of encodes kept"""
+        with self._lock:
+            return self._db.execute(
+                'SELECT COALESCE(SUM(size), 0) FROM encodes'
+            ).fetchone()[0]
+
+#===============================================================================
+# FUNCTIONS
+#===============================================================================
+
+def cacheKey(sourcePrint, options, handBrake=''):
+    """Returns the key an encode is cached by
+
+    Args:
+        sourcePrint : (str)
+            The source's fingerprint.
+
+        options : (str)
+            Every HandBrake option the encode is run with, besides the source
+            and destination.
+
+        handBrake='' : (str)
+            The HandBrake executable, and the version it reports. Another
+            HandBrake can encode the same options differently.
+
+    Raises:
+        N/A
+
+    Returns:
+        (str)
+            A hex digest of all three.
+
+    """
+    return hashlib.sha1(
+        sourcePrint + '\n' + options + '\n' + handBrake
+    ).hexdigest()
+
+#===============================================================================
+
+def fingerprint(path, sampleBytes=SAMPLE_BYTES):
+    """Returns a fingerprint of a source, from its size and three samples
+
+    Args:
+        path : (str)
+            The source.
+
+        sampleBytes=SAMPLE_BYTES : (int)
+            Bytes hashed from each of the start, middle and end.
+
+    Raises:
+        IOError
+            Raised if the source can't be read.
+
+    Returns:
+        (str)
+            The size, and a hex digest of the samples.
+
+    A source smaller than the three samples is hashed whole.
+
+    """
+    size = os.path.getsize(path)
+    digest = hashlib.sha1()
+
+    with open(path, 'rb') as f:
+        if size <= sampleBytes * 3:
+            digest.update(f.read())
+        else:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                middle = (size - sampleBytes) // 2
+                for start in [0, middle, size - sampleBytes]:
+                    digest.update(mapped[start:start + sampleBytes])
+            finally:
+                mapped.close()
+
+    return '{size}:{digest}'.format(size=size, digest=digest.hexdigest())
+
+#===============================================================================
+
+def linkFile(source, dest):
+    """Puts a file at a new path, sharing its blocks if the filesystem can
+
+    Args:
+        source : (str)
+            The file.
+
+        dest : (str)
+            The new path. Must not exist.
+
+    Raises:
+        IOError|OSError
+            Raised if the file couldn't be linked or copied.
+
+    Returns:
+        (str)
+            'link', 'reflink' or 'copy', for how it was done.
+
+    """
+    link = getattr(os, 'link', None)
+    if link:
+        try:
+            link(source, dest)
+            return 'link'
+        except OSError, err:
+            # Other filesystems, or filesystems without hard links
+            if err.errno not in LINK_ERRORS:
+                raise
+
+    if fcntl:
+        with open(source, 'rb') as src:
+            with open(dest, 'wb') as dst:
+                try:
+                    fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+                    return 'reflink'
+                except (IOError, OSError):
+                    pass
+
+    shutil.copyfile(source, dest)
+    return 'copy'
@@ -0,0 +1,168 @@
+#/usr/bin/python
+# Ripmaster.tools.estimate
+# Estimates how long an encode will take, and how big it will be, from samples
+
+"""
+
+Description
+-----------
+
+How long a movie takes to encode depends on its length, its resolution, the
+quality and tuning asked for, and how hard its picture is to compress. None of
+the movie's title, resolution or quality alone says which of two movies will
+finish first.
+
+Instead, a few short windows spread through the movie are encoded with the
+same options the real encode will use. How quickly HandBrake got through each
+second of the samples, and how many bytes each second of the samples took, are
+scaled up to the movie's whole length. Samples come from the middle of the
+movie rather than the start, so studio logos and black opening credits don't
+make a movie look cheaper than it is.
+
+Estimates are cached by the caller, keyed by the source file and the encode
+options, since sampling runs HandBrake several times per movie.
+
+Classes
+-------
+
+Estimate
+    The predicted encode time and output size of a movie.
+
+Functions
+---------
+
+extrapolate()
+    Scales sample encodes up to an <Estimate> of the whole movie.
+
+sampleWindows()
+    Returns the ranges of a movie to encode as samples.
+
+"""
+
+#===============================================================================
+# GLOBALS
+#===============================================================================
+
+SAMPLES_DEFAULT = 3
+SAMPLE_SECONDS_DEFAULT = 30
+
+#===============================================================================
+# CLASSES
+#===============================================================================
+
+class Estimate(object):
+    """The predicted encode time and output size of a movie
+
+    Args:
+        seconds : (float)
+            Predicted wall clock seconds the whole encode will take.
+
+        size : (int)
+            Predicted size of the encoded video, in bytes.
+
+        speed : (float)
+            Seconds of movie encoded per second of wall clock. The sample's
+            frames a second over the movie's frame rate.
+
+        bitrate : (float)
+            Bits a second of the encoded samples.
+
+    Raises:
+        N/A
+
+    """
+    def __init__(self, seconds, size, speed, bitrate):
+        self.seconds = seconds
+        self.size = size
+        self.speed = speed
+        self.bitrate = bitrate
+
+    def __repr__(self):
+        return 'Estimate({seconds!r}, {size!r}, {speed!r}, {bitrate!r})'.format(
+            seconds=self.seconds,
+            size=self.size,
+            speed=self.speed,
+            bitrate=self.bitrate
+        )
+
+#===============================================================================
+# FUNCTIONS
+#===============================================================================
+
+def extrapolate(duration, samples):
+    """Scales sample encodes up to an estimate of the whole movie
+
+    Args:
+        duration : (float)
+            Length of the movie, in seconds.
+
+        samples : [(float, float, int)]
+            The length in seconds, wall clock seconds taken, and encoded size
+            in bytes of each sample.
+
+    Raises:
+        N/A
+
+    Returns:
+        <Estimate>|None
+            The estimate, or None if the samples encoded nothing.
+
+    Samples are pooled rather than averaged, so a sample cut short at the end
+    of a movie counts for less.
+
+    """
+    length = sum([sample[0] for sample in samples])
+    taken = sum([sample[1] for sample in samples])
+    size = sum([sample[2] for sample in samples])
+    if length <= 0 or taken <= 0 or size <= 0:
+        return None
+
+    speed = length / taken
+    bitrate = size * 8 / length
+
+    return Estimate(
+        duration / speed, int(round(size * duration / length)), speed, bitrate
+    )
+
+#===============================================================================
+
+def sampleWindows(duration, samples=SAMPLES_DEFAULT,
+                  seconds=SAMPLE_SECONDS_DEFAULT):
+    """Returns the ranges of a movie to encode as samples
+
+    Args:
+        duration : (float)
+            Length of the movie, in seconds.
+
+        samples=SAMPLES_DEFAULT : (int)
+            How many samples to take.
+
+        seconds=SAMPLE_SECONDS_DEFAULT : (int)
+            Length of each sample, in seconds.
+
+    Raises:
+        N/A
+
+    Returns:
+        [(float, float)]
+            The start and length of each sample, in seconds. A movie too short
+            to hold the samples apart is sampled whole, in one range. Empty if
+            the duration isn't known.
+
+    Samples are centered at even spacings through the movie, leaving the same
+    gap before the first and after the last.
+
+    """
+    if not duration or duration <= 0 or samples < 1 or seconds <= 0:
+        return []
+
+    if duration <= samples * seconds:
+        return [(0.0, float(duration))]
+
+    windows = []
+    for i in xrange(samples):
+        center = duration * (i + 1) / (samples + 1)
+        start = max(0.0, min(center - seconds / 2.0, duration - seconds))
+        windows.append((start, float(seconds)))
+
+    return windows
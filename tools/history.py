@@ -0,0 +1,483 @@
+#/usr/bin/python
+# Ripmaster.tools.history
+# History of every finished stage, and the throughput model fit from it
+
+"""
+
+Description
+-----------
+
+Once a stage returns, the time it took is gone. Every stage that finishes is
+recorded in a HistoryStore instead: an SQLite database of what ran, how long
+it took, and what it ran on. Encodes also record the settings that decide how
+fast x264 goes: the resolution, x264 speed preset, tune, deinterlacing, forced
+frame rate, and the bitrate of the source.
+
+A ThroughputModel is fit from those records. An encode is predicted from the
+encodes before it with the same settings, its cohort. Within a cohort, the
+seconds taken per second of movie are fit as a straight line over the
+source's bitrate, since a busier source takes longer to encode. A cohort
+without enough history falls back to encodes at the same resolution and
+speed, then to every encode. Other stages are IO bound, and predicted from
+the bytes a second earlier runs of the stage got through.
+
+forecast() uses the model to predict when each movie in the queue will be
+finished, encoding as many at once as Ripmaster does.
+
+Classes
+-------
+
+HistoryStore
+    An SQLite backed record of every finished stage.
+
+ThroughputModel
+    Predicts how long stages will take, from the stages before them.
+
+Functions
+---------
+
+cohort()
+    Returns the settings an encode's throughput is grouped by.
+
+forecast()
+    Predicts when each movie in a queue will be finished.
+
+"""
+
+#===============================================================================
+# IMPORTS
+#===============================================================================
+
+# Standard Imports
+import sqlite3
+import threading
+
+#===============================================================================
+# GLOBALS
+#===============================================================================
+
+# A cohort needs this many encodes before a run is compared to it.
+MIN_RECORDS = 3
+# An encode going at less than this fraction of its cohort's speed is slow.
+SLOW_RATIO_DEFAULT = 0.5
+
+# The settings encodes are grouped by, from finest to coarsest. The last
+# groups every encode together.
+COHORTS = [
+    ('resolution', 'x264Speed', 'preset', 'tv', 'fps'),
+    ('resolution', 'x264Speed'),
+    (),
+]
+
+# Record keys, and the columns they're stored in
+FIELDS = [
+    ('stage', 'stage'),
+    ('path', 'path'),
+    ('started', 'started'),
+    ('seconds', 'seconds'),
+    ('duration', 'duration'),
+    ('sourceSize', 'source_size'),
+    ('outputSize', 'output_size'),
+    ('resolution', 'resolution'),
+    ('x264Speed', 'x264_speed'),
+    ('preset', 'preset'),
+    ('tv', 'tv'),
+    ('fps', 'fps'),
+    ('bitrate', 'bitrate'),
+    ('avgFps', 'avg_fps'),
+]
+
+SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS stages (
+        id INTEGER PRIMARY KEY,
+        stage TEXT NOT NULL,
+        path TEXT NOT NULL,
+        started REAL NOT NULL,
+        seconds REAL NOT NULL,
+        duration REAL,
+        source_size INTEGER,
+        output_size INTEGER,
+        resolution INTEGER,
+        x264_speed TEXT,
+        preset TEXT,
+        tv INTEGER,
+        fps INTEGER,
+        bitrate REAL,
+        avg_fps REAL
+    )""",
+    'CREATE INDEX IF NOT EXISTS stages_stage ON stages (stage, started)',
+]
+
+#===============================================================================
+# CLASSES
+#===============================================================================
+
+class HistoryStore(object):
+    """Records every finished stage
+
+    Args:
+        path : (str)
+            The SQLite database to keep the history in. Created if it doesn't
+            exist.
+
+    Raises:
+        sqlite3.Error
+            Raised if the database can't be opened.
+
+    Stages finish on different threads, so access goes through a lock.
+
+    """
+    def __init__(self, path):
+        self.path = path
+
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        try:
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.execute('PRAGMA synchronous=NORMAL')
+        except sqlite3.Error:
+            pass
+        for statement in SCHEMA:
+            self._db.execute(statement)
+        self._db.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute('SELECT COUNT(*) FROM stages').fetchone()[0]
+
+    #===========================================================================
+    # PUBLIC METHODS
+    #===========================================================================
+
+    def close(self):
+        """Closes the database"""
+        with self._lock:
+            self._db.close()
+
+    def record(self, record):
+        """Stores a finished stage
+
+        Args:
+            record : {str: any}
+                The stage, keyed as FIELDS are. stage, path, started and
+                seconds are needed, the rest can be left out.
+
+        Raises:
+            N/A
+
+        Returns:
+            None
+
+        """
+        columns = [column for key, column in FIELDS]
+        values = [record.get(key) for key, column in FIELDS]
+
+        with self._lock:
+            self._db.execute(
+                'INSERT INTO stages ({columns}) VALUES ({marks})'.format(
+                    columns=', '.join(columns),
+                    marks=', '.join(['?'] * len(columns))
+                ),
+                values
+            )
+            self._db.commit()
+
+    def records(self, stage=None):
+        """Returns the recorded stages, oldest first
+
+        Args:
+            stage=None : (str)
+                Only return this stage's records.
+
+        Raises:
+            N/A
+
+        Returns:
+            [{str: any}]
+                The records, keyed as FIELDS are.
+
+        """
+        query = 'SELECT {columns} FROM stages'.format(
+            columns=', '.join([column for key, column in FIELDS])
+        )
+        args = ()
+        if stage:
+            query += ' WHERE stage = ?'
+            args = (stage,)
+        query += ' ORDER BY started, id'
+
+        with self._lock:
+            rows = self._db.execute(query, args).fetchall()
+
+        keys = [key for key, column in FIELDS]
+        records = [dict(zip(keys, row)) for row in rows]
+        for record in records:
+            if record['tv'] is not None:
+                record['tv'] = bool(record['tv'])
+        return records
+
+#===============================================================================
+
+class ThroughputModel(object):
+    """Predicts how long stages will take, from the stages before them
+
+    Args:
+        records=None : [{str: any}]
+            Finished stages to fit the model to, as a <HistoryStore> returns
+            them.
+
+        minRecords=MIN_RECORDS : (int)
+            Encodes a cohort needs before it's used on its own.
+
+    Raises:
+        N/A
+
+    Records can be added as stages finish, and predictions use them at once.
+
+    """
+    def __init__(self, records=None, minRecords=MIN_RECORDS):
+        self.minRecords = minRecords
+
+        self._lock = threading.Lock()
+        # Usable records of each stage
+        self._records = {}
+
+        for record in records or []:
+            self.add(record)
+
+    #===========================================================================
+    # PRIVATE METHODS
+    #===========================================================================
+
+    def _cohort(self, record):
+        """Returns the finest cohort of encodes like this with enough history"""
+        encodes = self._records.get('encode', [])
+        for keys in COHORTS:
+            key = cohort(record, keys)
+            matching = [
+                encode for encode in encodes if cohort(encode, keys) == key
+            ]
+            if len(matching) >= self.minRecords or not keys and matching:
+                return keys, matching
+        return None, []
+
+    def _perSecond(self, record, encodes):
+        """Fits wall seconds per second of movie to the source bitrate"""
+        points = [
+            (encode['bitrate'], encode['seconds'] / encode['duration'])
+            for encode in encodes if encode['bitrate']
+        ]
+        pooled = (
+            sum([encode['seconds'] for encode in encodes]) /
+            sum([encode['duration'] for encode in encodes])
+        )
+
+        bitrate = record.get('bitrate')
+        if not bitrate or len(points) < self.minRecords:
+            return pooled
+
+        # Least squares, y = a + b * x
+        count = float(len(points))
+        meanX = sum([x for x, y in points]) / count
+        meanY = sum([y for x, y in points]) / count
+        spread = sum([(x - meanX) ** 2 for x, y in points])
+        if not spread:
+            return pooled
+        slope = sum([(x - meanX) * (y - meanY) for x, y in points]) / spread
+        perSecond = meanY + slope * (bitrate - meanX)
+
+        # A line fit to a few encodes can cross zero well outside them.
+        return perSecond if perSecond > 0 else pooled
+
+    #===========================================================================
+    # PUBLIC METHODS
+    #===========================================================================
+
+    def add(self, record):
+        """Adds a finished stage to the model
+
+        Records without a length of time, and encodes without the length of
+        the movie, can't predict anything and are left out.
+
+        """
+        if not record.get('seconds') or record['seconds'] <= 0:
+            return
+        if record['stage'] == 'encode' and not record.get('duration'):
+            return
+
+        with self._lock:
+            self._records.setdefault(record['stage'], []).append(record)
+
+    def expectedRate(self, record):
+        """Returns the seconds of movie an encode's cohort encodes a second
+
+        Args:
+            record : {str: any}
+                The encode's settings, keyed as <HistoryStore> records are.
+
+        Raises:
+            N/A
+
+        Returns:
+            (float)|None
+                The rate, or None if the encode's own cohort doesn't have
+                enough history to compare to. Coarser cohorts aren't used, as
+                different settings can run at very different rates.
+
+        """
+        with self._lock:
+            keys, encodes = self._cohort(record)
+            if keys != COHORTS[0]:
+                return None
+            return 1 / self._perSecond(record, encodes)
+
+    def predict(self, record):
+        """Predicts how many seconds a stage will take
+
+        Args:
+            record : {str: any}
+                The stage to run, keyed as <HistoryStore> records are, without
+                the seconds.
+
+        Raises:
+            N/A
+
+        Returns:
+            (float)|None
+                The seconds, or None if there's no history to go on, or the
+                movie's length or size needed isn't known.
+
+        """
+        with self._lock:
+            if record['stage'] == 'encode':
+                if not record.get('duration'):
+                    return None
+                keys, encodes = self._cohort(record)
+                if not encodes:
+                    return None
+                return record['duration'] * self._perSecond(record, encodes)
+
+            runs = self._records.get(record['stage'], [])
+            sized = [run for run in runs if run.get('sourceSize')]
+            if record.get('sourceSize') and sized:
+                perByte = (
+                    sum([run['seconds'] for run in sized]) /
+                    sum([run['sourceSize'] for run in sized])
+                )
+                return record['sourceSize'] * perByte
+            if runs:
+                return sum([run['seconds'] for run in runs]) / len(runs)
+            return None
+
+    def slow(self, record, rate, ratio=SLOW_RATIO_DEFAULT):
+        """Checks if an encode is going much slower than its cohort
+
+        Args:
+            record : {str: any}
+                The encode's settings.
+
+            rate : (float)
+                Seconds of movie the encode is getting through a second.
+
+            ratio=SLOW_RATIO_DEFAULT : (float)
+                The encode is slow below this fraction of its cohort's rate.
+
+        Raises:
+            N/A
+
+        Returns:
+            (float)|None
+                The fraction of its cohort's rate the encode is going at, if
+                it's slow. None if it isn't, or there's nothing to compare to.
+
+        """
+        expected = self.expectedRate(record)
+        if not rate or not expected:
+            return None
+        fraction = rate / expected
+        return fraction if fraction < ratio else None
+
+#===============================================================================
+# FUNCTIONS
+#===============================================================================
+
+def cohort(record, keys=COHORTS[0]):
+    """Returns the settings an encode's throughput is grouped by
+
+    Args:
+        record : {str: any}
+            The encode, keyed as <HistoryStore> records are.
+
+        keys=COHORTS[0] : (str,)
+            The settings to group by.
+
+    Raises:
+        N/A
+
+    Returns:
+        (any,)
+            The encode's value of each setting. Unset settings are None, and
+            tv is always a bool.
+
+    """
+    values = []
+    for key in keys:
+        value = record.get(key)
+        if key == 'tv':
+            value = bool(value)
+        elif not value:
+            value = None
+        values.append(value)
+    return tuple(values)
+
+#===============================================================================
+
+def forecast(jobs, model, encoders=1):
+    """Predicts when each movie in a queue will be finished
+
+    Args:
+        jobs : [[{str: any}]]
+            The stages left for each movie, in the order the queue runs them.
+
+        model : (<ThroughputModel>)
+            Predicts each stage.
+
+        encoders=1 : (int)
+            How many encodes run at once.
+
+    Raises:
+        N/A
+
+    Returns:
+        [(float)|None]
+            Seconds from now until each movie is finished, or None if any of
+            its stages can't be predicted.
+
+    Each encode starts once an encoder is free, as the queue does. Extracts
+    and conversions run alongside the encodes, and the merge starts once both
+    are done. A stage that can't be predicted is counted as taking no time,
+    so the movies after it are still forecast, if too early.
+
+    """
+    free = [0.0] * max(1, encoders)
+    finished = []
+
+    for stages in jobs:
+        known = True
+        predicted = {}
+        for record in stages:
+            seconds = model.predict(record)
+            if seconds is None:
+                known = False
+            predicted[record['stage']] = seconds or 0.0
+
+        ready = predicted.get('extract', 0.0) + predicted.get('convert', 0.0)
+        if 'encode' in predicted:
+            encoder = free.index(min(free))
+            free[encoder] += predicted['encode']
+            ready = max(ready, free[encoder])
+        done = ready + predicted.get('merge', 0.0)
+
+        finished.append(done if known else None)
+
+    return finished
@@ -0,0 +1,107 @@
+// Ripmaster.tools.java.Sup2SubServer
+// Runs many BDSup2Sub conversions inside a single JVM
+
+/*
+
+Description
+-----------
+
+Starting a fresh JVM for every subtitle track costs more than converting a
+small track does. Sup2SubServer is started once with BDSup2Sub's jar on the
+classpath, then reads conversion jobs from stdin, one per line. Each line is
+the tab separated argument list that would normally be given to
+'java -jar BDSup2Sub.jar'.
+
+BDSup2Sub's main method is called with those arguments, and its console output
+goes to stdout as normal. When the job is done, a line containing the DONE
+marker and the exit status is printed, so Ripmaster knows where one job's
+output ends.
+
+BDSup2Sub calls System.exit when a conversion finishes. Where the JVM allows
+it, that call is trapped with a SecurityManager so the server survives. Newer
+JVMs refuse to install a SecurityManager, in which case the JVM exits after
+the first job, and Ripmaster simply starts another.
+
+Usage:
+
+    java -cp BDSup2Sub.jar:<dir with this class> Sup2SubServer BDSup2Sub.jar
+
+*/
+
+import java.io.BufferedReader;
+import java.io.InputStreamReader;
+import java.lang.reflect.InvocationTargetException;
+import java.lang.reflect.Method;
+import java.security.Permission;
+import java.util.jar.JarFile;
+
+public class Sup2SubServer {
+
+    static final String DONE = "@@RIPMASTER_DONE@@";
+
+    static class ExitTrapped extends SecurityException {
+        final int status;
+
+        ExitTrapped(int status) {
+            super("System.exit(" + status + ")");
+            this.status = status;
+        }
+    }
+
+    public static void main(String[] args) throws Exception {
+        // The main class is read from the jar itself, so we don't depend on
+        // the package layout of a particular BDSup2Sub release.
+        JarFile jar = new JarFile(args[0]);
+        String mainClass = jar.getManifest().getMainAttributes().getValue(
+            "Main-Class"
+        );
+        jar.close();
+
+        Method sup2Sub = Class.forName(mainClass).getMethod(
+            "main", String[].class
+        );
+
+        try {
+            System.setSecurityManager(new SecurityManager() {
+                public void checkPermission(Permission perm) {}
+                public void checkPermission(Permission perm, Object context) {}
+                public void checkExit(int status) {
+                    throw new ExitTrapped(status);
+                }
+            });
+        } catch (UnsupportedOperationException e) {
+            // Can't trap System.exit on this JVM. Each job will end the server.
+        }
+
+        BufferedReader in = new BufferedReader(
+            new InputStreamReader(System.in, "UTF-8")
+        );
+
+        String line;
+        while ((line = in.readLine()) != null) {
+            if (line.length() == 0) {
+                continue;
+            }
+
+            int status = 0;
+            try {
+                sup2Sub.invoke(null, (Object) line.split("\t"));
+            } catch (InvocationTargetException e) {
+                Throwable cause = e.getCause();
+                if (cause instanceof ExitTrapped) {
+                    status = ((ExitTrapped) cause).status;
+                } else {
+                    cause.printStackTrace(System.out);
+                    status = 1;
+                }
+            } catch (ExitTrapped e) {
+                status = e.status;
+            }
+
+            System.err.flush();
+            System.out.flush();
+            System.out.println(DONE + " " + status);
+            System.out.flush();
+        }
+    }
+}
@@ -0,0 +1,260 @@
+#/usr/bin/python
+# Ripmaster.tools.jobstore
+# Crash safe store of every movie's progress
+
+"""
+
+Description
+-----------
+
+Ripmaster checkpoints after every stage of every movie, so a crash or restart
+picks up where it left off. The JobStore keeps that progress in an SQLite
+database, with a record for each movie and for each of its tracks.
+
+A checkpoint only writes the movie whose stage just finished, in a single
+transaction, so its cost doesn't grow with the size of the library. The
+database is in write ahead logging mode with full synchronous writes, so each
+transaction is flushed to disk before the checkpoint returns, and a crash at
+any point leaves either the old record or the new one, never a mix.
+
+Each movie record holds the pickled <tools.Movie>, which is what Ripmaster
+resumes from, along with a column for each stage so pending movies can be
+listed without unpickling the finished ones.
+
+Ripmaster used to pickle its whole movie list to movies.p. importPickle()
+reads one of those files into the store.
+
+Classes
+-------
+
+JobStore
+    An SQLite backed store of movies and their tracks, written a movie at a
+    time.
+
+"""
+
+#===============================================================================
+# IMPORTS
+#===============================================================================
+
+# Standard Imports
+import cPickle
+import sqlite3
+import threading
+
+#===============================================================================
+# GLOBALS
+#===============================================================================
+
+SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS movies (
+        path TEXT PRIMARY KEY,
+        position INTEGER NOT NULL,
+        extracted INTEGER NOT NULL,
+        converted INTEGER NOT NULL,
+        encoded INTEGER NOT NULL,
+        merged INTEGER NOT NULL,
+        movie BLOB NOT NULL
+    )""",
+    """CREATE TABLE IF NOT EXISTS tracks (
+        movie TEXT NOT NULL REFERENCES movies (path),
+        track_id TEXT NOT NULL,
+        type TEXT NOT NULL,
+        file_type TEXT NOT NULL,
+        extracted INTEGER NOT NULL,
+        converted INTEGER,
+        forced INTEGER,
+        forced_only INTEGER,
+        PRIMARY KEY (movie, track_id)
+    )""",
+    'CREATE INDEX IF NOT EXISTS movies_merged ON movies (merged, position)',
+]
+
+#===============================================================================
+# CLASSES
+#===============================================================================
+
+class JobStore(object):
+    """Stores the progress of every movie, a movie at a time
+
+    Args:
+        path : (str)
+            The SQLite database to keep jobs in. Created if it doesn't exist.
+
+    Raises:
+        sqlite3.Error
+            Raised if the database can't be opened.
+
+    Stages finish on different threads, so access goes through a lock.
+
+    """
+    def __init__(self, path):
+        self.path = path
+
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        # Paths are byte strings, in whatever encoding the filesystem uses.
+        # They're stored and read back as they are, so a title with an accent
+        # can be bound, and comes back equal to the path on disk.
+        self._db.text_factory = str
+        self._db.execute('PRAGMA journal_mode=WAL')
+        # Every commit is flushed to disk before it returns.
+        self._db.execute('PRAGMA synchronous=FULL')
+        for statement in SCHEMA:
+            self._db.execute(statement)
+        self._db.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute('SELECT COUNT(*) FROM movies').fetchone()[0]
+
+    #===========================================================================
+    # PRIVATE METHODS
+    #===========================================================================
+
+    def _load(self, query, args=()):
+        """Unpickles the movie of every row the query returns"""
+        with self._lock:
+            rows = self._db.execute(query, args).fetchall()
+        return [cPickle.loads(str(row[0])) for row in rows]
+
+    def _write(self, movie, position=None):
+        """Writes a movie and its tracks. The lock must already be held"""
+        if position is None:
+            position = self._db.execute(
+                'SELECT COALESCE(MAX(position) + 1, 0) FROM movies'
+            ).fetchone()[0]
+
+        self._db.execute(
+            'INSERT OR REPLACE INTO movies '
+            '(path, position, extracted, converted, encoded, merged, movie) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?)',
+            (movie.path, position, movie.extracted, movie.converted,
+             movie.encoded, movie.merged,
+             sqlite3.Binary(cPickle.dumps(movie, cPickle.HIGHEST_PROTOCOL)))
+        )
+
+        self._db.execute('DELETE FROM tracks WHERE movie = ?', (movie.path,))
+        rows = []
+        for track in movie.audioTracks:
+            rows.append(
+                (movie.path, str(track.trackID), 'audio', track.fileType,
+                 track.extracted, None, None, None)
+            )
+        for track in movie.subtitleTracks:
+            rows.append(
+                (movie.path, str(track.trackID), 'subtitles', track.fileType,
+                 track.extracted, track.converted, track.forced,
+                 track.forcedOnly)
+            )
+        self._db.executemany(
+            'INSERT INTO tracks (movie, track_id, type, file_type, extracted, '
+            'converted, forced, forced_only) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+            rows
+        )
+
+    #===========================================================================
+    # PUBLIC METHODS
+    #===========================================================================
+
+    def add(self, movies):
+        """Adds new movies after the ones already stored, in one transaction
+
+        Args:
+            movies : [<tools.Movie>]
+                The movies to add. A movie whose path is already stored
+                replaces it, keeping its place.
+
+        Raises:
+            N/A
+
+        Returns:
+            None
+
+        """
+        with self._lock:
+            with self._db:
+                for movie in movies:
+                    row = self._db.execute(
+                        'SELECT position FROM movies WHERE path = ?',
+                        (movie.path,)
+                    ).fetchone()
+                    self._write(movie, row[0] if row else None)
+
+    def close(self):
+        """Closes the database"""
+        with self._lock:
+            self._db.close()
+
+    def importPickle(self, pickleFile):
+        """Adds every movie from a movies.p file Ripmaster used to write
+
+        Args:
+            pickleFile : (str)
+                The pickled list of movies.
+
+        Raises:
+            IOError
+                Raised if the file can't be read.
+
+            EOFError
+                Raised if the file is empty or cut short.
+
+        Returns:
+            (int)
+                Number of movies imported.
+
+        """
+        with open(pickleFile, 'rb') as f:
+            movies = cPickle.load(f)
+
+        self.add(movies)
+
+        return len(movies)
+
+    def movies(self):
+        """Returns every stored movie, in the order they were added"""
+        return self._load('SELECT movie FROM movies ORDER BY position')
+
+    def paths(self):
+        """Returns the path of every stored movie
+
+        Args:
+            N/A
+
+        Raises:
+            N/A
+
+        Returns:
+            set(str)
+                The paths, without unpickling any movies.
+
+        """
+        with self._lock:
+            rows = self._db.execute('SELECT path FROM movies').fetchall()
+        return set([row[0] for row in rows])
+
+    def pending(self):
+        """Returns every movie that hasn't been merged, in the order added"""
+        return self._load(
+            'SELECT movie FROM movies WHERE merged = 0 ORDER BY position'
+        )
+
+    def save(self, movie):
+        """Checkpoints a single movie and its tracks
+
+        Args:
+            movie : (<tools.Movie>)
+                The movie to write. Added to the end if it isn't stored yet.
+
+        Raises:
+            N/A
+
+        Returns:
+            None
+
+        Only this movie's records are written, in one transaction that's on
+        disk by the time this returns.
+
+        """
+        self.add([movie])
@@ -0,0 +1,391 @@
+#/usr/bin/python
+# Ripmaster.tools.lease
+# Lease files that let several Ripmaster workers share one toConvert folder
+
+"""
+
+Description
+-----------
+
+Several encode boxes can work through the same toConvert share by running
+Ripmaster with --worker. Workers never talk to each other. Each movie is
+claimed by taking a lease on it: a small file in a lease folder on the share.
+
+Leases are taken by creating the lease file exclusively (O_CREAT | O_EXCL),
+which only one worker can ever do. A worker keeps its leases alive by touching
+them every quarter of the lease time. If a worker dies, its leases stop being
+touched, and once a lease is older than the lease time any other worker can
+take the movie over. Takeovers create the next generation of the lease file,
+again exclusively, so only one worker ever wins a takeover, and a worker that
+was only paused finds out it lost the lease the next time it checks. Released
+leases are marked as released rather than removed, so generations only ever
+go up, and a released job is taken with the next generation straight away.
+
+The progress of a movie is published to the share after every stage, by
+writing a new file and renaming it over the old one, so other workers only
+ever see a complete state. A worker only publishes while it still holds the
+lease. Once a movie is finished, a done marker is published with it, and the
+movie is never claimed again.
+
+Lease times are compared against each file's modification time, so the clocks
+of every worker and the file server need to be roughly in sync.
+
+Classes
+-------
+
+LeaseManager
+    Takes, renews and releases leases in a lease folder, and publishes and
+    loads the state of leased jobs.
+
+"""
+
+#===============================================================================
+# IMPORTS
+#===============================================================================
+
+# Standard Imports
+import cPickle
+import errno
+import hashlib
+import os
+import socket
+import threading
+import time
+import uuid
+
+#===============================================================================
+# GLOBALS
+#===============================================================================
+
+LEASE_SECONDS_DEFAULT = 120
+
+# Written in place of the token when a lease is released. The file is kept, so
+# the next lease on the job is always a higher generation.
+RELEASED = 'released'
+
+#===============================================================================
+# CLASSES
+#===============================================================================
+
+class LeaseManager(object):
+    """Takes and keeps leases on jobs, in a folder shared by every worker
+
+    Args:
+        directory : (str)
+            The shared lease folder. Created if it doesn't exist.
+
+        ttl=LEASE_SECONDS_DEFAULT : (int|float)
+            Seconds a lease lasts without being renewed.
+
+        owner=None : (str)
+            Name this worker writes into its leases, to tell workers apart when
+            reading them. Defaults to the host name and process ID.
+
+    Raises:
+        OSError
+            Raised if the lease folder can't be created.
+
+    Held leases are renewed by a background thread, started with the first
+    lease taken. A lease that turns out to have been taken over is dropped,
+    and publish() refuses to write for it from then on.
+
+    """
+    def __init__(self, directory, ttl=LEASE_SECONDS_DEFAULT, owner=None):
+        self.directory = directory
+        self.ttl = ttl
+        self.owner = owner if owner else '{host}:{pid}'.format(
+            host=socket.gethostname(), pid=os.getpid()
+        )
+
+        try:
+            os.makedirs(directory)
+        except OSError, err:
+            if err.errno != errno.EEXIST:
+                raise
+
+        # Key: (lease file, token)
+        self._held = {}
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._heartbeat = None
+
+    #===========================================================================
+    # PRIVATE METHODS
+    #===========================================================================
+
+    def _beat(self):
+        """Renews every held lease, a few times per lease time"""
+        while not self._stopped.wait(self.ttl / 4.0):
+            with self._lock:
+                keys = self._held.keys()
+            for key in keys:
+                if not self.renew(key):
+                    print "Lost the lease on {key}".format(key=key)
+
+    def _generations(self, name):
+        """Returns the generations of a job's lease files, highest first"""
+        prefix = name + '.lease.'
+        generations = []
+        for fileName in os.listdir(self.directory):
+            if fileName.startswith(prefix):
+                try:
+                    generations.append(int(fileName[len(prefix):]))
+                except ValueError:
+                    continue
+        return sorted(generations, reverse=True)
+
+    def _name(self, key):
+        """Returns the file name stem used for a job"""
+        if isinstance(key, unicode):
+            key = key.encode('utf-8')
+        return hashlib.sha1(key).hexdigest()
+
+    def _path(self, name, suffix):
+        """Returns a path in the lease folder"""
+        return os.path.join(self.directory, name + suffix)
+
+    def _readToken(self, path):
+        """Returns the token written in a lease file, or None"""
+        try:
+            with open(path, 'rb') as f:
+                return f.readline().strip()
+        except IOError:
+            return None
+
+    def _replace(self, path, data):
+        """Writes a file so that readers only ever see all of it"""
+        temp = '{path}.{token}.tmp'.format(path=path, token=uuid.uuid4().hex)
+        with open(temp, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        try:
+            os.rename(temp, path)
+        except OSError:
+            # Windows won't rename over an existing file.
+            if os.path.exists(path):
+                os.remove(path)
+            os.rename(temp, path)
+
+    def _tombstone(self, path):
+        """Marks a lease file released, keeping its generation in place"""
+        # Written in place rather than replaced, so the file never goes away
+        # for an acquire to start again from a lower generation.
+        try:
+            with open(path, 'r+b') as f:
+                f.write(RELEASED + '\n')
+                f.truncate()
+        except IOError:
+            pass
+
+    #===========================================================================
+    # PUBLIC METHODS
+    #===========================================================================
+
+    def acquire(self, key):
+        """Tries to take the lease on a job
+
+        Args:
+            key : (str)
+                Names the job. Every worker must use the same key for the
+                same job.
+
+        Raises:
+            N/A
+
+        Returns:
+            (bool)
+                True if the lease was taken. False if the job is done, or
+                another worker holds a live lease on it.
+
+        """
+        if self.isDone(key):
+            return False
+
+        with self._lock:
+            if key in self._held:
+                return True
+
+        name = self._name(key)
+        generations = self._generations(name)
+        generation = 0
+        if generations:
+            latest = self._path(name, '.lease.{0}'.format(generations[0]))
+            try:
+                age = time.time() - os.stat(latest).st_mtime
+            except OSError:
+                # Replaced by a takeover while we looked. Whoever creates the
+                # next generation first gets it.
+                age = self.ttl
+            if age < self.ttl and self._readToken(latest) != RELEASED:
+                return False
+            generation = generations[0] + 1
+
+        path = self._path(name, '.lease.{0}'.format(generation))
+        token = uuid.uuid4().hex
+        try:
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except OSError, err:
+            if err.errno == errno.EEXIST:
+                return False
+            raise
+        try:
+            os.write(fd, '{token}\n{owner}\n{key}\n'.format(
+                token=token, owner=self.owner, key=key
+            ))
+        finally:
+            os.close(fd)
+
+        # The last holder may have finished it, and released, while we looked.
+        if self.isDone(key):
+            self._tombstone(path)
+            return False
+
+        # Older generations belong to workers that are gone.
+        for old in generations:
+            try:
+                os.remove(self._path(name, '.lease.{0}'.format(old)))
+            except OSError:
+                pass
+
+        with self._lock:
+            self._held[key] = (path, token)
+            if not self._heartbeat:
+                self._heartbeat = threading.Thread(target=self._beat)
+                self._heartbeat.daemon = True
+                self._heartbeat.start()
+
+        return True
+
+    def close(self):
+        """Stops renewing leases, and releases every lease still held"""
+        self._stopped.set()
+        with self._lock:
+            keys = self._held.keys()
+        for key in keys:
+            self.release(key)
+
+    def held(self, key):
+        """True if this worker still holds the lease on a job"""
+        with self._lock:
+            if key not in self._held:
+                return False
+            path, token = self._held[key]
+
+        if self._readToken(path) != token:
+            return False
+
+        # A takeover creates a higher generation before it removes ours.
+        name = self._name(key)
+        generation = int(path.rsplit('.', 1)[-1])
+        return self._generations(name)[0] <= generation
+
+    def isDone(self, key):
+        """True if a job has been published as done"""
+        return os.path.exists(self._path(self._name(key), '.done'))
+
+    def load(self, key):
+        """Returns the last state published for a job, or None
+
+        Args:
+            key : (str)
+                Names the job.
+
+        Raises:
+            N/A
+
+        Returns:
+            (any)|None
+                The state given to publish(), or None if nothing has been
+                published, or it can't be read.
+
+        """
+        try:
+            with open(self._path(self._name(key), '.state'), 'rb') as f:
+                return cPickle.load(f)
+        except (IOError, EOFError, cPickle.UnpicklingError):
+            return None
+
+    def publish(self, key, state, done=False):
+        """Publishes the state of a leased job for every worker to see
+
+        Args:
+            key : (str)
+                Names the job.
+
+            state : (any)
+                The state of the job. Anything that can be pickled.
+
+            done=False : (bool)
+                If True, the job is marked done, and is never leased again.
+
+        Raises:
+            N/A
+
+        Returns:
+            (bool)
+                True if published. False if this worker doesn't hold the lease,
+                in which case nothing is written.
+
+        """
+        if not self.held(key):
+            return False
+
+        name = self._name(key)
+        self._replace(
+            self._path(name, '.state'),
+            cPickle.dumps(state, cPickle.HIGHEST_PROTOCOL)
+        )
+        if done:
+            self._replace(self._path(name, '.done'), key + '\n')
+
+        return True
+
+    def release(self, key):
+        """Gives up the lease on a job, if it's still held
+
+        Args:
+            key : (str)
+                Names the job.
+
+        Raises:
+            N/A
+
+        Returns:
+            None
+
+        """
+        held = self.held(key)
+        with self._lock:
+            path, token = self._held.pop(key, (None, None))
+        if held:
+            self._tombstone(path)
+
+    def renew(self, key):
+        """Renews the lease on a job, so it doesn't expire
+
+        Args:
+            key : (str)
+                Names the job.
+
+        Raises:
+            N/A
+
+        Returns:
+            (bool)
+                True if renewed. False if the lease was lost to another
+                worker, in which case it's dropped.
+
+        """
+        if self.held(key):
+            with self._lock:
+                path, token = self._held.get(key, (None, None))
+            try:
+                os.utime(path, None)
+                return True
+            except (OSError, TypeError):
+                pass
+
+        with self._lock:
+            self._held.pop(key, None)
+        return False
@@ -0,0 +1,1113 @@
+#/usr/bin/python
+# Ripmaster.tools.matroska
+# Reads Matroska files without mkvmerge or mkvextract
+
+"""
+
+Description
+-----------
+
+A Matroska file is EBML: a tree of elements, each written as an ID, a size and
+its data. IDs and sizes are variable length integers, whose first byte tells
+how many bytes follow:
+
+    1xxxxxxx                    1 byte
+    01xxxxxx xxxxxxxx           2 bytes
+    ...
+    00000001 xxxxxxxx x 7       8 bytes
+
+IDs keep their length marker. Sizes don't, and a size with every bit set is
+unknown, running to the end of the element holding it.
+
+After the EBML header, the whole file is a single Segment. Its children are the
+Info (the duration), Tracks, Chapters, Cues (an index of where each track's
+blocks are) and Tags, and the Clusters holding the movie itself. A SeekHead at
+the start of the Segment gives the position of the rest, so the Cues and Tags
+written after the Clusters are found without walking past them.
+
+MatroskaFile memory maps the file and reads only the elements it's asked for,
+so a 40GB rip is probed by touching a few pages at its start and end. The
+tracks come back in the same form mkvmerge's identification is parsed into,
+with the same track IDs, so the rest of Ripmaster can't tell the difference.
+
+A Cluster holds the blocks of every track for a few seconds of the movie. Each
+block starts with its track number, a timecode relative to the Cluster's, and
+flags. mkvmerge adds a cue for every subtitle block, so extractSubtitles()
+visits only the Clusters the Cues give for the subtitle tracks, and skips the
+gigabytes of video between them. The blocks are written to each sup straight
+from the mapped file, without being copied, the way mkvextract writes them:
+every PGS segment in a block gets the 'PG' header with the block's timestamp.
+
+Classes
+-------
+
+MatroskaFile
+    A memory mapped Matroska file, read a top level element at a time.
+
+Functions
+---------
+
+chapters()
+    Returns the chapter start times of a Matroska file.
+
+children()
+    Walks the child elements of a master element.
+
+extractSubtitles()
+    Extracts PGS subtitle tracks to sup files, in one pass over the Clusters.
+
+probe()
+    Returns the duration and tracks of a Matroska file, as mkvmerge lists them.
+
+readElement()
+    Reads the ID and size of the element at an offset.
+
+"""
+
+#===============================================================================
+# IMPORTS
+#===============================================================================
+
+# Standard Imports
+from binascii import hexlify
+import mmap
+import os
+import struct
+import zlib
+
+#===============================================================================
+# GLOBALS
+#===============================================================================
+
+# Element IDs, with their length markers, as they're written
+EBML = 0x1A45DFA3
+DOC_TYPE = 0x4282
+VOID = 0xEC
+SEGMENT = 0x18538067
+
+SEEK_HEAD = 0x114D9B74
+SEEK = 0x4DBB
+SEEK_ID = 0x53AB
+SEEK_POSITION = 0x53AC
+
+INFO = 0x1549A966
+TIMECODE_SCALE = 0x2AD7B1
+DURATION = 0x4489
+
+TRACKS = 0x1654AE6B
+TRACK_ENTRY = 0xAE
+TRACK_NUMBER = 0xD7
+TRACK_UID = 0x73C5
+TRACK_TYPE = 0x83
+FLAG_ENABLED = 0xB9
+FLAG_DEFAULT = 0x88
+FLAG_FORCED = 0x55AA
+NAME = 0x536E
+LANGUAGE = 0x22B59C
+CODEC_ID = 0x86
+CODEC_PRIVATE = 0x63A2
+VIDEO = 0xE0
+PIXEL_WIDTH = 0xB0
+PIXEL_HEIGHT = 0xBA
+DISPLAY_WIDTH = 0x54B0
+DISPLAY_HEIGHT = 0x54BA
+AUDIO = 0xE1
+SAMPLING_FREQUENCY = 0xB5
+CHANNELS = 0x9F
+
+CHAPTERS = 0x1043A770
+EDITION_ENTRY = 0x45B9
+CHAPTER_ATOM = 0xB6
+CHAPTER_TIME_START = 0x91
+
+CUES = 0x1C53BB6B
+CUE_POINT = 0xBB
+CUE_TIME = 0xB3
+CUE_TRACK_POSITIONS = 0xB7
+CUE_TRACK = 0xF7
+CUE_CLUSTER_POSITION = 0xF1
+
+TAGS = 0x1254C367
+TAG = 0x7373
+TARGETS = 0x63C0
+TAG_TRACK_UID = 0x63C5
+SIMPLE_TAG = 0x67C8
+TAG_NAME = 0x45A3
+TAG_STRING = 0x4487
+
+CONTENT_ENCODINGS = 0x6D80
+CONTENT_ENCODING = 0x6240
+CONTENT_ENCODING_ORDER = 0x5031
+CONTENT_ENCODING_SCOPE = 0x5032
+CONTENT_ENCODING_TYPE = 0x5033
+CONTENT_COMPRESSION = 0x5034
+CONTENT_COMP_ALGO = 0x4254
+CONTENT_COMP_SETTINGS = 0x4255
+
+CLUSTER = 0x1F43B675
+CLUSTER_TIMECODE = 0xE7
+SIMPLE_BLOCK = 0xA3
+BLOCK_GROUP = 0xA0
+BLOCK = 0xA1
+
+DOC_TYPES = ['matroska', 'webm']
+
+PGS_CODEC = 'S_HDMV/PGS'
+
+# The unsigned integers of a TrackEntry
+UINT_FIELDS = [
+    TRACK_NUMBER, TRACK_UID, TRACK_TYPE, FLAG_ENABLED, FLAG_DEFAULT,
+    FLAG_FORCED
+]
+
+# Track types, named as mkvmerge names them. Other types, like buttons, are
+# left out, as mkvmerge's identification is.
+TRACK_TYPES = {1: 'video', 2: 'audio', 0x11: 'subtitles'}
+
+# Nanoseconds in each tick of the Info's Duration and the Cues, unless the
+# file says otherwise
+TIMECODE_SCALE_DEFAULT = 1000000
+
+# The statistics tags mkvmerge lists as track properties, as tag_<name>
+STATISTICS_TAGS = ['BPS', 'DURATION', 'NUMBER_OF_BYTES', 'NUMBER_OF_FRAMES']
+
+# Bytes in a variable length integer, by its first byte. 0 is never valid.
+VINT_LENGTHS = [0] + [9 - byte.bit_length() for byte in xrange(1, 256)]
+# The value bits of a variable length integer, by its length. A size with all
+# of them set is unknown.
+VINT_MASKS = [(1 << 7 * length) - 1 for length in xrange(9)]
+
+FLOATS = {4: struct.Struct('>f'), 8: struct.Struct('>d')}
+
+# A block's timecode, relative to its Cluster's, and its flags
+BLOCK_HEADER = struct.Struct('>hB')
+# Blocks with either of these flags set hold several frames.
+LACING = 0x06
+
+# Content encodings that apply to each frame, rather than to the CodecPrivate
+SCOPE_FRAMES = 0x01
+# Content encoding types, and the compression algorithms we can undo
+COMPRESSION = 0
+ZLIB = 0
+HEADER_STRIPPING = 3
+
+# The header mkvextract puts before each PGS segment: the 'PG' magic, and the
+# presentation and decoding timestamps, at 90kHz.
+SUP_HEADER = struct.Struct('>2sII')
+SEGMENT_SIZE = struct.Struct('>H')
+
+#===============================================================================
+# CLASSES
+#===============================================================================
+
+class MatroskaFile(object):
+    """A memory mapped Matroska file
+
+    Args:
+        path : (str)
+            The file to read.
+
+    Raises:
+        IOError
+            Raised if the file can't be read.
+
+        ValueError
+            Raised if the file isn't Matroska, or its headers are cut short.
+
+    The file is mapped until close() is called. Each top level element is only
+    read when it's asked for, so a MatroskaFile can be opened just to list the
+    tracks without the Cues being touched.
+
+    """
+    def __init__(self, path):
+        self.path = path
+
+        with open(path, 'rb') as f:
+            if not f.read(1):
+                # mmap refuses empty files
+                raise ValueError('{path} is empty'.format(path=path))
+            self._buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        try:
+            self._open()
+        except:
+            self._buf.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    #===========================================================================
+    # PRIVATE METHODS
+    #===========================================================================
+
+    def _dataEnd(self, start, size):
+        """Returns where an element's data ends, within the Segment"""
+        if size is None:
+            return self._end
+        return min(start + size, self._end)
+
+    def _element(self, elementId):
+        """Returns the data start and end of a top level element, or None"""
+        offset = self._positions.get(elementId)
+        if offset is None:
+            return None
+        try:
+            foundId, start, size = readElement(self._buf, offset, self._end)
+        except ValueError:
+            return None
+        # A SeekHead left stale by an edit can point at anything.
+        if foundId != elementId:
+            return None
+        return start, self._dataEnd(start, size)
+
+    def _locate(self):
+        """Finds the position of every top level element
+
+        The elements before the first Cluster are walked, and every SeekHead
+        among them read. Without a SeekHead, the Clusters are walked past too,
+        a header at a time, to find the elements after them.
+
+        """
+        buf = self._buf
+        self._positions = {}
+        self._seekHeads = set()
+        # A SeekHead can index any Cluster, so the first is kept apart.
+        self._firstCluster = None
+
+        offset = self._start
+        while offset < self._end:
+            try:
+                elementId, start, size = readElement(buf, offset, self._end)
+            except ValueError:
+                # A file still being written ends part way through.
+                break
+            if elementId == CLUSTER:
+                if self._firstCluster is None:
+                    self._firstCluster = offset
+                if self._seekHeads:
+                    break
+            self._positions.setdefault(elementId, offset)
+            if elementId == SEEK_HEAD:
+                self._readSeekHead(offset)
+            if size is None:
+                break
+            offset = start + size
+
+    def _open(self):
+        """Reads the EBML header, and finds the Segment's elements"""
+        buf = self._buf
+        end = len(buf)
+
+        elementId, start, size = readElement(buf, 0, end)
+        if elementId != EBML or size is None:
+            raise ValueError(
+                '{path} is not an EBML file'.format(path=self.path)
+            )
+        headerEnd = start + size
+
+        docType = None
+        for childId, childStart, childEnd in children(buf, start, headerEnd):
+            if childId == DOC_TYPE:
+                docType = _string(buf, childStart, childEnd)
+        if docType not in DOC_TYPES:
+            raise ValueError(
+                '{path} is {docType}, not Matroska'.format(
+                    path=self.path, docType=docType
+                )
+            )
+
+        offset = headerEnd
+        while True:
+            elementId, start, size = readElement(buf, offset, end)
+            if elementId == SEGMENT:
+                break
+            if elementId != VOID or size is None:
+                raise ValueError(
+                    '{path} has no Segment'.format(path=self.path)
+                )
+            offset = start + size
+
+        self._start = start
+        # A rip that's still being written has a Segment longer than the file.
+        self._end = end if size is None else min(start + size, end)
+
+        self._info = None
+        # Each track's content encodings, by track number, once tracks() has
+        # read them.
+        self._encodings = None
+        self._locate()
+
+    def _readBlock(self, start, end):
+        """Returns a block's track number, relative timecode, flags and frame"""
+        buf = self._buf
+        first = ord(buf[start])
+        length = VINT_LENGTHS[first]
+        frameStart = start + length + BLOCK_HEADER.size
+        if not length or frameStart > end:
+            raise ValueError('Bad block at offset {0}'.format(start))
+        if length == 1:
+            number = first & 0x7F
+        else:
+            number = int(hexlify(buf[start:start + length]), 16) & \
+                VINT_MASKS[length]
+        timecode, flags = BLOCK_HEADER.unpack_from(buf, start + length)
+        return number, timecode, flags, frameStart
+
+    def _readEncodings(self, start, end):
+        """Returns the encodings of a track's frames, in the order to undo them
+
+        Args:
+            start : (int)
+                Offset of the ContentEncodings' data.
+
+            end : (int)
+                Offset the ContentEncodings' data ends at.
+
+        Raises:
+            N/A
+
+        Returns:
+            [((int), (int), (str))]
+                The type, compression algorithm and compression settings of
+                every encoding that applies to the frames, from the last
+                applied to the first.
+
+        """
+        buf = self._buf
+        encodings = []
+        for encodingId, encodingStart, encodingEnd in children(buf, start, end):
+            if encodingId != CONTENT_ENCODING:
+                continue
+            order = 0
+            scope = SCOPE_FRAMES
+            encodingType = COMPRESSION
+            algorithm = ZLIB
+            settings = ''
+            for elementId, childStart, childEnd in children(
+                    buf, encodingStart, encodingEnd):
+                if elementId == CONTENT_ENCODING_ORDER:
+                    order = _uint(buf, childStart, childEnd)
+                elif elementId == CONTENT_ENCODING_SCOPE:
+                    scope = _uint(buf, childStart, childEnd)
+                elif elementId == CONTENT_ENCODING_TYPE:
+                    encodingType = _uint(buf, childStart, childEnd)
+                elif elementId == CONTENT_COMPRESSION:
+                    for compId, compStart, compEnd in children(
+                            buf, childStart, childEnd):
+                        if compId == CONTENT_COMP_ALGO:
+                            algorithm = _uint(buf, compStart, compEnd)
+                        elif compId == CONTENT_COMP_SETTINGS:
+                            settings = buf[compStart:compEnd]
+            if scope & SCOPE_FRAMES:
+                encodings.append((order, encodingType, algorithm, settings))
+
+        # The encoding with the highest order was applied last.
+        encodings.sort(reverse=True)
+        return [encoding[1:] for encoding in encodings]
+
+    def _readInfo(self):
+        """Returns the timecode scale and the duration in ticks, or None"""
+        if self._info is None:
+            scale = TIMECODE_SCALE_DEFAULT
+            duration = None
+            located = self._element(INFO)
+            if located:
+                for elementId, start, end in children(self._buf, *located):
+                    if elementId == TIMECODE_SCALE:
+                        scale = _uint(self._buf, start, end)
+                    elif elementId == DURATION:
+                        duration = _float(self._buf, start, end)
+            self._info = (scale, duration)
+        return self._info
+
+    def _readSeekHead(self, offset):
+        """Adds the positions a SeekHead gives, following any it points to"""
+        if offset in self._seekHeads:
+            return
+        self._seekHeads.add(offset)
+
+        buf = self._buf
+        try:
+            elementId, start, size = readElement(buf, offset, self._end)
+            seeks = [
+                (seekStart, seekEnd) for seekId, seekStart, seekEnd in
+                children(buf, start, self._dataEnd(start, size))
+                if seekId == SEEK
+            ]
+        except ValueError:
+            return
+
+        for seekStart, seekEnd in seeks:
+            targetId = None
+            position = None
+            for childId, childStart, childEnd in children(
+                    buf, seekStart, seekEnd):
+                if childId == SEEK_ID:
+                    targetId = _uint(buf, childStart, childEnd)
+                elif childId == SEEK_POSITION:
+                    position = self._start + _uint(buf, childStart, childEnd)
+            if targetId is None or position is None or \
+                    position >= self._end:
+                continue
+            self._positions.setdefault(targetId, position)
+            if targetId == SEEK_HEAD:
+                self._readSeekHead(position)
+
+    def _readTags(self):
+        """Returns the statistics tags of each track, by track UID"""
+        buf = self._buf
+        tags = {}
+
+        located = self._element(TAGS)
+        if not located:
+            return tags
+
+        for tagId, tagStart, tagEnd in children(buf, *located):
+            if tagId != TAG:
+                continue
+            uids = []
+            values = {}
+            for elementId, start, end in children(buf, tagStart, tagEnd):
+                if elementId == TARGETS:
+                    uids = [
+                        _uint(buf, uidStart, uidEnd) for uidId, uidStart,
+                        uidEnd in children(buf, start, end)
+                        if uidId == TAG_TRACK_UID
+                    ]
+                elif elementId == SIMPLE_TAG:
+                    name = value = None
+                    for childId, childStart, childEnd in children(
+                            buf, start, end):
+                        if childId == TAG_NAME:
+                            name = _string(buf, childStart, childEnd)
+                        elif childId == TAG_STRING:
+                            value = _string(buf, childStart, childEnd)
+                    if name in STATISTICS_TAGS and value is not None:
+                        values['tag_' + name.lower()] = value
+            for uid in uids:
+                tags.setdefault(uid, {}).update(values)
+
+        return tags
+
+    def _readTrack(self, start, end, tags):
+        """Returns the track type and mkvmerge's properties of a TrackEntry"""
+        buf = self._buf
+
+        fields = {
+            FLAG_ENABLED: 1, FLAG_DEFAULT: 1, FLAG_FORCED: 0, LANGUAGE: 'eng'
+        }
+        codecPrivate = None
+        encodings = []
+        video = {}
+        audio = {}
+
+        for elementId, childStart, childEnd in children(buf, start, end):
+            if elementId in [NAME, LANGUAGE, CODEC_ID]:
+                fields[elementId] = _string(buf, childStart, childEnd)
+            elif elementId == CODEC_PRIVATE:
+                codecPrivate = childEnd - childStart
+            elif elementId == CONTENT_ENCODINGS:
+                encodings = self._readEncodings(childStart, childEnd)
+            elif elementId in [VIDEO, AUDIO]:
+                settings = video if elementId == VIDEO else audio
+                for settingId, settingStart, settingEnd in children(
+                        buf, childStart, childEnd):
+                    if settingId == SAMPLING_FREQUENCY:
+                        settings[settingId] = _float(
+                            buf, settingStart, settingEnd
+                        )
+                    else:
+                        settings[settingId] = _uint(
+                            buf, settingStart, settingEnd
+                        )
+            elif elementId in UINT_FIELDS:
+                fields[elementId] = _uint(buf, childStart, childEnd)
+
+        trackDict = {
+            'codec_id': fields.get(CODEC_ID, ''),
+            'default_track': '1' if fields[FLAG_DEFAULT] else '0',
+            'enabled_track': '1' if fields[FLAG_ENABLED] else '0',
+            'forced_track': '1' if fields[FLAG_FORCED] else '0',
+            'language': fields[LANGUAGE] or 'eng',
+        }
+        for key, elementId in [('number', TRACK_NUMBER), ('uid', TRACK_UID)]:
+            if elementId in fields:
+                trackDict[key] = str(fields[elementId])
+        if fields.get(NAME):
+            trackDict['track_name'] = fields[NAME]
+        if codecPrivate is not None:
+            trackDict['codec_private_length'] = str(codecPrivate)
+
+        if PIXEL_WIDTH in video and PIXEL_HEIGHT in video:
+            pixels = (video[PIXEL_WIDTH], video[PIXEL_HEIGHT])
+            display = (
+                video.get(DISPLAY_WIDTH, pixels[0]),
+                video.get(DISPLAY_HEIGHT, pixels[1])
+            )
+            trackDict['pixel_dimensions'] = '{0}x{1}'.format(*pixels)
+            trackDict['display_dimensions'] = '{0}x{1}'.format(*display)
+        if SAMPLING_FREQUENCY in audio:
+            trackDict['audio_sampling_frequency'] = str(
+                int(audio[SAMPLING_FREQUENCY])
+            )
+        if audio:
+            trackDict['audio_channels'] = str(audio.get(CHANNELS, 1))
+
+        trackDict.update(tags.get(fields.get(TRACK_UID), {}))
+
+        if TRACK_NUMBER in fields:
+            self._encodings[fields[TRACK_NUMBER]] = encodings
+
+        return TRACK_TYPES.get(fields.get(TRACK_TYPE)), trackDict
+
+    #===========================================================================
+    # PUBLIC METHODS
+    #===========================================================================
+
+    def blocks(self, numbers, clusters=None):
+        """Walks the blocks of some of the tracks, in the order they're written
+
+        Args:
+            numbers : [int]
+                The track numbers to return the blocks of. The blocks of every
+                other track are skipped over.
+
+            clusters=None : [int]
+                The file offsets of the Clusters to read, in order, as cues()
+                gives them. Every Cluster is read if None.
+
+        Raises:
+            ValueError
+                Raised if a Cluster isn't where it's said to be, or is cut
+                short, if a block holds several frames, or if a track's frames
+                are encrypted or compressed in a way that can't be undone.
+
+        Yields:
+            (int), (int), (buffer|str)
+                The track number, timestamp in nanoseconds, and frame of each
+                block. Frames that aren't compressed are buffers onto the
+                mapped file, so they're never copied.
+
+        """
+        buf = self._buf
+        if self._encodings is None:
+            self.tracks()
+        encodings = {}
+        for number in numbers:
+            encodings[number] = self._encodings.get(number, [])
+            for encodingType, algorithm, settings in encodings[number]:
+                if encodingType != COMPRESSION or \
+                        algorithm not in [ZLIB, HEADER_STRIPPING]:
+                    raise ValueError(
+                        'Track {number} of {path} is encrypted or compressed '
+                        'with an unknown algorithm'.format(
+                            number=number, path=self.path
+                        )
+                    )
+        scale = self._readInfo()[0]
+        if clusters is None:
+            clusters = self.clusters()
+
+        for offset in clusters:
+            elementId, start, size = readElement(buf, offset, self._end)
+            if elementId != CLUSTER or size is None:
+                raise ValueError(
+                    'No Cluster of known size at offset {0}'.format(offset)
+                )
+            timecode = 0
+            for childId, childStart, childEnd in children(
+                    buf, start, self._dataEnd(start, size)):
+                if childId == CLUSTER_TIMECODE:
+                    timecode = _uint(buf, childStart, childEnd)
+                    continue
+                elif childId == BLOCK_GROUP:
+                    for groupId, groupStart, groupEnd in children(
+                            buf, childStart, childEnd):
+                        if groupId == BLOCK:
+                            childStart, childEnd = groupStart, groupEnd
+                            break
+                    else:
+                        continue
+                elif childId != SIMPLE_BLOCK:
+                    continue
+
+                number, relative, flags, frameStart = self._readBlock(
+                    childStart, childEnd
+                )
+                if number not in encodings:
+                    continue
+                if flags & LACING:
+                    raise ValueError(
+                        'Laced block at offset {0}'.format(childStart)
+                    )
+                frame = buffer(buf, frameStart, childEnd - frameStart)
+                for encodingType, algorithm, settings in encodings[number]:
+                    frame = _decode(frame, algorithm, settings)
+                yield number, (timecode + relative) * scale, frame
+
+    def chapters(self):
+        """Returns the start of every chapter in seconds, in order
+
+        Every edition's chapters are listed together, as mkvextract's simple
+        chapter format lists them. Chapters nested in other chapters aren't.
+
+        """
+        buf = self._buf
+        located = self._element(CHAPTERS)
+        if not located:
+            return []
+
+        starts = set()
+        for editionId, editionStart, editionEnd in children(buf, *located):
+            if editionId != EDITION_ENTRY:
+                continue
+            for atomId, atomStart, atomEnd in children(
+                    buf, editionStart, editionEnd):
+                if atomId != CHAPTER_ATOM:
+                    continue
+                for elementId, start, end in children(buf, atomStart, atomEnd):
+                    if elementId == CHAPTER_TIME_START:
+                        starts.add(_uint(buf, start, end) / 1000000000.0)
+
+        return sorted(starts)
+
+    def close(self):
+        """Unmaps the file"""
+        self._buf.close()
+
+    def clusters(self):
+        """Yields the file offset of every Cluster, in order
+
+        The Clusters are walked from the first, a header at a time, until the
+        end of the Segment, or of the file if it's still being written.
+
+        """
+        buf = self._buf
+        offset = self._firstCluster
+        while offset is not None and offset < self._end:
+            try:
+                elementId, start, size = readElement(buf, offset, self._end)
+            except ValueError:
+                break
+            if elementId == CLUSTER:
+                yield offset
+            if size is None:
+                break
+            offset = start + size
+
+    def cues(self):
+        """Returns the Cues, the index of where each track's blocks are
+
+        Args:
+            N/A
+
+        Raises:
+            ValueError
+                Raised if the Cues are cut short.
+
+        Returns:
+            [(float, int, int)]
+                The time in seconds, track number, and file offset of the
+                Cluster holding the track's block at that time, for every cue,
+                in the order they're written. Empty if the file has no Cues.
+
+        """
+        buf = self._buf
+        located = self._element(CUES)
+        if not located:
+            return []
+
+        scale = self._readInfo()[0] / 1000000000.0
+        cues = []
+        for pointId, pointStart, pointEnd in children(buf, *located):
+            if pointId != CUE_POINT:
+                continue
+            time = None
+            positions = []
+            for elementId, start, end in children(buf, pointStart, pointEnd):
+                if elementId == CUE_TIME:
+                    time = _uint(buf, start, end) * scale
+                elif elementId == CUE_TRACK_POSITIONS:
+                    track = cluster = None
+                    for childId, childStart, childEnd in children(
+                            buf, start, end):
+                        if childId == CUE_TRACK:
+                            track = _uint(buf, childStart, childEnd)
+                        elif childId == CUE_CLUSTER_POSITION:
+                            cluster = self._start + _uint(
+                                buf, childStart, childEnd
+                            )
+                    if track is not None and cluster is not None:
+                        positions.append((track, cluster))
+            if time is not None:
+                cues.extend(
+                    [(time, track, cluster) for track, cluster in positions]
+                )
+
+        return cues
+
+    def duration(self):
+        """Returns the duration in nanoseconds, or None if it isn't given"""
+        scale, duration = self._readInfo()
+        if duration is None:
+            return None
+        return int(round(duration * scale))
+
+    def tracks(self):
+        """Returns every track, as mkvmerge's identification is parsed
+
+        Args:
+            N/A
+
+        Raises:
+            ValueError
+                Raised if the Tracks are cut short.
+
+        Returns:
+            [((int), (str), (dict))]
+                The (trackID, trackType, trackDict) of every video, audio and
+                subtitle track, as <tools._jsonTrackInfo> returns them. Track
+                IDs count every track in the file from 0, as mkvmerge's do.
+
+        """
+        located = self._element(TRACKS)
+        if not located:
+            return []
+
+        tags = self._readTags()
+        self._encodings = {}
+
+        tracks = []
+        entries = [
+            (start, end) for elementId, start, end in
+            children(self._buf, *located) if elementId == TRACK_ENTRY
+        ]
+        for trackID, (start, end) in enumerate(entries):
+            trackType, trackDict = self._readTrack(start, end, tags)
+            if trackType:
+                tracks.append((trackID, trackType, trackDict))
+
+        return tracks
+
+#===============================================================================
+# PRIVATE FUNCTIONS
+#===============================================================================
+
+def _complete(tracks, numbers, counts):
+    """True if each track had as many blocks as its statistics tags give"""
+    for number, (trackID, dest) in numbers.items():
+        frames = tracks[trackID].get('tag_number_of_frames')
+        if frames is not None and int(frames) != counts[number]:
+            return False
+    return True
+
+def _decode(frame, algorithm, settings):
+    """Undoes the compression of a frame"""
+    if algorithm == HEADER_STRIPPING:
+        return settings + frame[:]
+    try:
+        return zlib.decompress(frame)
+    except zlib.error as err:
+        raise ValueError('Bad compressed frame: {0}'.format(err))
+
+def _float(buf, start, end):
+    """Reads a float element's data"""
+    if start == end:
+        return 0.0
+    try:
+        return FLOATS[end - start].unpack_from(buf, start)[0]
+    except KeyError:
+        raise ValueError(
+            'A {size} byte float at offset {offset}'.format(
+                size=end - start, offset=start
+            )
+        )
+
+def _string(buf, start, end):
+    """Reads a string element's data, up to any padding"""
+    return buf[start:end].split('\x00', 1)[0]
+
+def _uint(buf, start, end):
+    """Reads an unsigned integer element's data"""
+    if start == end:
+        return 0
+    return int(hexlify(buf[start:end]), 16)
+
+def _writeSups(mkv, numbers, clusters):
+    """Writes the blocks of some tracks to sups, removing them on failure
+
+    Args:
+        mkv : (<MatroskaFile>)
+            The file to read.
+
+        numbers : {int: ((int), (str))}
+            The trackID and sup to write, by track number.
+
+        clusters : [int]|None
+            The Clusters to read, as <MatroskaFile.blocks> takes them.
+
+    Raises:
+        IOError
+            Raised if a sup can't be written.
+
+        ValueError
+            Raised if the blocks can't be read.
+
+    Returns:
+        {int: int}
+            The number of blocks written, by track number.
+
+    """
+    sups = {}
+    counts = dict.fromkeys(numbers, 0)
+    try:
+        try:
+            for number, (trackID, dest) in numbers.items():
+                sups[number] = open(dest, 'wb')
+            for number, timestamp, frame in mkv.blocks(numbers, clusters):
+                write = sups[number].write
+                header = SUP_HEADER.pack(
+                    'PG', timestamp * 9 // 100000 & 0xFFFFFFFF, 0
+                )
+                # A block holds a whole display set, a segment at a time.
+                size = len(frame)
+                offset = 0
+                while offset + 3 <= size:
+                    segment = min(
+                        SEGMENT_SIZE.unpack_from(frame, offset + 1)[0] + 3,
+                        size - offset
+                    )
+                    write(header)
+                    write(buffer(frame, offset, segment))
+                    offset += segment
+                counts[number] += 1
+        finally:
+            for sup in sups.values():
+                sup.close()
+    except (EnvironmentError, ValueError):
+        for trackID, dest in numbers.values():
+            if os.path.exists(dest):
+                os.remove(dest)
+        raise
+
+    return counts
+
+#===============================================================================
+# FUNCTIONS
+#===============================================================================
+
+def chapters(path):
+    """Returns the chapter start times of a Matroska file
+
+    Args:
+        path : (str)
+            The file to read.
+
+    Raises:
+        IOError
+            Raised if the file can't be read.
+
+        ValueError
+            Raised if the file isn't Matroska.
+
+    Returns:
+        [float]
+            The start of each chapter in seconds, in order, as
+            <MatroskaFile.chapters> returns them.
+
+    """
+    with MatroskaFile(path) as mkv:
+        return mkv.chapters()
+
+#===============================================================================
+
+def children(buf, start, end):
+    """Walks the child elements of a master element
+
+    Args:
+        buf : (str|<mmap>)
+            Buffer holding the file.
+
+        start : (int)
+            Offset of the master element's data.
+
+        end : (int)
+            Offset the master element's data ends at.
+
+    Raises:
+        ValueError
+            Raised if a child runs past the end of its master element.
+
+    Yields:
+        (int), (int), (int)
+            The ID, data offset and data end of every child. A child of
+            unknown size runs to the end of the master element.
+
+    """
+    offset = start
+    while offset < end:
+        elementId, childStart, size = readElement(buf, offset, end)
+        if size is None:
+            childEnd = end
+        else:
+            childEnd = childStart + size
+            if childEnd > end:
+                raise ValueError(
+                    'Truncated element at offset {0}'.format(offset)
+                )
+        yield elementId, childStart, childEnd
+        offset = childEnd
+
+#===============================================================================
+
+def extractSubtitles(path, extractions):
+    """Extracts PGS subtitle tracks to sup files, in one pass over the Clusters
+
+    Args:
+        path : (str)
+            The file to read.
+
+        extractions : [((int), (str))]
+            The trackID, as <MatroskaFile.tracks> gives it, and the sup to
+            write, of each track to extract.
+
+    Raises:
+        IOError
+            Raised if the file can't be read, or a sup can't be written.
+
+        ValueError
+            Raised if the file isn't Matroska, a track isn't PGS, or its
+            blocks can't be read. Any sups written are removed.
+
+    Returns:
+        {int: int}
+            The number of blocks written, by trackID.
+
+    Only the Clusters the Cues give for the tracks are read, if every track
+    has cues. If a track then has fewer blocks than its statistics tags say it
+    should, not every block was cued, and every Cluster is read instead.
+
+    """
+    with MatroskaFile(path) as mkv:
+        tracks = dict(
+            [(trackID, trackDict) for trackID, trackType, trackDict in
+             mkv.tracks()]
+        )
+        numbers = {}
+        for trackID, dest in extractions:
+            trackDict = tracks.get(trackID, {})
+            if trackDict.get('codec_id') != PGS_CODEC or \
+                    'number' not in trackDict:
+                raise ValueError(
+                    'Track {trackID} of {path} is not PGS subtitles'.format(
+                        trackID=trackID, path=path
+                    )
+                )
+            numbers[int(trackDict['number'])] = (trackID, dest)
+
+        cued = {}
+        for time, number, cluster in mkv.cues():
+            if number in numbers:
+                cued.setdefault(number, set()).add(cluster)
+
+        counts = None
+        if numbers and len(cued) == len(numbers):
+            clusters = sorted(set.union(*cued.values()))
+            try:
+                counts = _writeSups(mkv, numbers, clusters)
+            except ValueError:
+                # Cues left stale by an edit can point anywhere.
+                counts = None
+            if counts is not None and not _complete(tracks, numbers, counts):
+                counts = None
+        if counts is None:
+            counts = _writeSups(mkv, numbers, None)
+
+    return dict(
+        [(numbers[number][0], count) for number, count in counts.items()]
+    )
+
+#===============================================================================
+
+def probe(path):
+    """Returns the duration and tracks of a Matroska file
+
+    Args:
+        path : (str)
+            The file to read.
+
+    Raises:
+        IOError
+            Raised if the file can't be read.
+
+        ValueError
+            Raised if the file isn't Matroska, or its headers are cut short.
+
+    Returns:
+        (int|None), [((int), (str), (dict))]
+            The duration in nanoseconds, if the file gives it, and the
+            (trackID, trackType, trackDict) of every track, as
+            <tools._mkvProbe> returns them.
+
+    """
+    with MatroskaFile(path) as mkv:
+        return mkv.duration(), mkv.tracks()
+
+#===============================================================================
+
+def readElement(buf, offset, end):
+    """Reads the ID and size of the element at an offset
+
+    Args:
+        buf : (str|<mmap>)
+            Buffer holding the file.
+
+        offset : (int)
+            Offset of the element's ID.
+
+        end : (int)
+            Offset the element's header must end before.
+
+    Raises:
+        ValueError
+            Raised if there's no valid element header at the offset.
+
+    Returns:
+        (int), (int), (int|None)
+            The element's ID, the offset of its data, and the size of its
+            data, or None if the size is unknown.
+
+    """
+    # IDs are at most 4 bytes, and sizes 8, so the header is read in one go.
+    header = buf[offset:min(offset + 12, end)]
+    if not header:
+        raise ValueError('Truncated element at offset {0}'.format(offset))
+
+    first = ord(header[0])
+    idLength = VINT_LENGTHS[first]
+    if not idLength or idLength > 4 or idLength >= len(header):
+        raise ValueError('Bad element ID at offset {0}'.format(offset))
+    if idLength == 1:
+        elementId = first
+    else:
+        # Hex is the quickest way from bytes to a long in Python 2.
+        elementId = int(hexlify(header[:idLength]), 16)
+
+    first = ord(header[idLength])
+    sizeLength = VINT_LENGTHS[first]
+    headerLength = idLength + sizeLength
+    if not sizeLength or headerLength > len(header):
+        raise ValueError('Bad element size at offset {0}'.format(offset))
+    if sizeLength == 1:
+        size = first & 0x7F
+    else:
+        size = int(hexlify(header[idLength:headerLength]), 16) & \
+            VINT_MASKS[sizeLength]
+    if size == VINT_MASKS[sizeLength]:
+        size = None
+
+    return elementId, offset + headerLength, size
@@ -0,0 +1,546 @@
+#/usr/bin/python
+# Ripmaster.tools.metrics
+# Measures Ripmaster's stages and tools, for Prometheus to collect
+
+"""
+
+Description
+-----------
+
+Every stage of a movie, and every run of an external tool, is measured: how
+long it took, the bytes of the files it read and wrote, and whether it failed.
+The measurements are kept as counters, which Prometheus turns into rates, and
+shares of the total. If mkvextract takes 40% of a disc's wall time, its
+ripmaster_tool_seconds_total grows at 40% of the rate of every tool's put
+together.
+
+The bytes counted are the sizes of the files a tool is given to read, and of
+the files it has written once it's done. A tool working on a network share
+shows up as few bytes per second.
+
+Tools run through tools.runner count the CPU time they used too, which shows
+whether a slow tool was working or waiting.
+
+Tools run while a stage is running count their bytes towards the stage too.
+The stage is tracked per thread, so work a stage hands to a thread pool needs
+to be wrapped with carry().
+
+The counters can be written to a file in the Prometheus text format, for the
+node_exporter textfile collector to pick up, or served over HTTP.
+
+Classes
+-------
+
+Registry
+    Holds counters and gauges, and renders them in the Prometheus text format.
+
+Functions
+---------
+
+carry()
+    Wraps a function so it runs as part of the calling thread's stage.
+
+collect()
+    Registers a function that returns gauges, read each time metrics are
+    rendered.
+
+cpu()
+    Adds CPU time to the tool being measured on the calling thread.
+
+inc()
+    Adds to a counter.
+
+render()
+    Renders every metric in the Prometheus text format.
+
+serve()
+    Serves the metrics over HTTP from a background thread.
+
+stage()
+    Decorates a stage method, measuring every call.
+
+tool()
+    Measures a run of an external tool.
+
+writeTextfile()
+    Writes the metrics to a file, for the node_exporter textfile collector.
+
+"""
+
+#===============================================================================
+# IMPORTS
+#===============================================================================
+
+# Standard Imports
+import BaseHTTPServer
+from functools import wraps
+import os
+import threading
+import time
+
+#===============================================================================
+# GLOBALS
+#===============================================================================
+
+# Name: (type, help)
+METRICS = {
+    'ripmaster_encode_cache_hits_total': (
+        'counter', 'Encodes reused from the encode cache instead of run.'
+    ),
+    'ripmaster_encode_fps': (
+        'gauge', 'Frames a second of every running encode together.'
+    ),
+    'ripmaster_encode_frames_total': (
+        'counter', 'Frames encoded in encode slots.'
+    ),
+    'ripmaster_encode_slots_busy': (
+        'gauge', 'Encode slots running an encode.'
+    ),
+    'ripmaster_movies_completed_total': (
+        'counter', 'Movies merged into their final mkv.'
+    ),
+    'ripmaster_queue_depth': (
+        'gauge', 'Stages waiting to run, by stage.'
+    ),
+    'ripmaster_stages_running': (
+        'gauge', 'Stages running, by stage.'
+    ),
+    'ripmaster_tool_cpu_seconds_total': (
+        'counter', 'User and system CPU time each tool used.'
+    ),
+}
+for kind in ['stage', 'tool']:
+    METRICS.update({
+        'ripmaster_{0}_seconds_total'.format(kind): (
+            'counter', 'Wall time spent in each {0}.'.format(kind)
+        ),
+        'ripmaster_{0}_runs_total'.format(kind): (
+            'counter', 'Runs of each {0}, failed or not.'.format(kind)
+        ),
+        'ripmaster_{0}_failures_total'.format(kind): (
+            'counter', 'Runs of each {0} that failed.'.format(kind)
+        ),
+        'ripmaster_{0}_read_bytes_total'.format(kind): (
+            'counter', 'Bytes of the files each {0} read.'.format(kind)
+        ),
+        'ripmaster_{0}_written_bytes_total'.format(kind): (
+            'counter', 'Bytes of the files each {0} wrote.'.format(kind)
+        ),
+    })
+del kind
+
+HOST_DEFAULT = '127.0.0.1'
+
+# The stage, and tool measurement, each thread is running
+_LOCAL = threading.local()
+
+#===============================================================================
+# PRIVATE FUNCTIONS
+#===============================================================================
+
+def _escape(value):
+    """Escapes a label value for the Prometheus text format"""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace(
+        '\n', '\\n'
+    )
+
+#===============================================================================
+
+def _size(paths):
+    """Returns the total size of the files that exist"""
+    total = 0
+    for path in paths or []:
+        try:
+            total += os.path.getsize(path)
+        except (OSError, TypeError):
+            continue
+    return total
+
+#===============================================================================
+# CLASSES
+#===============================================================================
+
+class Registry(object):
+    """Holds counters and gauges, and renders them for Prometheus
+
+    Args:
+        N/A
+
+    Raises:
+        N/A
+
+    Counters are updated from any thread, through a lock.
+
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        # Name: {((label, value), ...): value}
+        self._values = {}
+        self._collectors = []
+
+    #===========================================================================
+    # PUBLIC METHODS
+    #===========================================================================
+
+    def collect(self, func):
+        """Registers a function returning gauges, read on every render
+
+        Args:
+            func : (callable)
+                Called with no arguments. Returns a list of (name, labels,
+                value), with labels a dictionary.
+
+        Raises:
+            N/A
+
+        Returns:
+            None
+
+        """
+        with self._lock:
+            self._collectors.append(func)
+
+    def inc(self, name, value=1, **labels):
+        """Adds to a counter"""
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            values = self._values.setdefault(name, {})
+            values[key] = values.get(key, 0) + value
+
+    def render(self):
+        """Renders every metric in the Prometheus text format
+
+        Args:
+            N/A
+
+        Raises:
+            N/A
+
+        Returns:
+            (str)
+                The metrics, a HELP and TYPE line before each.
+
+        A collector that raises is skipped, so one bad collector doesn't stop
+        the rest being exported.
+
+        """
+        with self._lock:
+            values = dict(
+                [(name, dict(samples)) for name, samples in
+                 self._values.items()]
+            )
+            collectors = list(self._collectors)
+
+        for func in collectors:
+            try:
+                gauges = func()
+            except Exception:
+                continue
+            for name, labels, value in gauges:
+                samples = values.setdefault(name, {})
+                key = tuple(sorted(labels.items()))
+                samples[key] = samples.get(key, 0) + value
+
+        lines = []
+        for name in sorted(values):
+            type, help = METRICS.get(name, ('untyped', name))
+            lines.append('# HELP {name} {help}'.format(name=name, help=help))
+            lines.append('# TYPE {name} {type}'.format(name=name, type=type))
+            for key in sorted(values[name]):
+                labels = ','.join(
+                    ['{0}="{1}"'.format(label, _escape(value))
+                     for label, value in key]
+                )
+                lines.append('{name}{labels} {value}'.format(
+                    name=name,
+                    labels='{' + labels + '}' if labels else '',
+                    value=repr(float(values[name][key]))
+                ))
+
+        return '\n'.join(lines) + '\n'
+
+#===============================================================================
+
+class _Measurement(object):
+    """Measures one run of a stage or tool, as a context manager"""
+    def __init__(self, registry, kind, name, reads=None, writes=None):
+        self.registry = registry
+        self.kind = kind
+        self.name = name
+        self.reads = reads
+        self.writes = writes
+
+        self.failed = False
+        self.cpuSeconds = 0.0
+        self.readBytes = 0
+        self.writtenBytes = 0
+
+    def __enter__(self):
+        self.started = time.time()
+        self.readBytes = _size(self.reads)
+        if self.kind == 'stage':
+            self.outer = getattr(_LOCAL, 'stage', None)
+            _LOCAL.stage = self.name
+        else:
+            self.outer = getattr(_LOCAL, 'tool', None)
+            _LOCAL.tool = self
+        return self
+
+    def __exit__(self, type, value, traceback):
+        elapsed = time.time() - self.started
+        self.writtenBytes += _size(self.writes)
+
+        labels = {self.kind: self.name}
+        prefix = 'ripmaster_' + self.kind
+        self.registry.inc(prefix + '_seconds_total', elapsed, **labels)
+        self.registry.inc(prefix + '_runs_total', **labels)
+        if self.failed or type is not None:
+            self.registry.inc(prefix + '_failures_total', **labels)
+
+        if self.kind == 'stage':
+            _LOCAL.stage = self.outer
+            # Bytes were counted as the stage's tools ran.
+            return False
+
+        _LOCAL.tool = self.outer
+        if self.cpuSeconds:
+            self.registry.inc(
+                prefix + '_cpu_seconds_total', self.cpuSeconds, **labels
+            )
+
+        self.registry.inc(
+            prefix + '_read_bytes_total', self.readBytes, **labels
+        )
+        self.registry.inc(
+            prefix + '_written_bytes_total', self.writtenBytes, **labels
+        )
+        stage = getattr(_LOCAL, 'stage', None)
+        if stage:
+            self.registry.inc(
+                'ripmaster_stage_read_bytes_total', self.readBytes, stage=stage
+            )
+            self.registry.inc(
+                'ripmaster_stage_written_bytes_total', self.writtenBytes,
+                stage=stage
+            )
+
+        return False
+
+    def fail(self):
+        """Counts the run as failed, without raising"""
+        self.failed = True
+
+# Everything Ripmaster measures is counted here.
+REGISTRY = Registry()
+
+#===============================================================================
+# FUNCTIONS
+#===============================================================================
+
+def carry(func):
+    """Wraps a function so it runs as part of the calling thread's stage
+
+    Args:
+        func : (callable)
+            The function to run on another thread, like in a thread pool.
+
+    Raises:
+        N/A
+
+    Returns:
+        (callable)
+            The wrapped function.
+
+    """
+    stage = getattr(_LOCAL, 'stage', None)
+
+    @wraps(func)
+    def carried(*args, **kwargs):
+        outer = getattr(_LOCAL, 'stage', None)
+        _LOCAL.stage = stage
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _LOCAL.stage = outer
+
+    return carried
+
+#===============================================================================
+
+def collect(func):
+    """Registers a function that returns gauges, on the default registry"""
+    REGISTRY.collect(func)
+
+#===============================================================================
+
+def cpu(seconds):
+    """Adds CPU time to the tool being measured on the calling thread
+
+    Args:
+        seconds : (float)|None
+            User and system CPU seconds a run of the tool used. None, for a
+            run whose CPU time isn't known, is ignored.
+
+    Raises:
+        N/A
+
+    Returns:
+        None
+
+    """
+    measurement = getattr(_LOCAL, 'tool', None)
+    if measurement and seconds:
+        measurement.cpuSeconds += seconds
+
+#===============================================================================
+
+def inc(name, value=1, **labels):
+    """Adds to a counter on the default registry"""
+    REGISTRY.inc(name, value, **labels)
+
+#===============================================================================
+
+def render():
+    """Renders the default registry in the Prometheus text format"""
+    return REGISTRY.render()
+
+#===============================================================================
+
+def serve(port, host=HOST_DEFAULT, registry=None):
+    """Serves the metrics over HTTP from a background thread
+
+    Args:
+        port : (int)
+            The port to listen on. 0 picks a free port.
+
+        host=HOST_DEFAULT : (str)
+            The address to listen on. Only this machine, by default.
+
+        registry=None : (<Registry>)
+            The metrics to serve. Defaults to the default registry.
+
+    Raises:
+        socket.error
+            Raised if the port can't be listened on.
+
+    Returns:
+        (<BaseHTTPServer.HTTPServer>)
+            The server. Its server_address has the port, and shutdown() stops
+            it.
+
+    """
+    registry = registry if registry else REGISTRY
+
+    class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+        """Answers every GET with the metrics"""
+        def do_GET(self):
+            body = registry.render()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = BaseHTTPServer.HTTPServer((host, port), Handler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+
+    return server
+
+#===============================================================================
+
+def stage(name, registry=None):
+    """Decorates a stage method, measuring every call
+
+    Args:
+        name : (str)
+            The stage's label.
+
+        registry=None : (<Registry>)
+            Where to count. Defaults to the default registry.
+
+    Raises:
+        N/A
+
+    Returns:
+        (callable)
+            The decorator.
+
+    A call that raises is counted as failed.
+
+    """
+    def decorator(func):
+        @wraps(func)
+        def measured(*args, **kwargs):
+            with _Measurement(registry or REGISTRY, 'stage', name):
+                return func(*args, **kwargs)
+        return measured
+    return decorator
+
+#===============================================================================
+
+def tool(name, reads=None, writes=None, registry=None):
+    """Measures a run of an external tool, as a context manager
+
+    Args:
+        name : (str)
+            The tool's label.
+
+        reads=None : [str]
+            The files the tool reads. Sized before it runs.
+
+        writes=None : [str]
+            The files the tool writes. Sized once it's done.
+
+        registry=None : (<Registry>)
+            Where to count. Defaults to the default registry.
+
+    Raises:
+        N/A
+
+    Returns:
+        (<_Measurement>)
+            Use in a with statement. Call its fail() if the tool fails without
+            raising.
+
+    """
+    return _Measurement(registry or REGISTRY, 'tool', name, reads, writes)
+
+#===============================================================================
+
+def writeTextfile(path, registry=None):
+    """Writes the metrics to a file, for the node_exporter textfile collector
+
+    Args:
+        path : (str)
+            The file to write. node_exporter only reads files ending in .prom.
+
+        registry=None : (<Registry>)
+            The metrics to write. Defaults to the default registry.
+
+    Raises:
+        IOError
+            Raised if the file can't be written.
+
+    Returns:
+        None
+
+    The metrics are written to a temporary file that's renamed over the old
+    one, so node_exporter never reads a file that's half written.
+
+    """
+    registry = registry if registry else REGISTRY
+    temp = '{path}.{pid}.tmp'.format(path=path, pid=os.getpid())
+    with open(temp, 'w') as f:
+        f.write(registry.render())
+    try:
+        os.rename(temp, path)
+    except OSError:
+        # Windows won't rename over an existing file.
+        if os.path.exists(path):
+            os.remove(path)
+        os.rename(temp, path)
@@ -0,0 +1,416 @@
+#/usr/bin/python
+# Ripmaster.tools.pgs
+# Reads Bluray PGS (.sup) subtitle streams without BDSup2Sub
+
+"""
+
+Description
+-----------
+
+A PGS subtitle stream, as written by mkvextract, is a flat list of segments.
+Every segment starts with a 13 byte header:
+
+    'PG' magic (2) | PTS (4) | DTS (4) | segment type (1) | payload size (2)
+
+The Presentation Composition Segment (PCS) of each display set lists the
+objects shown on screen, and each of those composition objects carries a
+'forced' flag. That's all Ripmaster needs to know whether a track is forced,
+or entirely forced, so this module walks the segment headers of a memory
+mapped sup and reads only the PCS payloads, skipping over the bitmaps.
+
+Classes
+-------
+
+Composition
+    The parsed contents of a single Presentation Composition Segment.
+
+SupInfo
+    Caption counts for a whole sup file, with the same forced and forcedOnly
+    meaning as <SubtitleTrack>.
+
+Functions
+---------
+
+readComposition()
+    Parses the PCS payload at a given offset into a <Composition>.
+
+readObject()
+    Parses an ODS payload, returning the object's size and bitmap data.
+
+readPalette()
+    Parses a PDS payload, returning the palette's YCrCb and alpha entries.
+
+segments()
+    Walks the segment headers of a buffer holding a PGS stream.
+
+supInfo()
+    Counts total and forced captions in a sup file.
+
+"""
+
+#===============================================================================
+# IMPORTS
+#===============================================================================
+
+# Standard Imports
+import mmap
+import struct
+
+#===============================================================================
+# GLOBALS
+#===============================================================================
+
+MAGIC = 'PG'
+
+# Segment Types
+PDS = 0x14  # Palette Definition Segment
+ODS = 0x15  # Object Definition Segment
+PCS = 0x16  # Presentation Composition Segment
+WDS = 0x17  # Window Definition Segment
+END = 0x80  # End of Display Set Segment
+
+# Composition States
+NORMAL = 0x00
+ACQUISITION_POINT = 0x40
+EPOCH_START = 0x80
+
+# Composition Object Flags
+OBJECT_CROPPED = 0x80
+OBJECT_FORCED = 0x40
+
+# Object Sequence Flags
+FIRST_IN_SEQUENCE = 0x80
+LAST_IN_SEQUENCE = 0x40
+
+HEADER = struct.Struct('>2sIIBH')
+ODS_HEADER = struct.Struct('>HBB')
+PCS_HEADER = struct.Struct('>HHBHBBBB')
+PCS_OBJECT = struct.Struct('>HBBHH')
+PDS_ENTRY = struct.Struct('>BBBBB')
+
+#===============================================================================
+# CLASSES
+#===============================================================================
+
+class Composition(object):
+    """A single Presentation Composition Segment
+
+    Args:
+        pts : (int)
+            Presentation timestamp of the display set, in 90kHz ticks.
+
+        width : (int)
+            Width of the video the subtitles are composed onto.
+
+        height : (int)
+            Height of the video the subtitles are composed onto.
+
+        number : (int)
+            The composition number, incremented for every display set.
+
+        state : (int)
+            One of NORMAL, ACQUISITION_POINT or EPOCH_START.
+
+        paletteUpdate : (bool)
+            True if this display set only changes the palette of the objects
+            already on screen.
+
+        paletteID : (int)
+            The palette the objects are drawn with.
+
+        objects : [(int, int, bool, int, int, (int, int, int, int)|None)]
+            The objects shown on screen, each an (objectID, windowID, forced,
+            x, y, crop) tuple. Crop is an (x, y, width, height) tuple if the
+            object is cropped.
+
+    """
+    def __init__(self, pts, width, height, number, state, paletteUpdate,
+                 paletteID, objects):
+        self.pts = pts
+        self.width = width
+        self.height = height
+        self.number = number
+        self.state = state
+        self.paletteUpdate = paletteUpdate
+        self.paletteID = paletteID
+        self.objects = objects
+
+    @property
+    def forced(self):
+        """True if any object shown by this composition is forced"""
+        return any([obj[2] for obj in self.objects])
+
+    @property
+    def layout(self):
+        """The objects and their placement, ignoring the forced flags"""
+        return tuple([(obj[0], obj[1], obj[3], obj[4]) for obj in self.objects])
+
+class SupInfo(object):
+    """Caption counts for a PGS subtitle stream
+
+    Args:
+        totalCount : (int)
+            Number of captions in the stream.
+
+        forcedCount : (int)
+            Number of those captions that are forced.
+
+    """
+    def __init__(self, totalCount, forcedCount):
+        self.totalCount = totalCount
+        self.forcedCount = forcedCount
+
+    def __repr__(self):
+        return '<SupInfo {forced} of {total} forced>'.format(
+            forced=self.forcedCount,
+            total=self.totalCount
+        )
+
+    @property
+    def forced(self):
+        """True if the stream contains any forced captions"""
+        return self.forcedCount > 0
+
+    @property
+    def forcedOnly(self):
+        """True if the stream contains nothing but forced captions"""
+        return self.forced and self.forcedCount == self.totalCount
+
+#===============================================================================
+# FUNCTIONS
+#===============================================================================
+
+def readComposition(buf, offset, pts=0):
+    """Parses a PCS payload
+
+    Args:
+        buf : (str|<mmap>)
+            Buffer holding the PGS stream.
+
+        offset : (int)
+            Offset of the start of the PCS payload, just after the header.
+
+        pts=0 : (int)
+            The presentation timestamp from the segment header.
+
+    Raises:
+        ValueError
+            Raised if the payload runs past the end of the buffer.
+
+    Returns:
+        <Composition>
+
+    """
+    try:
+        width, height, frameRate, number, state, paletteUpdate, paletteID, \
+            count = PCS_HEADER.unpack_from(buf, offset)
+    except struct.error:
+        raise ValueError('Truncated PCS at offset {0}'.format(offset))
+
+    offset += PCS_HEADER.size
+
+    objects = []
+    for i in xrange(count):
+        try:
+            objectID, windowID, flags, x, y = PCS_OBJECT.unpack_from(
+                buf, offset
+            )
+        except struct.error:
+            raise ValueError('Truncated PCS at offset {0}'.format(offset))
+        offset += PCS_OBJECT.size
+
+        crop = None
+        if flags & OBJECT_CROPPED:
+            try:
+                crop = struct.unpack_from('>HHHH', buf, offset)
+            except struct.error:
+                raise ValueError('Truncated PCS at offset {0}'.format(offset))
+            offset += 8
+
+        objects.append(
+            (objectID, windowID, bool(flags & OBJECT_FORCED), x, y, crop)
+        )
+
+    return Composition(
+        pts, width, height, number, state, bool(paletteUpdate & 0x80),
+        paletteID, objects
+    )
+
+def readObject(buf, offset, size):
+    """Parses an ODS payload
+
+    Args:
+        buf : (str|<mmap>)
+            Buffer holding the PGS stream.
+
+        offset : (int)
+            Offset of the start of the ODS payload, just after the header.
+
+        size : (int)
+            Size of the ODS payload.
+
+    Raises:
+        ValueError
+            Raised if the payload is too short.
+
+    Returns:
+        (int), (int), (int), (int|None), (int|None), (str)
+            The object ID, object version, sequence flags, width, height and
+            run length encoded data. Large objects are split over several
+            ODSs, and only the first in the sequence carries the size. The
+            width and height are None for the rest.
+
+    """
+    try:
+        objectID, version, sequence = ODS_HEADER.unpack_from(buf, offset)
+    except struct.error:
+        raise ValueError('Truncated ODS at offset {0}'.format(offset))
+
+    offset += ODS_HEADER.size
+    size -= ODS_HEADER.size
+
+    width = height = None
+    if sequence & FIRST_IN_SEQUENCE:
+        if size < 7:
+            raise ValueError('Truncated ODS at offset {0}'.format(offset))
+        # The first 3 bytes are the length of the object data. We don't need
+        # it, since we read the data of each fragment by its segment size.
+        width, height = struct.unpack_from('>HH', buf, offset + 3)
+        offset += 7
+        size -= 7
+
+    return objectID, version, sequence, width, height, buf[offset:offset + size]
+
+def readPalette(buf, offset, size):
+    """Parses a PDS payload
+
+    Args:
+        buf : (str|<mmap>)
+            Buffer holding the PGS stream.
+
+        offset : (int)
+            Offset of the start of the PDS payload, just after the header.
+
+        size : (int)
+            Size of the PDS payload.
+
+    Raises:
+        ValueError
+            Raised if the payload is too short.
+
+    Returns:
+        (int), (int), {int: (int, int, int, int)}
+            The palette ID, palette version, and a dictionary of the entries
+            defined, each a (Y, Cr, Cb, alpha) tuple keyed by palette index.
+
+    """
+    try:
+        paletteID, version = struct.unpack_from('>BB', buf, offset)
+    except struct.error:
+        raise ValueError('Truncated PDS at offset {0}'.format(offset))
+
+    entries = {}
+    for pos in xrange(offset + 2, offset + size - 4, PDS_ENTRY.size):
+        index, y, cr, cb, alpha = PDS_ENTRY.unpack_from(buf, pos)
+        entries[index] = (y, cr, cb, alpha)
+
+    return paletteID, version, entries
+
+def segments(buf):
+    """Walks the segments of a PGS stream
+
+    Args:
+        buf : (str|<mmap>)
+            Buffer holding the PGS stream.
+
+    Raises:
+        ValueError
+            Raised if a segment doesn't start with the PG magic, or runs past
+            the end of the buffer.
+
+    Yields:
+        (int), (int), (int), (int), (int)
+            The segment type, presentation timestamp, decoding timestamp,
+            payload offset and payload size of every segment.
+
+    """
+    offset = 0
+    end = len(buf)
+    unpack = HEADER.unpack_from
+    headerSize = HEADER.size
+
+    while offset < end:
+        try:
+            magic, pts, dts, segType, size = unpack(buf, offset)
+        except struct.error:
+            raise ValueError('Truncated segment at offset {0}'.format(offset))
+        if magic != MAGIC:
+            raise ValueError('No PGS segment at offset {0}'.format(offset))
+
+        offset += headerSize
+        if offset + size > end:
+            raise ValueError('Truncated segment at offset {0}'.format(offset))
+
+        yield segType, pts, dts, offset, size
+
+        offset += size
+
+def supInfo(path):
+    """Counts the total and forced captions of a sup file
+
+    Args:
+        path : (str)
+            The sup file to read.
+
+    Raises:
+        IOError
+            Raised if the file can't be read.
+
+        ValueError
+            Raised if the file isn't a PGS stream.
+
+    Returns:
+        <SupInfo>
+
+    A caption is every display set that puts objects on screen. Palette only
+    updates, and acquisition points that repeat the caption already being
+    shown, don't count as new captions. A caption is forced if any of its
+    objects are.
+
+    """
+    with open(path, 'rb') as f:
+        if not f.read(1):
+            # mmap refuses empty files, and there's nothing to count anyway.
+            return SupInfo(0, 0)
+        buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    try:
+        totalCount = 0
+        forcedCount = 0
+        shown = None
+
+        for segType, pts, dts, offset, size in segments(buf):
+            if segType != PCS:
+                continue
+
+            composition = readComposition(buf, offset, pts)
+
+            if composition.paletteUpdate:
+                continue
+            if not composition.objects:
+                # An empty composition clears the screen.
+                shown = None
+                continue
+
+            layout = composition.layout
+            if composition.state == ACQUISITION_POINT and layout == shown:
+                continue
+            shown = layout
+
+            totalCount += 1
+            if composition.forced:
+                forcedCount += 1
+    finally:
+        buf.close()
+
+    return SupInfo(totalCount, forcedCount)
@@ -0,0 +1,243 @@
+#/usr/bin/python
+# Ripmaster.tools.probecache
+# On disk cache of mkvmerge track probes, keyed by file identity
+
+"""
+
+Description
+-----------
+
+Building a <Movie> runs mkvmerge to list its tracks, and Ripmaster builds a
+Movie for every file in toConvert each time it starts. On a large library, or
+one on network storage, those mkvmerge launches take minutes.
+
+The ProbeCache stores the parsed result of each probe in a small SQLite
+database, along with the identity of the file it came from: its size,
+modification time in nanoseconds, and inode. A file whose identity still
+matches is never probed again. A file that has changed is probed again, and
+its entry replaced.
+
+Each entry records when it was last used. Once the cache holds more than its
+limit, the least recently used entries are removed.
+
+Classes
+-------
+
+ProbeCache
+    An SQLite backed cache of probe results, keyed by file path and
+    invalidated when the file changes.
+
+Functions
+---------
+
+fileIdentity()
+    Returns the (size, mtime_ns, inode) tuple a cache entry is keyed by.
+
+"""
+
+#===============================================================================
+# IMPORTS
+#===============================================================================
+
+# Standard Imports
+import cPickle
+import os
+import sqlite3
+import threading
+import time
+
+#===============================================================================
+# GLOBALS
+#===============================================================================
+
+MAX_ENTRIES_DEFAULT = 10000
+
+SCHEMA = """CREATE TABLE IF NOT EXISTS probes (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    inode INTEGER NOT NULL,
+    last_used REAL NOT NULL,
+    probe BLOB NOT NULL
+)"""
+
+#===============================================================================
+# CLASSES
+#===============================================================================
+
+class ProbeCache(object):
+    """Caches probe results on disk, keyed by file identity
+
+    Args:
+        path : (str)
+            The SQLite database to keep the cache in. Created if it doesn't
+            exist.
+
+        maxEntries=MAX_ENTRIES_DEFAULT : (int)
+            The most entries kept. The least recently used entries past this
+            are evicted whenever a new entry is stored.
+
+    Raises:
+        sqlite3.Error
+            Raised if the database can't be opened.
+
+    The cache is shared by every thread, so access goes through a lock.
+
+    """
+    def __init__(self, path, maxEntries=MAX_ENTRIES_DEFAULT):
+        self.path = path
+        self.maxEntries = max(1, maxEntries)
+
+        self._lock = threading.Lock()
+        self._lastUsed = 0
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        # Paths are byte strings, in whatever encoding the filesystem uses.
+        # Stored as they are, a path with an accent can be bound at all.
+        self._db.text_factory = str
+        try:
+            # Write ahead logging makes each small commit cheap. Not every
+            # filesystem supports it, in which case the default journal is
+            # fine.
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.execute('PRAGMA synchronous=NORMAL')
+        except sqlite3.Error:
+            pass
+        self._db.execute(SCHEMA)
+        self._db.execute(
+            'CREATE INDEX IF NOT EXISTS probes_last_used ON probes (last_used)'
+        )
+        self._db.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute('SELECT COUNT(*) FROM probes').fetchone()[0]
+
+    #===========================================================================
+    # PRIVATE METHODS
+    #===========================================================================
+
+    def _now(self):
+        """Returns the current time, always later than the last returned"""
+        # Lookups can come faster than the clock ticks, and ties would make
+        # eviction order arbitrary.
+        self._lastUsed = max(time.time(), self._lastUsed + 0.000001)
+        return self._lastUsed
+
+    #===========================================================================
+    # PUBLIC METHODS
+    #===========================================================================
+
+    def close(self):
+        """Closes the database"""
+        with self._lock:
+            self._db.close()
+
+    def get(self, file):
+        """Returns the cached probe of a file, if the file hasn't changed
+
+        Args:
+            file : (str)
+                The file to look up.
+
+        Raises:
+            N/A
+
+        Returns:
+            (any)|None
+                The probe stored for the file, or None if there isn't one, or
+                the file has changed since it was stored. A changed file's
+                entry is removed.
+
+        """
+        identity = fileIdentity(file)
+
+        with self._lock:
+            row = self._db.execute(
+                'SELECT size, mtime_ns, inode, probe FROM probes '
+                'WHERE path = ?',
+                (file,)
+            ).fetchone()
+
+            if not row:
+                return None
+
+            if identity is None or tuple(row[:3]) != identity:
+                self._db.execute('DELETE FROM probes WHERE path = ?', (file,))
+                self._db.commit()
+                return None
+
+            self._db.execute(
+                'UPDATE probes SET last_used = ? WHERE path = ?',
+                (self._now(), file)
+            )
+            self._db.commit()
+
+            return cPickle.loads(str(row[3]))
+
+    def put(self, file, probe):
+        """Stores the probe of a file, evicting old entries if needed
+
+        Args:
+            file : (str)
+                The file that was probed.
+
+            probe : (any)
+                The probe result. Anything that can be pickled.
+
+        Raises:
+            N/A
+
+        Returns:
+            None
+
+        If the file no longer exists, nothing is stored.
+
+        """
+        identity = fileIdentity(file)
+        if identity is None:
+            return
+
+        data = sqlite3.Binary(cPickle.dumps(probe, cPickle.HIGHEST_PROTOCOL))
+
+        with self._lock:
+            self._db.execute(
+                'INSERT OR REPLACE INTO probes '
+                '(path, size, mtime_ns, inode, last_used, probe) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (file,) + identity + (self._now(), data)
+            )
+            # Keep only the most recently used maxEntries.
+            self._db.execute(
+                'DELETE FROM probes WHERE path IN ('
+                'SELECT path FROM probes ORDER BY last_used DESC '
+                'LIMIT -1 OFFSET ?)',
+                (self.maxEntries,)
+            )
+            self._db.commit()
+
+#===============================================================================
+# FUNCTIONS
+#===============================================================================
+
+def fileIdentity(file):
+    """Returns the identity of a file on disk
+
+    Args:
+        file : (str)
+            The file to stat.
+
+    Raises:
+        N/A
+
+    Returns:
+        (int, int, int)|None
+            The size, modification time in nanoseconds, and inode of the
+            file, or None if it can't be stat'd. Inodes are 0 on Windows.
+
+    """
+    try:
+        stat = os.stat(file)
+    except OSError:
+        return None
+
+    return stat.st_size, int(round(stat.st_mtime * 1000000000)), stat.st_ino
@@ -0,0 +1,367 @@
+#/usr/bin/python
+# Ripmaster.tools.progress
+# Follows HandBrake's progress through an encode, and the queue's through its
+
+"""
+
+Description
+-----------
+
+HandBrakeCLI reports its progress on stdout as it encodes, rewriting a single
+line with carriage returns:
+
+    Encoding: task 1 of 1, 45.23 % (120.45 fps, avg 118.32 fps, ETA 00h12m34s)
+
+The frame rates and ETA are only shown once HandBrake has a few seconds of
+encode to go on. The runner hands each line to an EncodeProgress as soon as
+it's written, which keeps the percentage, the current and average frame rates
+and the ETA.
+
+A movie encoded in chunks has an EncodeProgress for each chunk, combined into
+the movie's by weighting each chunk by its share of the movie.
+
+An encode is stalled when its percentage hasn't moved for a while. queueEta()
+adds up the time left on the encodes running and the encodes still to come,
+using how fast the encodes so far have gone.
+
+Classes
+-------
+
+EncodeProgress
+    The progress of a single HandBrake encode, or of a movie encoded in chunks.
+
+Functions
+---------
+
+formatSeconds()
+    Formats a number of seconds the way HandBrake formats its ETA.
+
+parseProgress()
+    Parses a single HandBrake progress line.
+
+queueEta()
+    Estimates the seconds left until every movie is encoded.
+
+"""
+
+#===============================================================================
+# IMPORTS
+#===============================================================================
+
+# Standard Imports
+import re
+import time
+
+#===============================================================================
+# GLOBALS
+#===============================================================================
+
+PROGRESS_RE = re.compile(
+    r'Encoding: task (\d+) of (\d+), ([\d.]+) %'
+    r'(?: \(([\d.]+) fps, avg ([\d.]+) fps, ETA (\d+)h(\d+)m(\d+)s\))?'
+)
+
+# An encode whose percentage hasn't moved in this many seconds is stalled.
+STALL_SECONDS_DEFAULT = 600
+
+#===============================================================================
+# CLASSES
+#===============================================================================
+
+class EncodeProgress(object):
+    """The progress of a single HandBrake encode, or a movie's chunks
+
+    Args:
+        duration=None : (float)
+            Seconds of the source this encode covers, if known. Needed to
+            tell how fast the encode is going for queueEta().
+
+    Raises:
+        N/A
+
+    Attributes are updated from the thread reading HandBrake's output, and only
+    ever replaced whole, so other threads can read them as they like.
+
+    """
+    def __init__(self, duration=None):
+        self.duration = duration
+
+        self.percent = 0.0
+        self.fps = None
+        self.avgFps = None
+        self.eta = None
+
+        self.started = time.time()
+        # When the percentage last moved
+        self.updated = self.started
+        self.finished = None
+
+        # Chunks, and the share of the movie each stands for.
+        self.parts = []
+        self.weight = 1.0
+        self.skipped = 0.0
+        self.parent = None
+
+    #===========================================================================
+    # PRIVATE METHODS
+    #===========================================================================
+
+    def _combine(self):
+        """Sets our progress from the progress of our parts"""
+        percent = 100 * self.skipped + sum(
+            [part.percent * part.weight for part in self.parts]
+        )
+        if percent > self.percent:
+            self.percent = percent
+            self.updated = max([part.updated for part in self.parts])
+
+        running = [part for part in self.parts if not part.finished]
+        fps = [part.fps for part in running if part.fps is not None]
+        self.fps = sum(fps) if fps else None
+        avgFps = [part.avgFps for part in running if part.avgFps is not None]
+        self.avgFps = sum(avgFps) if avgFps else None
+        # Parts run side by side, so we're done when the slowest is.
+        eta = [part.eta for part in running if part.eta is not None]
+        self.eta = max(eta) if eta else None
+
+    #===========================================================================
+    # PUBLIC METHODS
+    #===========================================================================
+
+    def finish(self):
+        """Marks the encode as finished"""
+        self.percent = 100.0
+        self.eta = 0
+        self.fps = None
+        self.finished = time.time()
+        if self.parent:
+            self.parent._combine()
+
+    def part(self, weight):
+        """Returns the progress of a part of this encode
+
+        Args:
+            weight : (float)
+                The share of the whole this part stands for, from 0 to 1.
+
+        Raises:
+            N/A
+
+        Returns:
+            (<EncodeProgress>)
+                The part's progress. Updating it updates ours.
+
+        """
+        part = EncodeProgress(
+            self.duration * weight if self.duration else None
+        )
+        part.weight = weight
+        part.parent = self
+        self.parts.append(part)
+        return part
+
+    def rate(self):
+        """Returns the seconds of source encoded per second, or None"""
+        elapsed = (self.finished or time.time()) - self.started
+        if not self.duration or not self.percent or elapsed <= 0:
+            return None
+        # Parts skipped weren't encoded in the time we've taken.
+        encoded = self.duration * (self.percent / 100 - self.skipped)
+        return encoded / elapsed if encoded > 0 else None
+
+    def remaining(self):
+        """Returns the seconds left on the encode, or None if unknown
+
+        HandBrake's ETA is used once it gives one. Until then, the time
+        taken so far is extrapolated from the percentage.
+
+        """
+        if self.finished:
+            return 0
+        if self.eta is not None:
+            return self.eta
+        if self.percent > 100 * self.skipped:
+            elapsed = time.time() - self.started
+            done = self.percent - 100 * self.skipped
+            return elapsed * (100 - self.percent) / done
+        return None
+
+    def reuse(self):
+        """Finishes the encode without encoding, as an earlier one was reused
+
+        Nothing was encoded, so the encode counts as skipped, and doesn't
+        count towards how fast encodes go. A part counts as skipped by the
+        encode it's part of.
+
+        """
+        if self.parent:
+            if self in self.parent.parts:
+                self.parent.parts.remove(self)
+            self.parent.skip(self.weight)
+        self.skip(1.0 - self.skipped)
+        self.finish()
+
+    def skip(self, weight):
+        """Counts a part of this encode that was already done"""
+        self.skipped += weight
+        self.percent = max(self.percent, 100 * self.skipped)
+
+    def stalled(self, timeout=STALL_SECONDS_DEFAULT):
+        """True if the encode hasn't moved in timeout seconds"""
+        if self.finished:
+            return False
+        return time.time() - self.updated >= timeout
+
+    def update(self, line):
+        """Updates the progress from a line of HandBrake output
+
+        Args:
+            line : (str)
+                A line HandBrake wrote. Lines that aren't progress are ignored.
+
+        Raises:
+            N/A
+
+        Returns:
+            (bool)
+                True if the line was progress.
+
+        """
+        progress = parseProgress(line)
+        if not progress:
+            return False
+
+        # Two pass encodes run the same progress twice, as two tasks.
+        percent = (
+            (progress['task'] - 1) * 100 + progress['percent']
+        ) / progress['tasks']
+        if percent > self.percent:
+            self.percent = percent
+            self.updated = time.time()
+
+        if progress['fps'] is not None:
+            self.fps = progress['fps']
+            self.avgFps = progress['avgFps']
+            self.eta = progress['eta']
+
+        if self.parent:
+            self.parent._combine()
+
+        return True
+
+#===============================================================================
+# FUNCTIONS
+#===============================================================================
+
+def formatSeconds(seconds):
+    """Formats seconds as HandBrake's ETA is, or '--h--m--s' if unknown"""
+    if seconds is None:
+        return '--h--m--s'
+    seconds = int(seconds)
+    return '{0:02d}h{1:02d}m{2:02d}s'.format(
+        seconds // 3600, seconds % 3600 // 60, seconds % 60
+    )
+
+#===============================================================================
+
+def parseProgress(line):
+    """Parses a single HandBrake progress line
+
+    Args:
+        line : (str)
+            A line HandBrake wrote.
+
+    Raises:
+        N/A
+
+    Returns:
+        {str: int|float|None}|None
+            The task, tasks, percent, fps, avgFps and eta (in seconds) the line
+            gives, with fps, avgFps and eta None if it doesn't give them yet.
+            None if the line isn't progress.
+
+    """
+    match = PROGRESS_RE.search(line)
+    if not match:
+        return None
+
+    task, tasks, percent, fps, avgFps, hours, minutes, seconds = match.groups()
+
+    progress = {
+        'task': int(task),
+        'tasks': max(1, int(tasks)),
+        'percent': float(percent),
+        'fps': None,
+        'avgFps': None,
+        'eta': None,
+    }
+    if fps is not None:
+        progress['fps'] = float(fps)
+        progress['avgFps'] = float(avgFps)
+        progress['eta'] = int(hours) * 3600 + int(minutes) * 60 + int(seconds)
+
+    return progress
+
+#===============================================================================
+
+def queueEta(movies):
+    """Estimates the seconds left until every movie is encoded
+
+    Args:
+        movies : [<tools.Movie>]
+            Every movie in the queue. Movies already encoded are ignored.
+
+    Raises:
+        N/A
+
+    Returns:
+        (float)|None
+            Seconds until the last encode finishes, or None if no encode has
+            gone long enough to tell.
+
+    Encodes run one at a time, so the time left on the running encodes is
+    added to the time the movies still to come would take, at the rate the
+    encodes so far have gone. Movies whose length isn't known are counted as
+    the average length of the rest.
+
+    """
+    remaining = 0.0
+    pending = []
+    encoded = 0.0
+    spent = 0.0
+
+    for movie in movies:
+        progress = getattr(movie, 'progress', None)
+        duration = getattr(movie, 'duration', None)
+
+        if progress is not None:
+            rate = progress.rate()
+            if rate:
+                elapsed = (
+                    (progress.finished or time.time()) - progress.started
+                )
+                encoded += rate * elapsed
+                spent += elapsed
+
+        if movie.encoded:
+            continue
+
+        if progress is not None and progress.percent:
+            left = progress.remaining()
+            if left is not None:
+                remaining += left
+                continue
+
+        pending.append(duration)
+
+    if pending:
+        if not spent:
+            return None
+        known = [duration for duration in pending if duration]
+        average = sum(known) / len(known) if known else 0
+        if not average:
+            return None
+        source = sum([duration or average for duration in pending])
+        remaining += source / (encoded / spent)
+
+    return remaining
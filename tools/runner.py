@@ -0,0 +1,647 @@
+#/usr/bin/python
+# Ripmaster.tools.runner
+# Runs external tools from a single event loop, streaming their output
+
+"""
+
+Description
+-----------
+
+Every external tool Ripmaster runs goes through a ProcessRunner. The tool is
+started from an argument list, never through a shell, with its stdout and
+stderr piped back. A single thread waits on the pipes of every running tool
+at once, and hands each line to a parser as soon as it's written, so dozens of
+tools can be running without a thread blocked on each of their pipes.
+
+Lines end at a newline or a carriage return, since HandBrake and mkvmerge end
+their progress lines with carriage returns. Output nobody reads is written to
+Ripmaster's own console, the way it would be if the tool had been run
+directly.
+
+A run can be given a timeout, and can be cancelled. Either way the tool is
+sent SIGTERM, then killed if it's still running KILL_SECONDS later. Once a
+tool exits, its exit status and the CPU time it used are kept on its <Run>.
+
+Python 2 has no asyncio, so the loop is built on poll() (or select() where
+poll() is missing). Windows can't wait on pipes that way, so there each run
+reads its pipes on threads of its own instead, with no CPU time recorded.
+
+Classes
+-------
+
+ProcessRunner
+    Starts tools, and waits on every running tool's output from one thread.
+
+Run
+    One run of a tool: its output, exit status, and the CPU time it used.
+
+Functions
+---------
+
+run()
+    Runs a tool on the default runner, waiting for it to finish.
+
+start()
+    Starts a tool on the default runner, without waiting for it.
+
+"""
+
+#===============================================================================
+# IMPORTS
+#===============================================================================
+
+# Standard Imports
+import atexit
+import errno
+import os
+import re
+import select
+from subprocess import Popen, PIPE
+import sys
+import threading
+import time
+import traceback
+
+try:
+    import fcntl
+except ImportError:
+    # Windows runs are threaded, and don't need it.
+    fcntl = None
+
+#===============================================================================
+# GLOBALS
+#===============================================================================
+
+# Seconds a tool has to exit after SIGTERM, before it's killed
+KILL_SECONDS = 10
+# Bytes read from a pipe at a time
+READ_SIZE = 65536
+# A line longer than this is dropped, rather than held onto forever.
+LINE_LIMIT = 65536
+# Seconds between checks on a threaded run's timeout
+CHECK_SECONDS = 0.1
+
+# Windows can't poll or select on pipes.
+THREADED = os.name == 'nt'
+
+_LINE_END = re.compile(r'[\r\n]')
+
+#===============================================================================
+# PRIVATE FUNCTIONS
+#===============================================================================
+
+def _call(callback, line):
+    """Hands a line to a reader, so a reader that raises can't stop the loop"""
+    try:
+        callback(line)
+    except Exception:
+        traceback.print_exc()
+
+#===============================================================================
+
+def _closeOnExec(fd):
+    """Keeps a pipe of ours from being inherited by the tools we start"""
+    flags = fcntl.fcntl(fd, fcntl.F_GETFD)
+    fcntl.fcntl(fd, fcntl.F_SETFD, flags | fcntl.FD_CLOEXEC)
+
+#===============================================================================
+# CLASSES
+#===============================================================================
+
+class Run(object):
+    """One run of a tool
+
+    Args:
+        command : [str]
+            The tool and its arguments.
+
+        stdout=None : (callable)
+            Called with each line the tool writes to stdout.
+
+        stderr=None : (callable)
+            Called with each line the tool writes to stderr.
+
+        capture=False : (bool)
+            Keep everything the tool writes to stdout, in output.
+
+        timeout=None : (float)
+            Seconds the tool is given to finish before it's stopped.
+
+        onStart=None : (callable)
+            Called with the tool's pid as soon as it's started, from the
+            thread that started it. If it raises, the tool is killed.
+
+        stdin=False : (bool)
+            Give the tool a pipe to read its stdin from, written to through
+            process.stdin. Otherwise it shares Ripmaster's.
+
+    Raises:
+        N/A
+
+    Stdout that isn't captured or handed to a callback is written to
+    sys.stdout as it comes in, and stderr without a callback to sys.stderr.
+
+    """
+    def __init__(self, command, stdout=None, stderr=None, capture=False,
+                 timeout=None, onStart=None, stdin=False):
+        self.command = list(command)
+        self.callbacks = {'stdout': stdout, 'stderr': stderr}
+        self.capture = capture
+        self.timeout = timeout
+        self.onStart = onStart
+        self.stdin = stdin
+
+        self.process = None
+        self.pid = None
+        self.started = None
+        self.finished = None
+
+        # Set once the tool exits. Negative if a signal ended it, like
+        # Popen's returncode.
+        self.status = None
+        # The resource.struct_rusage of the tool, where it can be read.
+        self.rusage = None
+        self.timedOut = False
+        self.cancelled = False
+
+        self._output = []
+        self._partial = {'stdout': '', 'stderr': ''}
+        self._stopAt = None
+        self._killAt = None
+        self._reaping = False
+        self._done = threading.Event()
+        # A pipe the main thread waits on, written to when the tool exits
+        self._notify = None
+        self._notifyLock = threading.Lock()
+
+    def __repr__(self):
+        return '<Run {tool}: {status}>'.format(
+            tool=os.path.basename(self.command[0]),
+            status='running' if self.status is None else self.status
+        )
+
+    #===========================================================================
+    # PRIVATE METHODS
+    #===========================================================================
+
+    def _feed(self, name, block):
+        """Hands a block read from one of the tool's pipes to its reader"""
+        callback = self.callbacks[name]
+        if name == 'stdout' and self.capture:
+            self._output.append(block)
+        elif not callback:
+            stream = sys.stdout if name == 'stdout' else sys.stderr
+            stream.write(block)
+            stream.flush()
+
+        if not callback:
+            return
+
+        lines = _LINE_END.split(self._partial[name] + block)
+        self._partial[name] = lines.pop()
+        if len(self._partial[name]) > LINE_LIMIT:
+            self._partial[name] = ''
+        for line in lines:
+            if line:
+                _call(callback, line)
+
+    def _finish(self, status, rusage=None):
+        """Records the tool's exit, handing on any last unfinished lines"""
+        for name, callback in self.callbacks.items():
+            if callback and self._partial[name]:
+                _call(callback, self._partial[name])
+            self._partial[name] = ''
+
+        self.status = status
+        self.rusage = rusage
+        self.process.returncode = status
+        self.finished = time.time()
+        with self._notifyLock:
+            self._done.set()
+            if self._notify:
+                os.write(self._notify[1], '.')
+
+    #===========================================================================
+    # PROPERTIES
+    #===========================================================================
+
+    @property
+    def cpuSeconds(self):
+        """User and system CPU seconds the tool used, or None if unknown"""
+        if not self.rusage:
+            return None
+        return self.rusage.ru_utime + self.rusage.ru_stime
+
+    @property
+    def done(self):
+        """True once the tool has exited"""
+        return self._done.isSet()
+
+    @property
+    def output(self):
+        """Everything the tool wrote to stdout, if it was captured"""
+        return ''.join(self._output)
+
+    #===========================================================================
+    # PUBLIC METHODS
+    #===========================================================================
+
+    def stop(self):
+        """Sends the tool SIGTERM, killing it KILL_SECONDS later"""
+        if self.done or self._killAt:
+            return
+        try:
+            self.process.terminate()
+        except OSError:
+            # It exited already.
+            pass
+        self._killAt = time.time() + KILL_SECONDS
+
+    def wait(self, timeout=None):
+        """Waits for the tool to exit, returning its status
+
+        Args:
+            timeout=None : (float)
+                Seconds to wait. Waits until it exits if None.
+
+        Raises:
+            N/A
+
+        Returns:
+            (int)|None
+                The tool's exit status, or None if it's still running.
+
+        """
+        # In Python 2, an Event wait with a timeout polls, waking up late,
+        # and one without can't be interrupted by Ctrl+C. Ctrl+C only goes to
+        # the main thread, so other threads wait without a timeout, and the
+        # main thread waits on a pipe instead.
+        mainThread = isinstance(
+            threading.current_thread(), threading._MainThread
+        )
+        if timeout is None and not mainThread:
+            self._done.wait()
+            return self.status
+        if THREADED:
+            self._done.wait(timeout)
+            return self.status
+
+        with self._notifyLock:
+            if not self._done.isSet() and not self._notify:
+                self._notify = os.pipe()
+            notify = self._notify
+
+        end = None if timeout is None else time.time() + timeout
+        while not self._done.isSet():
+            left = None if end is None else end - time.time()
+            if left is not None and left <= 0:
+                break
+            try:
+                select.select([notify[0]], [], [], left)
+            except select.error, err:
+                if err.args[0] != errno.EINTR:
+                    raise
+
+        with self._notifyLock:
+            if self._done.isSet() and self._notify:
+                for fd in self._notify:
+                    os.close(fd)
+                self._notify = None
+
+        return self.status
+
+#===============================================================================
+
+class ProcessRunner(object):
+    """Starts tools, and waits on every running tool's output from one thread
+
+    Args:
+        N/A
+
+    Raises:
+        N/A
+
+    The loop's thread is started with the first tool, and kept for the life
+    of the process.
+
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        # Runs by the pipe being read from them, with the pipe's name.
+        self._pipes = {}
+        # Runs that are still running
+        self._runs = []
+        self._closed = False
+        self._thread = None
+        self._wake = None
+
+        # Daemon threads still running as Python shuts down fail on modules
+        # that have been torn down, so the loop is stopped first.
+        atexit.register(self.close)
+
+    #===========================================================================
+    # PRIVATE METHODS
+    #===========================================================================
+
+    def _close(self, run):
+        """Stops reading a run's pipes"""
+        with self._lock:
+            for fd, (piped, name) in self._pipes.items():
+                if piped is run:
+                    del self._pipes[fd]
+                    getattr(run.process, name).close()
+
+    def _loop(self):
+        """Reads every running tool's pipes, and reaps them as they exit"""
+        poller = select.poll() if hasattr(select, 'poll') else None
+        polled = set()
+
+        while True:
+            with self._lock:
+                fds = set(self._pipes) | set([self._wake[0]])
+                timeout = self._timeout()
+
+            if poller:
+                for fd in fds - polled:
+                    poller.register(fd, select.POLLIN)
+                for fd in polled - fds:
+                    poller.unregister(fd)
+                polled = fds
+                try:
+                    events = poller.poll(
+                        None if timeout is None else timeout * 1000
+                    )
+                except select.error, err:
+                    if err.args[0] != errno.EINTR:
+                        raise
+                    events = []
+                ready = [fd for fd, event in events]
+            else:
+                try:
+                    ready = select.select(list(fds), [], [], timeout)[0]
+                except select.error, err:
+                    if err.args[0] != errno.EINTR:
+                        raise
+                    ready = []
+
+            for fd in ready:
+                if fd == self._wake[0]:
+                    os.read(fd, READ_SIZE)
+                else:
+                    self._read(fd)
+
+            if self._closed:
+                return
+            self._check()
+
+    def _read(self, fd):
+        """Reads a block from a tool's pipe, closing it at the end"""
+        with self._lock:
+            run, name = self._pipes[fd]
+
+        try:
+            block = os.read(fd, READ_SIZE)
+        except OSError, err:
+            if err.errno in [errno.EAGAIN, errno.EINTR]:
+                return
+            block = ''
+
+        if block:
+            run._feed(name, block)
+            return
+
+        with self._lock:
+            del self._pipes[fd]
+        getattr(run.process, name).close()
+
+    def _check(self):
+        """Stops runs past their timeout, and reaps runs that have exited"""
+        now = time.time()
+        with self._lock:
+            runs = list(self._runs)
+            reading = set([run for run, name in self._pipes.values()])
+
+        for run in runs:
+            if run._stopAt and now >= run._stopAt and not run._killAt:
+                run.timedOut = True
+                run.stop()
+            if run._killAt and now >= run._killAt:
+                try:
+                    run.process.kill()
+                except OSError:
+                    pass
+                run._killAt = now + KILL_SECONDS
+                # Anything the tool started can hold its pipes open after
+                # it's killed, so we stop reading them.
+                self._close(run)
+                reading.discard(run)
+
+            if run in reading or run._reaping:
+                continue
+
+            # The tool has closed its output, so it's exiting. Waiting on it
+            # here would hold up every other tool, so a thread waits instead.
+            run._reaping = True
+            reaper = threading.Thread(target=self._reap, args=(run,))
+            reaper.daemon = True
+            reaper.start()
+
+    def _reap(self, run):
+        """Waits for a run that's closed its output to exit"""
+        while True:
+            try:
+                pid, status, rusage = os.wait4(run.pid, 0)
+                break
+            except OSError, err:
+                if err.errno != errno.EINTR:
+                    raise
+
+        with self._lock:
+            self._runs.remove(run)
+        if os.WIFSIGNALED(status):
+            status = -os.WTERMSIG(status)
+        else:
+            status = os.WEXITSTATUS(status)
+        run._finish(status, rusage)
+
+    def _start(self):
+        """Starts the loop's thread, if it isn't running"""
+        if self._thread:
+            return
+        self._wake = os.pipe()
+        for fd in self._wake:
+            _closeOnExec(fd)
+        self._thread = threading.Thread(target=self._loop)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _threaded(self, run):
+        """Reads a run's pipes and waits on it with threads of its own"""
+        def read(name):
+            stream = getattr(run.process, name)
+            while True:
+                block = os.read(stream.fileno(), READ_SIZE)
+                if not block:
+                    break
+                run._feed(name, block)
+            stream.close()
+
+        def wait():
+            readers = [
+                threading.Thread(target=read, args=(name,))
+                for name in ['stdout', 'stderr']
+            ]
+            for reader in readers:
+                reader.daemon = True
+                reader.start()
+            for reader in readers:
+                reader.join()
+            run._finish(run.process.wait())
+
+        def watch():
+            while not run.done:
+                if run._stopAt and time.time() >= run._stopAt:
+                    run.timedOut = True
+                    run.stop()
+                if run._killAt and time.time() >= run._killAt:
+                    run.process.kill()
+                    break
+                run._done.wait(CHECK_SECONDS)
+
+        for target in [wait, watch]:
+            thread = threading.Thread(target=target)
+            thread.daemon = True
+            thread.start()
+
+    def _timeout(self):
+        """Returns the seconds until the loop next needs to check its runs"""
+        times = []
+        for run in self._runs:
+            times.extend([when for when in [run._stopAt, run._killAt] if when])
+        if not times:
+            return None
+        return max(0, min(times) - time.time())
+
+    def _wakeUp(self):
+        """Wakes the loop, so it picks up new runs and deadlines"""
+        if self._wake:
+            os.write(self._wake[1], '.')
+
+    #===========================================================================
+    # PUBLIC METHODS
+    #===========================================================================
+
+    def cancel(self, run):
+        """Stops a run that's still going, marking it cancelled"""
+        if run.done:
+            return
+        run.cancelled = True
+        run.stop()
+        self._wakeUp()
+
+    def close(self):
+        """Stops the loop, leaving any tools still running to finish alone"""
+        self._closed = True
+        self._wakeUp()
+        if self._thread:
+            self._thread.join(1)
+
+    def run(self, command, **kwargs):
+        """Runs a tool, waiting for it to finish
+
+        Args:
+            command : [str]
+                The tool and its arguments.
+
+            Keyword arguments are the same as <Run>'s.
+
+        Raises:
+            OSError
+                Raised if the tool can't be started.
+
+        Returns:
+            (<Run>)
+                The finished run.
+
+        """
+        run = self.start(command, **kwargs)
+        run.wait()
+        return run
+
+    def start(self, command, **kwargs):
+        """Starts a tool, without waiting for it
+
+        Args:
+            command : [str]
+                The tool and its arguments.
+
+            Keyword arguments are the same as <Run>'s.
+
+        Raises:
+            OSError
+                Raised if the tool can't be started. Anything onStart raises
+                is raised too, once the tool's been killed.
+
+        Returns:
+            (<Run>)
+                The running tool. Its wait() waits for it to finish.
+
+        """
+        run = Run(command, **kwargs)
+
+        with self._lock:
+            if not THREADED:
+                self._start()
+            # Tools are started one at a time, and our ends of their pipes
+            # aren't inherited, so no tool holds another's pipes open after
+            # it exits.
+            run.process = Popen(
+                run.command, stdin=PIPE if run.stdin else None, stdout=PIPE,
+                stderr=PIPE
+            )
+            run.pid = run.process.pid
+            if run.onStart:
+                try:
+                    run.onStart(run.pid)
+                except Exception:
+                    run.process.kill()
+                    run.process.communicate()
+                    raise
+            run.started = time.time()
+            if run.timeout is not None:
+                run._stopAt = run.started + run.timeout
+
+            if not THREADED:
+                self._runs.append(run)
+                for name in ['stdout', 'stderr']:
+                    fd = getattr(run.process, name).fileno()
+                    _closeOnExec(fd)
+                    self._pipes[fd] = (run, name)
+                # A tool that inherited the stdin we write to would keep it
+                # open after we close ours.
+                if run.stdin:
+                    _closeOnExec(run.process.stdin.fileno())
+
+        if THREADED:
+            self._threaded(run)
+        else:
+            self._wakeUp()
+
+        return run
+
+# Every tool Ripmaster runs is run here.
+RUNNER = ProcessRunner()
+
+#===============================================================================
+# FUNCTIONS
+#===============================================================================
+
+def run(command, **kwargs):
+    """Runs a tool on the default runner, waiting for it to finish"""
+    return RUNNER.run(command, **kwargs)
+
+#===============================================================================
+
+def start(command, **kwargs):
+    """Starts a tool on the default runner, without waiting for it"""
+    return RUNNER.start(command, **kwargs)
@@ -0,0 +1,334 @@
+#/usr/bin/python
+# Ripmaster.tools.scheduler
+# Dependency graph executor for running Ripmaster's stages concurrently
+
+"""
+
+Description
+-----------
+
+Ripmaster's stages don't all depend on each other. A movie's Handbrake encode
+only needs the source mkv, while the final merge needs both the encode and the
+converted subtitles. This module lets Ripmaster describe those dependencies as
+a graph of tasks, then runs every task whose dependencies are met at the same
+time, so that hours of x264 encoding overlap with mkvextract and BDSup2Sub work
+instead of waiting behind it.
+
+Classes
+-------
+
+Task
+    A single unit of work within a <TaskGraph>, along with the tasks it must
+    wait for.
+
+TaskGraph
+    A collection of <Task>s. Runs ready tasks on pools of worker threads,
+    limiting how many tasks of a given kind can run at once.
+
+"""
+
+#===============================================================================
+# IMPORTS
+#===============================================================================
+
+# Standard Imports
+import threading
+import traceback
+
+#===============================================================================
+# GLOBALS
+#===============================================================================
+
+# Task States
+PENDING = 'pending'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+SKIPPED = 'skipped'
+
+WORKERS_DEFAULT = 4
+
+#===============================================================================
+# CLASSES
+#===============================================================================
+
+class Task(object):
+    """A single unit of work with dependencies
+
+    Args:
+        name : (str)
+            A human readable name for the task, used when reporting.
+
+        func : (callable)
+            Called with no arguments when the task is run.
+
+        deps=None : [<Task>]
+            Tasks that must finish successfully before this task can run.
+
+        kind=None : (str)
+            The kind of work this task does. A <TaskGraph> can limit how many
+            tasks of a kind run at once.
+
+    """
+    def __init__(self, name, func, deps=None, kind=None):
+        self.name = name
+        self.func = func
+        self.deps = [dep for dep in deps or [] if dep is not None]
+        self.kind = kind
+
+        self.state = PENDING
+        self.error = None
+
+    def __repr__(self):
+        return '<Task {name}: {state}>'.format(name=self.name, state=self.state)
+
+    @property
+    def ready(self):
+        """True if every dependency of this task has finished"""
+        return all([dep.state == DONE for dep in self.deps])
+
+    @property
+    def blocked(self):
+        """True if a dependency has failed, meaning this task can never run"""
+        return any([dep.state in [FAILED, SKIPPED] for dep in self.deps])
+
+class TaskGraph(object):
+    """Runs a graph of tasks, running ready tasks concurrently
+
+    Args:
+        workers=WORKERS_DEFAULT : (int)
+            Maximum number of tasks that can run at the same time.
+
+        limits=None : {str: int}
+            Maximum number of tasks of each kind that can run at the same time.
+            Kinds not present in the dictionary are only limited by workers.
+
+        persistent=False : (bool)
+            If True, run() doesn't return once every task is finished, but
+            waits for more tasks to be added until stop() is called.
+
+        pools=None : {str: (int, [str])}
+            Pools of worker threads of their own, by name, each with how many
+            workers it has and the kinds of task it runs. Tasks of those kinds
+            only run on their pool's workers, and every other task only runs
+            on the main workers, so tasks waiting on a disk in one pool never
+            keep the CPU bound tasks of another waiting for a worker.
+
+    Tasks are started in the order they were added, so adding tasks in the
+    order movies have been sorted in keeps that priority. Tasks can be added
+    while the graph is running.
+
+    If a task raises, the error is recorded on the task and every task that
+    depends on it is skipped. Tasks on other branches of the graph carry on.
+
+    """
+    def __init__(self, workers=WORKERS_DEFAULT, limits=None, persistent=False,
+                 pools=None):
+        self.workers = max(1, workers)
+        self.limits = limits if limits else {}
+        self.persistent = persistent
+        self.pools = pools if pools else {}
+
+        # The pool each kind of task runs on. Kinds without one run on the
+        # main workers.
+        self._kindPools = {}
+        for pool, (workers, kinds) in self.pools.items():
+            for kind in kinds:
+                self._kindPools[kind] = pool
+
+        self.tasks = []
+
+        self._condition = threading.Condition()
+        self._running = {}
+        self._stopped = False
+
+    #===========================================================================
+    # PRIVATE METHODS
+    #===========================================================================
+
+    def _kindAvailable(self, kind):
+        """Checks if another task of the given kind is allowed to start"""
+        if kind not in self.limits:
+            return True
+        return self._running.get(kind, 0) < self.limits[kind]
+
+    def _nextTask(self, pool=None):
+        """Returns the first pending task the pool can run, or None"""
+        if self._stopped:
+            return None
+        for task in self.tasks:
+            if task.state != PENDING:
+                continue
+            if task.blocked:
+                task.state = SKIPPED
+                # Skipping a task may unblock the loop in run(), since there
+                # might be nothing left to do.
+                self._condition.notifyAll()
+                continue
+            if self._kindPools.get(task.kind) != pool:
+                continue
+            if task.ready and self._kindAvailable(task.kind):
+                return task
+        return None
+
+    def _finished(self):
+        """Checks if there's nothing running, and nothing left that can run"""
+        if any([task.state == RUNNING for task in self.tasks]):
+            return False
+        for task in self.tasks:
+            if task.state == PENDING and not task.blocked:
+                return False
+        return True
+
+    def _work(self, pool=None):
+        """Worker thread loop. Grabs ready tasks and runs them until done"""
+        while True:
+            with self._condition:
+                task = self._nextTask(pool)
+                while task is None:
+                    if self._stopped:
+                        self._condition.notifyAll()
+                        return
+                    if self._finished() and not self.persistent:
+                        # Mark anything blocked as skipped before we leave.
+                        self._nextTask()
+                        self._condition.notifyAll()
+                        return
+                    self._condition.wait()
+                    task = self._nextTask(pool)
+
+                task.state = RUNNING
+                self._running[task.kind] = self._running.get(task.kind, 0) + 1
+
+            try:
+                task.func()
+            except Exception, err:
+                print ""
+                print "Task {name} failed: {err}".format(name=task.name, err=err)
+                traceback.print_exc()
+                print ""
+                state = FAILED
+                task.error = err
+            else:
+                state = DONE
+
+            with self._condition:
+                task.state = state
+                self._running[task.kind] -= 1
+                self._condition.notifyAll()
+
+    #===========================================================================
+    # PUBLIC METHODS
+    #===========================================================================
+
+    def addTask(self, name, func, deps=None, kind=None):
+        """Adds a new task to the graph
+
+        Args:
+            name : (str)
+                A human readable name for the task.
+
+            func : (callable)
+                Called with no arguments when the task is run.
+
+            deps=None : [<Task>|None]
+                Tasks this task waits on. None entries are ignored, which lets
+                callers pass in the result of a stage that was already done.
+
+            kind=None : (str)
+                The kind of work the task does, checked against limits.
+
+        Raises:
+            N/A
+
+        Returns:
+            <Task>
+                The newly added task.
+
+        """
+        task = Task(name, func, deps, kind)
+        with self._condition:
+            self.tasks.append(task)
+            self._condition.notifyAll()
+
+        return task
+
+    def counts(self):
+        """Counts the tasks of each kind in each state
+
+        Args:
+            N/A
+
+        Raises:
+            N/A
+
+        Returns:
+            {str: {str: int}}
+                The number of tasks in each state, by kind. States without
+                tasks are left out.
+
+        """
+        counts = {}
+        with self._condition:
+            for task in self.tasks:
+                states = counts.setdefault(task.kind, {})
+                states[task.state] = states.get(task.state, 0) + 1
+
+        return counts
+
+    def run(self):
+        """Runs every task in the graph, blocking until all are finished
+
+        Args:
+            N/A
+
+        Raises:
+            N/A
+
+        Returns:
+            [<Task>]
+                The tasks that failed or were skipped because of a failure.
+
+        A persistent graph runs until stop() is called. Tasks still pending
+        then are left pending.
+
+        """
+        workers = [(None, self.workers)] + [
+            (pool, max(1, count)) for pool, (count, kinds) in self.pools.items()
+        ]
+
+        threads = []
+        for pool, count in workers:
+            for i in xrange(count):
+                thread = threading.Thread(target=self._work, args=(pool,))
+                thread.daemon = True
+                thread.start()
+                threads.append(thread)
+
+        for thread in threads:
+            # Joining with a timeout keeps the main thread responsive to
+            # KeyboardInterrupt.
+            while thread.isAlive():
+                thread.join(1)
+
+        return [task for task in self.tasks if task.state in [FAILED, SKIPPED]]
+
+    def stop(self):
+        """Stops starting new tasks, letting running tasks finish
+
+        Args:
+            N/A
+
+        Raises:
+            N/A
+
+        Returns:
+            None
+
+        run() returns once the running tasks are done. Can be called from any
+        thread, including a signal handler.
+
+        """
+        with self._condition:
+            self._stopped = True
+            self._condition.notifyAll()
@@ -0,0 +1,359 @@
+#/usr/bin/python
+# Ripmaster Affinity Tests
+# Tests for splitting cores into encode slots
+"""
+Tests for all of the classes and functions inside of Ripmaster's
+tools.affinity module.
+"""
+
+#===============================================================================
+# IMPORTS
+#===============================================================================
+
+# Standard Imports
+import os
+import shutil
+from StringIO import StringIO
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+sys.path.append('/'.join(os.path.realpath(__file__).split('/')[:-3]))
+
+# Ripmaster Imports
+from tools import affinity
+from tools.progress import EncodeProgress
+
+#===============================================================================
+# CLASSES
+#===============================================================================
+
+class TestCpuLists(unittest.TestCase):
+    """Tests reading and writing Linux cpulists"""
+
+    #===========================================================================
+    # TESTS
+    #===========================================================================
+
+    def testParse(self):
+        """Tests ranges, single cores and stray whitespace"""
+        self.assertEqual(
+            [0, 1, 2, 3, 8, 10, 11],
+            affinity.parseCpuList(' 0-3,8, 10-11\n')
+        )
+
+    #===========================================================================
+
+    def testFormat(self):
+        """Tests that runs of cores are written as ranges"""
+        self.assertEqual(
+            '0-3,8,10-11',
+            affinity.formatCpuList([11, 10, 8, 3, 2, 1, 0])
+        )
+
+    #===========================================================================
+
+    def testAllowed(self):
+        """Tests reading the allowed cores from a process status file"""
+        root = tempfile.mkdtemp()
+        try:
+            status = os.path.join(root, 'status')
+            with open(status, 'w') as f:
+                f.write(
+                    'Name:\tpython\n'
+                    'Cpus_allowed:\t0f\n'
+                    'Cpus_allowed_list:\t0-1,4-5\n'
+                )
+
+            self.assertEqual(
+                [0, 1, 4, 5],
+                affinity.allowedCpus(status)
+            )
+        finally:
+            shutil.rmtree(root)
+
+#===============================================================================
+
+class TestTopology(unittest.TestCase):
+    """Tests reading NUMA nodes and hyperthreads, and partitioning by them"""
+
+    #===========================================================================
+    # SETUP & TEARDOWN
+    #===========================================================================
+
+    def setUp(self):
+        # Two nodes of two cores, each core with two hyperthreads, numbered
+        # the way Linux numbers them: 0-3 first threads, 4-7 second threads.
+        self.root = tempfile.mkdtemp()
+        self.sysNodes = os.path.join(self.root, 'node')
+        self.sysCpus = os.path.join(self.root, 'cpu')
+
+        for node, cpulist in [(0, '0-1,4-5'), (1, '2-3,6-7')]:
+            folder = os.path.join(self.sysNodes, 'node{0}'.format(node))
+            os.makedirs(folder)
+            with open(os.path.join(folder, 'cpulist'), 'w') as f:
+                f.write(cpulist + '\n')
+
+        for cpu in xrange(8):
+            folder = os.path.join(
+                self.sysCpus, 'cpu{0}'.format(cpu), 'topology'
+            )
+            os.makedirs(folder)
+            with open(os.path.join(folder, 'thread_siblings_list'), 'w') as f:
+                f.write('{0},{1}\n'.format(cpu % 4, cpu % 4 + 4))
+
+    #===========================================================================
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    #===========================================================================
+    # TESTS
+    #===========================================================================
+
+    def testNodes(self):
+        """Tests that hyperthreads of a core are next to each other"""
+        self.assertEqual(
+            [[0, 4, 1, 5], [2, 6, 3, 7]],
+            affinity.numaNodes(range(8), self.sysNodes, self.sysCpus)
+        )
+
+    #===========================================================================
+
+    def testNoTopology(self):
+        """Tests that cores are one node if /sys can't be read"""
+        missing = os.path.join(self.root, 'missing')
+
+        self.assertEqual(
+            [[0, 1, 2]],
+            affinity.numaNodes([0, 1, 2], missing, missing)
+        )
+
+    #===========================================================================
+
+    def testPartitionNodes(self):
+        """Tests that each slot keeps to a node, with whole cores"""
+        nodes = affinity.numaNodes(range(8), self.sysNodes, self.sysCpus)
+
+        self.assertEqual(
+            [[0, 4], [1, 5], [2, 6], [3, 7]],
+            affinity.partition(4, 0, range(8), nodes)
+        )
+
+    #===========================================================================
+
+    def testPartitionLeftovers(self):
+        """Tests that slots too big for a node are made from what's left"""
+        nodes = [[0, 1, 2], [3, 4, 5]]
+
+        self.assertEqual(
+            [[0, 1], [3, 4], [2, 5]],
+            affinity.partition(3, 2, range(6), nodes)
+        )
+
+    #===========================================================================
+
+    def testPartitionShort(self):
+        """Tests that only as many slots as fit are made"""
+        self.assertEqual(
+            [[0, 1, 2], [3, 4, 5]],
+            affinity.partition(4, 3, range(7))
+        )
+
+#===============================================================================
+
+class TestCpuSlots(unittest.TestCase):
+    """Tests handing out slots between threads and processes"""
+
+    #===========================================================================
+    # SETUP & TEARDOWN
+    #===========================================================================
+
+    def setUp(self):
+        # Suppress stdout
+        self.held = sys.stdout
+        sys.stdout = StringIO()
+
+        self.lockDir = tempfile.mkdtemp()
+        self.waitSeconds = affinity.WAIT_SECONDS
+        affinity.WAIT_SECONDS = 0.05
+
+    #===========================================================================
+
+    def tearDown(self):
+        affinity.WAIT_SECONDS = self.waitSeconds
+        shutil.rmtree(self.lockDir)
+
+        # Restore stdout
+        sys.stdout = self.held
+
+    #===========================================================================
+    # PRIVATE METHODS
+    #===========================================================================
+
+    def _slots(self, slots=2, cores=2):
+        """Returns CpuSlots over 4 stand in cores, locked in lockDir"""
+        return affinity.CpuSlots(
+            slots, cores, pin=False, lockDir=self.lockDir, cpus=range(4),
+            nodes=[range(4)]
+        )
+
+    #===========================================================================
+    # TESTS
+    #===========================================================================
+
+    def testSlots(self):
+        """Tests that each slot gets its own cores, with a thread per core"""
+        slots = self._slots()
+
+        self.assertEqual(
+            [([0, 1], 2), ([2, 3], 2)],
+            [(slot.cpus, slot.threads) for slot in slots.slots]
+        )
+
+    #===========================================================================
+
+    def testBlocking(self):
+        """Tests that an encode waits for a free slot"""
+        slots = self._slots()
+        first = slots.acquire()
+        second = slots.acquire()
+
+        taken = []
+        waiting = threading.Thread(
+            target=lambda: taken.append(slots.acquire())
+        )
+        waiting.start()
+        time.sleep(0.2)
+
+        self.assertEqual(
+            ([], 2),
+            (taken, slots.busy())
+        )
+
+        slots.release(second)
+        waiting.join(5)
+
+        self.assertEqual(
+            [second],
+            taken
+        )
+
+        slots.release(first)
+        slots.release(second)
+
+        self.assertEqual(
+            0,
+            slots.busy()
+        )
+
+    #===========================================================================
+
+    def testProcesses(self):
+        """Tests that slots another process holds aren't handed out"""
+        if not affinity.fcntl:
+            return
+
+        other = self._slots()
+        held = other.acquire()
+
+        slots = self._slots()
+        slot = slots.acquire()
+
+        self.assertNotEqual(
+            held.cpus,
+            slot.cpus
+        )
+
+        taken = []
+        waiting = threading.Thread(
+            target=lambda: taken.append(slots.acquire())
+        )
+        waiting.start()
+        time.sleep(0.2)
+
+        self.assertEqual(
+            [],
+            taken
+        )
+
+        # Nothing tells us the other process let go, it's found by checking.
+        other.release(held)
+        waiting.join(5)
+
+        self.assertEqual(
+            [held.cpus],
+            [taken[0].cpus]
+        )
+
+        slots.release(slot)
+        slots.release(taken[0])
+
+    #===========================================================================
+
+    def testFps(self):
+        """Tests the frames a second of every slot together"""
+        slots = self._slots()
+
+        first = EncodeProgress()
+        first.update(
+            'Encoding: task 1 of 1, 50.00 % (100.00 fps, avg 100.00 fps, '
+            'ETA 00h01m00s)'
+        )
+        second = EncodeProgress()
+        second.update(
+            'Encoding: task 1 of 1, 50.00 % (60.00 fps, avg 80.00 fps, '
+            'ETA 00h01m00s)'
+        )
+
+        a = slots.acquire(first)
+        b = slots.acquire(second)
+
+        self.assertEqual(
+            160.0,
+            slots.fps()
+        )
+
+        # Both ran at their average for 2 seconds, of 2 seconds with any
+        # encode running.
+        a.acquired = b.acquired = slots._activeSince = time.time() - 2
+        slots.release(a)
+        slots.release(b)
+
+        self.assertAlmostEqual(
+            180.0,
+            slots.averageFps(),
+            delta=5
+        )
+
+    #===========================================================================
+
+    def testPin(self):
+        """Tests that pin() moves a running child to the slot's cores"""
+        cpus = affinity.allowedCpus()
+        pin = affinity.pinner(cpus[:1])
+        if not pin or not os.path.exists('/proc/self/status'):
+            return
+
+        # The child waits to be pinned before it reads its status.
+        process = subprocess.Popen(
+            ['sh', '-c', 'read go; cat /proc/self/status'],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE
+        )
+        pin(process.pid)
+        status = process.communicate('\n')[0]
+
+        self.assertIn(
+            'Cpus_allowed_list:\t{0}\n'.format(cpus[0]),
+            status
+        )
+
+#===============================================================================
+# FUNCTIONS
+#===============================================================================
+
+if __name__ == '__main__':
+    unittest.main()
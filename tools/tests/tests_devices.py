@@ -0,0 +1,149 @@
+#/usr/bin/python
+# Ripmaster Devices Tests
+# Tests for limiting disk bound tool runs per disk
+"""
+Tests for all of the classes and functions inside of Ripmaster's
+tools.devices module.
+"""
+
+#===============================================================================
+# IMPORTS
+#===============================================================================
+
+# Standard Imports
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import unittest
+
+sys.path.append('/'.join(os.path.realpath(__file__).split('/')[:-3]))
+
+# Ripmaster Imports
+from tools import devices
+
+#===============================================================================
+# CLASSES
+#===============================================================================
+
+class TestDeviceOf(unittest.TestCase):
+    """Tests finding the device a file is on"""
+
+    #===========================================================================
+    # SETUP & TEARDOWN
+    #===========================================================================
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+
+    #===========================================================================
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    #===========================================================================
+    # TESTS
+    #===========================================================================
+
+    def testMissing(self):
+        """Tests that a file not written yet is on its folder's device"""
+        self.assertEqual(
+            os.stat(self.root).st_dev,
+            devices.deviceOf(os.path.join(self.root, 'Up', 'Up.mkv'))
+        )
+
+#===============================================================================
+
+class TestDeviceLimits(unittest.TestCase):
+    """Tests that runs wait on busy devices, and only busy devices"""
+
+    #===========================================================================
+    # SETUP & TEARDOWN
+    #===========================================================================
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.source = os.path.join(self.root, 'Up.mkv')
+        self.dest = os.path.join(self.root, 'Up--merged.mkv')
+
+        self.limits = devices.DeviceLimits(1)
+
+    #===========================================================================
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    #===========================================================================
+    # PRIVATE METHODS
+    #===========================================================================
+
+    def _waits(self, resource, paths):
+        """Checks if a run on the paths waits while the source is held"""
+        started = threading.Event()
+
+        def run():
+            with self.limits.hold(resource, paths):
+                started.set()
+
+        with self.limits.hold(devices.IO, [self.source, self.dest]):
+            thread = threading.Thread(target=run)
+            thread.start()
+            waited = not started.wait(0.2)
+
+        thread.join(5)
+        return waited
+
+    #===========================================================================
+    # TESTS
+    #===========================================================================
+
+    def testSameDevice(self):
+        """Tests that two IO runs on one device take turns"""
+        self.assertTrue(
+            self._waits(devices.IO, [self.source])
+        )
+
+        self.assertEqual(
+            {},
+            self.limits.running()
+        )
+
+    #===========================================================================
+
+    def testCpu(self):
+        """Tests that CPU runs don't wait on the disk"""
+        self.assertFalse(
+            self._waits(devices.CPU, [self.source])
+        )
+
+    #===========================================================================
+
+    def testOtherDevice(self):
+        """Tests that runs on a different device don't wait"""
+        # Stands in for a second disk, as the paths' devices are all that's
+        # compared.
+        device = devices.deviceOf(self.root)
+        self.limits._running[device + 1] = 1
+
+        self.assertEqual(
+            [device],
+            self.limits.acquire([self.source])
+        )
+
+    #===========================================================================
+
+    def testUnlimited(self):
+        """Tests that a perDevice of 0 doesn't limit runs"""
+        self.limits.perDevice = 0
+
+        self.assertFalse(
+            self._waits(devices.IO, [self.source])
+        )
+
+#===============================================================================
+# FUNCTIONS
+#===============================================================================
+
+if __name__ == '__main__':
+    unittest.main()
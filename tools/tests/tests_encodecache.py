@@ -0,0 +1,229 @@
+#/usr/bin/python
+# Ripmaster Encode Cache Tests
+# Tests for reusing finished encodes of the same source
+"""
+Tests for all of the classes and functions inside of Ripmaster's
+tools.encodecache module.
+
+REQUIREMENTS:
+
+mock
+"""
+
+#===============================================================================
+# IMPORTS
+#===============================================================================
+
+# Standard Imports
+import errno
+import mock
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.append('/'.join(os.path.realpath(__file__).split('/')[:-3]))
+
+# Ripmaster Imports
+from tools import encodecache
+
+#===============================================================================
+# CLASSES
+#===============================================================================
+
+class TestFingerprint(unittest.TestCase):
+    """Tests fingerprinting sources from their samples"""
+
+    #===========================================================================
+    # SETUP & TEARDOWN
+    #===========================================================================
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+
+    #===========================================================================
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    #===========================================================================
+    # PRIVATE METHODS
+    #===========================================================================
+
+    def _write(self, name, data):
+        """Writes a file to the temp folder, returning its path"""
+        path = os.path.join(self.root, name)
+        with open(path, 'wb') as f:
+            f.write(data)
+        return path
+
+    #===========================================================================
+    # TESTS
+    #===========================================================================
+
+    def testSamples(self):
+        """Tests that only the start, middle and end are fingerprinted"""
+        data = ''.join([chr(i % 251) for i in xrange(1000)])
+        first = self._write('first.mkv', data)
+        # Changed between the samples
+        second = self._write('second.mkv', data[:150] + 'x' + data[151:])
+        # Changed in the middle sample
+        third = self._write('third.mkv', data[:500] + 'x' + data[501:])
+
+        self.assertEqual(
+            (True, False),
+            (encodecache.fingerprint(first, 100) ==
+             encodecache.fingerprint(second, 100),
+             encodecache.fingerprint(first, 100) ==
+             encodecache.fingerprint(third, 100))
+        )
+
+        self.assertTrue(
+            encodecache.fingerprint(first, 100).startswith('1000:')
+        )
+
+    #===========================================================================
+
+    def testSmall(self):
+        """Tests that a source smaller than the samples is hashed whole"""
+        data = 'a' * 250
+        first = self._write('first.mkv', data)
+        second = self._write('second.mkv', data[:150] + 'b' + data[151:])
+
+        self.assertNotEqual(
+            encodecache.fingerprint(first, 100),
+            encodecache.fingerprint(second, 100)
+        )
+
+#===============================================================================
+
+class TestEncodeCache(unittest.TestCase):
+    """Tests storing, reusing and evicting encodes"""
+
+    #===========================================================================
+    # SETUP & TEARDOWN
+    #===========================================================================
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.cache = encodecache.EncodeCache(
+            os.path.join(self.root, 'encodes'), 100
+        )
+
+    #===========================================================================
+
+    def tearDown(self):
+        self.cache.close()
+        shutil.rmtree(self.root)
+
+    #===========================================================================
+    # PRIVATE METHODS
+    #===========================================================================
+
+    def _encode(self, name, size):
+        """Writes an encode of the given size, returning its path"""
+        path = os.path.join(self.root, name)
+        with open(path, 'wb') as f:
+            f.write(name[0] * size)
+        return path
+
+    #===========================================================================
+    # TESTS
+    #===========================================================================
+
+    def testReuse(self):
+        """Tests that a stored encode is put back in place of a new one"""
+        source = self._encode('Up.mkv', 40)
+        dest = self._encode('Up Again.mkv', 10)
+
+        self.assertEqual(
+            (False, True, True),
+            (self.cache.get('up', dest), self.cache.put('up', source),
+             self.cache.get('up', dest))
+        )
+
+        with open(dest, 'rb') as f:
+            self.assertEqual(
+                'U' * 40,
+                f.read()
+            )
+
+        # On one filesystem, both share the same blocks.
+        self.assertEqual(
+            os.stat(source).st_ino,
+            os.stat(dest).st_ino
+        )
+
+    #===========================================================================
+
+    def testEvict(self):
+        """Tests that the least recently used encodes are evicted past max"""
+        dest = os.path.join(self.root, 'dest.mkv')
+        self.cache.put('alien', self._encode('Alien.mkv', 40))
+        self.cache.put('brazil', self._encode('Brazil.mkv', 40))
+        self.cache.get('alien', dest)
+        self.cache.put('casablanca', self._encode('Casablanca.mkv', 40))
+
+        self.assertEqual(
+            (2, 80, True, False, True),
+            (len(self.cache), self.cache.size(),
+             self.cache.get('alien', dest), self.cache.get('brazil', dest),
+             self.cache.get('casablanca', dest))
+        )
+
+        # Larger than the whole cache
+        self.assertEqual(
+            (False, 2),
+            (self.cache.put('dune', self._encode('Dune.mkv', 101)),
+             len(self.cache))
+        )
+
+    #===========================================================================
+
+    def testMissing(self):
+        """Tests that an encode removed from the folder is forgotten"""
+        self.cache.put('up', self._encode('Up.mkv', 40))
+        os.remove(os.path.join(self.cache.folder, 'up.mkv'))
+
+        self.assertEqual(
+            (False, 0),
+            (self.cache.get('up', os.path.join(self.root, 'dest.mkv')),
+             len(self.cache))
+        )
+
+#===============================================================================
+
+class TestLinkFile(unittest.TestCase):
+    """Tests linking, or failing that copying, a file"""
+
+    #===========================================================================
+    # TESTS
+    #===========================================================================
+
+    def testCopy(self):
+        """Tests that a file is copied where it can't be linked"""
+        root = tempfile.mkdtemp()
+        source = os.path.join(root, 'Up.mkv')
+        dest = os.path.join(root, 'Up Copy.mkv')
+        with open(source, 'wb') as f:
+            f.write('Up')
+
+        crossDevice = OSError(errno.EXDEV, 'Invalid cross-device link')
+        with mock.patch.object(os, 'link', side_effect=crossDevice):
+            how = encodecache.linkFile(source, dest)
+
+        with open(dest, 'rb') as f:
+            self.assertEqual(
+                ('Up', True),
+                (f.read(), how in ['reflink', 'copy'])
+            )
+
+        shutil.rmtree(root)
+
+#===============================================================================
+# FUNCTIONS
+#===============================================================================
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+#/usr/bin/python
+# Ripmaster Estimate Tests
+# Tests for estimating encodes from samples
+"""
+Tests for all of the classes and functions inside of Ripmaster's
+tools.estimate module.
+"""
+
+#===============================================================================
+# IMPORTS
+#===============================================================================
+
+# Standard Imports
+import os
+import sys
+import unittest
+
+sys.path.append('/'.join(os.path.realpath(__file__).split('/')[:-3]))
+
+# Ripmaster Imports
+from tools import estimate
+
+#===============================================================================
+# CLASSES
+#===============================================================================
+
+class TestSampleWindows(unittest.TestCase):
+    """Tests choosing the ranges of a movie to sample"""
+
+    #===========================================================================
+    # TESTS
+    #===========================================================================
+
+    def testSpread(self):
+        """Tests that samples are centered at even spacings"""
+        self.assertEqual(
+            [(985.0, 30.0), (1985.0, 30.0), (2985.0, 30.0)],
+            estimate.sampleWindows(4000, 3, 30)
+        )
+
+    #===========================================================================
+
+    def testShort(self):
+        """Tests that a movie too short for the samples is sampled whole"""
+        self.assertEqual(
+            [(0.0, 80.0)],
+            estimate.sampleWindows(80, 3, 30)
+        )
+
+    #===========================================================================
+
+    def testUnknown(self):
+        """Tests that a movie without a duration isn't sampled"""
+        self.assertEqual(
+            [],
+            estimate.sampleWindows(None, 3, 30)
+        )
+
+#===============================================================================
+
+class TestExtrapolate(unittest.TestCase):
+    """Tests scaling samples up to the whole movie"""
+
+    #===========================================================================
+    # TESTS
+    #===========================================================================
+
+    def testEstimate(self):
+        """Tests that samples are pooled, then scaled by the duration"""
+        # 60 seconds of movie, encoded in 30 seconds, to 750000 bytes
+        result = estimate.extrapolate(
+            6000, [(30, 10.0, 250000), (30, 20.0, 500000)]
+        )
+
+        self.assertEqual(
+            (3000.0, 75000000, 2.0, 100000.0),
+            (result.seconds, result.size, result.speed, result.bitrate)
+        )
+
+    #===========================================================================
+
+    def testNothing(self):
+        """Tests that no samples give no estimate"""
+        self.assertEqual(
+            None,
+            estimate.extrapolate(6000, [])
+        )
+
+#===============================================================================
+# FUNCTIONS
+#===============================================================================
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,248 @@
+#/usr/bin/python
+# Ripmaster History Tests
+# Tests for the stage history and the throughput model fit from it
+"""
+Tests for all of the classes and functions inside of Ripmaster's
+tools.history module.
+"""
+
+#===============================================================================
+# IMPORTS
+#===============================================================================
+
+# Standard Imports
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.append('/'.join(os.path.realpath(__file__).split('/')[:-3]))
+
+# Ripmaster Imports
+from tools import history
+
+#===============================================================================
+# CLASSES
+#===============================================================================
+
+class TestHistoryStore(unittest.TestCase):
+    """Tests recording stages and reading them back"""
+
+    #===========================================================================
+    # SETUP & TEARDOWN
+    #===========================================================================
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.store = history.HistoryStore(
+            os.path.join(self.root, 'history.db')
+        )
+
+    #===========================================================================
+
+    def tearDown(self):
+        self.store.close()
+        shutil.rmtree(self.root)
+
+    #===========================================================================
+    # TESTS
+    #===========================================================================
+
+    def testRecords(self):
+        """Tests that records come back as they went in, oldest first"""
+        encode = _encode(1000.0, 1500.0, bitrate=20000000.0, tv=True)
+        encode['started'] = 2.0
+        merge = {
+            'stage': 'merge', 'path': '/Up.mkv', 'started': 1.0,
+            'seconds': 60.0, 'sourceSize': 30000000000
+        }
+        self.store.record(encode)
+        self.store.record(merge)
+
+        records = self.store.records()
+
+        self.assertEqual(
+            (2, 'merge', 30000000000, None),
+            (len(self.store), records[0]['stage'], records[0]['sourceSize'],
+             records[0]['tv'])
+        )
+
+        self.assertEqual(
+            [dict([(key, encode.get(key)) for key, column in history.FIELDS])],
+            self.store.records('encode')
+        )
+
+#===============================================================================
+
+class TestThroughputModel(unittest.TestCase):
+    """Tests predicting stages from the stages before them"""
+
+    #===========================================================================
+    # TESTS
+    #===========================================================================
+
+    def testCohort(self):
+        """Tests that encodes are predicted from encodes with their settings"""
+        model = history.ThroughputModel(
+            [_encode(1000.0, 1000.0) for i in xrange(3)] +
+            [_encode(1000.0, 4000.0, preset='animation') for i in xrange(3)]
+        )
+
+        self.assertEqual(
+            (2000.0, 8000.0),
+            (model.predict(_encode(2000.0)),
+             model.predict(_encode(2000.0, preset='animation')))
+        )
+
+    #===========================================================================
+
+    def testFallback(self):
+        """Tests that a cohort without enough history uses coarser ones"""
+        model = history.ThroughputModel(
+            [_encode(1000.0, 1000.0) for i in xrange(2)] +
+            [_encode(1000.0, 3000.0, resolution=720) for i in xrange(3)]
+        )
+
+        # Two 1080 encodes aren't enough on their own, and the 720 encodes
+        # aren't the same resolution, so every encode is pooled.
+        self.assertEqual(
+            4400.0,
+            model.predict(_encode(2000.0, tv=True))
+        )
+
+        self.assertEqual(
+            (3000.0, None),
+            (model.predict(_encode(1000.0, resolution=720, tv=True)),
+             model.expectedRate(_encode(1000.0, tv=True)))
+        )
+
+    #===========================================================================
+
+    def testBitrate(self):
+        """Tests that busier sources are predicted to take longer"""
+        model = history.ThroughputModel([
+            _encode(1000.0, seconds, bitrate=bitrate) for bitrate, seconds in
+            [(10.0, 1000.0), (20.0, 2000.0), (30.0, 3000.0)]
+        ])
+
+        self.assertAlmostEqual(
+            2500.0,
+            model.predict(_encode(1000.0, bitrate=25.0))
+        )
+
+    #===========================================================================
+
+    def testSizes(self):
+        """Tests that other stages are predicted from the bytes they read"""
+        model = history.ThroughputModel([
+            {'stage': 'merge', 'seconds': 100.0, 'sourceSize': 1000},
+            {'stage': 'merge', 'seconds': 300.0, 'sourceSize': 1000},
+        ])
+
+        self.assertEqual(
+            (800.0, 200.0, None),
+            (model.predict({'stage': 'merge', 'sourceSize': 4000}),
+             model.predict({'stage': 'merge'}),
+             model.predict({'stage': 'extract', 'sourceSize': 4000}))
+        )
+
+    #===========================================================================
+
+    def testSlow(self):
+        """Tests that an encode well behind its cohort is slow"""
+        model = history.ThroughputModel(
+            [_encode(1000.0, 1000.0) for i in xrange(3)]
+        )
+
+        self.assertEqual(
+            (0.4, None, None),
+            (model.slow(_encode(1000.0), 0.4),
+             model.slow(_encode(1000.0), 0.9),
+             model.slow(_encode(1000.0, preset='film'), 0.1))
+        )
+
+#===============================================================================
+
+class TestForecast(unittest.TestCase):
+    """Tests predicting when each movie in a queue finishes"""
+
+    #===========================================================================
+    # SETUP & TEARDOWN
+    #===========================================================================
+
+    def setUp(self):
+        self.model = history.ThroughputModel(
+            [_encode(1000.0, 1000.0) for i in xrange(3)] + [
+                {'stage': 'extract', 'seconds': 100.0},
+                {'stage': 'merge', 'seconds': 50.0},
+            ]
+        )
+
+    #===========================================================================
+    # PRIVATE METHODS
+    #===========================================================================
+
+    def _job(self, duration):
+        """Returns every stage of a movie of the given length"""
+        return [
+            {'stage': 'extract'}, {'stage': 'convert'}, _encode(duration),
+            {'stage': 'merge'}
+        ]
+
+    #===========================================================================
+    # TESTS
+    #===========================================================================
+
+    def testQueue(self):
+        """Tests that encodes queue for an encoder, and merges follow them"""
+        jobs = [self._job(1000.0), self._job(2000.0), self._job(500.0)]
+
+        # convert has no history, so nothing can be told for certain.
+        self.assertEqual(
+            [None, None, None],
+            history.forecast(jobs, self.model)
+        )
+
+        self.model.add({'stage': 'convert', 'seconds': 10.0})
+
+        self.assertEqual(
+            [1050.0, 3050.0, 3550.0],
+            history.forecast(jobs, self.model)
+        )
+
+        self.assertEqual(
+            [1050.0, 2050.0, 1550.0],
+            history.forecast(jobs, self.model, encoders=2)
+        )
+
+    #===========================================================================
+
+    def testEncoded(self):
+        """Tests that a movie already encoded only waits on its merge"""
+        jobs = [self._job(1000.0), [{'stage': 'merge'}]]
+
+        self.assertEqual(
+            [None, 50.0],
+            history.forecast(jobs, self.model)
+        )
+
+#===============================================================================
+# FUNCTIONS
+#===============================================================================
+
+def _encode(duration, seconds=None, **settings):
+    """Returns an encode record of a 1080p movie at the slow x264 speed"""
+    record = {
+        'stage': 'encode', 'path': '/Up.mkv', 'started': 0.0,
+        'seconds': seconds, 'duration': duration, 'resolution': 1080,
+        'x264Speed': 'slow', 'preset': None, 'tv': False, 'fps': None,
+        'bitrate': None,
+    }
+    record.update(settings)
+    return record
+
+#===============================================================================
+
+if __name__ == '__main__':
+    unittest.main()
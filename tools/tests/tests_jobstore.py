@@ -0,0 +1,228 @@
+#/usr/bin/python
+# Ripmaster Job Store Tests
+# Tests for the Ripmaster movie progress store
+"""
+Tests for all of the classes and functions inside of Ripmaster's
+tools.jobstore module.
+
+REQUIREMENTS:
+
+mock
+"""
+
+#===============================================================================
+# IMPORTS
+#===============================================================================
+
+# Standard Imports
+import cPickle
+import os
+import shutil
+from StringIO import StringIO
+import sys
+import tempfile
+import unittest
+
+sys.path.append('/'.join(os.path.realpath(__file__).split('/')[:-3]))
+
+# Ripmaster Imports
+from tools import jobstore
+from tests_tools import _buildMovie, MKVINFO_UP_PGS_JSON
+
+#===============================================================================
+# CLASSES
+#===============================================================================
+
+class TestJobStore(unittest.TestCase):
+    """Tests storing movies and their progress"""
+
+    #===========================================================================
+    # SETUP & TEARDOWN
+    #===========================================================================
+
+    def setUp(self):
+
+        # Suppress stdout
+        self.held = sys.stdout
+        sys.stdout = StringIO()
+
+        self.root = tempfile.mkdtemp()
+        self.store = jobstore.JobStore(os.path.join(self.root, 'jobs.db'))
+
+        self.movies = []
+        for title in ['Up', 'Cars', 'Brave']:
+            subdir = title + '__1080'
+            os.mkdir(os.path.join(self.root, subdir))
+            self.movies.append(
+                _buildMovie(
+                    self.root, subdir, title + '.mkv', MKVINFO_UP_PGS_JSON
+                )
+            )
+
+    #===========================================================================
+
+    def tearDown(self):
+        self.store.close()
+        shutil.rmtree(self.root)
+
+        # Restore stdout
+        sys.stdout = self.held
+
+    #===========================================================================
+    # TESTS
+    #===========================================================================
+
+    def testRoundTrip(self):
+        """Tests that stored movies come back in the order they were added"""
+        self.store.add(self.movies)
+
+        self.assertEqual(
+            [movie.path for movie in self.movies],
+            [movie.path for movie in self.store.movies()]
+        )
+
+        self.assertEqual(
+            set([movie.path for movie in self.movies]),
+            self.store.paths()
+        )
+
+    #===========================================================================
+
+    def testSave(self):
+        """Tests that a checkpoint updates the movie, keeping its place"""
+        self.store.add(self.movies)
+
+        self.movies[0].extracted = True
+        self.movies[0].subtitleTracks[0].extracted = True
+        self.store.save(self.movies[0])
+
+        movies = self.store.movies()
+
+        self.assertEqual(
+            [True, False, False],
+            [movie.extracted for movie in movies]
+        )
+
+        self.assertTrue(
+            movies[0].subtitleTracks[0].extracted
+        )
+
+    #===========================================================================
+
+    def testNonAscii(self):
+        """Tests storing a movie in a folder with an accented name"""
+        subdir = 'Am\xc3\xa9lie__1080'
+        os.mkdir(os.path.join(self.root, subdir))
+        movie = _buildMovie(
+            self.root, subdir, 'Am\xc3\xa9lie.mkv', MKVINFO_UP_PGS_JSON
+        )
+
+        self.store.add([movie])
+        movie.extracted = True
+        self.store.save(movie)
+
+        self.assertEqual(
+            set([movie.path]),
+            self.store.paths()
+        )
+
+        self.assertEqual(
+            [(movie.path, True)],
+            [(stored.path, stored.extracted) for stored in self.store.movies()]
+        )
+
+    #===========================================================================
+
+    def testPersists(self):
+        """Tests that saved progress is there after reopening the store"""
+        self.store.add(self.movies)
+        self.movies[1].encoded = True
+        self.store.save(self.movies[1])
+        self.store.close()
+
+        self.store = jobstore.JobStore(self.store.path)
+
+        self.assertEqual(
+            [False, True, False],
+            [movie.encoded for movie in self.store.movies()]
+        )
+
+    #===========================================================================
+
+    def testPending(self):
+        """Tests that merged movies aren't pending"""
+        self.store.add(self.movies)
+        self.movies[1].merged = True
+        self.store.save(self.movies[1])
+
+        self.assertEqual(
+            [self.movies[0].path, self.movies[2].path],
+            [movie.path for movie in self.store.pending()]
+        )
+
+    #===========================================================================
+
+    def testTracks(self):
+        """Tests that every audio and subtitle track has a record"""
+        movie = self.movies[0]
+        movie.subtitleTracks[0].converted = True
+        self.store.save(movie)
+
+        rows = self.store._db.execute(
+            'SELECT track_id, type, converted FROM tracks WHERE movie = ? '
+            'ORDER BY type, track_id',
+            (movie.path,)
+        ).fetchall()
+
+        self.assertEqual(
+            len(movie.audioTracks) + len(movie.subtitleTracks),
+            len(rows)
+        )
+
+        subtitles = [row for row in rows if row[1] == 'subtitles']
+        self.assertEqual(
+            (str(movie.subtitleTracks[0].trackID), 1),
+            (subtitles[0][0], subtitles[0][2])
+        )
+
+    #===========================================================================
+
+    def testImportPickle(self):
+        """Tests importing the movie list older versions pickled"""
+        pickleFile = os.path.join(self.root, 'movies.p')
+        with open(pickleFile, 'wb') as f:
+            cPickle.dump(self.movies, f)
+
+        self.assertEqual(
+            3,
+            self.store.importPickle(pickleFile)
+        )
+
+        self.assertEqual(
+            [movie.path for movie in self.movies],
+            [movie.path for movie in self.store.movies()]
+        )
+
+    #===========================================================================
+
+    def testImportTruncated(self):
+        """Tests that a cut short pickle raises, and imports nothing"""
+        pickleFile = os.path.join(self.root, 'movies.p')
+        with open(pickleFile, 'wb') as f:
+            pass
+
+        self.assertRaises(
+            EOFError,
+            self.store.importPickle,
+            pickleFile
+        )
+
+        self.assertEqual(
+            0,
+            len(self.store)
+        )
+
+#===============================================================================
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,301 @@
+#/usr/bin/python
+# Ripmaster Lease Tests
+# Tests for the Ripmaster shared lease files
+"""
+Tests for all of the classes and functions inside of Ripmaster's tools.lease
+module.
+"""
+
+#===============================================================================
+# IMPORTS
+#===============================================================================
+
+# Standard Imports
+import multiprocessing
+import os
+import shutil
+from StringIO import StringIO
+import sys
+import tempfile
+import time
+import unittest
+
+sys.path.append('/'.join(os.path.realpath(__file__).split('/')[:-3]))
+
+# Ripmaster Imports
+from tools import lease
+
+#===============================================================================
+# GLOBALS
+#===============================================================================
+
+JOBS = ['Movie {0}__1080/Movie.mkv'.format(i) for i in xrange(40)]
+
+#===============================================================================
+# FUNCTIONS
+#===============================================================================
+
+def _worker(directory, claims):
+    """Claims and finishes jobs until none are left, logging each claim"""
+    leases = lease.LeaseManager(directory, ttl=5)
+    for key in JOBS:
+        if leases.acquire(key):
+            with open(claims, 'a') as f:
+                f.write(key + '\n')
+            leases.publish(key, key, done=True)
+            leases.release(key)
+    leases.close()
+
+#===============================================================================
+
+def _crash(directory, key):
+    """Takes a lease, then dies without releasing it"""
+    leases = lease.LeaseManager(directory, ttl=0.5)
+    leases.acquire(key)
+    os._exit(0)
+
+#===============================================================================
+# CLASSES
+#===============================================================================
+
+class TestLeaseManager(unittest.TestCase):
+    """Tests taking, keeping and losing leases"""
+
+    #===========================================================================
+    # SETUP & TEARDOWN
+    #===========================================================================
+
+    def setUp(self):
+
+        # Suppress stdout
+        self.held = sys.stdout
+        sys.stdout = StringIO()
+
+        self.root = tempfile.mkdtemp()
+        self.directory = os.path.join(self.root, '.leases')
+        self.managers = []
+
+    #===========================================================================
+
+    def tearDown(self):
+        for manager in self.managers:
+            manager.close()
+        shutil.rmtree(self.root)
+
+        # Restore stdout
+        sys.stdout = self.held
+
+    #===========================================================================
+    # PRIVATE METHODS
+    #===========================================================================
+
+    def _manager(self, ttl=60):
+        """Returns a LeaseManager on the shared lease folder"""
+        manager = lease.LeaseManager(self.directory, ttl=ttl)
+        self.managers.append(manager)
+        return manager
+
+    #===========================================================================
+
+    def _expire(self):
+        """Backdates every lease file, as if their holders died"""
+        past = time.time() - 3600
+        for fileName in os.listdir(self.directory):
+            if '.lease.' in fileName:
+                os.utime(os.path.join(self.directory, fileName), (past, past))
+
+    #===========================================================================
+    # TESTS
+    #===========================================================================
+
+    def testExclusive(self):
+        """Tests that only one worker gets a lease"""
+        first = self._manager()
+        second = self._manager()
+
+        self.assertEqual(
+            [True, False],
+            [first.acquire(JOBS[0]), second.acquire(JOBS[0])]
+        )
+
+        self.assertTrue(
+            second.acquire(JOBS[1])
+        )
+
+    #===========================================================================
+
+    def testRelease(self):
+        """Tests that a released lease can be taken by another worker"""
+        first = self._manager()
+        second = self._manager()
+        first.acquire(JOBS[0])
+        first.release(JOBS[0])
+
+        self.assertTrue(
+            second.acquire(JOBS[0])
+        )
+
+        self.assertFalse(
+            first.held(JOBS[0])
+        )
+
+    #===========================================================================
+
+    def testReleaseTombstone(self):
+        """Tests that a released lease is marked, and taken at a higher one"""
+        first = self._manager()
+        second = self._manager()
+        third = self._manager()
+        first.acquire(JOBS[0])
+        first.release(JOBS[0])
+
+        # The released generation stays, so nobody can start again from 0.
+        name = first._name(JOBS[0])
+        self.assertEqual(
+            ([0], lease.RELEASED),
+            (first._generations(name),
+             first._readToken(first._path(name, '.lease.0')))
+        )
+
+        self.assertEqual(
+            [True, False],
+            [second.acquire(JOBS[0]), third.acquire(JOBS[0])]
+        )
+
+        self.assertEqual(
+            [1],
+            second._generations(name)
+        )
+
+    #===========================================================================
+
+    def testTakeover(self):
+        """Tests that an expired lease is taken over, and lost by its holder"""
+        first = self._manager()
+        second = self._manager()
+        third = self._manager()
+        first.acquire(JOBS[0])
+        self._expire()
+
+        self.assertEqual(
+            [True, False],
+            [second.acquire(JOBS[0]), third.acquire(JOBS[0])]
+        )
+
+        # The old holder can't renew, or publish over the new holder.
+        self.assertEqual(
+            [False, False, False],
+            [first.held(JOBS[0]), first.renew(JOBS[0]),
+             first.publish(JOBS[0], 'stale')]
+        )
+
+        self.assertTrue(
+            second.publish(JOBS[0], 'fresh')
+        )
+
+        self.assertEqual(
+            'fresh',
+            third.load(JOBS[0])
+        )
+
+        # Only the new generation is left.
+        self.assertEqual(
+            1,
+            len([name for name in os.listdir(self.directory)
+                 if '.lease.' in name])
+        )
+
+    #===========================================================================
+
+    def testPublishDone(self):
+        """Tests that a job published as done is never leased again"""
+        first = self._manager()
+        second = self._manager()
+        first.acquire(JOBS[0])
+
+        self.assertEqual(
+            None,
+            second.load(JOBS[0])
+        )
+
+        first.publish(JOBS[0], {'merged': True}, done=True)
+        first.release(JOBS[0])
+
+        self.assertEqual(
+            [True, False, {'merged': True}],
+            [second.isDone(JOBS[0]), second.acquire(JOBS[0]),
+             second.load(JOBS[0])]
+        )
+
+        # Nothing is left half written.
+        self.assertEqual(
+            [],
+            [name for name in os.listdir(self.directory)
+             if name.endswith('.tmp')]
+        )
+
+    #===========================================================================
+
+    def testHeartbeat(self):
+        """Tests that a held lease is renewed so it doesn't expire"""
+        first = self._manager(ttl=0.4)
+        second = self._manager(ttl=0.4)
+        first.acquire(JOBS[0])
+
+        time.sleep(1)
+
+        self.assertEqual(
+            [True, False],
+            [first.held(JOBS[0]), second.acquire(JOBS[0])]
+        )
+
+    #===========================================================================
+
+    def testDeadWorker(self):
+        """Tests that the lease of a worker process that died is reclaimed"""
+        process = multiprocessing.Process(
+            target=_crash, args=(self.directory, JOBS[0])
+        )
+        process.start()
+        process.join()
+
+        manager = self._manager(ttl=0.5)
+
+        self.assertFalse(
+            manager.acquire(JOBS[0])
+        )
+
+        time.sleep(0.6)
+
+        self.assertTrue(
+            manager.acquire(JOBS[0])
+        )
+
+    #===========================================================================
+
+    def testWorkerProcesses(self):
+        """Tests that every job is claimed once by competing processes"""
+        claims = os.path.join(self.root, 'claims')
+        processes = [
+            multiprocessing.Process(
+                target=_worker, args=(self.directory, claims)
+            )
+            for i in xrange(4)
+        ]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+
+        with open(claims) as f:
+            claimed = f.read().split('\n')[:-1]
+
+        self.assertEqual(
+            sorted(JOBS),
+            sorted(claimed)
+        )
+
+#===============================================================================
+
+if __name__ == '__main__':
+    unittest.main()
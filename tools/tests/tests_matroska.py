@@ -0,0 +1,657 @@
+#/usr/bin/python
+# Ripmaster Matroska Tests
+# Tests for reading Matroska headers without mkvmerge
+"""
+Tests for all of the classes and functions inside of Ripmaster's
+tools.matroska module.
+"""
+
+#===============================================================================
+# IMPORTS
+#===============================================================================
+
+# Standard Imports
+import os
+import shutil
+import struct
+import sys
+import tempfile
+import unittest
+import zlib
+
+sys.path.append('/'.join(os.path.realpath(__file__).split('/')[:-3]))
+
+# Ripmaster Imports
+from tools import matroska
+
+#===============================================================================
+# GLOBALS
+#===============================================================================
+
+# The tracks of the movie _buildMkv writes, as mkvmerge lists them
+UP_TRACKS = [
+    (0, 'video', {
+        'number': '1', 'uid': '11', 'codec_id': 'V_MPEG4/ISO/AVC',
+        'default_track': '1', 'enabled_track': '1', 'forced_track': '0',
+        'language': 'eng', 'pixel_dimensions': '1920x1080',
+        'display_dimensions': '1920x1080',
+    }),
+    (1, 'audio', {
+        'number': '2', 'uid': '12', 'codec_id': 'A_TRUEHD',
+        'default_track': '0', 'enabled_track': '1', 'forced_track': '0',
+        'language': 'fre', 'codec_private_length': '3',
+        'audio_sampling_frequency': '48000', 'audio_channels': '6',
+    }),
+    (2, 'subtitles', {
+        'number': '3', 'uid': '13', 'codec_id': 'S_HDMV/PGS',
+        'default_track': '1', 'enabled_track': '1', 'forced_track': '1',
+        'language': 'eng', 'track_name': 'Forced',
+        'tag_number_of_bytes': '40000',
+    }),
+    # Track ID 3 is the menu buttons, which aren't listed.
+    (4, 'subtitles', {
+        'number': '5', 'uid': '15', 'codec_id': 'S_HDMV/PGS',
+        'default_track': '1', 'enabled_track': '1', 'forced_track': '0',
+        'language': 'eng',
+    }),
+]
+
+# Two PGS segments, a Presentation Composition and an End of Display Set
+SEGMENTS = '\x16\x00\x03abc' + '\x80\x00\x00'
+
+#===============================================================================
+# CLASSES
+#===============================================================================
+
+class TestMatroskaFile(unittest.TestCase):
+    """Tests reading the headers of a Matroska file"""
+
+    #===========================================================================
+    # SETUP & TEARDOWN
+    #===========================================================================
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.path = os.path.join(self.root, 'Up.mkv')
+
+    #===========================================================================
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    #===========================================================================
+    # TESTS
+    #===========================================================================
+
+    def testProbe(self):
+        """Tests that the tracks are listed as mkvmerge lists them"""
+        _buildMkv(self.path)
+
+        self.assertEqual(
+            (5767563000000, UP_TRACKS),
+            matroska.probe(self.path)
+        )
+
+    #===========================================================================
+
+    def testChapters(self):
+        """Tests that every edition's chapters are listed once, in order"""
+        _buildMkv(self.path)
+
+        self.assertEqual(
+            [0.0, 600.0, 1200.5],
+            matroska.chapters(self.path)
+        )
+
+    #===========================================================================
+
+    def testCues(self):
+        """Tests that cues point at the clusters holding each track"""
+        clusters = _buildMkv(self.path)
+
+        with matroska.MatroskaFile(self.path) as mkv:
+            cues = mkv.cues()
+
+        self.assertEqual(
+            [(0.0, 1, clusters[0]), (0.0, 3, clusters[0]),
+             (2.5, 1, clusters[1])],
+            cues
+        )
+
+        # Each points at a Cluster.
+        with open(self.path, 'rb') as f:
+            data = f.read()
+        self.assertEqual(
+            [matroska.CLUSTER] * 3,
+            [matroska.readElement(data, cluster, len(data))[0]
+             for time, track, cluster in cues]
+        )
+
+    #===========================================================================
+
+    def testNoSeekHead(self):
+        """Tests that elements after the Clusters are found by walking them"""
+        _buildMkv(self.path, seekHead=False)
+
+        with matroska.MatroskaFile(self.path) as mkv:
+            self.assertEqual(
+                (UP_TRACKS, [0.0, 600.0, 1200.5], 3),
+                (mkv.tracks(), mkv.chapters(), len(mkv.cues()))
+            )
+
+    #===========================================================================
+
+    def testUnknownSize(self):
+        """Tests that a Segment of unknown size runs to the end of the file"""
+        _buildMkv(self.path, segmentSize=None)
+
+        self.assertEqual(
+            (5767563000000, UP_TRACKS),
+            matroska.probe(self.path)
+        )
+
+    #===========================================================================
+
+    def testTruncated(self):
+        """Tests that a rip still being written has its headers read"""
+        _buildMkv(self.path)
+        with open(self.path, 'rb') as f:
+            data = f.read()
+        with open(self.path, 'wb') as f:
+            f.write(data[:len(data) // 2])
+
+        # The Cues, Chapters and Tags were to be written after the Clusters.
+        with matroska.MatroskaFile(self.path) as mkv:
+            self.assertEqual(
+                ([0, 1, 2, 4], [], []),
+                ([track[0] for track in mkv.tracks()], mkv.chapters(),
+                 mkv.cues())
+            )
+
+    #===========================================================================
+
+    def testNotMatroska(self):
+        """Tests that files that aren't Matroska raise ValueError"""
+        with open(self.path, 'wb') as f:
+            f.write('x' * 1000)
+        self.assertRaises(
+            ValueError,
+            matroska.probe,
+            self.path
+        )
+
+        with open(self.path, 'wb') as f:
+            f.write(element(matroska.EBML, [element(matroska.DOC_TYPE, 'avi')]))
+        self.assertRaises(
+            ValueError,
+            matroska.probe,
+            self.path
+        )
+
+        open(self.path, 'wb').close()
+        self.assertRaises(
+            ValueError,
+            matroska.probe,
+            self.path
+        )
+
+#===============================================================================
+
+class TestReadElement(unittest.TestCase):
+    """Tests reading element headers"""
+
+    #===========================================================================
+    # TESTS
+    #===========================================================================
+
+    def testSizes(self):
+        """Tests that IDs keep their marker and sizes lose it"""
+        self.assertEqual(
+            [(0x1A45DFA3, 5, 0x23), (0xEC, 3, 0x3FFF - 1), (0xAE, 2, None)],
+            [matroska.readElement('\x1A\x45\xDF\xA3\xA3', 0, 5),
+             matroska.readElement('\xEC\x7F\xFE', 0, 3),
+             matroska.readElement('\xAE\xFF', 0, 2)]
+        )
+
+    #===========================================================================
+
+    def testBad(self):
+        """Tests that headers that can't be read raise ValueError"""
+        for data in ['\x00\x81', '\x1A\x45', '\x08' + '\x00' * 8 + '\x81']:
+            self.assertRaises(
+                ValueError,
+                matroska.readElement,
+                data, 0, len(data)
+            )
+
+    #===========================================================================
+
+    def testEncode(self):
+        """Tests that encoded elements read back as they went in"""
+        data = element(matroska.TRACK_UID, 300)
+
+        self.assertEqual(
+            ((matroska.TRACK_UID, 10, 2), 300),
+            (matroska.readElement(data, 0, len(data)),
+             struct.unpack('>H', data[10:])[0])
+        )
+
+class TestExtractSubtitles(unittest.TestCase):
+    """Tests extracting PGS subtitles from the Clusters"""
+
+    #===========================================================================
+    # SETUP & TEARDOWN
+    #===========================================================================
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.path = os.path.join(self.root, 'Up.mkv')
+        self.sups = [
+            os.path.join(self.root, 'Up_{0}.sup'.format(i)) for i in xrange(3)
+        ]
+
+    #===========================================================================
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    #===========================================================================
+    # PRIVATE METHODS
+    #===========================================================================
+
+    def _read(self, path):
+        """Returns the contents of a file"""
+        with open(path, 'rb') as f:
+            return f.read()
+
+    #===========================================================================
+    # TESTS
+    #===========================================================================
+
+    def testExtract(self):
+        """Tests that every segment is written with its timestamp"""
+        _buildSubtitleMkv(self.path, _block(1, 0, 'video'))
+
+        self.assertEqual(
+            {1: 2, 2: 1, 3: 1},
+            matroska.extractSubtitles(self.path, zip([1, 2, 3], self.sups))
+        )
+
+        # 100ms is 9000 ticks of 90kHz, and 9950ms 895500.
+        self.assertEqual(
+            [_sup(9000, SEGMENTS) + _sup(895500, SEGMENTS),
+             _sup(18000, SEGMENTS),
+             _sup(895500, SEGMENTS)],
+            [self._read(sup) for sup in self.sups]
+        )
+
+    #===========================================================================
+
+    def testCuedOnly(self):
+        """Tests that only the Clusters the Cues give are read"""
+        _buildSubtitleMkv(self.path, element(matroska.SIMPLE_BLOCK, '\x00'))
+
+        self.assertEqual(
+            {1: 2},
+            matroska.extractSubtitles(self.path, [(1, self.sups[0])])
+        )
+
+        # Reading the Cluster between them would have failed.
+        with matroska.MatroskaFile(self.path) as mkv:
+            self.assertRaises(
+                ValueError,
+                list,
+                mkv.blocks([2])
+            )
+
+    #===========================================================================
+
+    def testUncued(self):
+        """Tests that blocks missing from the Cues are found by the tags"""
+        _buildSubtitleMkv(self.path, _block(2, 0, SEGMENTS), frames=3)
+
+        self.assertEqual(
+            ({1: 3}, _sup(9000, SEGMENTS) + _sup(450000, SEGMENTS) +
+             _sup(895500, SEGMENTS)),
+            (matroska.extractSubtitles(self.path, [(1, self.sups[0])]),
+             self._read(self.sups[0]))
+        )
+
+    #===========================================================================
+
+    def testFailure(self):
+        """Tests that tracks that can't be extracted leave no sups behind"""
+        _buildSubtitleMkv(
+            self.path, element(matroska.SIMPLE_BLOCK, '\x00'), frames=3
+        )
+
+        # The text track isn't PGS.
+        self.assertRaises(
+            ValueError,
+            matroska.extractSubtitles,
+            self.path, zip([1, 4], self.sups)
+        )
+        # The Cues are short a block, and the Cluster they miss is corrupt.
+        self.assertRaises(
+            ValueError,
+            matroska.extractSubtitles,
+            self.path, zip([1, 2], self.sups)
+        )
+
+        self.assertEqual(
+            [False] * 3,
+            [os.path.exists(sup) for sup in self.sups]
+        )
+
+#===============================================================================
+# FUNCTIONS
+#===============================================================================
+
+def _block(number, timecode, frame, elementId=matroska.SIMPLE_BLOCK):
+    """Encodes a SimpleBlock, or the Block of a BlockGroup"""
+    return element(
+        elementId,
+        chr(0x80 | number) + struct.pack('>hB', timecode, 0x80) + frame
+    )
+
+#===============================================================================
+
+def _sup(pts, segments):
+    """Returns the segments of a block as mkvextract writes them to a sup"""
+    sup = ''
+    offset = 0
+    while offset < len(segments):
+        size = struct.unpack('>H', segments[offset + 1:offset + 3])[0] + 3
+        sup += struct.pack('>2sII', 'PG', pts, 0)
+        sup += segments[offset:offset + size]
+        offset += size
+    return sup
+
+#===============================================================================
+
+def _buildMkv(path, seekHead=True, segmentSize=True):
+    """Writes the headers of a movie, around two Clusters of junk
+
+    Args:
+        path : (str)
+            The file to write.
+
+        seekHead=True : (bool)
+            If False, no SeekHead is written.
+
+        segmentSize=True : (bool)
+            If None, the Segment's size is written as unknown.
+
+    Returns:
+        [int]
+            The file offset of each Cluster.
+
+    """
+    def track(number, trackType, codec, *extra):
+        return element(matroska.TRACK_ENTRY, [
+            element(matroska.TRACK_NUMBER, number),
+            element(matroska.TRACK_UID, number + 10),
+            element(matroska.TRACK_TYPE, trackType),
+            element(matroska.CODEC_ID, codec),
+        ] + list(extra))
+
+    def atom(start):
+        return element(
+            matroska.CHAPTER_ATOM, [element(matroska.CHAPTER_TIME_START, start)]
+        )
+
+    def cue(time, *tracks):
+        return element(matroska.CUE_POINT, [
+            element(matroska.CUE_TIME, time)
+        ] + [
+            element(matroska.CUE_TRACK_POSITIONS, [
+                element(matroska.CUE_TRACK, number),
+                # Written at a fixed size, so the Cues' size is known first
+                element(matroska.CUE_CLUSTER_POSITION, struct.pack('>Q', pos))
+            ]) for number, pos in tracks
+        ])
+
+    info = element(matroska.INFO, [
+        element(matroska.TIMECODE_SCALE, 1000000),
+        element(matroska.DURATION, 5767563.0),
+    ])
+    tracks = element(matroska.TRACKS, [
+        track(1, 1, 'V_MPEG4/ISO/AVC', element(matroska.VIDEO, [
+            element(matroska.PIXEL_WIDTH, 1920),
+            element(matroska.PIXEL_HEIGHT, 1080),
+        ])),
+        track(2, 2, 'A_TRUEHD',
+              element(matroska.FLAG_DEFAULT, 0),
+              element(matroska.LANGUAGE, 'fre\x00'),
+              element(matroska.CODEC_PRIVATE, 'abc'),
+              element(matroska.AUDIO, [
+                  element(matroska.SAMPLING_FREQUENCY, 48000.0),
+                  element(matroska.CHANNELS, 6),
+              ])),
+        track(3, 0x11, 'S_HDMV/PGS',
+              element(matroska.FLAG_FORCED, 1),
+              element(matroska.NAME, 'Forced')),
+        track(4, 0x12, 'B_VOBBTN'),
+        track(5, 0x11, 'S_HDMV/PGS'),
+    ])
+    clusters = [
+        element(matroska.CLUSTER, 'x' * 5000),
+        element(matroska.CLUSTER, 'y' * 3000),
+    ]
+    chapters = element(matroska.CHAPTERS, [
+        element(matroska.EDITION_ENTRY, [
+            atom(0), atom(600000000000), atom(1200500000000)
+        ]),
+        element(matroska.EDITION_ENTRY, [atom(600000000000)]),
+    ])
+    tags = element(matroska.TAGS, [
+        element(matroska.TAG, [
+            element(matroska.TARGETS, [element(matroska.TAG_TRACK_UID, 13)]),
+            element(matroska.SIMPLE_TAG, [
+                element(matroska.TAG_NAME, 'NUMBER_OF_BYTES'),
+                element(matroska.TAG_STRING, '40000'),
+            ]),
+            element(matroska.SIMPLE_TAG, [
+                element(matroska.TAG_NAME, 'ENCODER'),
+                element(matroska.TAG_STRING, 'Ripmaster'),
+            ]),
+        ]),
+    ])
+
+    def seek(elements):
+        entries = []
+        for elementId, position in elements:
+            entries.append(element(matroska.SEEK, [
+                element(matroska.SEEK_ID, struct.pack('>I', elementId)),
+                element(matroska.SEEK_POSITION, struct.pack('>Q', position)),
+            ]))
+        return element(matroska.SEEK_HEAD, entries)
+
+    # Everything but the SeekHead is the same size wherever it goes.
+    ids = [matroska.INFO, matroska.TRACKS, matroska.CUES, matroska.CHAPTERS,
+           matroska.TAGS]
+    head = seek([(elementId, 0) for elementId in ids]) if seekHead else ''
+    void = element(matroska.VOID, '\x00' * 10)
+
+    offset = len(head) + len(void)
+    positions = {matroska.INFO: offset}
+    offset += len(info)
+    positions[matroska.TRACKS] = offset
+    offset += len(tracks)
+    clusterPositions = []
+    for cluster in clusters:
+        clusterPositions.append(offset)
+        offset += len(cluster)
+    cues = element(matroska.CUES, [
+        cue(0, (1, clusterPositions[0]), (3, clusterPositions[0])),
+        cue(2500, (1, clusterPositions[1])),
+    ])
+    positions[matroska.CUES] = offset
+    offset += len(cues)
+    positions[matroska.CHAPTERS] = offset
+    offset += len(chapters)
+    positions[matroska.TAGS] = offset
+
+    if seekHead:
+        head = seek([(elementId, positions[elementId]) for elementId in ids])
+    segment = element(
+        matroska.SEGMENT,
+        [head, void, info, tracks] + clusters + [cues, chapters, tags]
+    )
+    if segmentSize is None:
+        # Sizes are written in 8 bytes, so the size is bytes 4 to 12.
+        segment = segment[:4] + '\x01' + '\xff' * 7 + segment[12:]
+
+    header = element(matroska.EBML, [element(matroska.DOC_TYPE, 'matroska')])
+    with open(path, 'wb') as f:
+        f.write(header + segment)
+
+    # Cluster positions are relative to the Segment's data.
+    segmentStart = len(header) + 12
+    return [segmentStart + position for position in clusterPositions]
+
+#===============================================================================
+
+def _buildSubtitleMkv(path, middle, frames=None):
+    """Writes a movie of three Clusters, with subtitles in the first and last
+
+    Args:
+        path : (str)
+            The file to write.
+
+        middle : (str)
+            The encoded blocks of the middle Cluster, which isn't cued.
+
+        frames=None : (int)
+            The number of frames the tags give track 2, if any.
+
+    Returns:
+        None
+
+    Track 2 is PGS, track 3 PGS compressed with zlib, track 4 PGS with its
+    first two bytes stripped, and track 5 text.
+
+    """
+    def track(number, trackType, codec, *extra):
+        return element(matroska.TRACK_ENTRY, [
+            element(matroska.TRACK_NUMBER, number),
+            element(matroska.TRACK_UID, number),
+            element(matroska.TRACK_TYPE, trackType),
+            element(matroska.CODEC_ID, codec),
+        ] + list(extra))
+
+    def compression(*settings):
+        return element(matroska.CONTENT_ENCODINGS, [
+            element(matroska.CONTENT_ENCODING, [
+                element(matroska.CONTENT_COMPRESSION, list(settings))
+            ])
+        ])
+
+    def cluster(timecode, *blocks):
+        return element(
+            matroska.CLUSTER,
+            [element(matroska.CLUSTER_TIMECODE, timecode)] + list(blocks)
+        )
+
+    info = element(matroska.INFO, [element(matroska.TIMECODE_SCALE, 1000000)])
+    tracks = element(matroska.TRACKS, [
+        track(1, 1, 'V_MPEG4/ISO/AVC'),
+        track(2, 0x11, matroska.PGS_CODEC),
+        track(3, 0x11, matroska.PGS_CODEC, compression()),
+        track(4, 0x11, matroska.PGS_CODEC, compression(
+            element(matroska.CONTENT_COMP_ALGO, matroska.HEADER_STRIPPING),
+            element(matroska.CONTENT_COMP_SETTINGS, SEGMENTS[:2]),
+        )),
+        track(5, 0x11, 'S_TEXT/UTF8'),
+    ])
+    clusters = [
+        cluster(
+            0,
+            _block(1, 0, 'video'),
+            _block(2, 100, SEGMENTS),
+            element(matroska.BLOCK_GROUP, [
+                _block(3, 200, zlib.compress(SEGMENTS), matroska.BLOCK),
+            ]),
+        ),
+        element(
+            matroska.CLUSTER,
+            [element(matroska.CLUSTER_TIMECODE, 5000), middle]
+        ),
+        cluster(
+            10000,
+            _block(2, -50, SEGMENTS),
+            _block(4, -50, SEGMENTS[2:]),
+            _block(5, -50, 'text'),
+        ),
+    ]
+    tags = element(matroska.TAGS, [
+        element(matroska.TAG, [
+            element(matroska.TARGETS, [element(matroska.TAG_TRACK_UID, 2)]),
+            element(matroska.SIMPLE_TAG, [
+                element(matroska.TAG_NAME, 'NUMBER_OF_FRAMES'),
+                element(matroska.TAG_STRING, str(frames)),
+            ]),
+        ]),
+    ] if frames else [])
+
+    offset = len(info) + len(tracks)
+    positions = []
+    for clusterData in clusters:
+        positions.append(offset)
+        offset += len(clusterData)
+
+    def cue(time, position, *numbers):
+        return element(matroska.CUE_POINT, [
+            element(matroska.CUE_TIME, time)
+        ] + [
+            element(matroska.CUE_TRACK_POSITIONS, [
+                element(matroska.CUE_TRACK, number),
+                element(matroska.CUE_CLUSTER_POSITION, position)
+            ]) for number in numbers
+        ])
+
+    cues = element(matroska.CUES, [
+        cue(0, positions[0], 1, 2, 3, 5),
+        cue(10000, positions[2], 2, 4, 5),
+    ])
+
+    header = element(matroska.EBML, [element(matroska.DOC_TYPE, 'matroska')])
+    with open(path, 'wb') as f:
+        f.write(header + element(
+            matroska.SEGMENT, [info, tracks] + clusters + [cues, tags]
+        ))
+
+#===============================================================================
+
+def element(elementId, data):
+    """Encodes a Matroska element. The reverse of matroska.readElement
+
+    Args:
+        elementId : (int)
+            The element's ID.
+
+        data : (str|int|float|[str])
+            The element's data. Integers are written as unsigned integers,
+            floats as 8 byte floats, and lists as the already encoded
+            children of a master element.
+
+    Returns:
+        (str)
+            The encoded element. Sizes are always written in 8 bytes.
+
+    """
+    if isinstance(data, list):
+        data = ''.join(data)
+    elif isinstance(data, float):
+        data = matroska.FLOATS[8].pack(data)
+    elif isinstance(data, (int, long)):
+        data = struct.pack('>Q', data).lstrip('\x00') or '\x00'
+
+    encodedId = '{0:x}'.format(elementId)
+    encodedId = ('0' * (len(encodedId) % 2) + encodedId).decode('hex')
+    return encodedId + '\x01' + struct.pack('>Q', len(data))[1:] + data
+
+#===============================================================================
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,275 @@
+#/usr/bin/python
+# Ripmaster Metrics Tests
+# Tests for measuring stages and tools for Prometheus
+"""
+Tests for all of the classes and functions inside of Ripmaster's
+tools.metrics module.
+"""
+
+#===============================================================================
+# IMPORTS
+#===============================================================================
+
+# Standard Imports
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import unittest
+import urllib2
+
+sys.path.append('/'.join(os.path.realpath(__file__).split('/')[:-3]))
+
+# Ripmaster Imports
+from tools import metrics
+
+#===============================================================================
+# CLASSES
+#===============================================================================
+
+class TestRegistry(unittest.TestCase):
+    """Tests counting and rendering metrics"""
+
+    #===========================================================================
+    # SETUP & TEARDOWN
+    #===========================================================================
+
+    def setUp(self):
+        self.registry = metrics.Registry()
+
+    #===========================================================================
+    # TESTS
+    #===========================================================================
+
+    def testRender(self):
+        """Tests the Prometheus text format, HELP and TYPE before samples"""
+        self.registry.inc('ripmaster_movies_completed_total')
+        self.registry.inc('ripmaster_movies_completed_total', 2)
+
+        self.assertEqual(
+            '# HELP ripmaster_movies_completed_total '
+            'Movies merged into their final mkv.\n'
+            '# TYPE ripmaster_movies_completed_total counter\n'
+            'ripmaster_movies_completed_total 3.0\n',
+            self.registry.render()
+        )
+
+    #===========================================================================
+
+    def testLabels(self):
+        """Tests that labels are sorted, kept apart and escaped"""
+        self.registry.inc('ripmaster_tool_runs_total', tool='mkvmerge')
+        self.registry.inc('ripmaster_tool_runs_total', tool='mkv"merge\\')
+
+        self.assertEqual(
+            ['ripmaster_tool_runs_total{tool="mkv\\"merge\\\\"} 1.0',
+             'ripmaster_tool_runs_total{tool="mkvmerge"} 1.0'],
+            self.registry.render().splitlines()[2:]
+        )
+
+    #===========================================================================
+
+    def testCollect(self):
+        """Tests that collectors are read on render, and bad ones skipped"""
+        depth = [3]
+        self.registry.collect(
+            lambda: [('ripmaster_queue_depth', {'stage': 'encode'}, depth[0])]
+        )
+        self.registry.collect(lambda: 1 / 0)
+
+        depth[0] = 5
+
+        self.assertEqual(
+            'ripmaster_queue_depth{stage="encode"} 5.0',
+            self.registry.render().splitlines()[-1]
+        )
+
+#===============================================================================
+
+class TestMeasurement(unittest.TestCase):
+    """Tests measuring stages and tools"""
+
+    #===========================================================================
+    # SETUP & TEARDOWN
+    #===========================================================================
+
+    def setUp(self):
+        self.registry = metrics.Registry()
+        self.dir = tempfile.mkdtemp()
+
+        self.source = os.path.join(self.dir, 'source.mkv')
+        with open(self.source, 'wb') as f:
+            f.write('x' * 1000)
+        self.dest = os.path.join(self.dir, 'dest.mkv')
+
+    #===========================================================================
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    #===========================================================================
+    # PRIVATE METHODS
+    #===========================================================================
+
+    def _samples(self):
+        """Returns the rendered samples, by name and labels"""
+        samples = {}
+        for line in self.registry.render().splitlines():
+            if not line.startswith('#'):
+                name, value = line.rsplit(' ', 1)
+                samples[name] = float(value)
+        return samples
+
+    def _write(self):
+        """Runs a stand in tool, reading source and writing dest"""
+        with metrics.tool(
+            'mkvmerge', [self.source], [self.dest], registry=self.registry
+        ):
+            with open(self.dest, 'wb') as f:
+                f.write('x' * 400)
+
+    #===========================================================================
+    # TESTS
+    #===========================================================================
+
+    def testToolBytes(self):
+        """Tests that a tool's bytes count towards the stage running it"""
+        stage = metrics.stage('merge', registry=self.registry)(self._write)
+        stage()
+
+        samples = self._samples()
+
+        self.assertEqual(
+            (1000, 400, 1000, 400, 1, 1),
+            (samples['ripmaster_tool_read_bytes_total{tool="mkvmerge"}'],
+             samples['ripmaster_tool_written_bytes_total{tool="mkvmerge"}'],
+             samples['ripmaster_stage_read_bytes_total{stage="merge"}'],
+             samples['ripmaster_stage_written_bytes_total{stage="merge"}'],
+             samples['ripmaster_tool_runs_total{tool="mkvmerge"}'],
+             samples['ripmaster_stage_runs_total{stage="merge"}'])
+        )
+
+    #===========================================================================
+
+    def testFailures(self):
+        """Tests that raising, or calling fail(), counts as a failure"""
+        @metrics.stage('encode', registry=self.registry)
+        def encode():
+            raise ValueError('HandBrake failed')
+
+        self.assertRaises(
+            ValueError,
+            encode
+        )
+
+        with metrics.tool('handbrake', registry=self.registry) as measurement:
+            measurement.fail()
+
+        samples = self._samples()
+
+        self.assertEqual(
+            (1, 1),
+            (samples['ripmaster_stage_failures_total{stage="encode"}'],
+             samples['ripmaster_tool_failures_total{tool="handbrake"}'])
+        )
+
+    #===========================================================================
+
+    def testCpu(self):
+        """Tests that CPU time goes to the tool measured on this thread"""
+        with metrics.tool('handbrake', registry=self.registry):
+            with metrics.tool('mkvmerge', registry=self.registry):
+                metrics.cpu(2.5)
+            metrics.cpu(10.0)
+            # Runs whose CPU time isn't known
+            metrics.cpu(None)
+        metrics.cpu(1.0)
+
+        samples = self._samples()
+
+        self.assertEqual(
+            (10.0, 2.5),
+            (samples['ripmaster_tool_cpu_seconds_total{tool="handbrake"}'],
+             samples['ripmaster_tool_cpu_seconds_total{tool="mkvmerge"}'])
+        )
+
+    #===========================================================================
+
+    def testCarry(self):
+        """Tests that carry() keeps the stage on another thread"""
+        @metrics.stage('convert', registry=self.registry)
+        def convert():
+            thread = threading.Thread(target=metrics.carry(self._write))
+            thread.start()
+            thread.join()
+
+        convert()
+
+        self.assertEqual(
+            400,
+            self._samples()['ripmaster_stage_written_bytes_total{stage="convert"}']
+        )
+
+#===============================================================================
+
+class TestExport(unittest.TestCase):
+    """Tests writing and serving the metrics"""
+
+    #===========================================================================
+    # SETUP & TEARDOWN
+    #===========================================================================
+
+    def setUp(self):
+        self.registry = metrics.Registry()
+        self.registry.inc('ripmaster_movies_completed_total')
+        self.dir = tempfile.mkdtemp()
+
+    #===========================================================================
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    #===========================================================================
+    # TESTS
+    #===========================================================================
+
+    def testTextfile(self):
+        """Tests that the textfile is written whole, with no temp left"""
+        path = os.path.join(self.dir, 'ripmaster.prom')
+        metrics.writeTextfile(path, registry=self.registry)
+        # Written over the old one
+        metrics.writeTextfile(path, registry=self.registry)
+
+        with open(path) as f:
+            text = f.read()
+
+        self.assertEqual(
+            (self.registry.render(), ['ripmaster.prom']),
+            (text, os.listdir(self.dir))
+        )
+
+    #===========================================================================
+
+    def testServe(self):
+        """Tests serving the metrics over HTTP"""
+        server = metrics.serve(0, registry=self.registry)
+        try:
+            response = urllib2.urlopen(
+                'http://{0}:{1}/metrics'.format(*server.server_address)
+            )
+            body = response.read()
+        finally:
+            server.shutdown()
+
+        self.assertEqual(
+            self.registry.render(),
+            body
+        )
+
+#===============================================================================
+# FUNCTIONS
+#===============================================================================
+
+if __name__ == '__main__':
+    unittest.main()
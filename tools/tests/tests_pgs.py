@@ -0,0 +1,385 @@
+#/usr/bin/python
+# Ripmaster PGS Tests
+# Tests for the Ripmaster PGS subtitle reader
+"""
+Tests for all of the classes and functions inside of Ripmaster's tools.pgs
+module.
+"""
+
+#===============================================================================
+# IMPORTS
+#===============================================================================
+
+# Standard Imports
+import os
+import struct
+import sys
+import tempfile
+import unittest
+
+sys.path.append('/'.join(os.path.realpath(__file__).split('/')[:-3]))
+
+# Ripmaster Imports
+from tools import pgs
+
+#===============================================================================
+# CLASSES
+#===============================================================================
+
+class TestSegments(unittest.TestCase):
+    """Tests walking the segment headers of a PGS stream"""
+
+    #===========================================================================
+    # TESTS
+    #===========================================================================
+
+    def testSegmentOffsets(self):
+        """Tests that every segment's type and payload are found"""
+        stream = buildSup([[(1, False)]], clear=False)
+
+        found = [
+            (segType, stream[offset:offset + size][:2])
+            for segType, pts, dts, offset, size in pgs.segments(stream)
+        ]
+
+        self.assertEqual(
+            [pgs.PCS, pgs.WDS, pgs.PDS, pgs.ODS, pgs.END],
+            [segType for segType, start in found]
+        )
+
+        # The PCS payload starts with the video width, 1920
+        self.assertEqual(
+            '\x07\x80',
+            found[0][1]
+        )
+
+    #===========================================================================
+
+    def testBadMagic(self):
+        """Tests that a stream not made of PG segments raises ValueError"""
+        self.assertRaises(
+            ValueError,
+            list,
+            pgs.segments('PX' + '\x00' * 20)
+        )
+
+    #===========================================================================
+
+    def testTruncated(self):
+        """Tests that a segment running past the end raises ValueError"""
+        stream = buildSup([[(1, False)]])
+
+        self.assertRaises(
+            ValueError,
+            list,
+            pgs.segments(stream[:-5] + stream[-4:-2])
+        )
+
+#===============================================================================
+
+class TestReadComposition(unittest.TestCase):
+    """Tests parsing a Presentation Composition Segment"""
+
+    #===========================================================================
+    # TESTS
+    #===========================================================================
+
+    def testObjects(self):
+        """Tests that objects, forced and crop flags are read"""
+        payload = pcsPayload(
+            [(0, True), (1, False)], state=pgs.EPOCH_START, cropped=True
+        )
+
+        composition = pgs.readComposition(payload, 0, pts=900)
+
+        self.assertEqual(
+            (1920, 1080, pgs.EPOCH_START, 900),
+            (composition.width, composition.height, composition.state,
+             composition.pts)
+        )
+
+        self.assertEqual(
+            [(0, 0, True, 100, 800, (0, 0, 50, 20)),
+             (1, 0, False, 100, 900, (0, 0, 50, 20))],
+            composition.objects
+        )
+
+        self.assertTrue(
+            composition.forced
+        )
+
+#===============================================================================
+
+class TestReadObject(unittest.TestCase):
+    """Tests parsing Object and Palette Definition Segments"""
+
+    #===========================================================================
+    # TESTS
+    #===========================================================================
+
+    def testFirstFragment(self):
+        """Tests that the first fragment of an object carries its size"""
+        payload = struct.pack('>HBB', 3, 1, pgs.FIRST_IN_SEQUENCE) + \
+            '\x00\x00\x07' + struct.pack('>HH', 20, 10) + 'abc'
+
+        self.assertEqual(
+            (3, 1, pgs.FIRST_IN_SEQUENCE, 20, 10, 'abc'),
+            pgs.readObject(payload, 0, len(payload))
+        )
+
+    #===========================================================================
+
+    def testLaterFragment(self):
+        """Tests that later fragments of an object only carry data"""
+        payload = struct.pack('>HBB', 3, 1, pgs.LAST_IN_SEQUENCE) + 'defg'
+
+        self.assertEqual(
+            (3, 1, pgs.LAST_IN_SEQUENCE, None, None, 'defg'),
+            pgs.readObject(payload, 0, len(payload))
+        )
+
+    #===========================================================================
+
+    def testPalette(self):
+        """Tests that every palette entry is read"""
+        payload = '\x02\x05' + '\x01\x10\x80\x80\xff' + '\x07\xeb\x80\x80\x40'
+
+        self.assertEqual(
+            (2, 5, {1: (16, 128, 128, 255), 7: (235, 128, 128, 64)}),
+            pgs.readPalette(payload, 0, len(payload))
+        )
+
+#===============================================================================
+
+class TestSupInfo(unittest.TestCase):
+    """Tests counting the forced captions of a sup file"""
+
+    #===========================================================================
+    # SETUP & TEARDOWN
+    #===========================================================================
+
+    def setUp(self):
+        self.files = []
+
+    #===========================================================================
+
+    def tearDown(self):
+        for path in self.files:
+            os.remove(path)
+
+    #===========================================================================
+    # PRIVATE METHODS
+    #===========================================================================
+
+    def _supInfo(self, stream):
+        """Writes the stream to a file and reads it back with supInfo"""
+        handle, path = tempfile.mkstemp(suffix='.sup')
+        os.write(handle, stream)
+        os.close(handle)
+        self.files.append(path)
+
+        return pgs.supInfo(path)
+
+    #===========================================================================
+    # TESTS
+    #===========================================================================
+
+    def testNoForced(self):
+        """Tests a track without forced captions"""
+        info = self._supInfo(
+            buildSup([[(0, False)], [(0, False)], [(0, False), (1, False)]])
+        )
+
+        self.assertEqual(
+            (3, 0, False, False),
+            (info.totalCount, info.forcedCount, info.forced, info.forcedOnly)
+        )
+
+    #===========================================================================
+
+    def testSomeForced(self):
+        """Tests a track with a mix of forced and normal captions"""
+        info = self._supInfo(
+            buildSup([[(0, False)], [(0, True)], [(0, False), (1, True)]])
+        )
+
+        self.assertEqual(
+            (3, 2, True, False),
+            (info.totalCount, info.forcedCount, info.forced, info.forcedOnly)
+        )
+
+    #===========================================================================
+
+    def testAllForced(self):
+        """Tests a track made up entirely of forced captions"""
+        info = self._supInfo(buildSup([[(0, True)], [(0, True)]]))
+
+        self.assertEqual(
+            (2, 2, True, True),
+            (info.totalCount, info.forcedCount, info.forced, info.forcedOnly)
+        )
+
+    #===========================================================================
+
+    def testRepeatsNotCounted(self):
+        """Tests that palette updates and repeated captions aren't counted"""
+        stream = buildSup([[(0, True)]], clear=False)
+        # An acquisition point repeating the caption already on screen
+        stream += segment(
+            pgs.PCS, pcsPayload([(0, True)], state=pgs.ACQUISITION_POINT)
+        )
+        # A palette only update for a fade
+        stream += segment(pgs.PCS, pcsPayload([(0, False)], paletteUpdate=True))
+        stream += segment(pgs.PCS, pcsPayload([]))
+        stream += buildSup([[(0, False)]])
+
+        info = self._supInfo(stream)
+
+        self.assertEqual(
+            (2, 1),
+            (info.totalCount, info.forcedCount)
+        )
+
+    #===========================================================================
+
+    def testEmpty(self):
+        """Tests that an empty sup has no captions"""
+        info = self._supInfo('')
+
+        self.assertEqual(
+            (0, False, False),
+            (info.totalCount, info.forced, info.forcedOnly)
+        )
+
+    #===========================================================================
+
+    def testNotPgs(self):
+        """Tests that a file that isn't a PGS stream raises ValueError"""
+        self.assertRaises(
+            ValueError,
+            self._supInfo,
+            'not a sup file at all'
+        )
+
+#===============================================================================
+# FUNCTIONS
+#===============================================================================
+
+def buildSup(captions, clear=True):
+    """Builds a PGS stream with a display set per caption
+
+    Args:
+        captions : [[(int, bool)]]
+            A list of captions, each a list of (objectID, forced) tuples.
+
+        clear=True : (bool)
+            If True, each caption is followed by an empty display set that
+            clears it from the screen.
+
+    Returns:
+        (str)
+
+    """
+    stream = ''
+    for i, objects in enumerate(captions):
+        pts = i * 90000
+        stream += segment(pgs.PCS, pcsPayload(objects, pgs.EPOCH_START), pts)
+        stream += segment(pgs.WDS, '\x01' + struct.pack('>BHHHH', 0, 0, 0, 0, 0))
+        stream += segment(pgs.PDS, '\x00\x00' + '\x01\x10\x80\x80\xff')
+        for objectID, forced in objects:
+            stream += segment(
+                pgs.ODS,
+                struct.pack('>HBB', objectID, 0, 0xc0) + '\x00\x00\x04' +
+                struct.pack('>HH', 1, 1) + '\x01'
+            )
+        stream += segment(pgs.END, '', pts)
+        if clear:
+            stream += segment(pgs.PCS, pcsPayload([]), pts + 45000)
+            stream += segment(pgs.END, '', pts + 45000)
+
+    return stream
+
+#===============================================================================
+
+def encodeRle(pixels, width, height):
+    """Run length encodes a bitmap of palette indexes
+
+    Args:
+        pixels : (str|bytearray)
+            width * height palette indexes, one row after another.
+
+        width : (int)
+            Width of the bitmap.
+
+        height : (int)
+            Height of the bitmap.
+
+    Returns:
+        (str)
+            The run length encoded bitmap, as stored in an ODS.
+
+    """
+    pixels = bytearray(pixels)
+    encoded = []
+
+    for row in xrange(height):
+        line = pixels[row * width:(row + 1) * width]
+        pos = 0
+        while pos < width:
+            color = line[pos]
+            end = pos + 1
+            while end < width and line[end] == color and end - pos < 0x3fff:
+                end += 1
+            length = end - pos
+
+            if color and length < 3:
+                encoded.append(chr(color) * length)
+            elif not color and length < 0x40:
+                encoded.append('\x00' + chr(length))
+            elif not color:
+                encoded.append(
+                    '\x00' + chr(0x40 | length >> 8) + chr(length & 0xff)
+                )
+            elif length < 0x40:
+                encoded.append('\x00' + chr(0x80 | length) + chr(color))
+            else:
+                encoded.append(
+                    '\x00' + chr(0xc0 | length >> 8) + chr(length & 0xff) +
+                    chr(color)
+                )
+            pos = end
+
+        encoded.append('\x00\x00')
+
+    return ''.join(encoded)
+
+#===============================================================================
+
+def pcsPayload(objects, state=pgs.NORMAL, paletteUpdate=False, cropped=False):
+    """Builds the payload of a PCS showing the given (objectID, forced)s"""
+    payload = struct.pack(
+        '>HHBHBBBB', 1920, 1080, 0x10, 0, state,
+        0x80 if paletteUpdate else 0, 0, len(objects)
+    )
+    for i, (objectID, forced) in enumerate(objects):
+        flags = pgs.OBJECT_FORCED if forced else 0
+        if cropped:
+            flags |= pgs.OBJECT_CROPPED
+        payload += struct.pack('>HBBHH', objectID, 0, flags, 100, 800 + i * 100)
+        if cropped:
+            payload += struct.pack('>HHHH', 0, 0, 50, 20)
+
+    return payload
+
+#===============================================================================
+
+def segment(segType, payload, pts=0):
+    """Wraps a payload in a PGS segment header"""
+    return struct.pack(
+        '>2sIIBH', 'PG', pts, 0, segType, len(payload)
+    ) + payload
+
+#===============================================================================
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,225 @@
+#/usr/bin/python
+# Ripmaster Probe Cache Tests
+# Tests for the Ripmaster mkvmerge probe cache
+"""
+Tests for all of the classes and functions inside of Ripmaster's
+tools.probecache module.
+"""
+
+#===============================================================================
+# IMPORTS
+#===============================================================================
+
+# Standard Imports
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.append('/'.join(os.path.realpath(__file__).split('/')[:-3]))
+
+# Ripmaster Imports
+from tools import probecache
+
+#===============================================================================
+# GLOBALS
+#===============================================================================
+
+PROBE = (
+    '5767563000000',
+    [(0, 'video', {'codec_id': 'V_MPEG4/ISO/AVC', 'language': 'eng'}),
+     (1, 'audio', {'codec_id': 'A_DTS', 'language': 'eng'})]
+)
+
+#===============================================================================
+# CLASSES
+#===============================================================================
+
+class TestProbeCache(unittest.TestCase):
+    """Tests storing, invalidating and evicting probes"""
+
+    #===========================================================================
+    # SETUP & TEARDOWN
+    #===========================================================================
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.cache = probecache.ProbeCache(os.path.join(self.dir, 'probes.db'))
+
+        self.movie = self._writeMovie('Up.mkv', 'Matroska')
+
+    #===========================================================================
+
+    def tearDown(self):
+        self.cache.close()
+        shutil.rmtree(self.dir)
+
+    #===========================================================================
+    # PRIVATE METHODS
+    #===========================================================================
+
+    def _writeMovie(self, name, contents):
+        """Writes a stand in movie file and returns its path"""
+        path = os.path.join(self.dir, name)
+        with open(path, 'wb') as f:
+            f.write(contents)
+        return path
+
+    #===========================================================================
+    # TESTS
+    #===========================================================================
+
+    def testHit(self):
+        """Tests that a stored probe is returned for an unchanged file"""
+        self.cache.put(self.movie, PROBE)
+
+        self.assertEqual(
+            PROBE,
+            self.cache.get(self.movie)
+        )
+
+    #===========================================================================
+
+    def testMiss(self):
+        """Tests that a file that was never stored isn't found"""
+        self.assertEqual(
+            None,
+            self.cache.get(self.movie)
+        )
+
+    #===========================================================================
+
+    def testNonAscii(self):
+        """Tests caching a file with an accented name"""
+        movie = self._writeMovie('Am\xc3\xa9lie.mkv', 'Matroska')
+
+        self.cache.put(movie, PROBE)
+
+        self.assertEqual(
+            PROBE,
+            self.cache.get(movie)
+        )
+
+    #===========================================================================
+
+    def testPersists(self):
+        """Tests that probes are still there after reopening the cache"""
+        self.cache.put(self.movie, PROBE)
+        self.cache.close()
+
+        self.cache = probecache.ProbeCache(self.cache.path)
+
+        self.assertEqual(
+            PROBE,
+            self.cache.get(self.movie)
+        )
+
+    #===========================================================================
+
+    def testChangedSize(self):
+        """Tests that a file that changed size is probed again"""
+        self.cache.put(self.movie, PROBE)
+
+        self._writeMovie('Up.mkv', 'Matroska, remuxed')
+
+        self.assertEqual(
+            None,
+            self.cache.get(self.movie)
+        )
+
+        # The stale entry is gone
+        self.assertEqual(
+            0,
+            len(self.cache)
+        )
+
+    #===========================================================================
+
+    def testChangedMtime(self):
+        """Tests that a file rewritten with the same size is probed again"""
+        self.cache.put(self.movie, PROBE)
+
+        stat = os.stat(self.movie)
+        os.utime(self.movie, (stat.st_atime, stat.st_mtime + 10))
+
+        self.assertEqual(
+            None,
+            self.cache.get(self.movie)
+        )
+
+    #===========================================================================
+
+    def testRemoved(self):
+        """Tests that a removed file isn't found, or stored"""
+        self.cache.put(self.movie, PROBE)
+        os.remove(self.movie)
+
+        self.assertEqual(
+            None,
+            self.cache.get(self.movie)
+        )
+
+        self.cache.put(self.movie, PROBE)
+
+        self.assertEqual(
+            0,
+            len(self.cache)
+        )
+
+    #===========================================================================
+
+    def testEviction(self):
+        """Tests that the least recently used entries are evicted"""
+        self.cache.maxEntries = 2
+
+        movies = [
+            self._writeMovie('Movie{0}.mkv'.format(i), str(i))
+            for i in xrange(3)
+        ]
+
+        self.cache.put(movies[0], PROBE)
+        self.cache.put(movies[1], PROBE)
+        # Using the first movie makes the second the least recently used.
+        self.cache.get(movies[0])
+        self.cache.put(movies[2], PROBE)
+
+        self.assertEqual(
+            [True, False, True],
+            [self.cache.get(movie) is not None for movie in movies]
+        )
+
+#===============================================================================
+
+class TestFileIdentity(unittest.TestCase):
+    """Tests the identity a cache entry is keyed by"""
+
+    #===========================================================================
+    # TESTS
+    #===========================================================================
+
+    def testIdentity(self):
+        """Tests that size, mtime in nanoseconds and inode are returned"""
+        with tempfile.NamedTemporaryFile() as f:
+            f.write('Matroska')
+            f.flush()
+            stat = os.stat(f.name)
+
+            self.assertEqual(
+                (8, int(round(stat.st_mtime * 1000000000)), stat.st_ino),
+                probecache.fileIdentity(f.name)
+            )
+
+    #===========================================================================
+
+    def testMissing(self):
+        """Tests that a missing file has no identity"""
+        self.assertEqual(
+            None,
+            probecache.fileIdentity('/the/best/fake/path.mkv')
+        )
+
+#===============================================================================
+
+if __name__ == '__main__':
+    unittest.main()
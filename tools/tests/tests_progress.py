@@ -0,0 +1,284 @@
+#/usr/bin/python
+# Ripmaster Progress Tests
+# Tests for following HandBrake's progress
+"""
+Tests for all of the classes and functions inside of Ripmaster's
+tools.progress module.
+"""
+
+#===============================================================================
+# IMPORTS
+#===============================================================================
+
+# Standard Imports
+import os
+import sys
+import unittest
+
+sys.path.append('/'.join(os.path.realpath(__file__).split('/')[:-3]))
+
+# Ripmaster Imports
+from tools import progress
+
+#===============================================================================
+# GLOBALS
+#===============================================================================
+
+STARTING = 'Encoding: task 1 of 1, 0.52 %'
+ENCODING = (
+    'Encoding: task 1 of 1, 45.23 % '
+    '(120.45 fps, avg 118.32 fps, ETA 01h12m34s)'
+)
+
+#===============================================================================
+# CLASSES
+#===============================================================================
+
+class StubMovie(object):
+    """Stands in for Movie, with what queueEta reads"""
+    def __init__(self, duration, encoded=False, encodeProgress=None):
+        self.duration = duration
+        self.encoded = encoded
+        self.progress = encodeProgress
+
+#===============================================================================
+
+class TestParseProgress(unittest.TestCase):
+    """Tests parsing HandBrake's progress lines"""
+
+    #===========================================================================
+    # TESTS
+    #===========================================================================
+
+    def testFull(self):
+        """Tests a line with frame rates and an ETA"""
+        self.assertEqual(
+            {'task': 1, 'tasks': 1, 'percent': 45.23, 'fps': 120.45,
+             'avgFps': 118.32, 'eta': 4354},
+            progress.parseProgress(ENCODING)
+        )
+
+    #===========================================================================
+
+    def testStarting(self):
+        """Tests a line from before HandBrake has an ETA"""
+        self.assertEqual(
+            {'task': 1, 'tasks': 1, 'percent': 0.52, 'fps': None,
+             'avgFps': None, 'eta': None},
+            progress.parseProgress(STARTING)
+        )
+
+    #===========================================================================
+
+    def testNotProgress(self):
+        """Tests that log lines aren't progress"""
+        self.assertEqual(
+            None,
+            progress.parseProgress('x264 [info]: using cpu capabilities')
+        )
+
+#===============================================================================
+
+class TestEncodeProgress(unittest.TestCase):
+    """Tests following a single encode"""
+
+    #===========================================================================
+    # TESTS
+    #===========================================================================
+
+    def testUpdate(self):
+        """Tests that a progress line updates the percentage, rates and ETA"""
+        encodeProgress = progress.EncodeProgress()
+
+        self.assertEqual(
+            [False, True, True],
+            [encodeProgress.update('Muxing: this may take awhile...'),
+             encodeProgress.update(STARTING),
+             encodeProgress.update(ENCODING)]
+        )
+
+        self.assertEqual(
+            (45.23, 120.45, 118.32, 4354),
+            (encodeProgress.percent, encodeProgress.fps,
+             encodeProgress.avgFps, encodeProgress.remaining())
+        )
+
+    #===========================================================================
+
+    def testTwoPass(self):
+        """Tests that the second pass of two counts as the second half"""
+        encodeProgress = progress.EncodeProgress()
+        encodeProgress.update('Encoding: task 2 of 2, 50.00 %')
+
+        self.assertEqual(
+            75.0,
+            encodeProgress.percent
+        )
+
+    #===========================================================================
+
+    def testExtrapolated(self):
+        """Tests the time left before HandBrake gives an ETA"""
+        encodeProgress = progress.EncodeProgress()
+        encodeProgress.started -= 100
+        encodeProgress.update('Encoding: task 1 of 1, 20.00 %')
+
+        self.assertAlmostEqual(
+            400,
+            encodeProgress.remaining(),
+            places=0
+        )
+
+    #===========================================================================
+
+    def testStalled(self):
+        """Tests that an encode is stalled once its percentage stops moving"""
+        encodeProgress = progress.EncodeProgress()
+        encodeProgress.update(ENCODING)
+
+        self.assertFalse(
+            encodeProgress.stalled(60)
+        )
+
+        encodeProgress.updated -= 120
+        # The same percentage again isn't progress.
+        encodeProgress.update(ENCODING)
+
+        self.assertTrue(
+            encodeProgress.stalled(60)
+        )
+
+        encodeProgress.finish()
+
+        self.assertFalse(
+            encodeProgress.stalled(60)
+        )
+
+    #===========================================================================
+
+    def testParts(self):
+        """Tests that parts count towards the whole by their weight"""
+        encodeProgress = progress.EncodeProgress(1000)
+        encodeProgress.skip(0.5)
+        first = encodeProgress.part(0.25)
+        second = encodeProgress.part(0.25)
+
+        first.update(ENCODING)
+        second.update(
+            'Encoding: task 1 of 1, 10.00 % '
+            '(50.00 fps, avg 40.00 fps, ETA 02h00m00s)'
+        )
+
+        self.assertAlmostEqual(
+            50 + 45.23 / 4 + 10.0 / 4,
+            encodeProgress.percent
+        )
+
+        self.assertEqual(
+            (170.45, 158.32, 7200, 250),
+            (encodeProgress.fps, encodeProgress.avgFps, encodeProgress.eta,
+             second.duration)
+        )
+
+        # The ETA is the slowest running part's.
+        second.finish()
+
+        self.assertEqual(
+            4354,
+            encodeProgress.eta
+        )
+
+    #===========================================================================
+
+    def testReuse(self):
+        """Tests that a reused part counts as skipped by the whole"""
+        encodeProgress = progress.EncodeProgress(1000)
+        first = encodeProgress.part(0.5)
+        encodeProgress.part(0.5).update(ENCODING)
+        first.reuse()
+
+        self.assertAlmostEqual(
+            50 + 45.23 / 2,
+            encodeProgress.percent
+        )
+
+        self.assertEqual(
+            (0.5, 1, 1.0, True),
+            (encodeProgress.skipped, len(encodeProgress.parts), first.skipped,
+             bool(first.finished))
+        )
+
+#===============================================================================
+
+class TestQueueEta(unittest.TestCase):
+    """Tests estimating when the queue will be encoded"""
+
+    #===========================================================================
+    # TESTS
+    #===========================================================================
+
+    def testEstimate(self):
+        """Tests adding the running encode to the movies still to come"""
+        # Encoded 1000 seconds of source in 500 seconds.
+        done = progress.EncodeProgress(1000)
+        done.started -= 500
+        done.finished = done.started + 500
+        done.percent = 100.0
+
+        # At the same rate
+        running = progress.EncodeProgress(2000)
+        running.started -= 452.3
+        running.update(ENCODING)
+
+        movies = [
+            StubMovie(1000, encoded=True, encodeProgress=done),
+            StubMovie(2000, encodeProgress=running),
+            StubMovie(3000),
+            # Counted as the average of the movies still to come.
+            StubMovie(None),
+        ]
+
+        self.assertAlmostEqual(
+            4354 + (3000 + 3000) / 2.0,
+            progress.queueEta(movies),
+            places=0
+        )
+
+    #===========================================================================
+
+    def testUnknown(self):
+        """Tests that there's no estimate before any encode has gone"""
+        self.assertEqual(
+            None,
+            progress.queueEta([StubMovie(1000), StubMovie(2000)])
+        )
+
+    #===========================================================================
+
+    def testDrained(self):
+        """Tests that an encoded queue has nothing left"""
+        self.assertEqual(
+            0,
+            progress.queueEta([StubMovie(1000, encoded=True)])
+        )
+
+#===============================================================================
+
+class TestFormatSeconds(unittest.TestCase):
+    """Tests formatting an ETA"""
+
+    #===========================================================================
+    # TESTS
+    #===========================================================================
+
+    def testFormat(self):
+        """Tests formatting seconds the way HandBrake does"""
+        self.assertEqual(
+            ['01h12m34s', '--h--m--s'],
+            [progress.formatSeconds(4354.7), progress.formatSeconds(None)]
+        )
+
+#===============================================================================
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,266 @@
+#/usr/bin/python
+# Ripmaster Runner Tests
+# Tests for running external tools from a single event loop
+"""
+Tests for all of the classes and functions inside of Ripmaster's
+tools.runner module.
+"""
+
+#===============================================================================
+# IMPORTS
+#===============================================================================
+
+# Standard Imports
+import os
+from StringIO import StringIO
+import sys
+import time
+import unittest
+
+sys.path.append('/'.join(os.path.realpath(__file__).split('/')[:-3]))
+
+# Ripmaster Imports
+from tools import runner
+
+#===============================================================================
+# CLASSES
+#===============================================================================
+
+class TestProcessRunner(unittest.TestCase):
+    """Tests running tools, reading their output and stopping them"""
+
+    #===========================================================================
+    # SETUP & TEARDOWN
+    #===========================================================================
+
+    def setUp(self):
+
+        # Suppress stdout
+        self.held = sys.stdout
+        sys.stdout = StringIO()
+
+        self.runner = runner.ProcessRunner()
+        self.killSeconds = runner.KILL_SECONDS
+        runner.KILL_SECONDS = 0.5
+
+    #===========================================================================
+
+    def tearDown(self):
+        runner.KILL_SECONDS = self.killSeconds
+
+        # Restore stdout
+        sys.stdout = self.held
+
+    #===========================================================================
+    # PRIVATE METHODS
+    #===========================================================================
+
+    def _sh(self, script, **kwargs):
+        """Runs a shell script as a tool, waiting for it to finish"""
+        return self.runner.run(['sh', '-c', script], **kwargs)
+
+    #===========================================================================
+    # TESTS
+    #===========================================================================
+
+    def testLines(self):
+        """Tests that lines end at newlines and carriage returns"""
+        if sys.platform.startswith('win'):
+            return
+
+        out = []
+        err = []
+        run = self._sh(
+            'printf "Encoding: 1 %%\\rEncoding: 2 %%\\r\\nDone\\nlast"; '
+            'echo warning >&2; exit 3',
+            stdout=out.append, stderr=err.append
+        )
+
+        self.assertEqual(
+            (3, ['Encoding: 1 %', 'Encoding: 2 %', 'Done', 'last'],
+             ['warning']),
+            (run.status, out, err)
+        )
+
+    #===========================================================================
+
+    def testCapture(self):
+        """Tests capturing stdout whole, and echoing what isn't read"""
+        if sys.platform.startswith('win'):
+            return
+
+        captured = self._sh('printf "one\\r\\ntwo"', capture=True)
+        self._sh('echo echoed')
+
+        self.assertEqual(
+            ('one\r\ntwo', 'echoed\n'),
+            (captured.output, sys.stdout.getvalue())
+        )
+
+    #===========================================================================
+
+    def testStdin(self):
+        """Tests that a tool given a stdin pipe reads what's written to it"""
+        if sys.platform.startswith('win'):
+            return
+
+        out = []
+        run = self.runner.start(
+            ['sh', '-c', 'while read line; do echo "got $line"; done'],
+            stdin=True, stdout=out.append
+        )
+        run.process.stdin.write('one\ntwo\n')
+        run.process.stdin.close()
+
+        self.assertEqual(
+            (0, ['got one', 'got two']),
+            (run.wait(), out)
+        )
+
+    #===========================================================================
+
+    def testOnStart(self):
+        """Tests that onStart gets the pid, and a tool it fails on is killed"""
+        if sys.platform.startswith('win'):
+            return
+
+        pids = []
+        run = self._sh('exit 0', onStart=pids.append)
+
+        self.assertEqual(
+            [run.pid],
+            pids
+        )
+
+        def fail(pid):
+            pids.append(pid)
+            raise OSError('no')
+
+        self.assertRaises(
+            OSError,
+            self.runner.start,
+            ['sleep', '30'],
+            onStart=fail
+        )
+
+        # Killed and reaped, so there's no such process any more.
+        self.assertRaises(
+            OSError,
+            os.kill,
+            pids[-1],
+            0
+        )
+
+    #===========================================================================
+
+    def testUsage(self):
+        """Tests that the CPU time a tool used is recorded"""
+        if sys.platform.startswith('win'):
+            return
+
+        run = self._sh('i=0; while [ $i -lt 20000 ]; do i=$((i+1)); done')
+
+        self.assertEqual(
+            0,
+            run.status
+        )
+
+        self.assertTrue(
+            run.cpuSeconds > 0
+        )
+
+    #===========================================================================
+
+    def testTimeout(self):
+        """Tests that a tool past its timeout is stopped"""
+        if sys.platform.startswith('win'):
+            return
+
+        started = time.time()
+        run = self._sh('sleep 10', timeout=0.2)
+
+        self.assertEqual(
+            (-15, True, False),
+            (run.status, run.timedOut, run.cancelled)
+        )
+
+        self.assertTrue(
+            time.time() - started < 5
+        )
+
+    #===========================================================================
+
+    def testKill(self):
+        """Tests that a tool ignoring SIGTERM is killed"""
+        if sys.platform.startswith('win'):
+            return
+
+        started = time.time()
+        run = self._sh('trap "" TERM; sleep 10', timeout=0.2)
+
+        self.assertEqual(
+            -9,
+            run.status
+        )
+
+        self.assertTrue(
+            time.time() - started < 5
+        )
+
+    #===========================================================================
+
+    def testCancel(self):
+        """Tests cancelling a running tool"""
+        if sys.platform.startswith('win'):
+            return
+
+        run = self.runner.start(['sleep', '10'])
+        self.runner.cancel(run)
+
+        self.assertEqual(
+            (-15, True, False),
+            (run.wait(5), run.cancelled, run.timedOut)
+        )
+
+    #===========================================================================
+
+    def testConcurrent(self):
+        """Tests that dozens of tools run at once from the one loop"""
+        if sys.platform.startswith('win'):
+            return
+
+        started = time.time()
+        runs = [
+            self.runner.start(
+                ['sh', '-c', 'sleep 0.5; echo {0}'.format(i)], capture=True
+            ) for i in xrange(40)
+        ]
+        for run in runs:
+            run.wait()
+
+        self.assertEqual(
+            ['{0}\n'.format(i) for i in xrange(40)],
+            [run.output for run in runs]
+        )
+
+        # Forty half second sleeps, one after another, would take 20 seconds.
+        self.assertTrue(
+            time.time() - started < 5
+        )
+
+    #===========================================================================
+
+    def testMissing(self):
+        """Tests that a tool that can't be started raises OSError"""
+        self.assertRaises(
+            OSError,
+            self.runner.run,
+            ['/no/such/tool']
+        )
+
+#===============================================================================
+# FUNCTIONS
+#===============================================================================
+
+if __name__ == '__main__':
+    unittest.main()
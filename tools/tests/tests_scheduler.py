@@ -0,0 +1,330 @@
+#/usr/bin/python
+# Ripmaster Scheduler Tests
+# Tests for the Ripmaster task graph executor
+"""
+Tests for the TaskGraph and Task classes inside of Ripmaster's tools.scheduler
+module.
+
+REQUIREMENTS:
+
+mock
+"""
+
+#===============================================================================
+# IMPORTS
+#===============================================================================
+
+# Standard Imports
+import os
+from StringIO import StringIO
+import sys
+import threading
+import unittest
+
+sys.path.append('/'.join(os.path.realpath(__file__).split('/')[:-3]))
+
+# Ripmaster Imports
+from tools import scheduler
+
+#===============================================================================
+# CLASSES
+#===============================================================================
+
+class TestTaskGraph(unittest.TestCase):
+    """Tests that the TaskGraph respects dependencies, limits and failures"""
+
+    #===========================================================================
+    # SETUP & TEARDOWN
+    #===========================================================================
+
+    def setUp(self):
+
+        # Suppress stdout
+        self.held = sys.stdout
+        sys.stdout = StringIO()
+
+        self.order = []
+        self.lock = threading.Lock()
+
+    #===========================================================================
+
+    def tearDown(self):
+        # Restore stdout
+        sys.stdout = self.held
+
+    #===========================================================================
+    # PRIVATE METHODS
+    #===========================================================================
+
+    def _record(self, name):
+        """Returns a task function that records when it ran"""
+        def run():
+            with self.lock:
+                self.order.append(name)
+        return run
+
+    #===========================================================================
+    # TESTS
+    #===========================================================================
+
+    def testDependencyOrder(self):
+        """Tests that a task only runs after all of its dependencies"""
+        graph = scheduler.TaskGraph(workers=4)
+
+        extract = graph.addTask('extract', self._record('extract'))
+        convert = graph.addTask(
+            'convert', self._record('convert'), deps=[extract]
+        )
+        encode = graph.addTask('encode', self._record('encode'))
+        graph.addTask('merge', self._record('merge'), deps=[convert, encode])
+
+        self.assertEqual(
+            [],
+            graph.run()
+        )
+
+        self.assertEqual(
+            'merge',
+            self.order[-1]
+        )
+
+        self.assertTrue(
+            self.order.index('extract') < self.order.index('convert')
+        )
+
+    #===========================================================================
+
+    def testNoneDependency(self):
+        """Tests that None dependencies are treated as already complete"""
+        graph = scheduler.TaskGraph(workers=1)
+
+        merge = graph.addTask('merge', self._record('merge'), deps=[None, None])
+
+        self.assertEqual(
+            [],
+            merge.deps
+        )
+
+        graph.run()
+
+        self.assertEqual(
+            ['merge'],
+            self.order
+        )
+
+    #===========================================================================
+
+    def testIndependentTasksOverlap(self):
+        """Tests that an encode runs while subtitle extraction is running"""
+        graph = scheduler.TaskGraph(workers=2)
+
+        encodeStarted = threading.Event()
+        overlapped = []
+
+        def extract():
+            # Extraction waits for the encode to start. If the graph ran these
+            # one at a time, the wait would time out.
+            overlapped.append(encodeStarted.wait(5))
+
+        graph.addTask('extract', extract)
+        graph.addTask('encode', encodeStarted.set)
+
+        graph.run()
+
+        self.assertEqual(
+            [True],
+            overlapped
+        )
+
+    #===========================================================================
+
+    def testKindLimit(self):
+        """Tests that no more than the limit of a kind run at the same time"""
+        graph = scheduler.TaskGraph(workers=4, limits={'encode': 1})
+
+        running = [0]
+        peak = [0]
+
+        def encode():
+            with self.lock:
+                running[0] += 1
+                peak[0] = max(peak[0], running[0])
+            threading.Event().wait(0.02)
+            with self.lock:
+                running[0] -= 1
+
+        for i in xrange(4):
+            graph.addTask('encode {0}'.format(i), encode, kind='encode')
+
+        graph.run()
+
+        self.assertEqual(
+            1,
+            peak[0]
+        )
+
+    #===========================================================================
+
+    def testPools(self):
+        """Tests that IO tasks only run on their pool, and CPU tasks off it"""
+        graph = scheduler.TaskGraph(
+            workers=1, pools={'io': (1, ['extract', 'merge'])}
+        )
+
+        encoded = threading.Event()
+        waited = []
+
+        def extract():
+            # The extract waits on the encode. If the main worker took the
+            # extract, which was added first, the wait would time out.
+            waited.append(encoded.wait(5))
+
+        graph.addTask('extract 1', extract, kind='extract')
+        graph.addTask('encode 1', encoded.set, kind='encode')
+
+        self.assertEqual(
+            [],
+            graph.run()
+        )
+
+        self.assertEqual(
+            [True],
+            waited
+        )
+
+    #===========================================================================
+
+    def testFailureSkipsDependents(self):
+        """Tests that a failed task skips dependents but not other branches"""
+        graph = scheduler.TaskGraph(workers=2)
+
+        def explode():
+            raise ValueError('bad track')
+
+        extract = graph.addTask('extract', explode)
+        convert = graph.addTask(
+            'convert', self._record('convert'), deps=[extract]
+        )
+        merge = graph.addTask('merge', self._record('merge'), deps=[convert])
+        encode = graph.addTask('encode', self._record('encode'))
+
+        failed = graph.run()
+
+        self.assertEqual(
+            [extract, convert, merge],
+            failed
+        )
+
+        self.assertEqual(
+            scheduler.FAILED,
+            extract.state
+        )
+
+        self.assertEqual(
+            scheduler.SKIPPED,
+            merge.state
+        )
+
+        self.assertEqual(
+            scheduler.DONE,
+            encode.state
+        )
+
+        self.assertEqual(
+            ['encode'],
+            self.order
+        )
+
+    #===========================================================================
+
+    def testPersistentAddWhileRunning(self):
+        """Tests that tasks added to a running persistent graph are run"""
+        graph = scheduler.TaskGraph(workers=2, persistent=True)
+        graph.addTask('encode 1', self._record('encode 1'))
+
+        runner = threading.Thread(target=graph.run)
+        runner.start()
+
+        # The graph has run out of tasks, but keeps running.
+        threading.Event().wait(0.05)
+        self.assertTrue(
+            runner.isAlive()
+        )
+
+        added = threading.Event()
+        graph.addTask('encode 2', added.set)
+
+        self.assertTrue(
+            added.wait(5)
+        )
+
+        graph.stop()
+        runner.join(5)
+
+        self.assertFalse(
+            runner.isAlive()
+        )
+
+    #===========================================================================
+
+    def testStopLetsRunningFinish(self):
+        """Tests that stop() finishes running tasks but starts no more"""
+        graph = scheduler.TaskGraph(workers=1)
+
+        started = threading.Event()
+        release = threading.Event()
+
+        def encode():
+            started.set()
+            release.wait(5)
+
+        encode1 = graph.addTask('encode 1', encode)
+        encode2 = graph.addTask('encode 2', self._record('encode 2'))
+
+        runner = threading.Thread(target=graph.run)
+        runner.start()
+
+        started.wait(5)
+        graph.stop()
+        release.set()
+        runner.join(5)
+
+        self.assertEqual(
+            (scheduler.DONE, scheduler.PENDING),
+            (encode1.state, encode2.state)
+        )
+
+    #===========================================================================
+
+    def testCounts(self):
+        """Tests counting tasks by kind and state"""
+        graph = scheduler.TaskGraph(workers=1)
+
+        extract = graph.addTask(
+            'extract 1', self._record('extract 1'), kind='extract'
+        )
+        for name in ['convert 1', 'convert 2']:
+            graph.addTask(
+                name, self._record(name), deps=[extract], kind='convert'
+            )
+
+        self.assertEqual(
+            {'extract': {scheduler.PENDING: 1},
+             'convert': {scheduler.PENDING: 2}},
+            graph.counts()
+        )
+
+        graph.run()
+
+        self.assertEqual(
+            {'extract': {scheduler.DONE: 1},
+             'convert': {scheduler.DONE: 2}},
+            graph.counts()
+        )
+
+#===============================================================================
+# FUNCTIONS
+#===============================================================================
+
+if __name__ == '__main__':
+    unittest.main()
@@ -15,12 +15,15 @@ mock
 #===============================================================================
 
 # Standard Imports
+import cPickle
+import json
 import os
 import mock
+import shutil
 from StringIO import StringIO
-import subprocess
 import sys
 import tempfile
+import threading
 import unittest
 
 # Grab our test's path and append the Ripmaster root directory
@@ -40,6 +43,13 @@ sys.path.append('/'.join(os.path.realpath(__file__).split('/')[:-3]))
 # Ripmaster Imports
 import tools
 
+# Test Imports
+from tests_matroska import element
+from tests_pgs import buildSup
+
+# Some tests need to swap mkvInfo out for a version that reads canned output.
+_realMkvInfo = tools.mkvInfo
+
 #===============================================================================
 # GLOBALS
 #===============================================================================
@@ -223,6 +233,116 @@ Track ID 3: subtitles (S_VOBSUB) [number:4 uid:2154180997 codec_id:S_VOBSUB code
 Chapters: 35 entries
 """
 
+# Up with the vobsub track swapped out for three bluray pgs tracks
+MKVINFO_UP_PGS = """File '/Users/sean/Downloads/Up.mkv': container: Matroska [duration:5767563000000 segment_uid:8e3ddb4566e67afca3142a25835e9c1d is_providing_timecodes:1]
+Track ID 0: video (V_MPEG4/ISO/AVC) [number:1 uid:1493619965 codec_id:V_MPEG4/ISO/AVC codec_private_length:44 codec_private_data:014d4028ffe1001c674d4028eca03c0113f2e02d4040405000003e90000bb808f183196001000568ef823c80 language:eng pixel_dimensions:1920x1080 display_dimensions:1920x1080 default_track:1 forced_track:0 enabled_track:1 packetizer:mpeg4_p10_video default_duration:41708332 content_encoding_algorithms:3]
+Track ID 1: audio (A_DTS) [number:2 uid:1095497111 codec_id:A_DTS codec_private_length:0 language:eng default_track:1 forced_track:0 enabled_track:1 default_duration:10666666 audio_sampling_frequency:48000 audio_channels:6 content_encoding_algorithms:3]
+Track ID 2: audio (A_TRUEHD) [number:3 uid:1518318168 codec_id:A_TRUEHD codec_private_length:0 language:eng default_track:0 forced_track:0 enabled_track:1 default_duration:10666666 audio_sampling_frequency:48000 audio_channels:6 content_encoding_algorithms:3]
+Track ID 3: subtitles (S_HDMV/PGS) [number:4 uid:2154180997 codec_id:S_HDMV/PGS codec_private_length:0 language:eng default_track:1 forced_track:0 enabled_track:1 content_encoding_algorithms:0]
+Track ID 4: subtitles (S_HDMV/PGS) [number:5 uid:2154180998 codec_id:S_HDMV/PGS codec_private_length:0 language:fre default_track:0 forced_track:0 enabled_track:1 content_encoding_algorithms:0]
+Track ID 5: subtitles (S_HDMV/PGS) [number:6 uid:2154180999 codec_id:S_HDMV/PGS codec_private_length:0 language:spa default_track:0 forced_track:0 enabled_track:1 content_encoding_algorithms:0]
+Chapters: 35 entries
+"""
+
+# mkvmerge JSON identification of Up, with the same tracks as MKVINFO_UP_PGS
+# plus the statistics tags mkvmerge writes, and track names the -I output has
+# to escape.
+MKVINFO_UP_PGS_JSON = {
+    'container': {
+        'properties': {
+            'duration': 5767563000000,
+            'is_providing_timecodes': True,
+            'segment_uid': '8e3ddb4566e67afca3142a25835e9c1d',
+        },
+        'recognized': True,
+        'supported': True,
+        'type': 'Matroska',
+    },
+    'errors': [],
+    'file_name': '/Users/sean/Downloads/Up.mkv',
+    'tracks': [
+        {
+            'codec': 'MPEG-4p10/AVC/h.264',
+            'id': 0,
+            'properties': {
+                'codec_id': 'V_MPEG4/ISO/AVC',
+                'codec_private_length': 44,
+                'default_track': True,
+                'forced_track': False,
+                'language': 'eng',
+                'pixel_dimensions': '1920x1080',
+                'tag_number_of_bytes': '28437295462',
+            },
+            'type': 'video',
+        },
+        {
+            'codec': 'DTS',
+            'id': 1,
+            'properties': {
+                'codec_id': 'A_DTS',
+                'codec_private_length': 0,
+                'default_track': True,
+                'forced_track': False,
+                'language': 'eng',
+                'tag_number_of_bytes': '1107372096',
+                'track_name': 'DTS-HD MA 5.1: English',
+            },
+            'type': 'audio',
+        },
+        {
+            'codec': 'TrueHD',
+            'id': 2,
+            'properties': {
+                'codec_id': 'A_TRUEHD',
+                'codec_private_length': 0,
+                'default_track': False,
+                'forced_track': False,
+                'language': 'eng',
+                'tag_number_of_bytes': '2661291630',
+            },
+            'type': 'audio',
+        },
+        {
+            'codec': 'HDMV PGS',
+            'id': 3,
+            'properties': {
+                'codec_id': 'S_HDMV/PGS',
+                'codec_private_length': 0,
+                'default_track': True,
+                'forced_track': False,
+                'language': 'eng',
+                'tag_number_of_bytes': '31590772',
+            },
+            'type': 'subtitles',
+        },
+        {
+            'codec': 'HDMV PGS',
+            'id': 4,
+            'properties': {
+                'codec_id': 'S_HDMV/PGS',
+                'codec_private_length': 0,
+                'default_track': False,
+                'forced_track': False,
+                'language': 'fre',
+                'tag_number_of_bytes': '29931416',
+                'track_name': u'Fran\xe7ais: Commentary',
+            },
+            'type': 'subtitles',
+        },
+        {
+            'codec': 'HDMV PGS',
+            'id': 5,
+            'properties': {
+                'codec_id': 'S_HDMV/PGS',
+                'default_track': False,
+                'forced_track': True,
+                'language': 'spa',
+            },
+            'type': 'subtitles',
+        },
+    ],
+}
+
 # SubtitleTrack.convertTrack() =================================================
 
 # We've obviously truncated the full return, but this contains all the parts
@@ -628,6 +748,86 @@ class TestTrackInfo(unittest.TestCase):
             trackDict
         )
 
+# _jsonTrackInfo() =============================================================
+
+class TestJsonTrackInfo(unittest.TestCase):
+    """Tests building track information from mkvmerge's JSON identification"""
+
+    #===========================================================================
+    # TESTS
+    #===========================================================================
+
+    def testBadTrackType(self):
+        """Tests that an unknown track type raises ValueError"""
+
+        self.assertRaises(
+            ValueError,
+            tools._jsonTrackInfo,
+            {'id': 5, 'type': 'telepathic', 'properties': {}}
+        )
+
+    #===========================================================================
+
+    def testTrackInfo(self):
+        """Tests that properties come back as strings, like mkvmerge -I's"""
+
+        trackID, trackType, trackDict = tools._jsonTrackInfo(
+            MKVINFO_UP_PGS_JSON['tracks'][1]
+        )
+
+        self.assertEqual(
+            (1, 'audio'),
+            (trackID, trackType)
+        )
+
+        self.assertEqual(
+            {
+                'codec_id': 'A_DTS',
+                'codec_private_length': '0',
+                'default_track': '1',
+                'forced_track': '0',
+                'language': 'eng',
+                'tag_number_of_bytes': '1107372096',
+                'track_name': 'DTS-HD MA 5.1: English',
+            },
+            trackDict
+        )
+
+    #===========================================================================
+
+    def testDefaults(self):
+        """Tests that missing flags and language are defaulted"""
+
+        trackID, trackType, trackDict = tools._jsonTrackInfo(
+            {'id': 12, 'type': 'subtitles', 'properties': {
+                'codec_id': 'S_HDMV/PGS'
+            }}
+        )
+
+        self.assertEqual(
+            {
+                'codec_id': 'S_HDMV/PGS',
+                'default_track': '0',
+                'forced_track': '0',
+                'language': 'eng',
+            },
+            trackDict
+        )
+
+    #===========================================================================
+
+    def testUnicodeName(self):
+        """Tests that non ascii track names are kept, as utf-8"""
+
+        trackID, trackType, trackDict = tools._jsonTrackInfo(
+            MKVINFO_UP_PGS_JSON['tracks'][4]
+        )
+
+        self.assertEqual(
+            'Fran\xc3\xa7ais: Commentary',
+            trackDict['track_name']
+        )
+
 # Config =======================================================================
 
 class TestStandardConfigSetup(unittest.TestCase):
@@ -1284,9 +1484,9 @@ class TestMkvInfoBasic(unittest.TestCase):
         # Build our config
         with tempfile.NamedTemporaryFile(mode='r+b') as f:
             f.write(self.configFile)
-            # Calling readlines on the temp file. Without this Config fails to
-            # read it. I have no idea why.
-            f.readlines()
+            # Config opens the file by name, so what's written has to reach
+            # the disk first.
+            f.flush()
             self.config = tools.Config(f.name)
 
     #===========================================================================
@@ -1299,12 +1499,33 @@ class TestMkvInfoBasic(unittest.TestCase):
     # TESTS
     #===========================================================================
 
-    @mock.patch('tools.PIPE')
-    @mock.patch('tools.Popen')
-    def testPopenCalledCorrectly(self, mockPopen, mockPIPE):
-        """Tests that Popen was called correctly"""
-        mockPopen.stdout.return_value = StringIO()
-        mockPIPE.return_value = StringIO()
+    @mock.patch('tools.runner.run')
+    def testRunCalledCorrectly(self, mockRun):
+        """Tests that mkvmerge was run correctly"""
+        mockRun.return_value = _fakeRun(json.dumps(MKVINFO_UP_PGS_JSON))
+
+        fakeMoviePath = '/the/best/fake/path.mkv'
+
+        movie = MockMovie(fakeMoviePath)
+
+        tools.mkvInfo(movie)
+
+        mockRun.assert_called_once_with(
+            [self.mkvMerge, '--identification-format', 'json', '--identify',
+             fakeMoviePath],
+            capture=True, timeout=tools.PROBE_TIMEOUT
+        )
+
+    #===========================================================================
+
+    @mock.patch('tools.runner.run')
+    def testFallbackRunCalledCorrectly(self, mockRun):
+        """Tests that mkvmerge -I is run if JSON isn't supported"""
+        # Old versions of mkvmerge don't know the option, and say so.
+        mockRun.side_effect = [
+            _fakeRun("Error: Unknown option"),
+            _fakeRun(),
+        ]
 
         fakeMoviePath = '/the/best/fake/path.mkv'
 
@@ -1312,14 +1533,1944 @@ class TestMkvInfoBasic(unittest.TestCase):
 
         tools.mkvInfo(movie)
 
-        mockPopen.assert_called_once_with(
-            [self.mkvMerge, '-I', fakeMoviePath],
-            shell=True,
-            stdout=mockPIPE
+        self.assertEqual(
+            mock.call(
+                [self.mkvMerge, '-I', fakeMoviePath], capture=True,
+                timeout=tools.PROBE_TIMEOUT
+            ),
+            mockRun.call_args
         )
 
 #===============================================================================
-# PRIVATE FUNCTIONS
+
+class TestMkvInfoTracks(unittest.TestCase):
+    """Tests that both probes build the same tracks"""
+
+    #===========================================================================
+    # SETUP & TEARDOWN
+    #===========================================================================
+
+    def setUp(self):
+
+        # Suppress stdout
+        self.held = sys.stdout
+        sys.stdout = StringIO()
+
+        self.root = tempfile.mkdtemp()
+        self.subdir = 'Up__1080'
+        os.mkdir(os.path.join(self.root, self.subdir))
+
+    #===========================================================================
+
+    def tearDown(self):
+        # Restore stdout
+        sys.stdout = self.held
+
+    #===========================================================================
+    # TESTS
+    #===========================================================================
+
+    def testSameTracks(self):
+        """Tests that JSON and -I identification give the same tracks"""
+        movies = [
+            _buildMovie(self.root, self.subdir, 'Up.mkv', info)
+            for info in [MKVINFO_UP_PGS, MKVINFO_UP_PGS_JSON]
+        ]
+
+        tracks = [
+            [(track.trackID, track.fileType, track.default,
+              track.info['language']) for track in movie.audioTracks +
+             movie.subtitleTracks]
+            for movie in movies
+        ]
+
+        self.assertEqual(
+            tracks[0],
+            tracks[1]
+        )
+
+        self.assertEqual(
+            [1080, 1080],
+            [movie.resolution for movie in movies]
+        )
+
+    #===========================================================================
+
+    def testDuration(self):
+        """Tests that the duration is read from either probe"""
+        for info in [MKVINFO_UP_PGS, MKVINFO_UP_PGS_JSON]:
+            movie = _buildMovie(self.root, self.subdir, 'Up.mkv', info)
+
+            self.assertEqual(
+                5767.563,
+                movie.duration
+            )
+
+    #===========================================================================
+
+    def testSizes(self):
+        """Tests that codec private and track sizes come from JSON"""
+        movie = _buildMovie(
+            self.root, self.subdir, 'Up.mkv', MKVINFO_UP_PGS_JSON
+        )
+
+        self.assertEqual(
+            [(0, 1107372096), (0, 2661291630)],
+            [(track.codecPrivateLength, track.size)
+             for track in movie.audioTracks]
+        )
+
+        # The last subtitle track has neither
+        self.assertEqual(
+            (None, None),
+            (movie.subtitleTracks[-1].codecPrivateLength,
+             movie.subtitleTracks[-1].size)
+        )
+
+    #===========================================================================
+
+    def testProbeCache(self):
+        """Tests that an unchanged movie isn't probed a second time"""
+        path = os.path.join(self.root, self.subdir, 'Up.mkv')
+        with open(path, 'wb') as f:
+            f.write('Matroska')
+
+        cacheFile = tools.Config.probeCacheFile
+        tools.Config.probeCacheFile = os.path.join(self.root, 'probes.db')
+        try:
+            first = _buildMovie(
+                self.root, self.subdir, 'Up.mkv', MKVINFO_UP_PGS_JSON
+            )
+            with mock.patch('tools.runner.run') as mockRun:
+                second = tools.Movie(self.root, self.subdir, 'Up.mkv')
+
+            self.assertFalse(
+                mockRun.called
+            )
+
+            self.assertEqual(
+                [(track.trackID, track.fileType) for track in
+                 first.audioTracks + first.subtitleTracks],
+                [(track.trackID, track.fileType) for track in
+                 second.audioTracks + second.subtitleTracks]
+            )
+
+            self.assertEqual(
+                first.duration,
+                second.duration
+            )
+        finally:
+            tools._PROBE_CACHE.close()
+            tools._PROBE_CACHE = None
+            tools.Config.probeCacheFile = cacheFile
+
+    #===========================================================================
+
+    def testProbeCacheFails(self):
+        """Tests that a movie is still probed if the probe cache fails"""
+        cache = mock.Mock()
+        cache.get.side_effect = tools.probecache.sqlite3.OperationalError(
+            'disk I/O error'
+        )
+        cache.put.side_effect = tools.probecache.sqlite3.OperationalError(
+            'disk I/O error'
+        )
+
+        with mock.patch('tools._probeCache', return_value=cache):
+            movie = _buildMovie(
+                self.root, self.subdir, 'Up.mkv', MKVINFO_UP_PGS_JSON
+            )
+
+        self.assertEqual(
+            (True, True),
+            (cache.get.called, cache.put.called)
+        )
+
+        self.assertEqual(
+            5767.563,
+            movie.duration
+        )
+
+# extractTracks() ==============================================================
+
+class TestExtractTracks(unittest.TestCase):
+    """Tests that a movie's tracks are extracted with a single mkvextract run"""
+
+    #===========================================================================
+    # SETUP & TEARDOWN
+    #===========================================================================
+
+    def setUp(self):
+
+        # Suppress stdout
+        self.held = sys.stdout
+        sys.stdout = StringIO()
+
+        self.root = tempfile.mkdtemp()
+        self.subdir = 'Up__1080'
+        os.mkdir(os.path.join(self.root, self.subdir))
+
+        self.movie = _buildMovie(self.root, self.subdir, 'Up.mkv', MKVINFO_UP_PGS)
+
+    #===========================================================================
+
+    def tearDown(self):
+        # Restore stdout
+        sys.stdout = self.held
+
+    #===========================================================================
+    # TESTS
+    #===========================================================================
+
+    @mock.patch('tools.runner.run')
+    def testSingleCommand(self, mockRun):
+        """Tests that every track is passed to one mkvextract command"""
+        tools.Config.mkvExtract = 'mkvextract'
+        mockRun.return_value = _fakeRun()
+
+        tools.mkvExtractTracks(
+            '/src/Up.mkv',
+            [(3, '/dest/Up_Track3_sub.sup'), (4, '/dest/Up_Track4_sub.sup')]
+        )
+
+        mockRun.assert_called_once_with(
+            ['mkvextract', 'tracks', '/src/Up.mkv',
+             '3:/dest/Up_Track3_sub.sup', '4:/dest/Up_Track4_sub.sup']
+        )
+
+    #===========================================================================
+
+    @mock.patch('tools.mkvExtractTracks')
+    def testMovieExtractsOnce(self, mockExtract):
+        """Tests that a movie extracts all its pgs tracks in one call"""
+        mockExtract.side_effect = _touchExtractions
+
+        self.movie.extractTracks()
+
+        self.assertEqual(
+            1,
+            mockExtract.call_count
+        )
+
+        trackIDs = [trackID for trackID, dest in mockExtract.call_args[0][1]]
+
+        self.assertEqual(
+            [3, 4, 5],
+            trackIDs
+        )
+
+        self.assertTrue(
+            self.movie.extracted
+        )
+
+        for track in self.movie.subtitleTracks:
+            self.assertTrue(
+                track.extracted
+            )
+            self.assertEqual(
+                track.extractPath(),
+                track.extractedSup
+            )
+
+    #===========================================================================
+
+    @mock.patch('tools.mkvExtractTracks')
+    def testMissingOutput(self, mockExtract):
+        """Tests that tracks mkvextract failed to write stay unextracted"""
+        def partial(file, extractions):
+            _touchExtractions(file, extractions[:1])
+        mockExtract.side_effect = partial
+
+        self.movie.extractTracks()
+
+        self.assertFalse(
+            self.movie.extracted
+        )
+
+        self.assertEqual(
+            [True, False, False],
+            [track.extracted for track in self.movie.subtitleTracks]
+        )
+
+        # Running again should only ask for the tracks that failed.
+        mockExtract.side_effect = _touchExtractions
+
+        self.movie.extractTracks()
+
+        self.assertEqual(
+            [4, 5],
+            [trackID for trackID, dest in mockExtract.call_args[0][1]]
+        )
+
+        self.assertTrue(
+            self.movie.extracted
+        )
+
+    #===========================================================================
+
+    @mock.patch('tools.mkvExtractTracks')
+    def testInterrupted(self, mockExtract):
+        """Tests that tracks written by a failed run are redone, not kept"""
+        def failed(file, extractions):
+            _touchExtractions(file, extractions)
+            return 2
+        mockExtract.side_effect = failed
+
+        # An empty track left by an older run doesn't count either.
+        track = self.movie.subtitleTracks[0]
+        open(track.extractPath(), 'wb').close()
+
+        self.movie.extractTracks()
+
+        self.assertEqual(
+            (False, [False] * 3),
+            (self.movie.extracted,
+             [track.extracted for track in self.movie.subtitleTracks])
+        )
+
+        # Nothing the failed run wrote is left to be mistaken for a track.
+        self.assertEqual(
+            [],
+            [name for name in os.listdir(os.path.join(self.root, self.subdir))
+             if name.endswith(tools.PARTIAL_EXT)]
+        )
+
+        mockExtract.side_effect = _touchExtractions
+
+        self.movie.extractTracks()
+
+        self.assertEqual(
+            ([3, 4, 5], True),
+            ([trackID for trackID, dest in mockExtract.call_args[0][1]],
+             self.movie.extracted)
+        )
+
+# SubtitleTrack.convertTrack() =================================================
+
+class TestSup2SubCounts(unittest.TestCase):
+    """Tests that caption counts are read from BDSup2Sub output"""
+
+    #===========================================================================
+    # TESTS
+    #===========================================================================
+
+    def testNoForced(self):
+        """Tests a track without any forced captions"""
+        self.assertEqual(
+            (1197, 0),
+            tools._sup2SubCounts(SUBTITLES_NO_FORCED.split('\n'))
+        )
+
+    #===========================================================================
+
+    def testSomeForced(self):
+        """Tests a track with some forced captions"""
+        self.assertEqual(
+            (1197, 30),
+            tools._sup2SubCounts(SUBTITLES_SOME_FORCED.split('\n'))
+        )
+
+    #===========================================================================
+
+    def testAllForced(self):
+        """Tests a track made up entirely of forced captions"""
+        self.assertEqual(
+            (1197, 1197),
+            tools._sup2SubCounts(SUBTITLES_ALL_FORCED.split('\n'))
+        )
+
+    #===========================================================================
+
+    def testForcedInPath(self):
+        """Tests that a path containing 'forced' isn't read as a count"""
+        lines = SUBTITLES_SOME_FORCED.replace(
+            '/Users/sean/', '/Users/sean/forced stuff/'
+        ).split('\n')
+
+        self.assertEqual(
+            (1197, 30),
+            tools._sup2SubCounts(lines)
+        )
+
+#===============================================================================
+
+class TestConvertTracks(unittest.TestCase):
+    """Tests that subtitle tracks convert on the shared BDSup2Sub pool"""
+
+    #===========================================================================
+    # SETUP & TEARDOWN
+    #===========================================================================
+
+    def setUp(self):
+
+        # Suppress stdout
+        self.held = sys.stdout
+        sys.stdout = StringIO()
+
+        self.root = tempfile.mkdtemp()
+        self.subdir = 'Up__1080'
+        os.mkdir(os.path.join(self.root, self.subdir))
+
+        self.movie = _buildMovie(self.root, self.subdir, 'Up.mkv', MKVINFO_UP_PGS)
+
+        with mock.patch('tools.mkvExtractTracks') as mockExtract:
+            mockExtract.side_effect = _touchExtractions
+            self.movie.extractTracks()
+
+        # Each track gets a different BDSup2Sub result, keyed by language.
+        self.outputs = {
+            'eng': SUBTITLES_NO_FORCED,
+            'fre': SUBTITLES_SOME_FORCED,
+            'spa': SUBTITLES_ALL_FORCED,
+        }
+
+        self.workers = tools.Config.sup2SubWorkers
+        tools.Config.sup2SubWorkers = 3
+        tools._SUP2SUB_POOL = None
+
+        self.converter = tools.Config.converter
+
+    #===========================================================================
+
+    def tearDown(self):
+        # Restore stdout
+        sys.stdout = self.held
+
+        tools.Config.sup2SubWorkers = self.workers
+        tools._SUP2SUB_POOL = None
+
+        tools.Config.converter = self.converter
+
+    #===========================================================================
+    # PRIVATE METHODS
+    #===========================================================================
+
+    def _fakeSup2Sub(self, file, options, dest, popen=False):
+        """Writes an idx/sub pair and returns the output for the track"""
+        for ext in ['.idx', '.sub']:
+            with open(dest.replace('.idx', ext), 'w') as f:
+                f.write('')
+
+        for track in self.movie.subtitleTracks:
+            if track.extractedSup == file:
+                output = self.outputs[track.info['language']]
+
+        if popen:
+            return output.split('\n')
+
+    #===========================================================================
+
+    def _writeSups(self):
+        """Writes a readable sup for each track, forced keyed by language"""
+        sups = {
+            'eng': buildSup([[(0, False)], [(0, False)]]),
+            'fre': buildSup([[(0, False)], [(0, True)]]),
+            'spa': buildSup([[(0, True)], [(0, True)]]),
+        }
+        for track in self.movie.subtitleTracks:
+            with open(track.extractedSup, 'wb') as f:
+                f.write(sups[track.info['language']])
+
+    #===========================================================================
+    # TESTS
+    #===========================================================================
+
+    @mock.patch('tools.bdSup2Sub')
+    def testForcedResults(self, mockSup2Sub):
+        """Tests that forced results are kept per track"""
+        mockSup2Sub.side_effect = self._fakeSup2Sub
+
+        self.movie.convertTracks()
+
+        self.assertTrue(
+            self.movie.converted
+        )
+
+        results = [
+            (track.info['language'], track.forced, track.forcedOnly)
+            for track in self.movie.subtitleTracks
+        ]
+
+        self.assertEqual(
+            [('eng', False, False), ('fre', True, False), ('spa', True, True)],
+            results
+        )
+
+        # Only the partially forced track needs a second, forced only, pass.
+        forcedPasses = [
+            call for call in mockSup2Sub.call_args_list
+            if '-D' in call[0][1]
+        ]
+
+        self.assertEqual(
+            1,
+            len(forcedPasses)
+        )
+
+        self.assertTrue(
+            forcedPasses[0][0][2].endswith('_Track4_sub_forced.idx')
+        )
+
+    #===========================================================================
+
+    @mock.patch('tools.bdSup2Sub')
+    def testForcedFromSup(self, mockSup2Sub):
+        """Tests that only the needed passes run when the sup is readable"""
+        mockSup2Sub.side_effect = self._fakeSup2Sub
+        self._writeSups()
+
+        # If BDSup2Sub's output were used, every track would look unforced.
+        self.outputs = dict.fromkeys(self.outputs, SUBTITLES_NO_FORCED)
+
+        self.movie.convertTracks()
+
+        results = [
+            (track.info['language'], track.forced, track.forcedOnly)
+            for track in self.movie.subtitleTracks
+        ]
+
+        self.assertEqual(
+            [('eng', False, False), ('fre', True, False), ('spa', True, True)],
+            results
+        )
+
+        passes = sorted(
+            [(os.path.basename(call[0][2]), call[0][1])
+             for call in mockSup2Sub.call_args_list]
+        )
+
+        # The entirely forced track goes straight to its forced only pass.
+        self.assertEqual(
+            [
+                ('Up_Track3_sub.idx', '-r 1080p'),
+                ('Up_Track4_sub.idx', '-r 1080p'),
+                ('Up_Track4_sub_forced.idx', '-r 1080p -D'),
+                ('Up_Track5_sub_forced.idx', '-r 1080p -D'),
+            ],
+            passes
+        )
+
+    #===========================================================================
+
+    @mock.patch('tools.bdSup2Sub')
+    def testNativeConverter(self, mockSup2Sub):
+        """Tests that the native converter writes every track without Java"""
+        tools.Config.converter = 'native'
+        self._writeSups()
+
+        self.movie.convertTracks()
+
+        self.assertFalse(
+            mockSup2Sub.called
+        )
+
+        self.assertTrue(
+            self.movie.converted
+        )
+
+        written = sorted(
+            [fileName for fileName in os.listdir(
+                os.path.join(self.root, self.subdir)
+            ) if fileName.endswith('.idx') or fileName.endswith('.sub')]
+        )
+
+        # The entirely forced track only gets a forced track.
+        self.assertEqual(
+            [
+                'Up_Track3_sub.idx', 'Up_Track3_sub.sub',
+                'Up_Track4_sub.idx', 'Up_Track4_sub.sub',
+                'Up_Track4_sub_forced.idx', 'Up_Track4_sub_forced.sub',
+                'Up_Track5_sub_forced.idx', 'Up_Track5_sub_forced.sub',
+            ],
+            written
+        )
+
+    #===========================================================================
+
+    @mock.patch('tools.bdSup2Sub')
+    @mock.patch('tools.vobsub.numpy', None)
+    def testNativeFallback(self, mockSup2Sub):
+        """Tests that BDSup2Sub is used if the native converter can't run"""
+        mockSup2Sub.side_effect = self._fakeSup2Sub
+        tools.Config.converter = 'native'
+        self._writeSups()
+
+        self.movie.convertTracks()
+
+        self.assertEqual(
+            4,
+            mockSup2Sub.call_count
+        )
+
+        self.assertTrue(
+            all([track.converted for track in self.movie.subtitleTracks])
+        )
+
+    #===========================================================================
+
+    @mock.patch('tools.bdSup2Sub')
+    def testConcurrentConversions(self, mockSup2Sub):
+        """Tests that tracks convert at the same time, up to the pool size"""
+        lock = threading.Lock()
+        running = [0]
+        peak = [0]
+
+        def slowSup2Sub(*args, **kwargs):
+            with lock:
+                running[0] += 1
+                peak[0] = max(peak[0], running[0])
+            threading.Event().wait(0.05)
+            with lock:
+                running[0] -= 1
+            return self._fakeSup2Sub(*args, **kwargs)
+
+        mockSup2Sub.side_effect = slowSup2Sub
+
+        self.movie.convertTracks()
+
+        self.assertEqual(
+            3,
+            peak[0]
+        )
+
+# Movie.encodeMovie() ==========================================================
+
+class TestChunkRanges(unittest.TestCase):
+    """Tests splitting a movie into encode chunks at chapters"""
+
+    #===========================================================================
+    # TESTS
+    #===========================================================================
+
+    def testEvenSplits(self):
+        """Tests that splits are made at the chapters nearest even splits"""
+        chapters = [0.0, 400.0, 1150.0, 1900.0, 2300.0, 3100.0, 3500.0]
+
+        self.assertEqual(
+            [(0.0, 1150.0), (1150.0, 1150.0), (2300.0, None)],
+            tools._chunkRanges(chapters, 3600.0, 3)
+        )
+
+    #===========================================================================
+
+    def testMinimumLength(self):
+        """Tests that no chunk is made shorter than the minimum length"""
+        # Only one chapter leaves both sides long enough.
+        chapters = [0.0, 100.0, 600.0, 900.0]
+
+        self.assertEqual(
+            [(0.0, 600.0), (600.0, None)],
+            tools._chunkRanges(chapters, 1000.0, 4)
+        )
+
+    #===========================================================================
+
+    def testUnsplittable(self):
+        """Tests that a movie without chapters or a duration isn't split"""
+        self.assertEqual(
+            [[], [], []],
+            [tools._chunkRanges([], 3600.0, 3),
+             tools._chunkRanges([0.0, 1800.0], None, 3),
+             tools._chunkRanges([0.0, 1800.0], 3600.0, 1)]
+        )
+
+#===============================================================================
+
+class TestMkvChapters(unittest.TestCase):
+    """Tests reading chapter starts from mkvextract"""
+
+    #===========================================================================
+    # TESTS
+    #===========================================================================
+
+    @mock.patch('tools.runner.run')
+    def testChapters(self, mockRun):
+        """Tests that chapter starts are read in seconds, in order"""
+        mockRun.return_value = _fakeRun(
+            'CHAPTER01=00:00:00.000\r\n'
+            'CHAPTER01NAME=Chapter 01\r\n'
+            'CHAPTER02=01:02:03.500\r\n'
+            'CHAPTER02NAME=Chapter 02\r\n'
+            'CHAPTER03=00:10:00.000\r\n'
+            'CHAPTER03NAME=Chapter 03\r\n'
+        )
+
+        self.assertEqual(
+            [0.0, 600.0, 3723.5],
+            tools.mkvChapters('/the/best/fake/path.mkv')
+        )
+
+        mockRun.assert_called_once_with(
+            [tools.Config.mkvExtract, 'chapters', '/the/best/fake/path.mkv',
+             '-s'],
+            capture=True, timeout=tools.PROBE_TIMEOUT
+        )
+
+#===============================================================================
+
+class TestNativeReader(unittest.TestCase):
+    """Tests reading tracks and chapters without mkvmerge or mkvextract"""
+
+    #===========================================================================
+    # SETUP & TEARDOWN
+    #===========================================================================
+
+    def setUp(self):
+
+        # Suppress stdout
+        self.held = sys.stdout
+        sys.stdout = StringIO()
+
+        self.root = tempfile.mkdtemp()
+        self.path = os.path.join(self.root, 'Up.mkv')
+
+        mkv = tools.matroska
+
+        def track(number, trackType, codec, *extra):
+            return element(mkv.TRACK_ENTRY, [
+                element(mkv.TRACK_NUMBER, number),
+                element(mkv.TRACK_TYPE, trackType),
+                element(mkv.CODEC_ID, codec),
+            ] + list(extra))
+
+        with open(self.path, 'wb') as f:
+            f.write(element(mkv.EBML, [element(mkv.DOC_TYPE, 'matroska')]))
+            f.write(element(mkv.SEGMENT, [
+                element(mkv.INFO, [element(mkv.DURATION, 5767563.0)]),
+                element(mkv.TRACKS, [
+                    track(1, 1, 'V_MPEG4/ISO/AVC', element(mkv.VIDEO, [
+                        element(mkv.PIXEL_WIDTH, 1920),
+                        element(mkv.PIXEL_HEIGHT, 1080),
+                    ])),
+                    track(2, 2, 'A_TRUEHD', element(mkv.FLAG_DEFAULT, 0)),
+                    track(3, 0x11, 'S_HDMV/PGS', element(mkv.LANGUAGE, 'fre')),
+                ]),
+                # An End of Display Set segment for track 3, 2 seconds in
+                element(mkv.CLUSTER, [
+                    element(mkv.CLUSTER_TIMECODE, 2000),
+                    element(mkv.SIMPLE_BLOCK, '\x83\x00\x00\x80\x80\x00\x00'),
+                ]),
+                element(mkv.CHAPTERS, [
+                    element(mkv.EDITION_ENTRY, [
+                        element(mkv.CHAPTER_ATOM, [
+                            element(mkv.CHAPTER_TIME_START, start)
+                        ]) for start in [0, 600000000000, 3723500000000]
+                    ]),
+                ]),
+            ]))
+
+        self.patches = [
+            mock.patch.object(tools.Config, 'probeReader', 'native'),
+            mock.patch.object(tools.Config, 'probeCache', False),
+        ]
+        for patch in self.patches:
+            patch.start()
+
+    #===========================================================================
+
+    def tearDown(self):
+        for patch in self.patches:
+            patch.stop()
+        shutil.rmtree(self.root)
+
+        # Restore stdout
+        sys.stdout = self.held
+
+    #===========================================================================
+    # TESTS
+    #===========================================================================
+
+    @mock.patch('tools.runner.run')
+    def testTracks(self, mockRun):
+        """Tests that tracks are read from the file without mkvmerge"""
+        movie = MockMovie(self.path)
+
+        videoTracks, audioTracks, subtitleTracks = tools.mkvInfo(movie)
+
+        self.assertEqual(
+            (0, '1920x1080', 5767.563),
+            (videoTracks[0][0], videoTracks[0][1]['pixel_dimensions'],
+             movie.duration)
+        )
+
+        self.assertEqual(
+            [(1, 'truehd', False), (2, 'pgs', True)],
+            [(track.trackID, track.fileType, track.default)
+             for track in audioTracks + subtitleTracks]
+        )
+
+        self.assertEqual(
+            'fre',
+            subtitleTracks[0].info['language']
+        )
+
+        self.assertFalse(
+            mockRun.called
+        )
+
+    #===========================================================================
+
+    @mock.patch('tools.runner.run')
+    def testChapters(self, mockRun):
+        """Tests that chapters are read from the file without mkvextract"""
+        self.assertEqual(
+            [0.0, 600.0, 3723.5],
+            tools.mkvChapters(self.path)
+        )
+
+        self.assertFalse(
+            mockRun.called
+        )
+
+    #===========================================================================
+
+    @mock.patch('tools.runner.run')
+    def testFallback(self, mockRun):
+        """Tests that mkvmerge lists files that can't be read directly"""
+        mockRun.return_value = _fakeRun(json.dumps(MKVINFO_UP_PGS_JSON))
+        with open(self.path, 'wb') as f:
+            f.write('Not Matroska')
+
+        tools.mkvInfo(MockMovie(self.path))
+
+        mockRun.assert_called_once_with(
+            [tools.Config.mkvMerge, '--identification-format', 'json',
+             '--identify', self.path],
+            capture=True, timeout=tools.PROBE_TIMEOUT
+        )
+
+    #===========================================================================
+
+    @mock.patch('tools.runner.run')
+    def testExtract(self, mockRun):
+        """Tests that subtitles are extracted without mkvextract"""
+        movie = mock.Mock(
+            fileName='Up.mkv', root=self.root, subdir='', path=self.path
+        )
+        track = tools.SubtitleTrack(movie, 2, 'pgs', {'default_track': '1'})
+
+        with mock.patch.object(tools.Config, 'extractor', 'native'):
+            extracted = tools.extractTracks(self.path, [track])
+
+        with open(track.extractedSup, 'rb') as f:
+            self.assertEqual(
+                ([track], 'PG\x00\x02\xbf\x20\x00\x00\x00\x00\x80\x00\x00'),
+                (extracted, f.read())
+            )
+
+        self.assertFalse(
+            mockRun.called
+        )
+
+    #===========================================================================
+
+    @mock.patch('tools.mkvExtract')
+    def testExtractFallback(self, mockExtract):
+        """Tests that mkvextract extracts tracks that can't be read directly"""
+        movie = mock.Mock(
+            fileName='Up.mkv', root=self.root, subdir='', path=self.path
+        )
+        # Track 1 is the audio.
+        track = tools.SubtitleTrack(movie, 1, 'pgs', {'default_track': '1'})
+
+        with mock.patch.object(tools.Config, 'extractor', 'native'):
+            track.extractTrack()
+
+        mockExtract.assert_called_once_with(
+            self.path, '1:', track.extractPath() + tools.PARTIAL_EXT
+        )
+
+#===============================================================================
+
+class TestChunkedEncode(unittest.TestCase):
+    """Tests encoding a movie in chunks with several HandBrakes"""
+
+    #===========================================================================
+    # SETUP & TEARDOWN
+    #===========================================================================
+
+    def setUp(self):
+
+        # Suppress stdout
+        self.held = sys.stdout
+        sys.stdout = StringIO()
+
+        self.root = tempfile.mkdtemp()
+        self.subdir = 'Up__1080'
+        os.mkdir(os.path.join(self.root, self.subdir))
+
+        # 5767.563 seconds long
+        self.movie = _buildMovie(
+            self.root, self.subdir, 'Up.mkv', MKVINFO_UP_PGS_JSON
+        )
+
+        self.chapters = [0.0, 1900.0, 3850.0, 5000.0]
+
+        self.encodeChunks = tools.Config.encodeChunks
+        self.encodeThreads = tools.Config.encodeThreads
+        tools.Config.encodeChunks = 3
+        tools.Config.encodeThreads = 4
+
+        # Destinations HandBrake should fail on
+        self.failing = []
+        self.encodes = []
+        self.lock = threading.Lock()
+
+    #===========================================================================
+
+    def tearDown(self):
+        # Restore stdout
+        sys.stdout = self.held
+
+        tools.Config.encodeChunks = self.encodeChunks
+        tools.Config.encodeThreads = self.encodeThreads
+
+    #===========================================================================
+    # PRIVATE METHODS
+    #===========================================================================
+
+    def _fakeHandBrake(self, file, options, dest, encodeProgress=None):
+        """Writes the destination, unless it's one that should fail"""
+        with self.lock:
+            self.encodes.append((options, dest))
+        encodeProgress.update(
+            'Encoding: task 1 of 1, 50.00 % '
+            '(100.00 fps, avg 90.00 fps, ETA 00h01m00s)'
+        )
+        if dest in self.failing:
+            return 1
+        with open(dest, 'w') as f:
+            f.write('')
+        encodeProgress.finish()
+        return 0
+
+    #===========================================================================
+
+    def _encode(self, checkpoint=None):
+        """Runs encodeMovie with HandBrake, mkvextract and mkvmerge faked"""
+        with mock.patch('tools.mkvChapters') as mockChapters, \
+                mock.patch('tools.handBrake', self._fakeHandBrake), \
+                mock.patch('tools.mkvAppend') as mockAppend:
+            mockChapters.return_value = self.chapters
+            mockAppend.return_value = 0
+            try:
+                self.movie.encodeMovie(checkpoint=checkpoint)
+            finally:
+                self.appends = mockAppend.call_args_list
+
+    #===========================================================================
+    # TESTS
+    #===========================================================================
+
+    def testChunks(self):
+        """Tests that each chunk is encoded over its range, then joined"""
+        checkpoint = mock.Mock()
+
+        self._encode(checkpoint)
+
+        self.assertEqual(
+            [(0.0, 1900.0), (1900.0, 1950.0), (3850.0, None)],
+            [(chunk['start'], chunk['length']) for chunk in self.movie.chunks]
+        )
+
+        options = [options for dest, options in sorted(
+            [(dest, options) for options, dest in self.encodes]
+        )]
+        self.assertTrue(
+            options[0].endswith(' --stop-at duration:1900.0')
+        )
+        self.assertTrue(
+            options[1].endswith(
+                ' --start-at duration:1900.0 --stop-at duration:1950.0'
+            )
+        )
+        self.assertTrue(
+            options[2].endswith(' --start-at duration:3850.0')
+        )
+        self.assertTrue(
+            all(['--encopts threads=4' in option for option in options])
+        )
+
+        paths = [chunk['path'] for chunk in self.movie.chunks]
+
+        self.assertEqual(
+            [mock.call(paths, self.movie.destination)],
+            self.appends
+        )
+
+        # Chunks are named like the encode, so scans skip them.
+        self.assertTrue(
+            all(['--converted' in path for path in paths])
+        )
+
+        # Joined chunks are removed
+        self.assertEqual(
+            [False, False, False],
+            [os.path.exists(path) for path in paths]
+        )
+
+        self.assertEqual(
+            3,
+            checkpoint.call_count
+        )
+
+        self.assertTrue(
+            self.movie.encoded
+        )
+
+    #===========================================================================
+
+    def testResume(self):
+        """Tests that only unfinished chunks are encoded again"""
+        self.failing = [
+            self.movie.destination.replace('.mkv', '.chunk01.mkv')
+        ]
+
+        self.assertRaises(
+            RuntimeError,
+            self._encode
+        )
+
+        self.assertEqual(
+            ([True, False, True], []),
+            ([chunk['encoded'] for chunk in self.movie.chunks], self.appends)
+        )
+
+        self.assertFalse(
+            self.movie.encoded
+        )
+
+        self.failing = []
+        self.encodes = []
+        self._encode()
+
+        self.assertEqual(
+            [self.movie.chunks[1]['path']],
+            [dest for options, dest in self.encodes]
+        )
+
+        self.assertTrue(
+            self.movie.encoded
+        )
+
+    #===========================================================================
+
+    def testSinglePiece(self):
+        """Tests that a movie is encoded whole without chunks configured"""
+        tools.Config.encodeChunks = 1
+
+        self._encode()
+
+        self.assertEqual(
+            [self.movie.destination],
+            [dest for options, dest in self.encodes]
+        )
+
+        self.assertFalse(
+            '--start-at' in self.encodes[0][0] or
+            'threads=' in self.encodes[0][0]
+        )
+
+    #===========================================================================
+
+    def testSinglePieceFailed(self):
+        """Tests that a failed encode without chunks isn't marked encoded"""
+        tools.Config.encodeChunks = 1
+        self.failing = [self.movie.destination]
+
+        self.assertRaises(
+            RuntimeError,
+            self._encode
+        )
+
+        self.assertEqual(
+            (False, None),
+            (self.movie.encoded, self.movie.progress.finished)
+        )
+
+    #===========================================================================
+
+    def testProgress(self):
+        """Tests that each chunk's progress counts by its share of the movie"""
+        self.failing = [
+            self.movie.destination.replace('.mkv', '.chunk01.mkv')
+        ]
+
+        self.assertRaises(
+            RuntimeError,
+            self._encode
+        )
+
+        # Chunks 0 and 2 finished, chunk 1 got half way.
+        duration = self.movie.duration
+        self.assertAlmostEqual(
+            100 * (1900.0 + 975.0 + duration - 3850.0) / duration,
+            self.movie.progress.percent
+        )
+
+        self.assertEqual(
+            (100.0, 90.0, 60),
+            (self.movie.progress.fps, self.movie.progress.avgFps,
+             self.movie.progress.eta)
+        )
+
+        # Resuming counts the finished chunks as done from the start.
+        self.failing = []
+        self._encode()
+
+        self.assertEqual(
+            (100.0, 1),
+            (self.movie.progress.percent, len(self.movie.progress.parts))
+        )
+
+        self.assertTrue(
+            self.movie.progress.finished
+        )
+
+    #===========================================================================
+
+    def testOldPickle(self):
+        """Tests encoding a movie pickled before chunks and durations"""
+        for name in ['remux', 'duration', 'chunks', 'progress', 'estimate']:
+            delattr(self.movie, name)
+        self.movie = cPickle.loads(cPickle.dumps(self.movie, 2))
+
+        self._encode()
+
+        # Without a duration, there's nothing to split the movie by.
+        self.assertEqual(
+            [self.movie.destination],
+            [dest for options, dest in self.encodes]
+        )
+
+        self.assertTrue(
+            self.movie.encoded
+        )
+
+#===============================================================================
+
+class TestEstimateEncode(unittest.TestCase):
+    """Tests estimating a movie's encode from sample encodes"""
+
+    #===========================================================================
+    # SETUP & TEARDOWN
+    #===========================================================================
+
+    def setUp(self):
+
+        # Suppress stdout
+        self.held = sys.stdout
+        sys.stdout = StringIO()
+
+        self.root = tempfile.mkdtemp()
+        self.subdir = 'Up__1080'
+        os.mkdir(os.path.join(self.root, self.subdir))
+
+        # 5767.563 seconds long
+        self.movie = _buildMovie(
+            self.root, self.subdir, 'Up.mkv', MKVINFO_UP_PGS_JSON
+        )
+        with open(self.movie.path, 'w') as f:
+            f.write('mkv')
+
+        self.estimateCacheFile = tools.Config.estimateCacheFile
+        self.estimateSamples = tools.Config.estimateSamples
+        self.estimateSeconds = tools.Config.estimateSeconds
+        tools.Config.estimateCacheFile = os.path.join(
+            self.root, 'estimates.db'
+        )
+        tools.Config.estimateSamples = 2
+        tools.Config.estimateSeconds = 10
+        tools._ESTIMATE_CACHE = None
+
+        self.encodes = []
+
+    #===========================================================================
+
+    def tearDown(self):
+        # Restore stdout
+        sys.stdout = self.held
+
+        if tools._ESTIMATE_CACHE:
+            tools._ESTIMATE_CACHE.close()
+        tools._ESTIMATE_CACHE = None
+        tools.Config.estimateCacheFile = self.estimateCacheFile
+        tools.Config.estimateSamples = self.estimateSamples
+        tools.Config.estimateSeconds = self.estimateSeconds
+
+        shutil.rmtree(self.root)
+
+    #===========================================================================
+    # PRIVATE METHODS
+    #===========================================================================
+
+    def _fakeHandBrake(self, file, options, dest, encodeProgress=None,
+                       cache=True):
+        """Writes 1000 bytes for each sample"""
+        self.encodes.append((options, dest))
+        with open(dest, 'w') as f:
+            f.write('x' * 1000)
+        return 0
+
+    #===========================================================================
+    # TESTS
+    #===========================================================================
+
+    def testSamples(self):
+        """Tests that samples are encoded with the real options, and scaled"""
+        with mock.patch('tools.handBrake', self._fakeHandBrake):
+            estimate = self.movie.estimateEncode()
+
+        options = self.movie._encodeOptions()
+        duration = self.movie.duration
+        ranges = ' --start-at duration:{0} --stop-at duration:10.0'
+        self.assertEqual(
+            [options + ranges.format(duration * i / 3 - 5.0) for i in [1, 2]],
+            [options for options, dest in self.encodes]
+        )
+
+        # 2000 bytes for 20 seconds of movie
+        self.assertEqual(
+            (int(round(duration * 100)), 800.0),
+            (estimate.size, estimate.bitrate)
+        )
+
+        # Samples are cleaned up once they're measured.
+        self.assertFalse(
+            any([os.path.exists(dest) for options, dest in self.encodes])
+        )
+
+        self.assertTrue(
+            self.movie.estimate is estimate
+        )
+
+    #===========================================================================
+
+    def testCache(self):
+        """Tests that a movie is only sampled again if the settings change"""
+        with mock.patch('tools.handBrake', self._fakeHandBrake):
+            first = self.movie.estimateEncode()
+            second = self.movie.estimateEncode()
+
+        self.assertEqual(
+            (2, first.size),
+            (len(self.encodes), second.size)
+        )
+
+        tools.Config.estimateSeconds = 20
+        with mock.patch('tools.handBrake', self._fakeHandBrake):
+            self.movie.estimateEncode()
+
+        self.assertEqual(
+            4,
+            len(self.encodes)
+        )
+
+    #===========================================================================
+
+    def testFailed(self):
+        """Tests that a movie with no encoded samples has no estimate"""
+        with mock.patch('tools.handBrake') as mockHandBrake:
+            mockHandBrake.return_value = 1
+            estimate = self.movie.estimateEncode()
+
+        self.assertEqual(
+            (None, 2),
+            (estimate, mockHandBrake.call_count)
+        )
+
+#===============================================================================
+
+class TestStageHistory(unittest.TestCase):
+    """Tests that finished stages are recorded in the history"""
+
+    #===========================================================================
+    # SETUP & TEARDOWN
+    #===========================================================================
+
+    def setUp(self):
+
+        # Suppress stdout
+        self.held = sys.stdout
+        sys.stdout = StringIO()
+
+        self.root = tempfile.mkdtemp()
+        self.subdir = 'Up__1080_animation_tv'
+        os.mkdir(os.path.join(self.root, self.subdir))
+
+        # 5767.563 seconds long
+        self.movie = _buildMovie(
+            self.root, self.subdir, 'Up.mkv', MKVINFO_UP_PGS_JSON
+        )
+        with open(self.movie.path, 'w') as f:
+            f.write('x' * 5767563)
+
+        self.historyFile = tools.Config.historyFile
+        tools.Config.historyFile = os.path.join(self.root, 'history.db')
+        tools._HISTORY = None
+        tools._THROUGHPUT = None
+
+    #===========================================================================
+
+    def tearDown(self):
+        # Restore stdout
+        sys.stdout = self.held
+
+        if tools._HISTORY:
+            tools._HISTORY.close()
+        tools._HISTORY = None
+        tools._THROUGHPUT = None
+        tools.Config.historyFile = self.historyFile
+
+        shutil.rmtree(self.root)
+
+    #===========================================================================
+    # PRIVATE METHODS
+    #===========================================================================
+
+    def _fakeHandBrake(self, file, options, dest, encodeProgress=None):
+        """Writes the encode"""
+        with open(dest, 'w') as f:
+            f.write('x' * 1000)
+        return 0
+
+    #===========================================================================
+    # TESTS
+    #===========================================================================
+
+    def testEncode(self):
+        """Tests that an encode is recorded with the settings it ran with"""
+        with mock.patch('tools.handBrake', self._fakeHandBrake):
+            self.movie.encodeMovie()
+
+        records = tools.historyStore().records()
+        self.assertEqual(
+            1,
+            len(records)
+        )
+
+        record = records[0]
+        self.assertEqual(
+            ('encode', self.movie.path, 5767.563, 1000, 1080,
+             tools.Config.x264Speed, 'animation', True, 8000.0),
+            (record['stage'], record['path'], record['duration'],
+             record['outputSize'], record['resolution'], record['x264Speed'],
+             record['preset'], record['tv'], round(record['bitrate']))
+        )
+
+        # The model learns from it at once.
+        self.assertAlmostEqual(
+            record['seconds'],
+            tools.throughputModel().predict(
+                tools.stageRecord(self.movie, 'encode')
+            )
+        )
+
+    #===========================================================================
+
+    def testDisabled(self):
+        """Tests that nothing is recorded without a history file"""
+        tools.Config.historyFile = ''
+        with mock.patch('tools.handBrake', self._fakeHandBrake):
+            self.movie.encodeMovie()
+
+        self.assertEqual(
+            (None, None),
+            (tools.historyStore(), tools.throughputModel())
+        )
+
+#===============================================================================
+
+class TestRemux(unittest.TestCase):
+    """Tests merging a source's video without encoding it"""
+
+    #===========================================================================
+    # SETUP & TEARDOWN
+    #===========================================================================
+
+    def setUp(self):
+
+        # Suppress stdout
+        self.held = sys.stdout
+        sys.stdout = StringIO()
+
+        self.root = tempfile.mkdtemp()
+
+        self.autoRemux = tools.Config.autoRemux
+        self.remuxMaxKbps = tools.Config.remuxMaxKbps
+
+    #===========================================================================
+
+    def tearDown(self):
+        # Restore stdout
+        sys.stdout = self.held
+
+        tools.Config.autoRemux = self.autoRemux
+        tools.Config.remuxMaxKbps = self.remuxMaxKbps
+
+        shutil.rmtree(self.root)
+
+    #===========================================================================
+    # PRIVATE METHODS
+    #===========================================================================
+
+    def _movie(self, subdir, size=0):
+        """Builds the 1920x1080 H.264 Up in the given folder"""
+        os.mkdir(os.path.join(self.root, subdir))
+        with open(os.path.join(self.root, subdir, 'Up.mkv'), 'w') as f:
+            f.seek(size)
+            f.write('x')
+        return _buildMovie(self.root, subdir, 'Up.mkv', MKVINFO_UP_PGS_JSON)
+
+    #===========================================================================
+    # TESTS
+    #===========================================================================
+
+    def testInstruction(self):
+        """Tests that the remux instruction skips the encode"""
+        movie = self._movie('Up__720_remux')
+
+        self.assertEqual(
+            (True, True),
+            (movie.remux, movie.encoded)
+        )
+
+    #===========================================================================
+
+    def testAuto(self):
+        """Tests that only H.264 within the target is remuxed automatically"""
+        self.assertFalse(
+            self._movie('Up__1080').remux
+        )
+
+        tools.Config.autoRemux = True
+
+        self.assertEqual(
+            [True, False, False],
+            [self._movie(subdir).remux for subdir in
+             ['Up (2009)__1080', 'Up__720', 'Up__1080_tv']]
+        )
+
+    #===========================================================================
+
+    def testMaxKbps(self):
+        """Tests that sources over remux_Max_Kbps are still encoded"""
+        tools.Config.autoRemux = True
+        tools.Config.remuxMaxKbps = 10000
+
+        # 5767.563 seconds long, so 10000 kbps is about 7.2 GB.
+        self.assertEqual(
+            [True, False],
+            [self._movie(subdir, size).remux for subdir, size in
+             [('Up__1080', 7000000000), ('Up (2009)__1080', 7300000000)]]
+        )
+
+    #===========================================================================
+
+    def testMerge(self):
+        """Tests that a remux merges the video from the source"""
+        movie = self._movie('Up__1080_remux')
+
+        with mock.patch('tools.mkvmerge') as mockMerge, \
+                mock.patch('tools.Movie') as mockMovie:
+            mockMerge.return_value = 0
+            movie.mergeMovie()
+
+        command = mockMerge.call_args[0][0]
+        self.assertEqual(
+            ['-A', '-S', '-B', '-M', movie.path, '-D', '-S', '-B'],
+            command[:8]
+        )
+
+        # There's no encode to look for subtitles in.
+        self.assertFalse(
+            mockMovie.called
+        )
+
+        self.assertTrue(
+            movie.merged
+        )
+
+    #===========================================================================
+
+    def testMergeFailed(self):
+        """Tests that a failed mkvmerge fails the merge"""
+        movie = self._movie('Up__1080_remux')
+
+        with mock.patch('tools.runner.run') as mockRun:
+            mockRun.return_value = _fakeRun(status=2)
+            self.assertRaises(
+                RuntimeError,
+                movie.mergeMovie
+            )
+
+        self.assertFalse(
+            movie.merged
+        )
+
+#===============================================================================
+
+class TestHandBrake(unittest.TestCase):
+    """Tests running HandBrake and reading its progress"""
+
+    #===========================================================================
+    # SETUP & TEARDOWN
+    #===========================================================================
+
+    def setUp(self):
+
+        # Suppress stdout
+        self.held = sys.stdout
+        sys.stdout = StringIO()
+
+        self.root = tempfile.mkdtemp()
+        self.handBrake = tools.Config.handBrake
+
+        # Stands in for HandBrakeCLI, writing progress the way it does.
+        tools.Config.handBrake = os.path.join(self.root, 'HandBrakeCLI')
+        with open(tools.Config.handBrake, 'w') as f:
+            f.write(
+                '#!/bin/sh\n'
+                'if [ "$1" = --version ]; then\n'
+                '    echo "HandBrake ${VERSION:-1.0.0}"\n'
+                '    exit 0\n'
+                'fi\n'
+                'echo "$@" > "$4.args"\n'
+                'printf "\\rEncoding: task 1 of 1, 10.00 %%"\n'
+                'printf "\\rEncoding: task 1 of 1, 55.50 %% (120.50 fps, '
+                'avg 110.25 fps, ETA 00h02m05s)"\n'
+                'echo\n'
+                'echo "Encode done!"\n'
+                'exit $STATUS\n'
+            )
+        os.chmod(tools.Config.handBrake, 0755)
+
+    #===========================================================================
+
+    def tearDown(self):
+        tools.Config.handBrake = self.handBrake
+        shutil.rmtree(self.root)
+        os.environ.pop('STATUS', None)
+        os.environ.pop('VERSION', None)
+
+        # Restore stdout
+        sys.stdout = self.held
+
+    #===========================================================================
+    # TESTS
+    #===========================================================================
+
+    def testProgress(self):
+        """Tests that progress is read from HandBrake's output as it encodes"""
+        if sys.platform.startswith('win'):
+            return
+
+        os.environ['STATUS'] = '1'
+        encodeProgress = tools.progress.EncodeProgress()
+        dest = os.path.join(self.root, 'Up Movie--converted.mkv')
+
+        status = tools.handBrake(
+            '/src/Up Movie.mkv', '-f mkv -q 20 --encopts threads=4', dest,
+            encodeProgress=encodeProgress
+        )
+
+        self.assertEqual(
+            (1, 55.5, 120.5, 110.25, 125),
+            (status, encodeProgress.percent, encodeProgress.fps,
+             encodeProgress.avgFps, encodeProgress.eta)
+        )
+
+        # A failed encode isn't finished.
+        self.assertEqual(
+            None,
+            encodeProgress.finished
+        )
+
+        # Paths with spaces reach HandBrake whole.
+        with open(dest + '.args') as f:
+            self.assertEqual(
+                '-i /src/Up Movie.mkv -o {dest} -f mkv -q 20 --encopts '
+                'threads=4\n'.format(dest=dest),
+                f.read()
+            )
+
+    #===========================================================================
+
+    def testFinished(self):
+        """Tests that a successful encode finishes its progress"""
+        if sys.platform.startswith('win'):
+            return
+
+        os.environ['STATUS'] = '0'
+        encodeProgress = tools.progress.EncodeProgress()
+
+        tools.handBrake(
+            '/src/Up.mkv', '-f mkv', os.path.join(self.root, 'Up.mkv'),
+            encodeProgress=encodeProgress
+        )
+
+        self.assertEqual(
+            (100.0, 0),
+            (encodeProgress.percent, encodeProgress.eta)
+        )
+
+        self.assertTrue(
+            encodeProgress.finished
+        )
+
+    #===========================================================================
+
+    def testSlot(self):
+        """Tests that an encode in a slot runs a thread per core of it"""
+        if sys.platform.startswith('win'):
+            return
+
+        os.environ['STATUS'] = '0'
+        dest = os.path.join(self.root, 'Up.mkv')
+        slots = tools.affinity.CpuSlots(
+            2, pin=False, lockDir=self.root, cpus=range(6), nodes=[range(6)]
+        )
+
+        with mock.patch.object(tools, '_CPU_SLOTS', slots):
+            with mock.patch.object(tools.Config, 'encodeSlots', 2):
+                tools.handBrake('/src/Up.mkv', '-f mkv --encopts ref=4', dest)
+
+        with open(dest + '.args') as f:
+            self.assertEqual(
+                '-i /src/Up.mkv -o {dest} -f mkv --encopts ref=4:threads=3\n'
+                ''.format(dest=dest),
+                f.read()
+            )
+
+        # The slot is free again.
+        self.assertEqual(
+            0,
+            slots.busy()
+        )
+
+    #===========================================================================
+
+    def testCache(self):
+        """Tests that a second encode of the same source reuses the first"""
+        if sys.platform.startswith('win'):
+            return
+
+        os.environ['STATUS'] = '0'
+        source = os.path.join(self.root, 'Up.mkv')
+        with open(source, 'w') as f:
+            f.write('Up')
+        first = os.path.join(self.root, 'Up--converted.mkv')
+        second = os.path.join(self.root, 'Up Again--converted.mkv')
+        # Our HandBrake only writes its args, so the encode is made for it.
+        with open(first, 'w') as f:
+            f.write('Encoded Up')
+        encodeProgress = tools.progress.EncodeProgress()
+
+        with mock.patch.object(tools, '_ENCODE_CACHE', None):
+            with mock.patch.multiple(
+                tools.Config, encodeCacheGb=1,
+                encodeCacheFolder=os.path.join(self.root, 'encodes')
+            ):
+                tools.handBrake(source, '-f mkv', first)
+                status = tools.handBrake(
+                    source, '-f mkv', second, encodeProgress=encodeProgress
+                )
+                tools._ENCODE_CACHE.close()
+
+        with open(second) as f:
+            self.assertEqual(
+                (0, 'Encoded Up'),
+                (status, f.read())
+            )
+
+        # HandBrake didn't run again, and the encode counts as skipped.
+        self.assertEqual(
+            (False, 1.0, True),
+            (os.path.exists(second + '.args'), encodeProgress.skipped,
+             bool(encodeProgress.finished))
+        )
+
+    #===========================================================================
+
+    def testCacheVersion(self):
+        """Tests that encodes from another HandBrake version aren't reused"""
+        if sys.platform.startswith('win'):
+            return
+
+        os.environ['STATUS'] = '0'
+        source = os.path.join(self.root, 'Up.mkv')
+        with open(source, 'w') as f:
+            f.write('Up')
+        first = os.path.join(self.root, 'Up--converted.mkv')
+        second = os.path.join(self.root, 'Up Again--converted.mkv')
+        with open(first, 'w') as f:
+            f.write('Encoded Up')
+
+        with mock.patch.object(tools, '_ENCODE_CACHE', None):
+            with mock.patch.multiple(
+                tools.Config, encodeCacheGb=1,
+                encodeCacheFolder=os.path.join(self.root, 'encodes')
+            ):
+                tools.handBrake(source, '-f mkv', first)
+                # HandBrake is upgraded in place between runs.
+                os.environ['VERSION'] = '1.1.0'
+                tools._HANDBRAKE_VERSIONS.clear()
+                tools.handBrake(source, '-f mkv', second)
+                tools._ENCODE_CACHE.close()
+
+        self.assertEqual(
+            ('HandBrake 1.1.0', True),
+            (tools._HANDBRAKE_VERSIONS[tools.Config.handBrake],
+             os.path.exists(second + '.args'))
+        )
+
+#===============================================================================
+
+# Sup2SubServer ================================================================
+
+class TestSup2SubServer(unittest.TestCase):
+    """Tests that conversions are sent to a persistent BDSup2Sub JVM"""
+
+    #===========================================================================
+    # SETUP & TEARDOWN
+    #===========================================================================
+
+    def setUp(self):
+
+        # Suppress stdout
+        self.held = sys.stdout
+        sys.stdout = StringIO()
+
+        self.persistent = tools.Config.sup2SubPersistent
+        tools.Config.sup2SubPersistent = True
+        tools.Config.java = '/usr/bin/java'
+        tools.Config.sup2Sub = '/opt/BDSup2Sub.jar'
+
+        tools.Sup2SubServer.unavailable = False
+        tools._stopSup2SubServers()
+
+    #===========================================================================
+
+    def tearDown(self):
+        # Restore stdout
+        sys.stdout = self.held
+
+        tools.Config.sup2SubPersistent = self.persistent
+        tools.Sup2SubServer.unavailable = False
+        tools._stopSup2SubServers()
+
+    #===========================================================================
+    # TESTS
+    #===========================================================================
+
+    @mock.patch('tools.runner.start')
+    @mock.patch('tools.Sup2SubServer._compile')
+    def testJobOutput(self, mockCompile, mockStart):
+        """Tests that one job's output is read up to the DONE marker"""
+        mockCompile.return_value = '/tmp/ripmaster-java'
+        mockStart.side_effect = _fakeJvm(
+            [SUBTITLES_SOME_FORCED + '@@RIPMASTER_DONE@@ 0\n' + 'next job\n']
+        )
+
+        shellOut = tools.bdSup2Sub(
+            '/movie/Up_Track3_sub.sup', '-r 1080p', '/movie/Up_Track3_sub.idx',
+            popen=True
+        )
+
+        mockStart.assert_called_once_with(
+            [
+                '/usr/bin/java', '-cp',
+                os.pathsep.join(['/opt/BDSup2Sub.jar', '/tmp/ripmaster-java']),
+                'Sup2SubServer', '/opt/BDSup2Sub.jar'
+            ],
+            stdin=True, stdout=mock.ANY, stderr=mock.ANY
+        )
+
+        jvm = mockStart.side_effect.tool
+        jvm.process.stdin.write.assert_called_once_with(
+            '-r\t1080p\t-o\t/movie/Up_Track3_sub.idx\t/movie/Up_Track3_sub.sup\n'
+        )
+
+        # Blank lines aren't passed on by the runner.
+        self.assertEqual(
+            [line for line in SUBTITLES_SOME_FORCED.split('\n') if line],
+            shellOut
+        )
+
+        self.assertEqual(
+            (1197, 30),
+            tools._sup2SubCounts(shellOut)
+        )
+
+    #===========================================================================
+
+    @mock.patch('tools.runner.start')
+    @mock.patch('tools.Sup2SubServer._compile')
+    def testServerReused(self, mockCompile, mockStart):
+        """Tests that a second job goes to the JVM the first job started"""
+        mockCompile.return_value = '/tmp/ripmaster-java'
+        mockStart.side_effect = _fakeJvm(
+            ['first\n@@RIPMASTER_DONE@@ 0\n', 'second\n@@RIPMASTER_DONE@@ 0\n']
+        )
+
+        first = tools.bdSup2Sub('a.sup', '-r 720p', 'a.idx', popen=True)
+        second = tools.bdSup2Sub('b.sup', '-r 720p -D', 'b.idx', popen=True)
+
+        self.assertEqual(
+            (1, ['first'], ['second']),
+            (mockStart.call_count, first, second)
+        )
+
+    #===========================================================================
+
+    @mock.patch('tools.metrics.tool')
+    @mock.patch('tools.runner.start')
+    @mock.patch('tools.Sup2SubServer._compile')
+    def testFailedJob(self, mockCompile, mockStart, mockTool):
+        """Tests that a job BDSup2Sub fails is counted as a failed run"""
+        mockCompile.return_value = '/tmp/ripmaster-java'
+        mockStart.side_effect = _fakeJvm(['Error\n@@RIPMASTER_DONE@@ 1\n'])
+        measured = mockTool.return_value.__enter__.return_value
+
+        tools.bdSup2Sub('a.sup', '-r 720p', 'a.idx')
+
+        measured.fail.assert_called_once_with()
+
+    #===========================================================================
+
+    @mock.patch('tools._execute')
+    def testCompile(self, mockExecute):
+        """Tests that the launcher is compiled outside of the install"""
+        def javac(command):
+            classDir = command[command.index('-d') + 1]
+            open(os.path.join(classDir, 'Sup2SubServer.class'), 'wb').close()
+            return _fakeRun()
+        mockExecute.side_effect = javac
+
+        server = tools.Sup2SubServer('/usr/bin/java', '/opt/BDSup2Sub.jar')
+        classDir = server._compile()
+
+        self.assertEqual(
+            (True, False, classDir),
+            (os.path.isfile(os.path.join(classDir, 'Sup2SubServer.class')),
+             classDir.startswith(os.path.dirname(tools.Sup2SubServer.SOURCE)),
+             server._compile())
+        )
+
+        tools.Sup2SubServer.removeLauncher()
+
+        self.assertFalse(
+            os.path.exists(classDir)
+        )
+
+    #===========================================================================
+
+    @mock.patch('tools.runner.run')
+    @mock.patch('tools.Sup2SubServer._compile')
+    def testFallback(self, mockCompile, mockRun):
+        """Tests that Java is started per track if the launcher won't build"""
+        mockCompile.side_effect = OSError("Couldn't compile")
+        mockRun.return_value = _fakeRun(SUBTITLES_NO_FORCED)
+
+        shellOut = tools.bdSup2Sub('a.sup', '-r 720p', 'a.idx', popen=True)
+
+        self.assertTrue(
+            tools.Sup2SubServer.unavailable
+        )
+
+        self.assertEqual(
+            SUBTITLES_NO_FORCED.split('\n'),
+            shellOut
+        )
+
+        mockRun.assert_called_once_with(
+            ['/usr/bin/java', '-jar', '/opt/BDSup2Sub.jar', '-r', '720p', '-o',
+             'a.idx', 'a.sup'],
+            capture=True
+        )
+
+#===============================================================================
+# PRIVATE FUNCTIONS
+#===============================================================================
+
+def _fakeJvm(jobs):
+    """Stands in for runner.start, the launcher answering each job in turn
+
+    The JVM runs until its stdin is closed, writing the next of jobs to its
+    stdout each time a job is written to its stdin.
+
+    """
+    def start(command, **kwargs):
+        tool = start.tool
+        exited = threading.Event()
+
+        def write(job):
+            for line in jobs.pop(0).split('\n'):
+                if line:
+                    kwargs['stdout'](line)
+        def close():
+            tool.done = True
+            tool.status = 0
+            exited.set()
+        def wait(timeout=None):
+            exited.wait(timeout)
+            return tool.status
+
+        tool.done = False
+        tool.status = None
+        tool.cpuSeconds = None
+        tool.process.stdin.write.side_effect = write
+        tool.process.stdin.close.side_effect = close
+        tool.wait.side_effect = wait
+        return tool
+
+    start.tool = mock.Mock()
+    return start
+
+#===============================================================================
+
+def _buildMovie(root, subdir, fileName, info):
+    """Builds a Movie whose tracks come from the given mkvmerge output
+
+    Info is either mkvmerge -I output, or a dictionary of mkvmerge's JSON
+    identification.
+
+    """
+    def fakeRun(args, **kwargs):
+        if '-I' in args:
+            # mkvmerge output is read the way it comes on Windows.
+            output = info.replace('\n', '\r\n')
+        elif isinstance(info, dict):
+            output = json.dumps(info)
+        else:
+            # Too old for JSON
+            output = 'Error: Unknown option'
+        return _fakeRun(output)
+
+    def fakeInfo(movie):
+        with mock.patch('tools.runner.run', fakeRun):
+            return _realMkvInfo(movie)
+
+    with mock.patch('tools.mkvInfo', fakeInfo):
+        return tools.Movie(root, subdir, fileName)
+
+#===============================================================================
+
+def _fakeRun(output='', status=0):
+    """Stands in for a tool run that's finished, with the given stdout"""
+    return mock.Mock(
+        output=output, status=status, cpuSeconds=None, timedOut=False
+    )
+
+#===============================================================================
+
+def _touchExtractions(file, extractions):
+    """Stands in for mkvextract by creating every destination file"""
+    for trackID, dest in extractions:
+        with open(dest, 'wb') as f:
+            f.write('PG')
+    return 0
+
 #===============================================================================
 
 def _buildTrackLine(id, trackType, trackDict):
@@ -0,0 +1,451 @@
+#/usr/bin/python
+# Ripmaster VobSub Tests
+# Tests for the Ripmaster native PGS to VobSub converter
+"""
+Tests for all of the classes and functions inside of Ripmaster's tools.vobsub
+module.
+
+REQUIREMENTS:
+
+numpy
+"""
+
+#===============================================================================
+# IMPORTS
+#===============================================================================
+
+# Standard Imports
+import os
+import shutil
+import struct
+import sys
+import tempfile
+import unittest
+
+sys.path.append('/'.join(os.path.realpath(__file__).split('/')[:-3]))
+
+# Ripmaster Imports
+from tools import pgs
+from tools import vobsub
+from tests_pgs import encodeRle, pcsPayload, segment
+
+#===============================================================================
+# GLOBALS
+#===============================================================================
+
+# Palette index: (Y, Cr, Cb, alpha)
+PALETTE = {
+    1: (235, 128, 128, 255),  # White
+    2: (16, 128, 128, 255),  # Black
+    3: (126, 128, 128, 255),  # Grey
+    4: (235, 128, 128, 20),  # Nearly transparent white
+}
+
+#===============================================================================
+# CLASSES
+#===============================================================================
+
+class TestConvert(unittest.TestCase):
+    """Tests converting a sup file to VobSub"""
+
+    #===========================================================================
+    # SETUP & TEARDOWN
+    #===========================================================================
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.sup = os.path.join(self.dir, 'movie_Track3_sub.sup')
+        self.idx = os.path.join(self.dir, 'movie_Track3_sub.idx')
+        self.forcedIdx = os.path.join(self.dir, 'movie_Track3_sub_forced.idx')
+
+        # 40 x 10 caption. A white bar with a black border, a grey stripe,
+        # and a few nearly transparent pixels.
+        self.bitmap = bytearray('\x02' * 40)
+        for row in xrange(8):
+            self.bitmap += '\x02' + '\x01' * 30 + '\x03' * 4 + '\x04' * 4 + \
+                '\x02'
+        self.bitmap += '\x02' * 40
+
+    #===========================================================================
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    #===========================================================================
+    # PRIVATE METHODS
+    #===========================================================================
+
+    def _writeSup(self, forced):
+        """Writes a sup with a caption per entry of forced"""
+        with open(self.sup, 'wb') as f:
+            f.write(buildSup([self.bitmap] * len(forced), 40, 10, forced))
+
+    #===========================================================================
+    # TESTS
+    #===========================================================================
+
+    def testBitmap(self):
+        """Tests that a caption is quantized to the 4 VobSub colours"""
+        self._writeSup([False])
+
+        vobsub.convert(self.sup, idx=self.idx)
+
+        x, y, bitmap, forced, duration = decodeSpu(readSub(self.idx)[0])
+
+        # Caption is at 100, 800 in 1080p
+        self.assertEqual(
+            (100, 800),
+            (x, y)
+        )
+
+        expected = [[vobsub.EMPHASIS1] * 40]
+        expected += [
+            [vobsub.EMPHASIS1] + [vobsub.PATTERN] * 30 +
+            [vobsub.EMPHASIS2] * 4 + [vobsub.BACKGROUND] * 4 +
+            [vobsub.EMPHASIS1]
+        ] * 8
+        expected += [[vobsub.EMPHASIS1] * 40]
+
+        self.assertEqual(
+            expected,
+            bitmap
+        )
+
+        # The caption is cleared half a second later, in 1024 tick units.
+        self.assertEqual(
+            (False, 44),
+            (forced, duration)
+        )
+
+    #===========================================================================
+
+    def testIdx(self):
+        """Tests the frame size and caption index of the .idx"""
+        self._writeSup([False, False])
+
+        vobsub.convert(self.sup, idx=self.idx, language='fre')
+
+        with open(self.idx, 'r') as f:
+            lines = f.read().splitlines()
+
+        self.assertTrue(
+            'size: 1920x1080' in lines
+        )
+
+        self.assertTrue(
+            'id: fr, index: 0' in lines
+        )
+
+        self.assertEqual(
+            ['timestamp: 00:00:00:000, filepos: 000000000',
+             'timestamp: 00:00:01:000, filepos: 000000800'],
+            [line for line in lines if line.startswith('timestamp')]
+        )
+
+        # Every pack is the same size
+        self.assertEqual(
+            2 * vobsub.PACK_SIZE,
+            os.path.getsize(self.idx.replace('.idx', '.sub'))
+        )
+
+    #===========================================================================
+
+    def testForcedOnePass(self):
+        """Tests that the full and forced tracks are written together"""
+        self._writeSup([True, False, True])
+
+        info = vobsub.convert(
+            self.sup, idx=self.idx, forcedIdx=self.forcedIdx
+        )
+
+        self.assertEqual(
+            (3, 2),
+            (info.totalCount, info.forcedCount)
+        )
+
+        self.assertEqual(
+            [True, False, True],
+            [decodeSpu(spu)[3] for spu in readSub(self.idx)]
+        )
+
+        self.assertEqual(
+            [True, True],
+            [decodeSpu(spu)[3] for spu in readSub(self.forcedIdx)]
+        )
+
+    #===========================================================================
+
+    def testNoForced(self):
+        """Tests that no forced track is written without forced captions"""
+        self._writeSup([False, False])
+
+        info = vobsub.convert(
+            self.sup, idx=self.idx, forcedIdx=self.forcedIdx
+        )
+
+        self.assertFalse(
+            info.forced
+        )
+
+        self.assertFalse(
+            os.path.exists(self.forcedIdx)
+        )
+
+    #===========================================================================
+
+    def testScaled(self):
+        """Tests that captions are scaled and placed on an NTSC frame"""
+        self._writeSup([False])
+
+        vobsub.convert(self.sup, idx=self.idx, resolution='ntsc')
+
+        x, y, bitmap, forced, duration = decodeSpu(readSub(self.idx)[0])
+
+        # 1920x1080 to 720x480
+        self.assertEqual(
+            (38, 356, 15, 4),
+            (x, y, len(bitmap[0]), len(bitmap))
+        )
+
+    #===========================================================================
+
+    def testLargeCaption(self):
+        """Tests that a caption too large for one pack is split over several"""
+        # Noise doesn't run length encode well, so this is well over a pack.
+        self.bitmap = bytearray(
+            '\x01\x02'[(i * 7 + i // 400) % 2] for i in xrange(400 * 40)
+        )
+        with open(self.sup, 'wb') as f:
+            f.write(buildSup([self.bitmap], 400, 40, [False]))
+
+        vobsub.convert(self.sup, idx=self.idx)
+
+        subSize = os.path.getsize(self.idx.replace('.idx', '.sub'))
+
+        self.assertTrue(
+            subSize > vobsub.PACK_SIZE
+        )
+
+        self.assertEqual(
+            0,
+            subSize % vobsub.PACK_SIZE
+        )
+
+        x, y, bitmap, forced, duration = decodeSpu(readSub(self.idx)[0])
+
+        colors = {1: vobsub.PATTERN, 2: vobsub.EMPHASIS1}
+        self.assertEqual(
+            [[colors[pixel] for pixel in self.bitmap[row * 400:(row + 1) * 400]]
+             for row in xrange(40)],
+            bitmap
+        )
+
+    #===========================================================================
+
+    def testNoNumpy(self):
+        """Tests that converting without NumPy raises ImportError"""
+        self._writeSup([False])
+
+        numpy = vobsub.numpy
+        vobsub.numpy = None
+        try:
+            self.assertRaises(
+                ImportError,
+                vobsub.convert,
+                self.sup,
+                self.idx
+            )
+        finally:
+            vobsub.numpy = numpy
+
+#===============================================================================
+
+class TestDecodeRle(unittest.TestCase):
+    """Tests decoding object bitmaps"""
+
+    #===========================================================================
+    # TESTS
+    #===========================================================================
+
+    def testRoundTrip(self):
+        """Tests that every kind of run survives encoding and decoding"""
+        width = 300
+        # Single pixels, short and long runs of 0, and short and long runs of
+        # other colours.
+        row = bytearray(
+            '\x01\x02\x02' + '\x00' * 10 + '\x05' * 20 + '\x00' * 100 +
+            '\x09' * 100 + '\x03' * 67
+        )
+        pixels = row + bytearray(reversed(row))
+
+        encoded = encodeRle(pixels, width, 2)
+
+        self.assertEqual(
+            str(pixels),
+            vobsub._decodeRle(encoded, width, 2).tostring()
+        )
+
+    #===========================================================================
+
+    def testDecode(self):
+        """Tests decoding each kind of run by hand"""
+        data = '\x04' + '\x00\x02' + '\x00\x83\x07' + '\x00\x00' + \
+            '\x00\x40\x01' + '\x00\xc0\x02\x06' + '\x00\x00'
+
+        self.assertEqual(
+            '\x04\x00\x00\x07\x07\x07' + '\x00\x06',
+            vobsub._decodeRle(data, 6, 2).tostring()[:8]
+        )
+
+    #===========================================================================
+
+    def testOverflowClipped(self):
+        """Tests that runs longer than a row don't spill into the next"""
+        data = '\x00\x85\x07' + '\x00\x00' + '\x01\x01\x01\x01' + '\x00\x00'
+
+        self.assertEqual(
+            '\x07\x07\x07' + '\x01\x01\x01',
+            vobsub._decodeRle(data, 3, 2).tostring()
+        )
+
+#===============================================================================
+# FUNCTIONS
+#===============================================================================
+
+def buildSup(bitmaps, width, height, forced):
+    """Builds a PGS stream with a real bitmap for each caption
+
+    Args:
+        bitmaps : [(bytearray)]
+            width * height palette indexes for each caption.
+
+        width : (int)
+            Width of every bitmap.
+
+        height : (int)
+            Height of every bitmap.
+
+        forced : [bool]
+            If each caption is forced.
+
+    Returns:
+        (str)
+
+    Each caption is shown for a second, starting a second apart, and cleared
+    half way through.
+
+    """
+    palette = '\x00\x00' + ''.join(
+        [chr(index) + struct.pack('>BBBB', *entry)
+         for index, entry in sorted(PALETTE.items())]
+    )
+
+    stream = ''
+    for i, bitmap in enumerate(bitmaps):
+        pts = i * 90000
+        data = encodeRle(bitmap, width, height)
+        stream += segment(
+            pgs.PCS, pcsPayload([(0, forced[i])], pgs.EPOCH_START), pts
+        )
+        stream += segment(pgs.PDS, palette, pts)
+        stream += segment(
+            pgs.ODS,
+            struct.pack('>HBB', 0, 0, 0xc0) +
+            struct.pack('>I', len(data) + 4)[1:] +
+            struct.pack('>HH', width, height) + data,
+            pts
+        )
+        stream += segment(pgs.END, '', pts)
+        stream += segment(pgs.PCS, pcsPayload([]), pts + 45000)
+        stream += segment(pgs.END, '', pts + 45000)
+
+    return stream
+
+#===============================================================================
+
+def decodeSpu(spu):
+    """Decodes a subpicture unit
+
+    Args:
+        spu : (str)
+            A complete subpicture unit.
+
+    Returns:
+        (int), (int), [[int]], (bool), (int)
+            The x and y position, bitmap rows, forced flag and display
+            duration of the caption.
+
+    """
+    size, controlOffset = struct.unpack_from('>HH', spu, 0)
+    delay, nextOffset = struct.unpack_from('>HH', spu, controlOffset)
+
+    pos = controlOffset + 4
+    forced = None
+    while ord(spu[pos]) != vobsub.CMD_END:
+        command = ord(spu[pos])
+        pos += 1
+        if command in [vobsub.FSTA_DSP, vobsub.STA_DSP]:
+            forced = command == vobsub.FSTA_DSP
+        elif command in [vobsub.SET_COLOR, vobsub.SET_CONTR]:
+            pos += 2
+        elif command == vobsub.SET_DAREA:
+            area = struct.unpack('>Q', '\x00\x00' + spu[pos:pos + 6])[0]
+            pos += 6
+        elif command == vobsub.SET_DSPXA:
+            fields = struct.unpack_from('>HH', spu, pos)
+            pos += 4
+
+    x1, x2 = area >> 36, (area >> 24) & 0xfff
+    y1, y2 = (area >> 12) & 0xfff, area & 0xfff
+    width = x2 - x1 + 1
+    height = y2 - y1 + 1
+
+    duration, stopOffset = struct.unpack_from('>HH', spu, nextOffset)
+
+    rows = [None] * height
+    for field, offset in enumerate(fields):
+        nibbles = []
+        for byte in spu[offset:controlOffset]:
+            nibbles.extend([ord(byte) >> 4, ord(byte) & 0x0f])
+        pos = 0
+        for row in xrange(field, height, 2):
+            line = []
+            while len(line) < width:
+                code = 0
+                for count in xrange(1, 5):
+                    code = (code << 4) | nibbles[pos]
+                    pos += 1
+                    # Each extra nibble allows a run 2 bits longer.
+                    if code >= 1 << (2 * count):
+                        break
+                length, color = code >> 2, code & 0x03
+                line.extend([color] * (length or width - len(line)))
+            if pos % 2:
+                pos += 1
+            rows[row] = line
+
+    return x1, y1, rows, forced, duration
+
+#===============================================================================
+
+def readSub(idx):
+    """Reads every subpicture unit from the .sub file next to an .idx"""
+    with open(idx.replace('.idx', '.sub'), 'rb') as f:
+        data = f.read()
+
+    spus = []
+    for pos in xrange(0, len(data), vobsub.PACK_SIZE):
+        pes = pos + vobsub.PACK_HEADER_SIZE
+        length, flags, headerLength = struct.unpack_from('>HxBB', data, pes + 4)
+        payload = data[pes + 9 + headerLength + 1:pes + 6 + length]
+        if flags & 0x80:
+            spus.append(payload)
+        else:
+            spus[-1] += payload
+
+    return spus
+
+#===============================================================================
+
+if __name__ == '__main__':
+    unittest.main()
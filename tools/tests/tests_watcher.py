@@ -0,0 +1,256 @@
+#/usr/bin/python
+# Ripmaster Watcher Tests
+# Tests for the Ripmaster toConvert folder watcher
+"""
+Tests for all of the classes and functions inside of Ripmaster's tools.watcher
+module.
+"""
+
+#===============================================================================
+# IMPORTS
+#===============================================================================
+
+# Standard Imports
+import os
+import shutil
+from StringIO import StringIO
+import sys
+import tempfile
+import unittest
+
+sys.path.append('/'.join(os.path.realpath(__file__).split('/')[:-3]))
+
+# Ripmaster Imports
+from tools import watcher
+
+#===============================================================================
+# CLASSES
+#===============================================================================
+
+class TestFolderWatcher(unittest.TestCase):
+    """Tests finding new movies with polling"""
+
+    inotify = False
+
+    #===========================================================================
+    # SETUP & TEARDOWN
+    #===========================================================================
+
+    def setUp(self):
+
+        # Suppress stdout
+        self.held = sys.stdout
+        sys.stdout = StringIO()
+
+        self.root = tempfile.mkdtemp()
+        self.watchers = []
+
+    #===========================================================================
+
+    def tearDown(self):
+        for folderWatcher in self.watchers:
+            folderWatcher.close()
+        shutil.rmtree(self.root)
+
+        # Restore stdout
+        sys.stdout = self.held
+
+    #===========================================================================
+    # PRIVATE METHODS
+    #===========================================================================
+
+    def _watch(self, known=None, settle=0):
+        """Returns a FolderWatcher on root that polls every check"""
+        folderWatcher = watcher.FolderWatcher(
+            self.root, known=known, settle=settle, poll=0,
+            inotify=self.inotify
+        )
+        self.watchers.append(folderWatcher)
+        return folderWatcher
+
+    #===========================================================================
+
+    def _write(self, subdir, fileName, contents='Matroska'):
+        """Writes a movie file, creating its folder if needed"""
+        folder = os.path.join(self.root, subdir)
+        if not os.path.exists(folder):
+            os.mkdir(folder)
+        path = os.path.join(folder, fileName)
+        with open(path, 'ab') as f:
+            f.write(contents)
+        return path.replace('\\', '/')
+
+    #===========================================================================
+
+    def _checkAll(self, folderWatcher, checks=3):
+        """Checks a few times, returning everything reported"""
+        found = []
+        for i in xrange(checks):
+            found.extend(folderWatcher.check(0.05))
+        return found
+
+    #===========================================================================
+    # TESTS
+    #===========================================================================
+
+    def testExistingMovies(self):
+        """Tests that movies already there when watching starts are found"""
+        self._write('Up__1080', 'Up.mkv')
+        folderWatcher = self._watch()
+
+        self.assertEqual(
+            [(self.root, 'Up__1080', 'Up.mkv')],
+            self._checkAll(folderWatcher)
+        )
+
+    #===========================================================================
+
+    def testExistingSettle(self):
+        """Tests that movies there at the start still wait to settle"""
+        self._write('Up__1080', 'Up.mkv')
+        folderWatcher = self._watch(settle=60)
+
+        # A rip already in toConvert at startup may still be being written.
+        self.assertEqual(
+            [],
+            self._checkAll(folderWatcher)
+        )
+
+    #===========================================================================
+
+    def testNewFolder(self):
+        """Tests that a folder added after watching starts is found"""
+        folderWatcher = self._watch()
+        self.assertEqual(
+            [],
+            folderWatcher.check(0.05)
+        )
+
+        self._write('Up__1080', 'Up.mkv')
+
+        self.assertEqual(
+            [(self.root, 'Up__1080', 'Up.mkv')],
+            self._checkAll(folderWatcher)
+        )
+
+    #===========================================================================
+
+    def testReportedOnce(self):
+        """Tests that a movie is reported once, and added to known"""
+        path = self._write('Up__1080', 'Up.mkv')
+        folderWatcher = self._watch()
+
+        self._checkAll(folderWatcher)
+
+        self.assertEqual(
+            [],
+            self._checkAll(folderWatcher)
+        )
+
+        self.assertTrue(
+            path in folderWatcher.known
+        )
+
+    #===========================================================================
+
+    def testSkipped(self):
+        """Tests that known movies, encodes and plain folders are skipped"""
+        known = self._write('Up__1080', 'Up.mkv')
+        self._write('Up__1080', 'Up--converted.mkv')
+        self._write('Up__1080', 'Up.txt')
+        self._write('Unsorted', 'Cars.mkv')
+        folderWatcher = self._watch(known=set([known]))
+
+        self.assertEqual(
+            [],
+            self._checkAll(folderWatcher)
+        )
+
+    #===========================================================================
+
+    def testSettle(self):
+        """Tests that a movie still being written isn't reported"""
+        folderWatcher = self._watch(settle=60)
+
+        path = self._write('Up__1080', 'Up.mkv')
+
+        self.assertEqual(
+            [],
+            self._checkAll(folderWatcher)
+        )
+
+        # Once it's been unchanged for the settle interval, it's reported.
+        folderWatcher._pending[path] = (
+            folderWatcher._pending[path][0],
+            folderWatcher._pending[path][1] - 60
+        )
+
+        self.assertEqual(
+            [(self.root, 'Up__1080', 'Up.mkv')],
+            folderWatcher.check(0)
+        )
+
+    #===========================================================================
+
+    def testGrowingResetsSettle(self):
+        """Tests that a file that grows starts its settle interval again"""
+        folderWatcher = self._watch(settle=60)
+        path = self._write('Up__1080', 'Up.mkv')
+        folderWatcher.check(0)
+
+        identity, since = folderWatcher._pending[path]
+        folderWatcher._pending[path] = (identity, since - 60)
+
+        self._write('Up__1080', 'Up.mkv', 'more data')
+
+        self.assertEqual(
+            [],
+            folderWatcher.check(0)
+        )
+
+        self.assertNotEqual(
+            identity,
+            folderWatcher._pending[path][0]
+        )
+
+#===============================================================================
+
+class TestFolderWatcherInotify(TestFolderWatcher):
+    """Tests finding new movies with inotify, where it's available"""
+
+    inotify = True
+
+    #===========================================================================
+    # TESTS
+    #===========================================================================
+
+    def testUsingInotify(self):
+        """Tests that inotify is used on Linux"""
+        if not sys.platform.startswith('linux'):
+            return
+
+        self.assertTrue(
+            self._watch()._inotify is not None
+        )
+
+#===============================================================================
+
+class TestIsMovie(unittest.TestCase):
+    """Tests which file names are movies to encode"""
+
+    #===========================================================================
+    # TESTS
+    #===========================================================================
+
+    def testIsMovie(self):
+        """Tests that only mkvs that aren't our encodes are movies"""
+        self.assertEqual(
+            [True, False, False],
+            [watcher.isMovie(name) for name in
+             ['Up.mkv', 'Up--converted.mkv', 'Up.sup']]
+        )
+
+#===============================================================================
+
+if __name__ == '__main__':
+    unittest.main()
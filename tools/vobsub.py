@@ -0,0 +1,874 @@
+#/usr/bin/python
+# Ripmaster.tools.vobsub
+# Converts Bluray PGS (.sup) subtitles to VobSub (.idx/.sub) without BDSup2Sub
+
+"""
+
+Description
+-----------
+
+Handbrake and most players can't use Bluray PGS subtitles, so Ripmaster
+converts them to DVD VobSub subtitles. This module does that conversion in
+Python, rather than starting a JVM to run BDSup2Sub for every track.
+
+Each caption of the PGS stream is decoded from its run length encoded objects
+into NumPy arrays, drawn with the caption's palette, and resampled from the
+Bluray's frame to the target frame size. VobSub captions only have 4 colours,
+so the resampled caption is quantized by alpha and luminance into background,
+text, outline and anti-aliasing colours, the same way BDSup2Sub does by
+default.
+
+The captions are then run length encoded again as DVD subpictures, wrapped in
+MPEG program stream packs and written to a .sub file, with the .idx file
+listing the timestamp and file position of each one.
+
+Every caption is only decoded once. The full track and the forced captions
+(the '_forced' track <SubtitleTrack> expects) are written at the same time,
+in a single pass over the sup.
+
+NumPy is required. If it isn't installed, convert raises an ImportError, and
+Ripmaster falls back to BDSup2Sub.
+
+Classes
+-------
+
+Caption
+    A single decoded caption, quantized to the 4 VobSub colours and placed
+    on the target frame.
+
+VobSubWriter
+    Writes <Caption>s to an .idx/.sub pair.
+
+Functions
+---------
+
+captions()
+    Decodes every caption of a PGS stream, scaled to a target frame size.
+
+convert()
+    Converts a sup file to a full VobSub track, a forced VobSub track, or
+    both at once.
+
+"""
+
+#===============================================================================
+# IMPORTS
+#===============================================================================
+
+# Standard Imports
+import mmap
+import os
+import struct
+
+# NumPy is an optional dependency. Without it the native converter can't run,
+# but the rest of Ripmaster still can.
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Ripmaster Imports
+from tools import pgs
+
+#===============================================================================
+# GLOBALS
+#===============================================================================
+
+# Frame sizes for each of the resolution names BDSup2Sub accepts with -r
+FRAME_SIZES = {
+    '1080p': (1920, 1080),
+    '720p': (1280, 720),
+    'ntsc': (720, 480),
+    'pal': (720, 576),
+}
+
+# The 4 colours of every caption, as indexes into PALETTE
+BACKGROUND = 0
+PATTERN = 1
+EMPHASIS1 = 2
+EMPHASIS2 = 3
+
+# The first 4 entries are the ones our captions use, the rest are BDSup2Sub's
+# default DVD palette.
+PALETTE = [
+    '000000', 'f0f0f0', '101010', '808080',
+    '3333fa', '1111bb', 'fa3333', 'bb1111',
+    '33fa33', '11bb11', 'fafa33', 'bbbb11',
+    'fa33fa', 'bb11bb', '33fafa', '11bbbb',
+]
+
+# Pixels with less alpha than this are background. The rest are sorted into
+# text, outline and anti-aliasing by their luminance.
+ALPHA_THRESHOLD = 80
+LUMA_HIGH = 180
+LUMA_LOW = 80
+
+# How long the last caption stays up if nothing clears it, in 90kHz ticks.
+LAST_DURATION = 5 * 90000
+
+# VobSub .idx files use ISO 639-1 language codes, while mkvmerge reports
+# ISO 639-2 codes.
+LANGUAGE_CODES = {
+    'ara': 'ar', 'chi': 'zh', 'cze': 'cs', 'dan': 'da', 'deu': 'de',
+    'dut': 'nl', 'eng': 'en', 'fin': 'fi', 'fra': 'fr', 'fre': 'fr',
+    'ger': 'de', 'gre': 'el', 'heb': 'he', 'hin': 'hi', 'hun': 'hu',
+    'ita': 'it', 'jpn': 'ja', 'kor': 'ko', 'nld': 'nl', 'nor': 'no',
+    'pol': 'pl', 'por': 'pt', 'rus': 'ru', 'spa': 'es', 'swe': 'sv',
+    'tha': 'th', 'tur': 'tr', 'zho': 'zh',
+}
+
+# Subpicture Control Commands
+FSTA_DSP = 0x00  # Forced start of display
+STA_DSP = 0x01  # Start of display
+STP_DSP = 0x02  # Stop display
+SET_COLOR = 0x03
+SET_CONTR = 0x04
+SET_DAREA = 0x05
+SET_DSPXA = 0x06
+CMD_END = 0xff
+
+# MPEG Program Stream
+PACK_SIZE = 0x800
+PACK_HEADER_SIZE = 14
+PES_HEADER_SIZE = 9
+MUX_RATE = struct.pack('>I', (25200 << 2) | 0x03)[1:]
+SUBSTREAM_ID = 0x20
+
+IDX_HEADER = """# VobSub index file, v7 (do not modify this line!)
+#
+# Converted from a Bluray PGS stream by Ripmaster
+
+size: {width}x{height}
+org: 0, 0
+scale: 100%, 100%
+alpha: 100%
+smooth: OFF
+fadein/out: 0, 0
+align: OFF at LEFT TOP
+time offset: 0
+forced subs: OFF
+palette: {palette}
+custom colors: OFF, tridx: 0000, colors: 000000, 000000, 000000, 000000
+
+# Language index in use
+langidx: 0
+
+id: {language}, index: 0
+"""
+
+#===============================================================================
+# PRIVATE FUNCTIONS
+#===============================================================================
+
+def _decodeRle(data, width, height):
+    """Decodes an object's run length encoded bitmap into a NumPy array
+
+    Object bitmaps are run length encoded. A non zero byte is a single pixel
+    of that palette index, and a zero byte starts a run:
+
+        00 00                   end of line
+        00 00LLLLLL             L pixels of index 0
+        00 01LLLLLL LLLLLLLL    L pixels of index 0
+        00 10LLLLLL CC          L pixels of index C
+        00 11LLLLLL LLLLLLLL CC L pixels of index C
+
+    Runs that would overflow a row or the bitmap are clipped. Decoding in a
+    Python loop over every run was where almost all the time of a conversion
+    went, so the runs are all found at once instead.
+
+    Any byte other than 0 is a single pixel, unless it's part of a run. So
+    only the zero bytes need working out: each one is either the start of a
+    run, or part of the run before it. The length of the run that would start
+    at every zero byte is worked out at once, and the actual runs are the
+    chain of them from the first, followed by pointer doubling. Every round
+    doubles both the number of runs found and the distance each jump covers.
+
+    """
+    size = len(data)
+    # Padded, so the bytes after a token start can always be read.
+    buf = numpy.zeros(size + 4, dtype=numpy.uint8)
+    buf[:size] = numpy.frombuffer(data, dtype=numpy.uint8)
+
+    zeros = numpy.flatnonzero(buf[:size] == 0)
+    flags = buf[zeros + 1] >> 6
+    lengths = 2 + (flags > 0) + (flags > 2)
+
+    # The next zero byte after the run, or the end of the chain.
+    jump = numpy.searchsorted(zeros, zeros + lengths)
+    jump = numpy.append(jump, zeros.size)
+
+    escapes = numpy.zeros(0, dtype=numpy.intp)
+    if zeros.size:
+        escapes = numpy.zeros(1, dtype=numpy.intp)
+        while True:
+            following = jump[escapes]
+            following = following[following < zeros.size]
+            if not following.size:
+                break
+            escapes = numpy.concatenate([escapes, following])
+            jump = jump[jump]
+
+    # Every byte that isn't part of a run is a single pixel.
+    runStarts = numpy.zeros(size + 5, dtype=numpy.int8)
+    runEnds = numpy.zeros(size + 5, dtype=numpy.int8)
+    runStarts[zeros[escapes]] = 1
+    runEnds[zeros[escapes] + lengths[escapes]] = 1
+    covered = numpy.cumsum(runStarts[:size] - runEnds[:size]) > 0
+    starts = numpy.flatnonzero(~covered | runStarts[:size].astype(bool))
+
+    first = buf[starts].astype(numpy.intp)
+    flag = buf[starts + 1].astype(numpy.intp)
+    second = buf[starts + 2].astype(numpy.intp)
+    third = buf[starts + 3].astype(numpy.intp)
+
+    escape = first == 0
+    endOfLine = escape & (flag == 0)
+    extended = escape & (flag & 0x40 > 0)
+    colored = escape & (flag & 0x80 > 0)
+
+    runs = numpy.where(escape, flag & 0x3f, 1)
+    runs = numpy.where(extended, (runs << 8) | second, runs)
+    runs[endOfLine] = 0
+    colors = numpy.where(escape, 0, first)
+    colors = numpy.where(colored, numpy.where(extended, third, second), colors)
+
+    # Which row every run is on, and where it starts within it.
+    rows = numpy.cumsum(endOfLine) - endOfLine
+    ends = numpy.cumsum(runs)
+    rowStarts = numpy.zeros(rows[-1] + 1 if rows.size else 1, numpy.intp)
+    lineEnds = ends[endOfLine]
+    rowStarts[1:lineEnds.size + 1] = lineEnds[:rowStarts.size - 1]
+    columns = ends - runs - rowStarts[rows]
+
+    # Clip runs that overflow their row, and drop rows past the bottom.
+    runs = numpy.clip(numpy.minimum(runs, width - columns), 0, None)
+    keep = (rows < height) & (runs > 0) & (colors > 0)
+    runs = runs[keep]
+
+    offsets = numpy.cumsum(runs) - runs
+    positions = numpy.repeat(
+        rows[keep] * width + columns[keep] - offsets, runs
+    ) + numpy.arange(runs.sum())
+
+    pixels = numpy.zeros(width * height, dtype=numpy.uint8)
+    pixels[positions] = numpy.repeat(colors[keep], runs)
+
+    return pixels.reshape(height, width)
+
+#===============================================================================
+
+def _encodeField(rows):
+    """Run length encodes one field of a subpicture as 2 bit DVD runs
+
+    Each run is a code of (length << 2) | colour, written in 1 to 4 nibbles
+    depending on the length. The last run of a line is written with a length
+    of 0, meaning the rest of the line, and each line is padded to a whole
+    byte.
+
+    """
+    height, width = rows.shape
+    if not height:
+        return ''
+
+    starts = numpy.ones(rows.shape, dtype=bool)
+    starts[:, 1:] = rows[:, 1:] != rows[:, :-1]
+    runRows, runColumns = numpy.nonzero(starts)
+    colors = rows[runRows, runColumns].astype(numpy.intp)
+
+    last = numpy.append(runRows[1:] != runRows[:-1], True)
+    lengths = numpy.append(runColumns[1:], width) - runColumns
+
+    # Runs over 255 pixels are split, unless they end the line.
+    pieces = numpy.where(last, 1, (lengths + 254) // 255)
+    colors = numpy.repeat(colors, pieces)
+    lengths = numpy.repeat(lengths, pieces)
+    runRows = numpy.repeat(runRows, pieces)
+    last = numpy.repeat(last, pieces)
+    pieceEnds = numpy.cumsum(pieces)
+    piece = numpy.arange(pieceEnds[-1]) - numpy.repeat(pieceEnds - pieces, pieces)
+    lengths = numpy.minimum(lengths - piece * 255, 255)
+
+    lengths[last] = 0
+    codes = (lengths << 2) | colors
+    counts = numpy.where(
+        last, 4, 1 + (lengths >= 0x04) + (lengths >= 0x10) + (lengths >= 0x40)
+    )
+
+    # Pad odd lines with a trailing zero nibble on their last code.
+    lineNibbles = numpy.bincount(runRows, weights=counts, minlength=height)
+    padded = last & (lineNibbles[runRows].astype(numpy.intp) % 2 > 0)
+    codes[padded] <<= 4
+    counts[padded] += 1
+
+    codeEnds = numpy.cumsum(counts)
+    index = numpy.repeat(numpy.arange(counts.size), counts)
+    digit = numpy.arange(codeEnds[-1]) - numpy.repeat(codeEnds - counts, counts)
+    shifts = (counts[index] - 1 - digit) * 4
+    nibbles = ((codes[index] >> shifts) & 0x0f).astype(numpy.uint8)
+
+    return ((nibbles[0::2] << 4) | nibbles[1::2]).tostring()
+
+#===============================================================================
+
+def _packHeader(scr):
+    """Builds an MPEG-2 pack header with the given system clock reference"""
+    return '\x00\x00\x01\xba' + struct.pack(
+        '>BBBBBB',
+        0x44 | ((scr >> 27) & 0x38) | ((scr >> 28) & 0x03),
+        (scr >> 20) & 0xff,
+        0x04 | ((scr >> 12) & 0xf8) | ((scr >> 13) & 0x03),
+        (scr >> 5) & 0xff,
+        0x04 | ((scr << 3) & 0xf8),
+        0x01,
+    ) + MUX_RATE + '\xf8'
+
+#===============================================================================
+
+def _pts(pts):
+    """Encodes a presentation timestamp for a PES header"""
+    return struct.pack(
+        '>BBBBB',
+        0x21 | ((pts >> 29) & 0x0e),
+        (pts >> 22) & 0xff,
+        0x01 | ((pts >> 14) & 0xfe),
+        (pts >> 7) & 0xff,
+        0x01 | ((pts << 1) & 0xfe),
+    )
+
+#===============================================================================
+
+def _resample(plane, size, axis):
+    """Resizes a float plane along one axis
+
+    Shrinking averages every source pixel that falls within a destination
+    pixel, which keeps thin outlines from disappearing. Enlarging is bilinear.
+
+    """
+    old = plane.shape[axis]
+    if size == old:
+        return plane
+
+    shape = [1, 1]
+    shape[axis] = size
+
+    if size < old:
+        edges = numpy.arange(size) * old // size
+        sums = numpy.add.reduceat(plane, edges, axis=axis)
+        counts = numpy.diff(numpy.append(edges, old)).astype(numpy.float32)
+        return sums / counts.reshape(shape)
+
+    pos = (numpy.arange(size) + 0.5) * (old / float(size)) - 0.5
+    pos = numpy.clip(pos, 0, old - 1)
+    low = numpy.floor(pos).astype(numpy.intp)
+    high = numpy.minimum(low + 1, old - 1)
+    weight = (pos - low).astype(numpy.float32).reshape(shape)
+
+    lowPlane = numpy.take(plane, low, axis=axis)
+    highPlane = numpy.take(plane, high, axis=axis)
+
+    return lowPlane + (highPlane - lowPlane) * weight
+
+#===============================================================================
+
+def _timestamp(pts):
+    """Formats a 90kHz timestamp the way .idx files expect"""
+    ms = pts // 90
+    return '{h:02d}:{m:02d}:{s:02d}:{ms:03d}'.format(
+        h=ms // 3600000,
+        m=ms // 60000 % 60,
+        s=ms // 1000 % 60,
+        ms=ms % 1000
+    )
+
+#===============================================================================
+# CLASSES
+#===============================================================================
+
+class _Object(object):
+    """An object bitmap, gathered from one or more ODS fragments"""
+    def __init__(self, width, height, data):
+        self.width = width
+        self.height = height
+        self.fragments = [data]
+        self._pixels = None
+
+    def append(self, data):
+        """Adds the data of the next ODS fragment of the object"""
+        self.fragments.append(data)
+        self._pixels = None
+
+    def pixels(self):
+        """Decodes the object into a height x width array of palette indexes"""
+        if self._pixels is None:
+            self._pixels = _decodeRle(
+                ''.join(self.fragments), self.width, self.height
+            )
+        return self._pixels
+
+class Caption(object):
+    """A single caption, ready to be written as a VobSub subpicture
+
+    Args:
+        start : (int)
+            Presentation timestamp the caption appears at, in 90kHz ticks.
+
+        forced : (bool)
+            True if any of the objects of the caption were forced.
+
+        x : (int)
+            Left edge of the caption on the target frame.
+
+        y : (int)
+            Top edge of the caption on the target frame.
+
+        bitmap : (<numpy.ndarray>)
+            height x width array of BACKGROUND, PATTERN, EMPHASIS1 and
+            EMPHASIS2 colours.
+
+    The end of a caption isn't known until the next display set, so it's set
+    afterwards.
+
+    """
+    def __init__(self, start, forced, x, y, bitmap):
+        self.start = start
+        self.end = None
+        self.forced = forced
+        self.x = x
+        self.y = y
+        self.bitmap = bitmap
+
+    def __repr__(self):
+        return '<Caption {start}-{end} at {x},{y}>'.format(
+            start=self.start,
+            end=self.end,
+            x=self.x,
+            y=self.y
+        )
+
+    @classmethod
+    def render(cls, composition, objects, palettes, frame):
+        """Draws a composition's objects and scales them to the frame
+
+        Args:
+            composition : (<pgs.Composition>)
+                The composition to draw.
+
+            objects : {int: <_Object>}
+                Every object defined so far in the epoch.
+
+            palettes : {int: {int: (int, int, int, int)}}
+                Every palette defined so far in the epoch.
+
+            frame : (int, int)
+                Width and height of the target frame.
+
+        Raises:
+            N/A
+
+        Returns:
+            <Caption>|None
+                None if none of the composition's objects are defined, or
+                if they're entirely off the frame.
+
+        """
+        pieces = []
+        for objectID, windowID, forced, x, y, crop in composition.objects:
+            obj = objects.get(objectID)
+            if not obj or not obj.width or not obj.height:
+                continue
+            pixels = obj.pixels()
+            if crop:
+                cropX, cropY, cropWidth, cropHeight = crop
+                pixels = pixels[
+                    cropY:cropY + cropHeight, cropX:cropX + cropWidth
+                ]
+            if pixels.size:
+                pieces.append((x, y, pixels))
+
+        if not pieces:
+            return None
+
+        # Palette lookup tables. Undefined entries are transparent.
+        luma = numpy.zeros(256, dtype=numpy.float32)
+        alpha = numpy.zeros(256, dtype=numpy.float32)
+        for index, entry in palettes.get(composition.paletteID, {}).items():
+            luma[index] = entry[0]
+            alpha[index] = entry[3]
+        # Y is stored with video levels, 16-235.
+        luma = numpy.clip((luma - 16) * (255 / 219.0), 0, 255)
+
+        left = min([x for x, y, pixels in pieces])
+        top = min([y for x, y, pixels in pieces])
+        right = max([x + pixels.shape[1] for x, y, pixels in pieces])
+        bottom = max([y + pixels.shape[0] for x, y, pixels in pieces])
+
+        # Luminance is premultiplied by alpha, so that resampling doesn't
+        # bleed the colour of transparent pixels into the edges of the text.
+        lumaPlane = numpy.zeros((bottom - top, right - left), numpy.float32)
+        alphaPlane = numpy.zeros((bottom - top, right - left), numpy.float32)
+        for x, y, pixels in pieces:
+            height, width = pixels.shape
+            region = (slice(y - top, y - top + height),
+                      slice(x - left, x - left + width))
+            alphaPlane[region] = alpha[pixels]
+            lumaPlane[region] = luma[pixels] * alpha[pixels] / 255
+
+        frameWidth, frameHeight = frame
+        scaleX = frameWidth / float(composition.width or frameWidth)
+        scaleY = frameHeight / float(composition.height or frameHeight)
+
+        x = int(round(left * scaleX))
+        y = int(round(top * scaleY))
+        width = max(1, int(round((right - left) * scaleX)))
+        height = max(1, int(round((bottom - top) * scaleY)))
+
+        lumaPlane = _resample(_resample(lumaPlane, height, 0), width, 1)
+        alphaPlane = _resample(_resample(alphaPlane, height, 0), width, 1)
+
+        # Clip the caption to the frame.
+        clipLeft = max(0, -x)
+        clipTop = max(0, -y)
+        clipRight = min(width, frameWidth - x)
+        clipBottom = min(height, frameHeight - y)
+        if clipLeft >= clipRight or clipTop >= clipBottom:
+            return None
+        lumaPlane = lumaPlane[clipTop:clipBottom, clipLeft:clipRight]
+        alphaPlane = alphaPlane[clipTop:clipBottom, clipLeft:clipRight]
+
+        luma = lumaPlane * 255 / numpy.maximum(alphaPlane, 1)
+        visible = alphaPlane >= ALPHA_THRESHOLD
+
+        bitmap = numpy.zeros(alphaPlane.shape, dtype=numpy.uint8)
+        bitmap[visible] = EMPHASIS2
+        bitmap[visible & (luma >= LUMA_HIGH)] = PATTERN
+        bitmap[visible & (luma < LUMA_LOW)] = EMPHASIS1
+
+        return cls(
+            composition.pts, composition.forced,
+            x + clipLeft, y + clipTop, bitmap
+        )
+
+    def subpicture(self):
+        """Encodes the caption as a DVD subpicture unit
+
+        Args:
+            N/A
+
+        Raises:
+            ValueError
+                Raised if the encoded caption is too large for a subpicture.
+
+        Returns:
+            (str)
+                The subpicture unit, with its display control sequences.
+
+        """
+        height, width = self.bitmap.shape
+
+        # DVD subpictures are interlaced, so the even and odd lines are
+        # encoded separately.
+        top = _encodeField(self.bitmap[0::2])
+        bottom = _encodeField(self.bitmap[1::2])
+
+        topOffset = 4
+        bottomOffset = topOffset + len(top)
+        controlOffset = bottomOffset + len(bottom)
+        # The first control sequence is 24 bytes long.
+        stopOffset = controlOffset + 24
+        size = stopOffset + 6
+
+        if size > 0xffff:
+            raise ValueError(
+                'Caption at {time} is too large for a subpicture'.format(
+                    time=_timestamp(self.start)
+                )
+            )
+
+        area = (
+            (self.x << 36) | ((self.x + width - 1) << 24) |
+            (self.y << 12) | (self.y + height - 1)
+        )
+
+        # Delays are in units of 1024 90kHz ticks.
+        duration = int(round((self.end - self.start) / 1024.0))
+
+        return ''.join([
+            struct.pack('>HH', size, controlOffset),
+            top,
+            bottom,
+            struct.pack(
+                '>HHBBBBBBBB',
+                0, stopOffset,
+                FSTA_DSP if self.forced else STA_DSP,
+                SET_COLOR, (EMPHASIS2 << 4) | EMPHASIS1,
+                (PATTERN << 4) | BACKGROUND,
+                SET_CONTR, 0xff, 0xf0,
+                SET_DAREA,
+            ),
+            struct.pack('>Q', area)[2:],
+            struct.pack(
+                '>BHHB', SET_DSPXA, topOffset, bottomOffset, CMD_END
+            ),
+            struct.pack(
+                '>HHBB', min(duration, 0xffff), stopOffset, STP_DSP, CMD_END
+            ),
+        ])
+
+class VobSubWriter(object):
+    """Writes captions to an .idx/.sub pair
+
+    Args:
+        idx : (str)
+            The .idx file to write. The .sub file is written alongside it.
+
+        frame : (int, int)
+            Width and height of the frame the captions are placed on.
+
+        language='en' : (str)
+            ISO 639-1 language code of the captions.
+
+    The .sub file is written as captions are added, and the .idx is written
+    when the writer is closed.
+
+    """
+    def __init__(self, idx, frame, language='en'):
+        self.idx = idx
+        self.sub = os.path.splitext(idx)[0] + '.sub'
+        self.frame = frame
+        self.language = language
+
+        self.entries = []
+        self._sub = open(self.sub, 'wb')
+
+    def close(self):
+        """Finishes the .sub file and writes the .idx file"""
+        self._sub.close()
+
+        lines = [
+            IDX_HEADER.format(
+                width=self.frame[0],
+                height=self.frame[1],
+                palette=', '.join(PALETTE),
+                language=self.language
+            )
+        ]
+        for pts, filePos in self.entries:
+            lines.append('timestamp: {time}, filepos: {pos:09x}\n'.format(
+                time=_timestamp(pts),
+                pos=filePos
+            ))
+
+        with open(self.idx, 'w') as f:
+            f.write(''.join(lines))
+
+    def write(self, caption):
+        """Writes a caption to the .sub file as MPEG program stream packs
+
+        Args:
+            caption : (<Caption>)
+                The caption to write. It must have an end time.
+
+        Raises:
+            ValueError
+                Raised if the caption is too large for a subpicture.
+
+        Returns:
+            None
+
+        """
+        spu = caption.subpicture()
+
+        self.entries.append((caption.start, self._sub.tell()))
+
+        packs = []
+        pos = 0
+        while pos < len(spu):
+            # Only the first packet of a subpicture carries its timestamp.
+            pts = _pts(caption.start) if not pos else ''
+            room = PACK_SIZE - PACK_HEADER_SIZE - PES_HEADER_SIZE - 1
+            room -= len(pts)
+
+            payload = spu[pos:pos + room]
+            pos += len(payload)
+            spare = room - len(payload)
+
+            # Every pack is the same size. A few spare bytes can be stuffed
+            # into the PES header, more than that needs a padding packet.
+            stuffing = spare if spare < 6 else 0
+            padding = ''
+            if spare >= 6:
+                padding = '\x00\x00\x01\xbe' + struct.pack('>H', spare - 6)
+                padding += '\xff' * (spare - 6)
+
+            header = pts + '\xff' * stuffing
+            packs.append(''.join([
+                _packHeader(caption.start),
+                '\x00\x00\x01\xbd',
+                struct.pack(
+                    '>HBBB',
+                    3 + len(header) + 1 + len(payload),
+                    0x81,
+                    0x80 if pts else 0x00,
+                    len(header)
+                ),
+                header,
+                chr(SUBSTREAM_ID),
+                payload,
+                padding,
+            ]))
+
+        self._sub.write(''.join(packs))
+
+#===============================================================================
+# FUNCTIONS
+#===============================================================================
+
+def captions(buf, frame):
+    """Decodes every caption of a PGS stream
+
+    Args:
+        buf : (str|<mmap>)
+            Buffer holding the PGS stream.
+
+        frame : (int, int)
+            Width and height of the frame the captions are scaled to.
+
+    Raises:
+        ValueError
+            Raised if the buffer isn't a PGS stream.
+
+    Yields:
+        <Caption>
+            Every caption, with its end time set.
+
+    Captions are counted the same way as <pgs.supInfo>. Palette only updates,
+    and acquisition points repeating the caption on screen, don't start a new
+    caption.
+
+    """
+    objects = {}
+    palettes = {}
+    composition = None
+    shown = None
+    pending = None
+
+    for segType, pts, dts, offset, size in pgs.segments(buf):
+        if segType == pgs.PCS:
+            composition = pgs.readComposition(buf, offset, pts)
+            if composition.state == pgs.EPOCH_START:
+                objects = {}
+                palettes = {}
+
+        elif segType == pgs.PDS:
+            paletteID, version, entries = pgs.readPalette(buf, offset, size)
+            palettes.setdefault(paletteID, {}).update(entries)
+
+        elif segType == pgs.ODS:
+            objectID, version, sequence, width, height, data = pgs.readObject(
+                buf, offset, size
+            )
+            if sequence & pgs.FIRST_IN_SEQUENCE:
+                objects[objectID] = _Object(width, height, data)
+            elif objectID in objects:
+                objects[objectID].append(data)
+
+        elif segType == pgs.END and composition:
+            # Objects and palettes follow the PCS, so the display set can
+            # only be drawn once it's complete.
+            current = composition
+            composition = None
+
+            if current.paletteUpdate:
+                continue
+            layout = current.layout
+            if current.state == pgs.ACQUISITION_POINT and layout == shown:
+                continue
+            shown = layout if layout else None
+
+            if pending:
+                pending.end = current.pts
+                yield pending
+                pending = None
+
+            if layout:
+                pending = Caption.render(current, objects, palettes, frame)
+
+    if pending:
+        pending.end = pending.start + LAST_DURATION
+        yield pending
+
+def convert(sup, idx=None, forcedIdx=None, resolution='1080p', language='eng'):
+    """Converts a PGS sup file to VobSub
+
+    Args:
+        sup : (str)
+            The sup file to convert.
+
+        idx=None : (str)
+            The .idx file to write every caption to. Skipped if None.
+
+        forcedIdx=None : (str)
+            The .idx file to write only the forced captions to. Skipped if
+            None, and not written at all if there are no forced captions.
+
+        resolution='1080p' : (str)
+            The frame size to scale to. One of the keys of FRAME_SIZES, the
+            same names BDSup2Sub takes.
+
+        language='eng' : (str)
+            ISO 639-2 language code of the track, as reported by mkvmerge.
+
+    Raises:
+        ImportError
+            Raised if NumPy isn't installed.
+
+        IOError
+            Raised if the sup can't be read or a VobSub file can't be written.
+
+        ValueError
+            Raised if the sup isn't a PGS stream, or a caption can't be
+            encoded.
+
+    Returns:
+        <pgs.SupInfo>
+            The caption counts of the sup.
+
+    """
+    if numpy is None:
+        raise ImportError('The native subtitle converter requires NumPy')
+
+    frame = FRAME_SIZES[resolution]
+    language = LANGUAGE_CODES.get(language, language[:2])
+
+    writer = VobSubWriter(idx, frame, language) if idx else None
+    forcedWriter = None
+
+    totalCount = 0
+    forcedCount = 0
+
+    with open(sup, 'rb') as f:
+        empty = not f.read(1)
+        # mmap refuses empty files, and there's nothing to convert anyway.
+        buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if not empty \
+            else ''
+
+    try:
+        for caption in captions(buf, frame):
+            totalCount += 1
+            if writer:
+                writer.write(caption)
+            if caption.forced:
+                forcedCount += 1
+                if forcedIdx and not forcedWriter:
+                    forcedWriter = VobSubWriter(forcedIdx, frame, language)
+                if forcedWriter:
+                    forcedWriter.write(caption)
+    finally:
+        if not empty:
+            buf.close()
+        if writer:
+            writer.close()
+        if forcedWriter:
+            forcedWriter.close()
+
+    return pgs.SupInfo(totalCount, forcedCount)
@@ -0,0 +1,367 @@
+#/usr/bin/python
+# Ripmaster.tools.watcher
+# Watches the toConvert folder for new movies to queue
+
+"""
+
+Description
+-----------
+
+When Ripmaster runs with --watch, it keeps running after the movies it found
+at startup are queued, and picks up new Name__instructions folders as they
+appear in toConvert.
+
+A rip shows up in toConvert long before it's finished. MakeMKV writes the mkv
+in place over several minutes, so a movie is only reported once its size and
+modification time haven't changed for a settle interval.
+
+On Linux the folders are watched with inotify, through ctypes, so nothing is
+listed until something changes. Anywhere inotify isn't available, toConvert is
+listed again every poll interval instead.
+
+Classes
+-------
+
+FolderWatcher
+    Watches a root folder for new movie files, and reports each one once it
+    has stopped changing.
+
+Functions
+---------
+
+isMovie()
+    Checks if a file name is one Ripmaster should encode.
+
+"""
+
+#===============================================================================
+# IMPORTS
+#===============================================================================
+
+# Standard Imports
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import time
+
+#===============================================================================
+# GLOBALS
+#===============================================================================
+
+POLL_DEFAULT = 10
+SETTLE_DEFAULT = 60
+
+# inotify events we wake up for: a new movie folder, or a new movie file.
+# Writes to a growing file aren't watched, there would be thousands of them.
+# Pending files are checked with stat until they settle instead.
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_ISDIR = 0x40000000
+
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+
+# struct inotify_event, without the trailing name
+EVENT_HEADER = struct.Struct('iIII')
+
+#===============================================================================
+# CLASSES
+#===============================================================================
+
+class _Inotify(object):
+    """A minimal inotify binding, reporting which folders saw changes
+
+    Raises:
+        OSError
+            Raised if inotify isn't available on this system.
+
+    """
+    def __init__(self):
+        libName = ctypes.util.find_library('c')
+        try:
+            libc = ctypes.CDLL(libName, use_errno=True)
+            self._addWatch = libc.inotify_add_watch
+            init = libc.inotify_init
+        except (OSError, AttributeError):
+            raise OSError(errno.ENOSYS, 'inotify is not available')
+
+        self._addWatch.argtypes = [
+            ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32
+        ]
+
+        self.fd = init()
+        if self.fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+
+        # Watch descriptor: folder
+        self._folders = {}
+
+    #===========================================================================
+    # PUBLIC METHODS
+    #===========================================================================
+
+    def close(self):
+        """Closes the inotify descriptor, removing every watch"""
+        os.close(self.fd)
+
+    def read(self, timeout):
+        """Waits for events, returning the folders they happened in
+
+        Args:
+            timeout : (float)
+                Seconds to wait for an event.
+
+        Raises:
+            N/A
+
+        Returns:
+            set(str)|None
+                The folders that saw changes, or None if the kernel dropped
+                events and everything needs to be listed again.
+
+        """
+        try:
+            readable = select.select([self.fd], [], [], timeout)[0]
+        except select.error, err:
+            if err.args[0] == errno.EINTR:
+                return set()
+            raise
+        if not readable:
+            return set()
+
+        data = os.read(self.fd, 65536)
+
+        folders = set()
+        pos = 0
+        while pos + EVENT_HEADER.size <= len(data):
+            wd, mask, cookie, length = EVENT_HEADER.unpack_from(data, pos)
+            pos += EVENT_HEADER.size
+            name = data[pos:pos + length].rstrip('\0')
+            pos += length
+
+            if mask & IN_Q_OVERFLOW:
+                return None
+            if wd not in self._folders:
+                continue
+
+            folders.add(self._folders[wd])
+            if mask & IN_ISDIR:
+                # A new movie folder
+                folders.add(os.path.join(self._folders[wd], name))
+
+        return folders
+
+    def watch(self, folder):
+        """Starts watching a folder
+
+        Args:
+            folder : (str)
+                The folder to watch.
+
+        Raises:
+            OSError
+                Raised if the watch can't be added, usually because the
+                system's watch limit has been reached.
+
+        Returns:
+            None
+
+        """
+        if folder in self._folders.values():
+            return
+
+        wd = self._addWatch(self.fd, folder, WATCH_MASK)
+        if wd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err), folder)
+
+        self._folders[wd] = folder
+
+#===============================================================================
+
+class FolderWatcher(object):
+    """Watches a root folder for new movies, once they've stopped changing
+
+    Args:
+        root : (str)
+            The folder movie folders are placed in, usually toConvert.
+
+        known=None : set(str)
+            Paths of movies that are already queued. These are never
+            reported. Reported movies are added to this set.
+
+        settle=SETTLE_DEFAULT : (int|float)
+            Seconds a movie's size and modification time must stay the same
+            before it's reported.
+
+        poll=POLL_DEFAULT : (int|float)
+            Seconds between listings of root, when inotify isn't available.
+
+        inotify=True : (bool)
+            Use inotify if it's available. If False, always poll.
+
+    Raises:
+        N/A
+
+    Only folders with an instruction set (a '__' in their name) are searched,
+    the same as a normal Ripmaster scan. Movie paths are built the same way
+    <tools.Movie> builds them, so they can be checked against known.
+
+    """
+    def __init__(self, root, known=None, settle=SETTLE_DEFAULT,
+                 poll=POLL_DEFAULT, inotify=True):
+        self.root = root
+        self.known = known if known is not None else set()
+        self.settle = settle
+        self.poll = poll
+
+        # Path: ((size, mtime), time that identity was first seen)
+        self._pending = {}
+
+        self._inotify = None
+        if inotify:
+            try:
+                self._inotify = _Inotify()
+                self._inotify.watch(root)
+            except OSError, err:
+                print "Could not watch {root} with inotify, polling every " \
+                      "{poll} seconds instead: {err}".format(
+                          root=root, poll=poll, err=err
+                      )
+                self._closeInotify()
+
+        # Everything is listed once to begin with.
+        self._scan(self._movieFolders())
+        self._lastScan = time.time()
+
+    #===========================================================================
+    # PRIVATE METHODS
+    #===========================================================================
+
+    def _closeInotify(self):
+        """Stops using inotify, falling back to polling"""
+        if self._inotify:
+            self._inotify.close()
+        self._inotify = None
+
+    def _movieFolders(self):
+        """Returns every folder in root with an instruction set"""
+        try:
+            names = os.listdir(self.root)
+        except OSError:
+            return []
+        return [
+            os.path.join(self.root, name) for name in names if '__' in name
+        ]
+
+    def _scan(self, folders):
+        """Lists the given folders, adding any new movies to pending"""
+        for folder in folders:
+            if folder == self.root or '__' not in os.path.basename(folder):
+                continue
+            if self._inotify:
+                try:
+                    self._inotify.watch(folder)
+                except OSError, err:
+                    print "Could not watch {folder}, polling instead: " \
+                          "{err}".format(folder=folder, err=err)
+                    self._closeInotify()
+            try:
+                names = os.listdir(folder)
+            except OSError:
+                # Removed, or a file with '__' in its name.
+                continue
+            for name in names:
+                if not isMovie(name):
+                    continue
+                path = os.path.join(folder, name).replace('\\', '/')
+                if path not in self.known and path not in self._pending:
+                    self._pending[path] = (None, None)
+
+    def _settled(self, now):
+        """Returns pending movies that have stopped changing"""
+        settled = []
+        for path, (identity, since) in self._pending.items():
+            try:
+                stat = os.stat(path)
+            except OSError:
+                # Gone before it settled
+                del self._pending[path]
+                continue
+
+            current = (stat.st_size, stat.st_mtime)
+            if current != identity:
+                self._pending[path] = (current, now)
+            elif now - since >= self.settle:
+                del self._pending[path]
+                settled.append(path)
+
+        return sorted(settled)
+
+    #===========================================================================
+    # PUBLIC METHODS
+    #===========================================================================
+
+    def close(self):
+        """Stops watching"""
+        self._closeInotify()
+
+    def check(self, timeout=None):
+        """Waits for changes, then returns movies that have settled
+
+        Args:
+            timeout=None : (int|float)
+                Most seconds to wait. Defaults to the poll interval. Returns
+                early if a pending movie might have settled.
+
+        Raises:
+            N/A
+
+        Returns:
+            [(str, str, str)]
+                The (root, subdir, fileName) of every new movie that's ready,
+                the arguments a <tools.Movie> is built with. Each movie is
+                only ever returned once.
+
+        """
+        if timeout is None:
+            timeout = self.poll
+        if self._pending:
+            # Wake up in time to check pending files again.
+            timeout = min(timeout, self.settle / 2.0)
+
+        if self._inotify:
+            folders = self._inotify.read(timeout)
+            if folders is None:
+                folders = self._movieFolders()
+            self._scan(folders)
+        else:
+            wait = self._lastScan + self.poll - time.time()
+            if wait > timeout:
+                # Not time to list root yet, but pending files are checked.
+                time.sleep(timeout)
+            else:
+                time.sleep(max(0, wait))
+                self._scan(self._movieFolders())
+                self._lastScan = time.time()
+
+        ready = []
+        for path in self._settled(time.time()):
+            self.known.add(path)
+            subdir, fileName = path.split('/')[-2:]
+            ready.append((self.root, subdir, fileName))
+
+        return ready
+
+#===============================================================================
+# FUNCTIONS
+#===============================================================================
+
+def isMovie(fileName):
+    """Checks if a file is an mkv to encode, and not one of our encodes"""
+    return '--converted' not in fileName and '.mkv' in fileName